@@ -0,0 +1,165 @@
+"""
+The EnergyFlexibility OPC UA address space.
+
+Shared by ``flex_server.py`` and the tests so the server and the
+:mod:`flexagent.opcua_bridge` agree on the node layout. Variables are
+addressed by their browse path below the root object, e.g.
+``"Microgrid/SolarGenerator/CurrentGen"``.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from opcua import ua
+
+from .envelope import Envelope, FlexibilityEngine
+
+NAMESPACE_URI = "http://example.org/energyflexibility"
+ROOT = "EnergyFlexibility"
+
+# Array variables below Microgrid/TimeSeries, one per microgrid simulation column
+SERIES_COLUMNS = ('Solar_Generation', 'Wind_Generation', 'CHP_Generation', 'Demand', 'Thermal_Demand',
+                  'Total_Generation', 'Battery_Storage', 'Battery_Change', 'Thermal_Storage', 'Thermal_Change',
+                  'Surplus_Deficit', 'Grid_Export')
+
+# KPIs/<Window>/<Variable>, see flexagent.kpi
+KPI_WINDOWS = ('Total', 'Hour', 'Day', 'Week')
+KPI_VARIABLES = ('SelfSufficiency', 'SelfConsumption', 'Generated', 'Consumed', 'SelfConsumed', 'SelfSupplied',
+                 'Exported', 'Imported')
+
+# Array variables below Envelope, see flexagent.envelope
+ENVELOPE_VARIABLES = tuple(''.join(part.capitalize() for part in field.split('_')) for field in Envelope._fields)
+
+
+def calculate_flex_method(nodes, engine):
+    """
+    Callback for ``calculateFlex`` computing the envelopes from the values in the address space.
+
+    The battery storage (``Capacity`` and ``InitialEnergy``, charged and
+    discharged in one hour at most) and the building's ``FlexibleLoad``
+    (shiftable by that much for one hour) are the assets. The envelopes are
+    written to the ``Envelope`` arrays and ``Flexibility`` is set to the
+    power range of the first step.
+
+    :param nodes: Variable nodes by browse path below the root object.
+    :param engine: :class:`~flexagent.envelope.FlexibilityEngine` keeping the assets between calls.
+    """
+    def calculate_flex(parent):
+        capacity = float(nodes['Microgrid/BatteryStorage/Capacity'].get_value())
+        energy = float(nodes['Microgrid/BatteryStorage/InitialEnergy'].get_value())
+        flexible_load = abs(float(nodes['Building/FlexibleLoad'].get_value()))
+        engine.update([{'name': 'microgrid/battery', 'building': 'microgrid', 'type': 'battery',
+                        'capacity': capacity, 'power': capacity, 'efficiency': 1.0,
+                        'soc': min(energy / capacity, 1.0) if capacity > 0 else 0.0},
+                       {'name': 'building/flexible_load', 'building': str(nodes['Building/BuildingID'].get_value()),
+                        'type': 'shiftable', 'load': flexible_load, 'increase': flexible_load,
+                        'decrease': flexible_load, 'energy': flexible_load}])
+        envelope = engine.envelope()
+        for name, values in zip(ENVELOPE_VARIABLES, envelope):
+            nodes['Envelope/' + name].set_value(ua.Variant(values.tolist(), ua.VariantType.Double))
+        nodes['Envelope/Step'].set_value(engine.step_hours * 3600)
+        nodes['Flexibility'].set_value(float(envelope.up_power[0] + envelope.down_power[0]))
+        return [ua.Variant(True, ua.VariantType.Boolean)]
+
+    return calculate_flex
+
+
+def build_address_space(server, calculate_flex=None, engine=None):
+    """
+    Register the namespace and create the EnergyFlexibility objects on a server.
+
+    :param server: ``opcua.Server`` instance, not yet started.
+    :param calculate_flex: Callback behind the ``calculateFlex`` method, defaults to
+                           :func:`calculate_flex_method` with ``engine``.
+    :param engine: :class:`~flexagent.envelope.FlexibilityEngine` for the default callback, one with a day of
+                   15 minute steps if not given.
+    :returns: Namespace index
+    :rtype: int
+    """
+    idx = server.register_namespace(NAMESPACE_URI)
+    objects = server.get_objects_node()
+    variables = []
+    nodes = {}
+
+    def add_variable(parent, name, value):
+        variable = parent.add_variable(idx, name, value)
+        variables.append(variable)
+        path = parent_paths.get(parent.nodeid)
+        nodes[path + '/' + name if path else name] = variable
+        return variable
+
+    def add_object(parent, name):
+        child = parent.add_object(idx, name)
+        path = parent_paths.get(parent.nodeid)
+        parent_paths[child.nodeid] = path + '/' + name if path else name
+        return child
+
+    if calculate_flex is None:
+        calculate_flex = calculate_flex_method(nodes, engine or FlexibilityEngine())
+
+    # Create the root object "Energy Flexibility"
+    energy_flexibility = objects.add_object(idx, ROOT)
+    parent_paths = {energy_flexibility.nodeid: ''}
+    add_variable(energy_flexibility, "Flexibility", 0.0)
+    add_variable(energy_flexibility, "GeneratedEnergy", 0.0)
+    add_variable(energy_flexibility, "FlexibleLoad", 0.0)
+    energy_flexibility.add_method(idx, "calculateFlex", calculate_flex, [], [ua.VariantType.Boolean])
+
+    building = add_object(energy_flexibility, "Building")
+    add_variable(building, "BuildingID", 0)
+    add_variable(building, "FlexibleLoad", 0.0)
+    add_variable(building, "DateTime", "")
+
+    district = add_object(energy_flexibility, "District")
+    add_variable(district, "Buildings", "")
+    add_variable(district, "LoadID", 0)
+    add_variable(district, "Loads", 0.0)
+    add_variable(district, "TotalLoad", 0.0)
+
+    microgrid = add_object(energy_flexibility, "Microgrid")
+
+    solar_generator = add_object(microgrid, "SolarGenerator")
+    add_variable(solar_generator, "CurrentGen", 0.0)
+    add_variable(solar_generator, "EfficiencyCoeff", 0.0)
+    add_variable(solar_generator, "Time", "")
+
+    wind_generator = add_object(microgrid, "WindGenerator")
+    add_variable(wind_generator, "CurrentGen", 0.0)
+    add_variable(wind_generator, "EfficiencyCoeff", 0.0)
+    add_variable(wind_generator, "Time", "")
+
+    battery_storage = add_object(microgrid, "BatteryStorage")
+    add_variable(battery_storage, "StorageID", 0)
+    add_variable(battery_storage, "Capacity", 0.0)
+    add_variable(battery_storage, "InitialEnergy", 0.0)
+    add_variable(battery_storage, "TargetEnergy", 0.0)
+    add_variable(battery_storage, "HoldingDuration", 0.0)
+    add_variable(battery_storage, "EnergyLoss", 0.0)
+
+    # Whole simulation output: start and step in epoch seconds, one Double array per column
+    time_series = add_object(microgrid, "TimeSeries")
+    add_variable(time_series, "Start", 0.0)
+    add_variable(time_series, "Step", 0.0)
+    for column in SERIES_COLUMNS:
+        variable = add_variable(time_series, column, ua.Variant([], ua.VariantType.Double))
+        variable.set_value_rank(ua.ValueRank.OneDimension)
+        variable.set_array_dimensions([0])
+
+    # Result of calculateFlex: step in seconds, one Double array per envelope
+    envelope = add_object(energy_flexibility, "Envelope")
+    add_variable(envelope, "Step", 0.0)
+    for name in ENVELOPE_VARIABLES:
+        variable = add_variable(envelope, name, ua.Variant([], ua.VariantType.Double))
+        variable.set_value_rank(ua.ValueRank.OneDimension)
+        variable.set_array_dimensions([0])
+
+    kpis = add_object(energy_flexibility, "KPIs")
+    for window in KPI_WINDOWS:
+        kpi_window = add_object(kpis, window)
+        for name in KPI_VARIABLES:
+            add_variable(kpi_window, name, 0.0)
+
+    # Set variables to be writable by clients
+    for variable in variables:
+        variable.set_writable()
+
+    return idx
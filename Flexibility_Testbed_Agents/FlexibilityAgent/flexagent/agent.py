@@ -7,8 +7,17 @@ __docformat__ = 'reStructuredText'
 import logging
 import sys
 from volttron.platform.agent import utils
+from volttron.platform.messaging.timeseries import decode_frame, is_timeseries
 from volttron.platform.vip.agent import Agent, Core, RPC
 
+from .envelope import FlexibilityEngine
+from .kpi import KpiEngine
+
+try:
+    from .opcua_bridge import OpcUaBridge
+except ImportError:
+    OpcUaBridge = None
+
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
@@ -35,8 +44,13 @@ def flexagent(config_path, **kwargs):
     setting1 = int(config.get('setting1', 1))
     setting2 = config.get('setting2', "neighborhood/totalEnergy")
     setting3 = config.get('setting3', "microgrid/data")
+    setting4 = config.get('setting4')
+    setting5 = float(config.get('setting5', 5))
+    setting6 = config.get('setting6', "flexibility/kpis")
+    setting7 = int(config.get('setting7', 96))
+    setting8 = float(config.get('setting8', 900))
 
-    return Flexagent(setting1, setting2, **kwargs)
+    return Flexagent(setting1, setting2, setting3, setting4, setting5, setting6, setting7, setting8, **kwargs)
 
 
 class Flexagent(Agent):
@@ -44,17 +58,42 @@ class Flexagent(Agent):
     Document agent constructor here.
     """
 
-    def __init__(self, setting1=1, setting2="neighborhood/totalEnergy", setting3="microgrid/data", **kwargs):
+    def __init__(self, setting1=1, setting2="neighborhood/totalEnergy", setting3="microgrid/data", setting4=None,
+                 setting5=5, setting6="flexibility/kpis", setting7=96, setting8=900, **kwargs):
         super(Flexagent, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
         self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        self.setting7 = setting7
+        self.setting8 = setting8
 
         self.default_config = {"setting1": setting1,
                                "setting2": setting2,
-                               "setting3": setting3}
+                               "setting3": setting3,
+                               "setting4": setting4,
+                               "setting5": setting5,
+                               "setting6": setting6,
+                               "setting7": setting7,
+                               "setting8": setting8}
+
+        # Running self sufficiency / self consumption over all received microgrid intervals
+        self.kpis = KpiEngine()
+
+        # Flexibility envelopes of the registered assets over setting7 steps of setting8 seconds
+        self.flex = FlexibilityEngine(setting7, setting8 / 3600.0)
+
+        # OPC UA bridge, values staged in _handle_publish are written every setting5 seconds
+        self.bridge = None
+        self.flush_greenlet = None
+
+        # Latest neighborhood total and microgrid simulation (DataFrame) received
+        self.total_energy = None
+        self.microgrid_data = None
 
         # Set a default configuration to ensure that self.configure is called immediately to setup
         # the agent.
@@ -78,6 +117,13 @@ class Flexagent(Agent):
             setting1 = int(config["setting1"])
             setting2 = str(config["setting2"])
             setting3 = str(config["setting3"])
+            setting4 = config["setting4"]
+            setting5 = float(config["setting5"])
+            setting6 = str(config["setting6"])
+            setting7 = int(config["setting7"])
+            setting8 = float(config["setting8"])
+            if setting7 <= 0 or setting8 <= 0:
+                raise ValueError("Horizon and step length must be positive")
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
@@ -85,36 +131,99 @@ class Flexagent(Agent):
         self.setting1 = setting1
         self.setting2 = setting2
         self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        if (setting7, setting8) != (self.setting7, self.setting8):
+            # Envelopes of another horizon can not be reused
+            self.flex = FlexibilityEngine(setting7, setting8 / 3600.0)
+        self.setting7 = setting7
+        self.setting8 = setting8
+
+        self._create_bridge()
+        self._create_subscriptions(self.setting2, self.setting3)
+
+    def _create_bridge(self):
+        """
+        Connect to the OPC UA server in setting4 and flush staged values every setting5 seconds
+        """
+        if self.flush_greenlet is not None:
+            self.flush_greenlet.kill()
+            self.flush_greenlet = None
+        if self.bridge is not None:
+            self.bridge.disconnect()
+            self.bridge = None
+
+        if not self.setting4:
+            return
+        if OpcUaBridge is None:
+            _log.error("OPC UA url configured but the opcua package is not installed.")
+            return
 
-        self._create_subscriptions(self.setting2)
-        self._create_subscriptions(self.setting3)
+        self.bridge = OpcUaBridge(self.setting4)
+        self.flush_greenlet = self.core.periodic(self.setting5, self._flush_bridge)
 
-    def _create_subscriptions(self, topic):
+    def _flush_bridge(self):
+        try:
+            if not self.bridge.connected:
+                self.bridge.connect()
+            self.bridge.flush()
+        except Exception as e:
+            _log.error("OPC UA write to {} failed: {}".format(self.setting4, e))
+            self.bridge.disconnect()
+
+    def _create_subscriptions(self, *topics):
         """
-        Unsubscribe from all pub/sub topics and create a subscription to a topic in the configuration which triggers
-        the _handle_publish callback
+        Unsubscribe from all pub/sub topics and create a subscription to each topic in the configuration which
+        triggers the _handle_publish callback
         """
         self.vip.pubsub.unsubscribe("pubsub", None, None)
 
-        self.vip.pubsub.subscribe(peer='pubsub',
-                                  prefix=topic,
-                                  callback=self._handle_publish)
+        for topic in topics:
+            self.vip.pubsub.subscribe(peer='pubsub',
+                                      prefix=topic,
+                                      callback=self._handle_publish)
 
     def _handle_publish(self, peer, sender, bus, topic, headers, message):
         """
         Callback triggered by the subscription setup using the topic from the agent's config file
         """
-        if topic == "neighborhood/totalEnergy":
-            #store energy consumtption data in var and publish it to the opc ua server
-            pass
-        if topic == "microgrid/data":
-            #store dataframe/dictionary and split it (one for each: battery, wind, solar, chp, total, etc.)
-            #calculate the points for self sufficiency calculation
-            #calculate self sufficiency + self consumption and store it in opc ua server for flexibility
-            #store other data points to opc ua server (überhaupt möglich? nimmt nur einzelne punkte???)
-            pass
-
-        pass
+        if is_timeseries(message):
+            try:
+                message = decode_frame(message)
+            except ValueError as e:
+                _log.error("Bad time-series payload on {}: {}".format(topic, e))
+                return
+
+        if topic.startswith(self.setting2):
+            self.total_energy = message
+            if self.bridge is not None and isinstance(message, dict) and 'totalEnergy' in message:
+                self.bridge.set('District/TotalLoad', message['totalEnergy'])
+        if topic.startswith(self.setting3):
+            self.microgrid_data = message
+            if self.bridge is not None and hasattr(message, 'columns'):
+                # Whole week as array variables, the current step as scalar values
+                self.bridge.set_series('Microgrid/TimeSeries', message)
+                current = message.iloc[0]
+                self.bridge.set_many({'Microgrid/SolarGenerator/CurrentGen': current['Solar_Generation'],
+                                      'Microgrid/WindGenerator/CurrentGen': current['Wind_Generation'],
+                                      'GeneratedEnergy': current['Total_Generation']})
+            # Only the intervals that are over count, the rest of the week is a forecast
+            now = utils.get_aware_utc_now().timestamp()
+            if hasattr(message, 'columns') and self.kpis.add_frame(message, now=now):
+                self._publish_kpis()
+
+    def _publish_kpis(self):
+        """
+        Publish the current KPIs of all windows and stage them for the OPC UA server
+        """
+        snapshot = self.kpis.snapshot()
+        self.vip.pubsub.publish('pubsub', self.setting6, message=snapshot)
+        if self.bridge is not None:
+            for window, values in snapshot.items():
+                for name, value in values.items():
+                    variable = ''.join(part.capitalize() for part in name.split('_'))
+                    self.bridge.set('KPIs/{}/{}'.format(window.capitalize(), variable), value)
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
@@ -139,7 +248,45 @@ class Flexagent(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        if self.bridge is not None and self.bridge.connected:
+            self._flush_bridge()
+            self.bridge.disconnect()
+
+    @RPC.export
+    def get_kpis(self, window=None):
+        """
+        RPC method
+
+        Current self sufficiency, self consumption and energy sums for "total", "hour", "day" or "week", or all of
+        them if no window is given.
+        """
+        return self.kpis.snapshot(window)
+
+    @RPC.export
+    def calculate_flex(self, assets=None, remove=None):
+        """
+        RPC method
+
+        Update the registered assets and return the upward and downward power and energy envelopes of the
+        microgrid and of every building, see flexagent.envelope. Unchanged assets are not recomputed.
+
+        :param assets: Asset dictionaries to add or update.
+        :param remove: Names of assets to drop.
+        """
+        if remove:
+            self.flex.remove(remove)
+        if assets:
+            self.flex.update(assets)
+        snapshot = self.flex.snapshot()
+        if self.bridge is not None:
+            microgrid = snapshot['microgrid']
+            self.bridge.set_many({'Envelope/Step': self.setting8,
+                                  'Envelope/UpPower': microgrid['up_power'],
+                                  'Envelope/DownPower': microgrid['down_power'],
+                                  'Envelope/UpEnergy': microgrid['up_energy'],
+                                  'Envelope/DownEnergy': microgrid['down_energy'],
+                                  'Flexibility': microgrid['up_power'][0] + microgrid['down_power'][0]})
+        return snapshot
 
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
@@ -0,0 +1,293 @@
+"""
+Flexibility envelopes of buildings and the microgrid.
+
+Every asset is described as a deviation from its baseline consumption
+``b`` (kW, positive when drawing from the grid) within power limits
+``p_min <= p <= p_max`` and with a stored energy headroom ``E_up`` above and
+``E_down`` below its current state (kWh at the grid connection). Over a
+horizon of steps of ``dt`` hours the envelopes are::
+
+    up_power[t]    = min(p_max[t] - b[t], E_up / dt)
+    down_power[t]  = min(b[t] - p_min[t], E_down / dt)
+    up_energy[t]   = min(sum over k <= t of (p_max[k] - b[k]) * dt, E_up)
+    down_energy[t] = min(sum over k <= t of (b[k] - p_min[k]) * dt, E_down)
+
+Up is additional consumption, down is reduced consumption (or feed-in).
+The power envelopes hold for a deviation in a single step, the energy
+envelopes for a deviation sustained from the first step up to ``t``.
+
+Asset types, given as dictionaries with a ``name``, a ``building`` and a
+``type``; profiles may be scalars or one value per step:
+
+``battery``
+    ``capacity`` (kWh), ``power`` (kW), ``efficiency`` (charging, 0.9),
+    ``soc`` and ``min_soc`` (fractions, 0.5 and 0.0).
+``thermal``
+    Heat pump or heater with thermal storage covering a heat ``demand``
+    profile (kW thermal): ``capacity`` (kWh thermal), ``power`` (kW
+    electric), ``cop`` (1.0), ``soc`` and ``min_soc``.
+``shiftable``
+    Load profile ``load`` (kW) that can be raised by ``increase`` and
+    lowered by ``decrease`` (kW) for at most ``energy`` kWh.
+
+:class:`FlexibilityEngine` keeps one row of envelopes per asset and only
+recomputes the rows of assets whose description changed, all assets of a
+type at once.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import namedtuple
+
+import numpy as np
+
+Envelope = namedtuple('Envelope', ['up_power', 'down_power', 'up_energy', 'down_energy'])
+
+# Parameters of each asset type, None for required ones
+ASSET_TYPES = {
+    'battery': {'capacity': None, 'power': None, 'efficiency': 0.9, 'soc': 0.5, 'min_soc': 0.0},
+    'thermal': {'capacity': None, 'power': None, 'cop': 1.0, 'soc': 0.5, 'min_soc': 0.0, 'demand': 0.0},
+    'shiftable': {'load': None, 'increase': None, 'decrease': None, 'energy': None},
+}
+
+# Parameters given per step
+PROFILES = ('demand', 'load')
+
+
+def _battery(p, num_steps):
+    energy = p['soc'] * p['capacity']
+    baseline = np.zeros((len(energy), num_steps))
+    power = p['power'][:, None]
+    return (baseline, baseline - power, baseline + power, (p['capacity'] - energy) / p['efficiency'],
+            energy - p['min_soc'] * p['capacity'])
+
+
+def _thermal(p, num_steps):
+    energy = p['soc'] * p['capacity']
+    cop = p['cop']
+    power = np.broadcast_to(p['power'][:, None], (len(cop), num_steps))
+    # Without deviation the heat pump follows the demand, as far as its power allows
+    baseline = np.minimum(p['demand'] / cop[:, None], power)
+    return (baseline, np.zeros_like(baseline), power, (p['capacity'] - energy) / cop,
+            (energy - p['min_soc'] * p['capacity']) / cop)
+
+
+def _shiftable(p, num_steps):
+    load = p['load']
+    return (load, np.maximum(load - p['decrease'][:, None], 0.0), load + p['increase'][:, None], p['energy'],
+            p['energy'])
+
+
+_BOUNDS = {'battery': _battery, 'thermal': _thermal, 'shiftable': _shiftable}
+
+
+def envelopes(baseline, p_min, p_max, e_up, e_down, step_hours):
+    """
+    Envelopes of many assets at once.
+
+    :param baseline: Baseline power, shape ``(assets, steps)``.
+    :param p_min: Lowest power, shape ``(assets, steps)``.
+    :param p_max: Highest power, shape ``(assets, steps)``.
+    :param e_up: Energy that can be taken up, shape ``(assets,)``.
+    :param e_down: Energy that can be given back, shape ``(assets,)``.
+    :returns: Array of shape ``(assets, 4, steps)`` in the order of :class:`Envelope`.
+    :rtype: numpy.ndarray
+    """
+    up_room = np.clip(p_max - baseline, 0.0, None)
+    down_room = np.clip(baseline - p_min, 0.0, None)
+    e_up = np.clip(e_up, 0.0, None)[:, None]
+    e_down = np.clip(e_down, 0.0, None)[:, None]
+    return np.stack([np.minimum(up_room, e_up / step_hours),
+                     np.minimum(down_room, e_down / step_hours),
+                     np.minimum(np.cumsum(up_room, axis=1) * step_hours, e_up),
+                     np.minimum(np.cumsum(down_room, axis=1) * step_hours, e_down)], axis=1)
+
+
+def _key(asset):
+    return tuple(sorted((name, tuple(np.ravel(value).tolist()) if np.ndim(value) else value)
+                        for name, value in asset.items()))
+
+
+class FlexibilityEngine(object):
+    """
+    Envelopes of a set of assets, kept up to date incrementally.
+
+    :param horizon: Number of steps.
+    :param step_hours: Step length in hours.
+    """
+
+    def __init__(self, horizon=96, step_hours=0.25):
+        self.horizon = int(horizon)
+        self.step_hours = float(step_hours)
+        self.computed = 0
+        self._rows = np.zeros((0, 4, self.horizon))
+        self._names = []
+        self._buildings = []
+        self._index = {}
+        self._keys = {}
+        self._order = None
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def assets(self):
+        return list(self._names)
+
+    def update(self, assets):
+        """
+        Add or update assets, keeping the envelopes of unchanged ones.
+
+        :param assets: Asset dictionaries, see the module documentation.
+        :returns: Number of assets whose envelopes were recomputed.
+        :raises ValueError: for unknown types, missing parameters or profiles of the wrong length.
+        """
+        changed = {}
+        for asset in assets:
+            name = asset.get('name')
+            if name is None:
+                raise ValueError("Asset without a name: {}".format(asset))
+            key = _key(asset)
+            if self._keys.get(name) != key:
+                changed[name] = (asset, key)
+        if not changed:
+            return 0
+
+        by_type = {}
+        for name, (asset, _) in changed.items():
+            asset_type = asset.get('type')
+            if asset_type not in ASSET_TYPES:
+                raise ValueError("Asset {} has unknown type {!r}, choose one of {}.".format(
+                    name, asset_type, ", ".join(ASSET_TYPES)))
+            by_type.setdefault(asset_type, []).append(asset)
+
+        # Compute everything first so that a bad asset leaves the engine untouched
+        computed = []
+        for asset_type, group in by_type.items():
+            params = self._parameters(asset_type, group)
+            rows = envelopes(*_BOUNDS[asset_type](params, self.horizon), step_hours=self.step_hours)
+            computed.append((group, rows))
+
+        for group, rows in computed:
+            for asset, row in zip(group, rows):
+                name = asset['name']
+                building = str(asset.get('building', ''))
+                position = self._index.get(name)
+                if position is None:
+                    position = self._append(name, building)
+                elif self._buildings[position] != building:
+                    self._buildings[position] = building
+                    self._order = None
+                self._rows[position] = row
+                self._keys[name] = changed[name][1]
+        self.computed += len(changed)
+        return len(changed)
+
+    def _parameters(self, asset_type, group):
+        params = {}
+        for param, default in ASSET_TYPES[asset_type].items():
+            values = []
+            for asset in group:
+                value = asset.get(param, default)
+                if value is None:
+                    raise ValueError("Asset {} of type {} needs {!r}.".format(asset['name'], asset_type, param))
+                values.append(value)
+            if param in PROFILES:
+                try:
+                    params[param] = np.stack([np.broadcast_to(np.asarray(value, dtype=np.float64), (self.horizon,))
+                                              for value in values])
+                except ValueError:
+                    raise ValueError("Profile {!r} needs one value or {} values.".format(param, self.horizon))
+            else:
+                params[param] = np.asarray(values, dtype=np.float64)
+        return params
+
+    def _append(self, name, building):
+        position = len(self._names)
+        if position == len(self._rows):
+            rows = np.zeros((max(2 * position, 16), 4, self.horizon))
+            rows[:position] = self._rows
+            self._rows = rows
+        self._names.append(name)
+        self._buildings.append(building)
+        self._index[name] = position
+        self._order = None
+        return position
+
+    def remove(self, names):
+        """
+        Drop assets, unknown names are ignored.
+
+        :returns: Number of assets removed.
+        """
+        removed = 0
+        for name in names:
+            position = self._index.pop(name, None)
+            if position is None:
+                continue
+            del self._keys[name]
+            last = len(self._names) - 1
+            if position != last:
+                # Move the last asset into the gap
+                self._rows[position] = self._rows[last]
+                self._names[position] = self._names[last]
+                self._buildings[position] = self._buildings[last]
+                self._index[self._names[position]] = position
+            self._names.pop()
+            self._buildings.pop()
+            self._order = None
+            removed += 1
+        return removed
+
+    def asset_envelope(self, name):
+        try:
+            return Envelope(*self._rows[self._index[name]])
+        except KeyError:
+            raise ValueError("Unknown asset {}".format(name))
+
+    def envelope(self, building=None):
+        """
+        Summed envelopes of one building, or of all assets (the microgrid) if no building is given.
+
+        :rtype: Envelope
+        """
+        rows = self._rows[:len(self._names)]
+        if building is not None:
+            names, sums = self.building_envelopes()
+            try:
+                return Envelope(*sums[names.index(str(building))])
+            except ValueError:
+                raise ValueError("Unknown building {}".format(building))
+        return Envelope(*rows.sum(axis=0))
+
+    def building_envelopes(self):
+        """
+        Summed envelopes of every building.
+
+        :returns: Building names and an array of shape ``(buildings, 4, steps)``.
+        :rtype: tuple
+        """
+        if self._order is None:
+            buildings = np.asarray(self._buildings, dtype=object)
+            order = np.argsort(buildings, kind='stable')
+            sorted_buildings = buildings[order]
+            starts = np.flatnonzero(np.r_[True, sorted_buildings[1:] != sorted_buildings[:-1]]) \
+                if len(order) else np.zeros(0, dtype=np.intp)
+            self._order = (order, starts, sorted_buildings[starts].tolist())
+        order, starts, names = self._order
+        if not len(order):
+            return [], np.zeros((0, 4, self.horizon))
+        return list(names), np.add.reduceat(self._rows[order], starts, axis=0)
+
+    def snapshot(self):
+        """
+        Envelopes of the microgrid and of every building as lists, for RPC and pub/sub.
+        """
+        names, sums = self.building_envelopes()
+        return {'step_hours': self.step_hours,
+                'microgrid': _as_lists(self.envelope()),
+                'buildings': {name: _as_lists(Envelope(*rows)) for name, rows in zip(names, sums)}}
+
+
+def _as_lists(envelope):
+    return {field: values.tolist() for field, values in envelope._asdict().items()}
@@ -0,0 +1,177 @@
+"""
+Incremental self-sufficiency and self-consumption KPIs.
+
+Every interval adds its energy flows to running totals and to one running
+sum per rolling window, so an update costs the same no matter how much
+history has been seen. Windows are measured in data time: an interval
+leaves a window once an interval at least the window length newer has been
+added.
+
+Simulations look ahead, so a frame only adds the intervals that are over
+by the time it arrives. Later intervals are taken from the newest frame
+covering them once they are over, which lets re-simulations with updated
+demand replace the values of intervals that have not happened yet.
+
+The flows of an interval with generation ``g``, demand ``d`` and battery
+change ``c`` (positive when charging) are::
+
+    direct        = min(g, d)
+    stored        = min(max(c, 0), max(g - d, 0))
+    self_consumed = direct + stored
+    self_supplied = direct + max(-c, 0)
+    exported      = max(g - self_consumed, 0)
+    imported      = max(d - self_supplied, 0) + max(c, 0) - stored
+
+Self-sufficiency is ``self_supplied / consumed`` and self-consumption
+``self_consumed / generated``.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import deque
+
+import numpy as np
+
+QUANTITIES = ('generated', 'consumed', 'self_consumed', 'self_supplied', 'exported', 'imported')
+
+WINDOWS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+
+
+def flows(generation, demand, battery_change=0.0):
+    """
+    Energy flows of one or many intervals, in the order of :data:`QUANTITIES`.
+
+    Works element wise on NumPy arrays.
+    """
+    generation = np.asarray(generation, dtype=np.float64)
+    demand = np.asarray(demand, dtype=np.float64)
+    battery_change = np.asarray(battery_change, dtype=np.float64)
+
+    direct = np.minimum(generation, demand)
+    charge = np.maximum(battery_change, 0)
+    stored = np.minimum(charge, np.maximum(generation - demand, 0))
+    self_consumed = direct + stored
+    self_supplied = direct + np.maximum(-battery_change, 0)
+    exported = np.maximum(generation - self_consumed, 0)
+    # Grid charging of the battery is imported energy as well
+    imported = np.maximum(demand - self_supplied, 0) + charge - stored
+    return generation, demand, self_consumed, self_supplied, exported, imported
+
+
+def summarize(sums):
+    """
+    KPI dictionary from summed flows.
+    """
+    result = dict(zip(QUANTITIES, (float(value) for value in sums)))
+    generated, consumed = result['generated'], result['consumed']
+    result['self_sufficiency'] = result['self_supplied'] / consumed if consumed > 0 else 0.0
+    result['self_consumption'] = result['self_consumed'] / generated if generated > 0 else 0.0
+    return result
+
+
+class _Window(object):
+    __slots__ = ('length', 'entries', 'sums')
+
+    def __init__(self, length):
+        self.length = length
+        self.entries = deque()
+        self.sums = [0.0] * len(QUANTITIES)
+
+
+class KpiEngine(object):
+    """
+    Running KPI totals with rolling windows.
+
+    :param windows: Window name to length in seconds, defaults to :data:`WINDOWS`.
+    """
+
+    def __init__(self, windows=None):
+        self.windows = {name: _Window(length) for name, length in (windows or WINDOWS).items()}
+        self.totals = [0.0] * len(QUANTITIES)
+        self.count = 0
+        self.skipped = 0
+        self.last_timestamp = None
+
+    def add(self, timestamp, generation, demand, battery_change=0.0):
+        """
+        Add one interval.
+
+        Intervals that are not newer than the last one added are skipped, so
+        overlapping publishes are not counted twice.
+
+        :param timestamp: Interval time in seconds since the epoch.
+        :returns: True if the interval was added.
+        """
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            self.skipped += 1
+            return False
+        values = [float(value) for value in flows(generation, demand, battery_change)]
+        self._add(timestamp, values)
+        return True
+
+    def add_frame(self, frame, now=None):
+        """
+        Add the intervals of a microgrid simulation frame.
+
+        Generation is the sum of the solar, wind and CHP columns, which are
+        zero while the microgrid curtails.
+
+        :param now: Time in seconds since the epoch, only intervals ending by
+                    then are added. None adds all of them.
+        :returns: Number of intervals added.
+        """
+        timestamps = frame.index.asi8 / 1e9
+        if now is not None and len(timestamps):
+            # An interval lasts until the next one, the last one as long as its predecessor
+            step = timestamps[-1] - timestamps[-2] if len(timestamps) > 1 else 0.0
+            ends = np.append(timestamps[1:], timestamps[-1] + step)
+            frame = frame.iloc[:int(np.searchsorted(ends, now, side='right'))]
+            timestamps = timestamps[:len(frame)]
+        generation = (frame['Solar_Generation'] + frame['Wind_Generation'] + frame['CHP_Generation']).to_numpy()
+        battery_change = frame['Battery_Change'].to_numpy() if 'Battery_Change' in frame else 0.0
+        columns = np.broadcast_arrays(*flows(generation, frame['Demand'].to_numpy(), battery_change))
+
+        added = 0
+        for timestamp, values in zip(timestamps, np.stack(columns, axis=1).tolist()):
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                self.skipped += 1
+                continue
+            self._add(timestamp, values)
+            added += 1
+        return added
+
+    def _add(self, timestamp, values):
+        totals = self.totals
+        for i, value in enumerate(values):
+            totals[i] += value
+        for window in self.windows.values():
+            entries, sums = window.entries, window.sums
+            entries.append((timestamp, values))
+            for i, value in enumerate(values):
+                sums[i] += value
+            cutoff = timestamp - window.length
+            while entries[0][0] <= cutoff:
+                _, old = entries.popleft()
+                for i, value in enumerate(old):
+                    sums[i] -= value
+        self.last_timestamp = timestamp
+        self.count += 1
+
+    def snapshot(self, window=None):
+        """
+        Current KPIs.
+
+        :param window: Name of a rolling window, ``"total"`` or None for all of them.
+        :returns: KPI dictionary, or a dictionary of them keyed by window name
+                  when ``window`` is None.
+        """
+        if window is None:
+            result = {'total': summarize(self.totals)}
+            result.update((name, summarize(w.sums)) for name, w in self.windows.items())
+            return result
+        if window == 'total':
+            return summarize(self.totals)
+        try:
+            return summarize(self.windows[window].sums)
+        except KeyError:
+            raise ValueError("Unknown KPI window {}, available: total, {}".format(window, ", ".join(self.windows)))
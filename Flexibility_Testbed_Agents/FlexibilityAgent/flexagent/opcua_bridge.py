@@ -0,0 +1,205 @@
+"""
+Batched writes from the Flexagent into the EnergyFlexibility OPC UA server.
+
+Values are staged with :meth:`OpcUaBridge.set` and only sent by
+:meth:`OpcUaBridge.flush`, so every variable is written at most once per
+publishing interval no matter how often it was updated, and all of them
+travel in a single Write request. Browse paths are translated to NodeIds
+once, in one TranslateBrowsePathsToNodeIds request for all new paths, and
+cached together with the variant type of the node.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from opcua import Client, ua
+
+from .address_space import NAMESPACE_URI, ROOT
+
+_log = logging.getLogger(__name__)
+
+CachedNode = namedtuple('CachedNode', ['nodeid', 'variant_type'])
+
+
+class OpcUaBridge(object):
+    """
+    Client side of the EnergyFlexibility address space.
+
+    :param url: Server endpoint, e.g. ``opc.tcp://localhost:4840/freeopcua/server/``.
+    :param namespace_uri: Namespace the EnergyFlexibility nodes live in.
+    :param root: Browse name of the root object below the Objects folder.
+    :param max_batch: Maximum number of nodes per Write request.
+    :param timeout: Client request timeout in seconds.
+    """
+
+    def __init__(self, url, namespace_uri=NAMESPACE_URI, root=ROOT, max_batch=1000, timeout=4):
+        self.url = url
+        self.namespace_uri = namespace_uri
+        self.root = root
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.client = None
+        self.round_trips = 0
+        self._idx = None
+        self._nodes = {}
+        self._pending = {}
+
+    @property
+    def connected(self):
+        return self.client is not None
+
+    @property
+    def pending(self):
+        """Paths staged for the next :meth:`flush`."""
+        return list(self._pending)
+
+    def connect(self):
+        client = Client(self.url, timeout=self.timeout)
+        client.connect()
+        try:
+            self._idx = client.get_namespace_index(self.namespace_uri)
+        except Exception:
+            client.disconnect()
+            raise
+        self.client = client
+        # NodeIds are only valid for the server they came from.
+        self._nodes = {}
+
+    def disconnect(self):
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            finally:
+                self.client = None
+
+    def resolve(self, paths):
+        """
+        Look up the nodes behind browse paths, translating all unknown ones in one request.
+
+        :param paths: Browse paths below the root object, e.g. ``"District/TotalLoad"``.
+        :returns: One :class:`CachedNode` per path, None for paths the server does not have.
+        """
+        missing = [path for path in dict.fromkeys(paths) if path not in self._nodes]
+        if missing:
+            browse_paths = [self._browse_path(path) for path in missing]
+            results = self._request(self.client.uaclient.translate_browsepaths_to_nodeids, browse_paths)
+            found = []
+            for path, result in zip(missing, results):
+                if result.StatusCode.is_good() and result.Targets:
+                    found.append((path, result.Targets[0].TargetId))
+                else:
+                    _log.warning("OPC UA node {}/{} not found: {}".format(self.root, path, result.StatusCode.name))
+                    self._nodes[path] = None
+
+            if found:
+                values = self._request(self.client.uaclient.get_attributes, [nodeid for _, nodeid in found],
+                                       ua.AttributeIds.Value)
+                for (path, nodeid), value in zip(found, values):
+                    self._nodes[path] = CachedNode(nodeid, value.Value.VariantType)
+        return [self._nodes[path] for path in paths]
+
+    def set(self, path, value):
+        """
+        Stage a value for the next flush, replacing any value already staged for the same path.
+
+        Sequences and NumPy arrays are written as array values.
+        """
+        self._pending[path] = value
+
+    def set_many(self, values):
+        """Stage a ``{path: value}`` mapping."""
+        self._pending.update(values)
+
+    def set_series(self, path, frame):
+        """
+        Stage a DataFrame as one array per column below ``path`` plus its
+        ``Start`` and ``Step`` in epoch seconds.
+        """
+        index = frame.index.asi8
+        if len(index):
+            self._pending[path + '/Start'] = index[0] / 1e9
+            self._pending[path + '/Step'] = (index[1] - index[0]) / 1e9 if len(index) > 1 else 0.0
+        for column in frame.columns:
+            self._pending['{}/{}'.format(path, column)] = frame[column].to_numpy(dtype=float)
+
+    def flush(self):
+        """
+        Write every staged value, at most ``max_batch`` nodes per request.
+        If a request fails the values stay staged.
+
+        :returns: Number of nodes written successfully.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        try:
+            return self._write(pending)
+        except Exception:
+            # Keep the values for the next flush unless they were replaced in the meantime
+            pending.update(self._pending)
+            self._pending = pending
+            raise
+
+    def _write(self, pending):
+        paths = list(pending)
+        nodeids = []
+        datavalues = []
+        now = datetime.utcnow()
+        for path, node in zip(paths, self.resolve(paths)):
+            if node is None:
+                continue
+            datavalue = ua.DataValue(_to_variant(pending[path], node.variant_type))
+            datavalue.SourceTimestamp = now
+            nodeids.append(node.nodeid)
+            datavalues.append(datavalue)
+
+        written = 0
+        for start in range(0, len(nodeids), self.max_batch):
+            results = self._request(self.client.uaclient.set_attributes, nodeids[start:start + self.max_batch],
+                                    datavalues[start:start + self.max_batch], ua.AttributeIds.Value)
+            for nodeid, status in zip(nodeids[start:], results):
+                if status.is_good():
+                    written += 1
+                else:
+                    _log.warning("OPC UA write to {} failed: {}".format(nodeid, status.name))
+        return written
+
+    def _browse_path(self, path):
+        browse_path = ua.BrowsePath()
+        browse_path.StartingNode = ua.TwoByteNodeId(ua.ObjectIds.ObjectsFolder)
+        for name in [self.root] + path.split('/'):
+            element = ua.RelativePathElement()
+            element.ReferenceTypeId = ua.TwoByteNodeId(ua.ObjectIds.HierarchicalReferences)
+            element.IsInverse = False
+            element.IncludeSubtypes = True
+            element.TargetName = ua.QualifiedName(name, self._idx)
+            browse_path.RelativePath.Elements.append(element)
+        return browse_path
+
+    def _request(self, method, *args):
+        if self.client is None:
+            raise RuntimeError("OPC UA bridge is not connected")
+        self.round_trips += 1
+        return method(*args)
+
+
+def _to_variant(value, variant_type):
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    elif isinstance(value, np.generic):
+        value = value.item()
+    elif isinstance(value, tuple):
+        value = list(value)
+
+    if variant_type in (ua.VariantType.Double, ua.VariantType.Float):
+        value = [float(v) for v in value] if isinstance(value, list) else float(value)
+    elif variant_type in (ua.VariantType.Int16, ua.VariantType.Int32, ua.VariantType.Int64,
+                          ua.VariantType.UInt16, ua.VariantType.UInt32, ua.VariantType.UInt64):
+        value = [int(v) for v in value] if isinstance(value, list) else int(value)
+    elif variant_type == ua.VariantType.String and not isinstance(value, list):
+        value = str(value)
+    return ua.Variant(value, variant_type)
@@ -18,7 +18,7 @@ setup(
     author="christian caus",
     author_email="christiancaus@gmail.com",
     description="gets data from the microgrid and from the neighborhood agent and performs the flex calculation (self sufficiency + self consumption) and stores data to an opc ua server",
-    install_requires=['volttron'],
+    install_requires=['volttron', 'opcua'],
     packages=packages,
     entry_points={
         'setuptools.installation': [
@@ -0,0 +1,113 @@
+import time
+
+import numpy as np
+import pytest
+
+from flexagent.envelope import FlexibilityEngine, envelopes
+
+
+def battery(name='b1/battery', building='b1', **kwargs):
+    asset = {'name': name, 'building': building, 'type': 'battery', 'capacity': 10.0, 'power': 4.0,
+             'efficiency': 1.0, 'soc': 0.5}
+    asset.update(kwargs)
+    return asset
+
+
+def test_battery_envelope():
+    engine = FlexibilityEngine(horizon=4, step_hours=1.0)
+    engine.update([battery(soc=0.2, min_soc=0.1)])
+    envelope = engine.asset_envelope('b1/battery')
+    # 8 kWh of room at 4 kW, 1 kWh above the minimum
+    np.testing.assert_allclose(envelope.up_power, [4, 4, 4, 4])
+    np.testing.assert_allclose(envelope.down_power, [1, 1, 1, 1])
+    np.testing.assert_allclose(envelope.up_energy, [4, 8, 8, 8])
+    np.testing.assert_allclose(envelope.down_energy, [1, 1, 1, 1])
+
+
+def test_thermal_and_shiftable_envelopes():
+    engine = FlexibilityEngine(horizon=3, step_hours=0.5)
+    engine.update([{'name': 'hp', 'building': 'b1', 'type': 'thermal', 'capacity': 6.0, 'power': 2.0, 'cop': 3.0,
+                    'soc': 0.5, 'demand': [3.0, 6.0, 9.0]},
+                   {'name': 'dishwasher', 'building': 'b1', 'type': 'shiftable', 'load': [0.0, 2.0, 0.0],
+                    'increase': 2.0, 'decrease': 2.0, 'energy': 1.0}])
+    heat_pump = engine.asset_envelope('hp')
+    # Baseline 1, 2 and (limited by the power) 2 kW electric, 1 kWh electric of room either way
+    np.testing.assert_allclose(heat_pump.up_power, [1, 0, 0])
+    np.testing.assert_allclose(heat_pump.down_power, [1, 2, 2])
+    np.testing.assert_allclose(heat_pump.up_energy, [0.5, 0.5, 0.5])
+    np.testing.assert_allclose(heat_pump.down_energy, [0.5, 1, 1])
+
+    load = engine.asset_envelope('dishwasher')
+    np.testing.assert_allclose(load.up_power, [2, 2, 2])
+    np.testing.assert_allclose(load.down_power, [0, 2, 0])
+    np.testing.assert_allclose(load.down_energy, [0, 1, 1])
+
+    total = engine.envelope('b1')
+    np.testing.assert_allclose(total.down_power, heat_pump.down_power + load.down_power)
+
+
+def test_only_changed_assets_are_recomputed():
+    engine = FlexibilityEngine(horizon=8)
+    assets = [battery('b{}/battery'.format(i), 'b{}'.format(i % 3)) for i in range(10)]
+    assert engine.update(assets) == 10
+    assert engine.update(assets) == 0
+    before = engine.envelope()
+
+    assets[4] = battery('b4/battery', 'b1', soc=0.9)
+    assert engine.update(assets) == 1
+    assert engine.computed == 11
+    assert engine.envelope().up_energy[-1] < before.up_energy[-1]
+
+    names, sums = engine.building_envelopes()
+    assert names == ['b0', 'b1', 'b2']
+    np.testing.assert_allclose(sums.sum(axis=0), np.stack(engine.envelope()))
+
+    assert engine.remove(['b0/battery', 'missing']) == 1
+    assert len(engine) == 9
+    np.testing.assert_allclose(engine.asset_envelope('b9/battery').up_power, 4.0)
+    snapshot = engine.snapshot()
+    assert sorted(snapshot['buildings']) == ['b0', 'b1', 'b2']
+    assert len(snapshot['microgrid']['up_power']) == 8
+
+
+def test_invalid_assets_leave_the_engine_untouched():
+    engine = FlexibilityEngine(horizon=4)
+    engine.update([battery()])
+    with pytest.raises(ValueError):
+        engine.update([battery('b2/battery'), {'name': 'x', 'type': 'nuclear'}])
+    with pytest.raises(ValueError):
+        engine.update([{'name': 'x', 'type': 'battery', 'power': 1.0}])
+    with pytest.raises(ValueError):
+        engine.update([{'name': 'x', 'type': 'shiftable', 'load': [1.0, 2.0], 'increase': 1, 'decrease': 1,
+                        'energy': 1}])
+    assert engine.assets == ['b1/battery']
+    with pytest.raises(ValueError):
+        engine.envelope('nowhere')
+
+
+def test_envelopes_never_negative():
+    result = envelopes(np.array([[2.0, 5.0]]), np.array([[3.0, 0.0]]), np.array([[1.0, 6.0]]),
+                       np.array([-1.0]), np.array([4.0]), 1.0)
+    assert (result >= 0).all()
+
+
+@pytest.mark.slow
+def test_hundreds_of_assets_in_milliseconds():
+    rng = np.random.default_rng(0)
+    assets = []
+    for i in range(300):
+        building = 'building_{:04d}'.format(i)
+        assets.append(battery(building + '/battery', building, soc=rng.uniform()))
+        assets.append({'name': building + '/hp', 'building': building, 'type': 'thermal', 'capacity': 20.0,
+                       'power': 5.0, 'cop': 3.0, 'soc': rng.uniform(), 'demand': rng.uniform(0, 12, 96)})
+        assets.append({'name': building + '/load', 'building': building, 'type': 'shiftable',
+                       'load': rng.uniform(0, 3, 96), 'increase': 2.0, 'decrease': 1.0, 'energy': 3.0})
+    engine = FlexibilityEngine()
+    engine.update(assets)
+
+    for asset in assets[::3]:
+        asset['soc'] = rng.uniform()
+    start = time.perf_counter()
+    assert engine.update(assets) == 300
+    engine.snapshot()
+    assert time.perf_counter() - start < 0.1
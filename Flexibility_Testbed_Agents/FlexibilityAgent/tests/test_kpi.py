@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from flexagent.kpi import QUANTITIES, KpiEngine, flows, summarize
+
+
+def make_frame(num_time_points, seed=5):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-01', periods=num_time_points, freq='15min')
+    return pd.DataFrame({'Solar_Generation': rng.uniform(0, 4000, num_time_points),
+                         'Wind_Generation': rng.uniform(0, 2000, num_time_points),
+                         'CHP_Generation': np.full(num_time_points, 1600.0),
+                         'Demand': rng.uniform(3000, 10000, num_time_points),
+                         'Battery_Change': rng.uniform(-500, 500, num_time_points)}, index=index)
+
+
+def batch_kpis(frame):
+    generation = frame['Solar_Generation'] + frame['Wind_Generation'] + frame['CHP_Generation']
+    return summarize([column.sum() for column in flows(generation, frame['Demand'], frame['Battery_Change'])])
+
+
+def test_flows_balance():
+    generated, consumed, self_consumed, self_supplied, exported, imported = flows(
+        [10.0, 2.0, 5.0, 0.0], [4.0, 6.0, 5.0, 3.0], [3.0, -1.0, 0.0, 2.0])
+    np.testing.assert_allclose(self_consumed, [7.0, 2.0, 5.0, 0.0])
+    np.testing.assert_allclose(self_supplied, [4.0, 3.0, 5.0, 0.0])
+    np.testing.assert_allclose(exported, [3.0, 0.0, 0.0, 0.0])
+    # The last interval charges the battery from the grid
+    np.testing.assert_allclose(imported, [0.0, 3.0, 0.0, 5.0])
+
+
+def test_rolling_windows_match_batch():
+    frame = make_frame(96 * 10)
+    engine = KpiEngine()
+    assert engine.add_frame(frame) == len(frame)
+
+    snapshot = engine.snapshot()
+    for window, rows in [('total', len(frame)), ('hour', 4), ('day', 96), ('week', 96 * 7)]:
+        expected = batch_kpis(frame.iloc[-rows:])
+        for name, value in expected.items():
+            assert snapshot[window][name] == pytest.approx(value, rel=1e-9, abs=1e-6), (window, name)
+    assert engine.snapshot('day') == snapshot['day']
+
+
+def test_single_intervals_and_duplicates():
+    engine = KpiEngine(windows={'half_hour': 1800})
+    assert engine.add(0, 10.0, 4.0, 3.0)
+    assert engine.add(900, 2.0, 6.0, -1.0)
+    assert not engine.add(900, 2.0, 6.0, -1.0)
+    assert engine.add(1800, 5.0, 5.0)
+    assert engine.skipped == 1
+
+    # The first interval left the half hour window
+    window = engine.snapshot('half_hour')
+    assert window['generated'] == 7.0
+    assert window['self_sufficiency'] == pytest.approx(8.0 / 11.0)
+    assert engine.snapshot('total')['generated'] == 17.0
+
+    # A republished, overlapping frame only adds the new intervals
+    frame = make_frame(8)
+    engine = KpiEngine()
+    engine.add_frame(frame.iloc[:6])
+    assert engine.add_frame(frame) == 2
+    assert engine.snapshot('total')['consumed'] == pytest.approx(frame['Demand'].sum())
+
+
+def test_overlapping_simulations_add_the_realized_intervals():
+    first = make_frame(96 * 7)
+    second = make_frame(96 * 7, seed=6)
+    start = first.index[0].timestamp()
+    engine = KpiEngine()
+
+    # Two intervals are over, the rest of the week lies ahead
+    assert engine.add_frame(first, now=start + 1800) == 2
+    assert engine.snapshot('week')['consumed'] == pytest.approx(first['Demand'].iloc[:2].sum())
+
+    # A re-simulation of the same week supplies the intervals that ended since
+    assert engine.add_frame(second, now=start + 4000) == 2
+    assert engine.skipped == 2
+    expected = pd.concat([first.iloc[:2], second.iloc[2:4]])
+    assert engine.snapshot('total') == pytest.approx(batch_kpis(expected))
+
+    assert engine.add_frame(second, now=start - 1) == 0
+    assert engine.add_frame(second, now=start + 7 * 86400) == 96 * 7 - 4
+    assert engine.snapshot('hour') == pytest.approx(batch_kpis(second.iloc[-4:]))
+
+
+def test_empty_and_unknown_window():
+    engine = KpiEngine()
+    assert engine.snapshot('week') == dict.fromkeys(QUANTITIES + ('self_sufficiency', 'self_consumption'), 0.0)
+    with pytest.raises(ValueError):
+        engine.snapshot('month')
@@ -0,0 +1,136 @@
+import socket
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('opcua')
+from opcua import Server
+
+from flexagent.address_space import ROOT, SERIES_COLUMNS, build_address_space
+from flexagent.opcua_bridge import OpcUaBridge
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = Server()
+    server.set_endpoint("opc.tcp://127.0.0.1:{}/freeopcua/server/".format(free_port()))
+    build_address_space(server)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def bridge(server):
+    bridge = OpcUaBridge(server.endpoint.geturl())
+    bridge.connect()
+    yield bridge
+    bridge.disconnect()
+
+
+def read(server, path):
+    idx = server.get_namespace_index("http://example.org/energyflexibility")
+    node = server.get_objects_node().get_child(["{}:{}".format(idx, name) for name in [ROOT] + path.split('/')])
+    return node.get_value()
+
+
+def test_batched_write_is_one_round_trip(server, bridge):
+    bridge.set_many({'District/TotalLoad': 1250.5,
+                     'Building/BuildingID': 3,
+                     'Building/DateTime': '2024-01-01T00:00:00',
+                     'Microgrid/SolarGenerator/CurrentGen': np.float64(800)})
+    assert bridge.flush() == 4
+    # One request to translate the paths, one to read their types and one write
+    assert bridge.round_trips == 3
+
+    assert read(server, 'District/TotalLoad') == 1250.5
+    assert read(server, 'Building/BuildingID') == 3
+    assert read(server, 'Building/DateTime') == '2024-01-01T00:00:00'
+    assert read(server, 'Microgrid/SolarGenerator/CurrentGen') == 800.0
+
+    bridge.set('District/TotalLoad', 1.0)
+    bridge.flush()
+    assert bridge.round_trips == 4
+
+
+def test_updates_are_coalesced(server, bridge):
+    for value in range(100):
+        bridge.set('District/TotalLoad', float(value))
+    assert bridge.pending == ['District/TotalLoad']
+    assert bridge.flush() == 1
+    assert read(server, 'District/TotalLoad') == 99.0
+    assert bridge.flush() == 0
+
+
+def test_series_are_written_as_arrays(server, bridge):
+    index = pd.date_range('2024-01-01', periods=96 * 7, freq='15min')
+    frame = pd.DataFrame(np.random.default_rng(0).uniform(0, 1000, (len(index), len(SERIES_COLUMNS))),
+                         index=index, columns=SERIES_COLUMNS)
+
+    bridge.set_series('Microgrid/TimeSeries', frame)
+    assert bridge.flush() == len(SERIES_COLUMNS) + 2
+    assert bridge.round_trips == 3
+
+    np.testing.assert_array_equal(read(server, 'Microgrid/TimeSeries/Demand'), frame['Demand'].values)
+    assert read(server, 'Microgrid/TimeSeries/Start') == index[0].timestamp()
+    assert read(server, 'Microgrid/TimeSeries/Step') == 900.0
+
+
+def test_unknown_paths_are_skipped(server, bridge):
+    bridge.set('District/DoesNotExist', 1.0)
+    bridge.set('District/Loads', 2.0)
+    assert bridge.flush() == 1
+    assert read(server, 'District/Loads') == 2.0
+
+    # Missing nodes are cached as well
+    bridge.set('District/DoesNotExist', 1.0)
+    round_trips = bridge.round_trips
+    assert bridge.flush() == 0
+    assert bridge.round_trips == round_trips
+
+
+def test_max_batch(server):
+    bridge = OpcUaBridge(server.endpoint.geturl(), max_batch=2)
+    bridge.connect()
+    try:
+        bridge.set_many({'Microgrid/BatteryStorage/{}'.format(name): 1.0
+                         for name in ('Capacity', 'InitialEnergy', 'TargetEnergy', 'HoldingDuration', 'EnergyLoss')})
+        assert bridge.flush() == 5
+        assert bridge.round_trips == 2 + 3
+    finally:
+        bridge.disconnect()
+
+
+def test_not_connected():
+    bridge = OpcUaBridge("opc.tcp://127.0.0.1:1/")
+    bridge.set('District/Loads', 1.0)
+    with pytest.raises(RuntimeError):
+        bridge.flush()
+    assert bridge.pending == ['District/Loads']
+
+
+def test_calculate_flex_writes_the_envelope(server, bridge):
+    bridge.set_many({'Microgrid/BatteryStorage/Capacity': 100.0,
+                     'Microgrid/BatteryStorage/InitialEnergy': 40.0,
+                     'Building/FlexibleLoad': 5.0})
+    bridge.flush()
+
+    idx = server.get_namespace_index("http://example.org/energyflexibility")
+    root = server.get_objects_node().get_child(["{}:{}".format(idx, ROOT)])
+    assert bridge.client.get_node(root.nodeid).call_method("{}:calculateFlex".format(idx)) is True
+
+    up_power = read(server, 'Envelope/UpPower')
+    assert len(up_power) == 96
+    assert up_power[0] == pytest.approx(100.0 + 5.0)
+    assert read(server, 'Envelope/DownEnergy')[-1] == pytest.approx(40.0 + 5.0)
+    assert read(server, 'Envelope/Step') == 900.0
+    assert read(server, 'Flexibility') == pytest.approx(up_power[0] + 100.0 + 5.0)
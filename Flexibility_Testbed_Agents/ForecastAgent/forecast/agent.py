@@ -0,0 +1,309 @@
+"""
+Agent documentation goes here.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+import sys
+from datetime import datetime
+
+import numpy as np
+import pytz
+from volttron.platform.agent import utils
+from volttron.platform.messaging import headers as headers_mod
+from volttron.platform.messaging.timeseries import encode, is_timeseries, iter_readings
+from volttron.platform.vip.agent import Agent, Core, RPC
+
+from .history import LoadHistory
+from .models import ModelCache, get_model
+
+_log = logging.getLogger(__name__)
+utils.setup_logging()
+__version__ = "0.1"
+
+TOTAL = 'total'
+
+
+def forecast(config_path, **kwargs):
+    """
+    Parses the Agent configuration and returns an instance of
+    the agent created using that configuration.
+
+    :param config_path: Path to a configuration file.
+    :type config_path: str
+    :returns: Forecast
+    :rtype: Forecast
+    """
+    try:
+        config = utils.load_config(config_path)
+    except Exception:
+        config = {}
+
+    if not config:
+        _log.info("Using Agent defaults for starting configuration.")
+
+    setting1 = config.get('setting1', "devices/neighborhood/fleet")
+    setting2 = config.get('setting2', "energyConsumption")
+    setting3 = config.get('setting3', "forecast/load")
+    setting4 = float(config.get('setting4', 900))
+    setting5 = int(config.get('setting5', 672))
+    setting6 = config.get('setting6', "seasonal_naive")
+    setting7 = config.get('setting7', {})
+    setting8 = float(config.get('setting8', 3600))
+    setting9 = float(config.get('setting9', 900))
+    setting10 = int(config.get('setting10', 4 * 672))
+
+    return Forecast(setting1, setting2, setting3, setting4, setting5, setting6, setting7, setting8, setting9,
+                    setting10, **kwargs)
+
+
+class Forecast(Agent):
+    """
+    Forecasts the load of every building and of the whole neighborhood.
+
+    Building readings are collected into a :class:`~forecast.history.LoadHistory`.
+    Every setting9 seconds the configured model (see :mod:`forecast.models`)
+    forecasts all buildings at once and the forecast is published as a
+    columnar time series with one column per building and a ``total`` column.
+    Fitted models are reused until they are setting8 seconds old.
+    """
+
+    def __init__(self, setting1="devices/neighborhood/fleet", setting2="energyConsumption",
+                 setting3="forecast/load", setting4=900, setting5=672, setting6="seasonal_naive", setting7=None,
+                 setting8=3600, setting9=900, setting10=4 * 672, **kwargs):
+        super(Forecast, self).__init__(**kwargs)
+        _log.debug("vip_identity: " + self.core.identity)
+
+        self.setting1 = setting1
+        self.setting2 = setting2
+        self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        self.setting7 = setting7 or {}
+        self.setting8 = setting8
+        self.setting9 = setting9
+        self.setting10 = setting10
+
+        self.default_config = {"setting1": setting1,
+                               "setting2": setting2,
+                               "setting3": setting3,
+                               "setting4": setting4,
+                               "setting5": setting5,
+                               "setting6": setting6,
+                               "setting7": setting7 or {},
+                               "setting8": setting8,
+                               "setting9": setting9,
+                               "setting10": setting10}
+
+        self.history = LoadHistory(setting4, setting10)
+        self.models = ModelCache(setting8)
+        self.publish_greenlet = None
+        self.last_forecast = None
+
+        # Set a default configuration to ensure that self.configure is called immediately to setup
+        # the agent.
+        self.vip.config.set_default("config", self.default_config)
+        # Hook self.configure up to changes to the configuration file "config".
+        self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"], pattern="config")
+
+    def configure(self, config_name, action, contents):
+        """
+        Called after the Agent has connected to the message bus. If a configuration exists at startup
+        this will be called before onstart.
+
+        Is called every time the configuration in the store changes.
+        """
+        config = self.default_config.copy()
+        config.update(contents)
+
+        _log.debug("Configuring Agent")
+
+        try:
+            setting1 = str(config["setting1"])
+            setting2 = str(config["setting2"])
+            setting3 = str(config["setting3"])
+            setting4 = float(config["setting4"])
+            setting5 = int(config["setting5"])
+            setting6 = str(config["setting6"])
+            setting7 = dict(config["setting7"])
+            setting8 = float(config["setting8"])
+            setting9 = float(config["setting9"])
+            setting10 = int(config["setting10"])
+            model = get_model(setting6, **setting7)
+            if setting10 < model.min_history:
+                raise ValueError("{} needs a history of at least {} steps".format(model, model.min_history))
+            if setting5 <= 0 or setting9 <= 0:
+                raise ValueError("Horizon and publish interval must be positive")
+        except (ValueError, TypeError) as e:
+            _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
+            return
+
+        if (setting4, setting10) != (self.history.step, self.history.capacity):
+            self.history = LoadHistory(setting4, setting10)
+        self.models = ModelCache(setting8)
+
+        self.setting1 = setting1
+        self.setting2 = setting2
+        self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        self.setting7 = setting7
+        self.setting8 = setting8
+        self.setting9 = setting9
+        self.setting10 = setting10
+
+        if self.publish_greenlet is not None:
+            self.publish_greenlet.kill()
+        self.publish_greenlet = self.core.periodic(self.setting9, self._publish_forecast, wait=self.setting9)
+
+        self._create_subscriptions(self.setting1)
+
+    def _create_subscriptions(self, topic):
+        """
+        Unsubscribe from all pub/sub topics and create a subscription to a topic in the configuration which triggers
+        the _handle_publish callback
+        """
+        self.vip.pubsub.unsubscribe("pubsub", None, None)
+
+        self.vip.pubsub.subscribe(peer='pubsub',
+                                  prefix=topic,
+                                  callback=self._handle_publish)
+
+    def _handle_publish(self, peer, sender, bus, topic, headers, message):
+        """
+        Callback triggered by the subscription setup using the topic from the agent's config file
+
+        The building is the topic below setting1, without a trailing "all". Columnar time-series messages add one
+        reading per row.
+        """
+        building = self._get_building(topic)
+        if is_timeseries(message):
+            try:
+                for column, readings in iter_readings(message):
+                    if column == self.setting2:
+                        self.history.add_many(building,
+                                              [utils.get_utc_seconds_from_epoch(ts) for ts, _ in readings],
+                                              [value for _, value in readings])
+            except (ValueError, KeyError, TypeError) as e:
+                _log.error("Bad time-series payload on {}: {}".format(topic, e))
+            return
+
+        value = self._get_value(message)
+        if value is None:
+            _log.warning("No {} value in message from {}".format(self.setting2, topic))
+            return
+        if not self.history.add(building, self._get_timestamp(headers), value):
+            _log.warning("Dropping reading older than the history from {}".format(topic))
+
+    def _get_building(self, topic):
+        building = topic[len(self.setting1):].strip('/')
+        if building.endswith('/all') or building == 'all':
+            building = building[:-3].rstrip('/')
+        return building or topic
+
+    def _get_value(self, message):
+        """
+        Extract the configured point from a building message, a device "all" message or a bare number.
+        """
+        if isinstance(message, list) and message:
+            message = message[0]
+        if isinstance(message, dict):
+            message = message.get(self.setting2)
+        try:
+            return float(message)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _get_timestamp(headers):
+        """
+        Seconds since the epoch from the message Date header, or now if it is missing.
+        """
+        date = headers.get(headers_mod.DATE) if headers else None
+        if date:
+            try:
+                return utils.get_utc_seconds_from_epoch(utils.parse_timestamp_string(date))
+            except (TypeError, ValueError):
+                _log.warning("Invalid {} header: {}".format(headers_mod.DATE, date))
+        return utils.get_utc_seconds_from_epoch(utils.get_aware_utc_now())
+
+    def _publish_forecast(self):
+        """
+        Forecast all buildings from the step after the latest reading and publish the forecast.
+        """
+        names, loads, end = self.history.matrix()
+        if not names:
+            return
+        now = utils.get_utc_seconds_from_epoch(utils.get_aware_utc_now())
+        try:
+            model = self.models.get(self.setting6, loads, end, now, **self.setting7)
+        except ValueError as e:
+            _log.error("Fitting {} failed: {}".format(self.setting6, e))
+            return
+        forecast = model.predict(end, self.setting5)
+        values = np.concatenate([forecast, forecast.sum(axis=0, keepdims=True)])
+        message = encode(values, names + [TOTAL], start=end * self.history.step, step=self.history.step)
+
+        timestamp = utils.format_timestamp(datetime.fromtimestamp(now, pytz.utc))
+        headers = {headers_mod.DATE: timestamp, headers_mod.TIMESTAMP: timestamp}
+        self.vip.pubsub.publish('pubsub', self.setting3, headers=headers, message=message)
+        self.last_forecast = message
+
+    @Core.receiver("onstart")
+    def onstart(self, sender, **kwargs):
+        """
+        This is method is called once the Agent has successfully connected to the platform.
+        This is a good place to setup subscriptions if they are not dynamic or
+        do any other startup activities that require a connection to the message bus.
+        Called after any configurations methods that are called at startup.
+
+        Usually not needed if using the configuration store.
+        """
+        pass
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        """
+        This method is called when the Agent is about to shutdown, but before it disconnects from
+        the message bus.
+        """
+        if self.publish_greenlet is not None:
+            self.publish_greenlet.kill()
+
+    @RPC.export
+    def get_forecast(self):
+        """
+        RPC method
+
+        The latest published forecast as a columnar time-series payload, None before the first one.
+        """
+        return self.last_forecast
+
+    @RPC.export
+    def get_metrics(self):
+        """
+        RPC method
+
+        Number of buildings, dropped readings and model fits.
+        """
+        return {"buildings": len(self.history),
+                "late": self.history.late,
+                "fits": self.models.fits,
+                "cached": self.models.hits}
+
+
+def main():
+    """Main method called to start the agent."""
+    utils.vip_main(forecast,
+                   version=__version__)
+
+
+if __name__ == '__main__':
+    # Entry point for script
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,121 @@
+"""
+Load history of many buildings on a common step grid.
+
+Readings are averaged per building and step into a ring buffer of
+``capacity`` steps, one row per building. Steps without a reading are NaN.
+Rows are added as buildings show up, so the fleet does not have to be
+known in advance.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import numpy as np
+
+
+class LoadHistory(object):
+    """
+    Ring buffer of per step mean loads.
+
+    :param step: Step length in seconds.
+    :param capacity: Number of steps kept.
+    """
+
+    def __init__(self, step=900, capacity=4 * 672):
+        self.step = float(step)
+        self.capacity = int(capacity)
+        if self.step <= 0 or self.capacity <= 0:
+            raise ValueError("step and capacity must be positive")
+        self.buildings = []
+        self.late = 0
+        self.end = None
+        self._index = {}
+        self._sums = np.zeros((0, self.capacity))
+        self._counts = np.zeros((0, self.capacity), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.buildings)
+
+    def add(self, building, timestamp, value):
+        """
+        Add one reading.
+
+        :param timestamp: Reading time in seconds since the epoch.
+        :returns: False if the reading is older than the buffer and was dropped.
+        """
+        step = int(timestamp // self.step)
+        if not self._advance(step):
+            self.late += 1
+            return False
+        row = self._row(building)
+        column = step % self.capacity
+        self._sums[row, column] += value
+        self._counts[row, column] += 1
+        return True
+
+    def add_many(self, building, timestamps, values):
+        """
+        Add a series of readings of one building.
+
+        :returns: Number of readings added.
+        """
+        steps = (np.asarray(timestamps, dtype=np.float64) // self.step).astype(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(steps):
+            return 0
+        self._advance(int(steps.max()))
+        keep = steps >= self.end - self.capacity
+        self.late += int((~keep).sum())
+        if not keep.any():
+            return 0
+        # Only buildings with an accepted reading get a row
+        row = self._row(building)
+        columns = steps[keep] % self.capacity
+        np.add.at(self._sums[row], columns, values[keep])
+        np.add.at(self._counts[row], columns, 1)
+        return int(keep.sum())
+
+    def _row(self, building):
+        row = self._index.get(building)
+        if row is None:
+            row = len(self.buildings)
+            if row == len(self._sums):
+                size = max(2 * row, 16)
+                self._sums = np.concatenate([self._sums, np.zeros((size - row, self.capacity))])
+                self._counts = np.concatenate([self._counts,
+                                               np.zeros((size - row, self.capacity), dtype=np.int32)])
+            self.buildings.append(building)
+            self._index[building] = row
+        return row
+
+    def _advance(self, step):
+        """Move the end of the buffer past ``step``, clearing the reused columns."""
+        if self.end is None:
+            self.end = step + 1
+            return True
+        if step >= self.end:
+            cleared = np.arange(self.end, min(step + 1, self.end + self.capacity)) % self.capacity
+            self._sums[:, cleared] = 0.0
+            self._counts[:, cleared] = 0
+            self.end = step + 1
+            return True
+        return step >= self.end - self.capacity
+
+    def matrix(self, steps=None):
+        """
+        Mean loads of the last ``steps`` steps, oldest first.
+
+        :param steps: Number of steps, the whole buffer by default.
+        :returns: Building names, loads of shape ``(buildings, steps)`` with NaN where missing and the absolute
+                  step following the last column.
+        :rtype: tuple
+        """
+        steps = self.capacity if steps is None else min(int(steps), self.capacity)
+        num_buildings = len(self.buildings)
+        if self.end is None:
+            return [], np.zeros((0, steps)), 0
+        columns = np.arange(self.end - steps, self.end) % self.capacity
+        sums = self._sums[:num_buildings, columns]
+        counts = self._counts[:num_buildings, columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            loads = np.where(counts > 0, sums / counts, np.nan)
+        return list(self.buildings), loads, self.end
@@ -0,0 +1,243 @@
+"""
+Batch load forecasting models.
+
+Every model is fitted on a ``(buildings, steps)`` history matrix at once
+and predicts a ``(buildings, horizon)`` matrix, so the cost of a refresh is a
+few matrix operations no matter how many buildings there are. Time is
+counted in absolute steps (seconds since the epoch divided by the step
+length), which keeps the daily and weekly phase of a model independent of
+when it was fitted: a model fitted an hour ago predicts from the current
+step as well as a fresh one.
+
+Missing readings in the history are NaN.
+
+Models are registered by name so agent configurations can select them::
+
+    model = get_model('regression', periods=(96, 672), harmonics=4)
+"""
+
+__docformat__ = 'reStructuredText'
+
+import numpy as np
+
+MODELS = {}
+
+
+def register_model(cls):
+    """Class decorator adding a model to :data:`MODELS` under its ``name``."""
+    MODELS[cls.name] = cls
+    return cls
+
+
+def get_model(model, **params):
+    """
+    Look up and instantiate a model.
+
+    :param model: Registered model name.
+    :param params: Model parameters.
+    :rtype: BaseModel
+    """
+    try:
+        cls = MODELS[model]
+    except KeyError:
+        raise ValueError("Invalid forecast model {!r}. Choose one of {}.".format(model, sorted(MODELS)))
+    return cls(**params)
+
+
+def _fill_missing(history):
+    """Replace NaN readings by the mean of the building, or zero for buildings without any reading."""
+    missing = np.isnan(history)
+    if not missing.any():
+        return history
+    counts = (~missing).sum(axis=1)
+    means = np.where(counts > 0, np.nansum(history, axis=1) / np.maximum(counts, 1), 0.0)
+    return np.where(missing, means[:, None], history)
+
+
+class BaseModel(object):
+    """
+    Base class for forecast models.
+
+    Subclasses set ``name`` and implement :meth:`fit` and :meth:`predict`.
+    """
+    name = None
+
+    #: Shortest history the model can be fitted on, in steps.
+    min_history = 1
+
+    def fit(self, history, end):
+        """
+        Fit the model for all buildings.
+
+        :param history: Readings, shape ``(buildings, steps)``, NaN where missing.
+        :param end: Absolute step following the last column of the history.
+        :returns: The model itself.
+        """
+        raise NotImplementedError()
+
+    def predict(self, start, horizon):
+        """
+        Forecast all buildings.
+
+        :param start: Absolute step of the first forecast value.
+        :param horizon: Number of steps.
+        :returns: Forecast, shape ``(buildings, horizon)``, never negative.
+        :rtype: numpy.ndarray
+        """
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__,
+                               ", ".join("{}={!r}".format(k, v) for k, v in sorted(vars(self).items())
+                                         if not k.startswith('_')))
+
+
+@register_model
+class SeasonalNaive(BaseModel):
+    """
+    Repeat the last season.
+
+    With ``seasons`` above one the profile is the mean of that many past
+    seasons, which smooths out a single unusual day or week.
+
+    :param season: Season length in steps, a week of 15 minute steps by default.
+    :param seasons: Number of past seasons averaged.
+    """
+    name = 'seasonal_naive'
+
+    def __init__(self, season=672, seasons=1):
+        self.season = int(season)
+        self.seasons = int(seasons)
+        if self.season < 1 or self.seasons < 1:
+            raise ValueError("season and seasons must be positive")
+        self._profile = None
+
+    @property
+    def min_history(self):
+        return self.season * self.seasons
+
+    def fit(self, history, end):
+        history = np.asarray(history, dtype=np.float64)
+        length = self.season * self.seasons
+        if history.shape[1] < length:
+            raise ValueError("{} needs {} steps of history, got {}".format(self.name, length, history.shape[1]))
+        block = history[:, -length:].reshape(len(history), self.seasons, self.season)
+        counts = (~np.isnan(block)).sum(axis=1)
+        profile = np.where(counts > 0, np.nansum(block, axis=1) / np.maximum(counts, 1), np.nan)
+        profile = _fill_missing(profile)
+        # Column j of the block is absolute step end - length + j, store the profile by phase
+        self._profile = np.roll(profile, (end - length) % self.season, axis=1)
+        return self
+
+    def predict(self, start, horizon):
+        if self._profile is None:
+            raise ValueError("Model is not fitted")
+        phase = (start + np.arange(horizon)) % self.season
+        return np.clip(self._profile[:, phase], 0.0, None)
+
+
+@register_model
+class FourierRegression(BaseModel):
+    """
+    Least squares fit of a level, a linear trend and daily and weekly harmonics.
+
+    All buildings share the design matrix, so the fit is one least squares
+    solve with a right hand side per building.
+
+    :param periods: Season lengths in steps.
+    :param harmonics: Number of sine and cosine pairs per period.
+    :param trend: Fit a linear trend as well.
+    """
+    name = 'regression'
+
+    def __init__(self, periods=(96, 672), harmonics=3, trend=False):
+        self.periods = tuple(int(period) for period in periods)
+        self.harmonics = int(harmonics)
+        self.trend = bool(trend)
+        self._coefficients = None
+        self._origin = 0
+        self._scale = 1.0
+
+    @property
+    def min_history(self):
+        return 2 * (1 + self.trend + 2 * self.harmonics * len(self.periods))
+
+    def features(self, steps):
+        """
+        Design matrix of absolute steps.
+
+        :rtype: numpy.ndarray
+        """
+        steps = np.asarray(steps)
+        columns = [np.ones(len(steps))]
+        if self.trend:
+            columns.append((steps - self._origin) / self._scale)
+        for period in self.periods:
+            # Integer phase first so large absolute steps keep their precision
+            angle = 2 * np.pi * (steps % period) / period
+            for harmonic in range(1, self.harmonics + 1):
+                columns.append(np.sin(harmonic * angle))
+                columns.append(np.cos(harmonic * angle))
+        return np.stack(columns, axis=1)
+
+    def fit(self, history, end):
+        history = _fill_missing(np.asarray(history, dtype=np.float64))
+        num_steps = history.shape[1]
+        if num_steps < self.min_history:
+            raise ValueError("{} needs {} steps of history, got {}".format(self.name, self.min_history, num_steps))
+        steps = np.arange(end - num_steps, end)
+        self._origin = end - num_steps
+        self._scale = float(num_steps)
+        self._coefficients = np.linalg.lstsq(self.features(steps), history.T, rcond=None)[0]
+        return self
+
+    def predict(self, start, horizon):
+        if self._coefficients is None:
+            raise ValueError("Model is not fitted")
+        forecast = self.features(np.arange(start, start + horizon)) @ self._coefficients
+        return np.clip(forecast.T, 0.0, None)
+
+
+class ModelCache(object):
+    """
+    Fitted models, refitted once they are older than the refit interval.
+
+    A model is also refitted when the number of buildings in the history
+    changed, otherwise :meth:`get` returns the cached model without looking
+    at the history.
+
+    :param refit_interval: Seconds a fitted model is used for.
+    """
+
+    def __init__(self, refit_interval=3600):
+        self.refit_interval = float(refit_interval)
+        self.fits = 0
+        self.hits = 0
+        self._models = {}
+
+    def get(self, name, history, end, now, **params):
+        """
+        Fitted model for a history.
+
+        :param name: Registered model name.
+        :param history: Readings, shape ``(buildings, steps)``.
+        :param end: Absolute step following the last column of the history.
+        :param now: Current time in seconds.
+        :param params: Model parameters.
+        :rtype: BaseModel
+        """
+        key = (name, tuple(sorted((k, repr(v)) for k, v in params.items())))
+        cached = self._models.get(key)
+        if cached is not None:
+            model, fitted_at, num_buildings = cached
+            if now - fitted_at < self.refit_interval and num_buildings == len(history):
+                self.hits += 1
+                return model
+        model = get_model(name, **params).fit(history, end)
+        self._models[key] = (model, now, len(history))
+        self.fits += 1
+        return model
+
+    def invalidate(self):
+        """Refit every model on the next call."""
+        self._models.clear()
@@ -0,0 +1,27 @@
+from setuptools import setup, find_packages
+
+MAIN_MODULE = 'agent'
+
+# Find the agent package that contains the main module
+packages = find_packages('.')
+agent_package = 'forecast'
+
+# Find the version number from the main module
+agent_module = agent_package + '.' + MAIN_MODULE
+_temp = __import__(agent_module, globals(), locals(), ['__version__'], 0)
+__version__ = _temp.__version__
+
+# Setup
+setup(
+    name=agent_package + 'agent',
+    version=__version__,
+    author="christian caus",
+    description="Agent that forecasts the load of every building and of the whole neighborhood for the microgrid dispatch.",
+    install_requires=['volttron', 'numpy'],
+    packages=packages,
+    entry_points={
+        'setuptools.installation': [
+            'eggsecutable = ' + agent_module + ':main',
+        ]
+    }
+)
\ No newline at end of file
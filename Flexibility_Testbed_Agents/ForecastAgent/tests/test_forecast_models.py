@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+from forecast.history import LoadHistory
+from forecast.models import FourierRegression, ModelCache, SeasonalNaive, get_model
+
+DAY = 96
+WEEK = 7 * DAY
+
+
+def weekly_loads(num_buildings, num_steps, end, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    steps = np.arange(end - num_steps, end)
+    level = rng.uniform(5, 50, (num_buildings, 1))
+    daily = np.sin(2 * np.pi * (steps % DAY) / DAY)
+    weekly = np.cos(2 * np.pi * (steps % WEEK) / WEEK)
+    loads = level * (1 + 0.3 * daily + 0.1 * weekly)
+    return loads + noise * rng.standard_normal(loads.shape)
+
+
+def test_seasonal_naive_repeats_the_season_by_phase():
+    end = 10 * WEEK + 37
+    history = weekly_loads(3, 2 * WEEK, end)
+    model = SeasonalNaive().fit(history, end)
+    np.testing.assert_allclose(model.predict(end, WEEK), history[:, -WEEK:])
+    # Later forecasts from the same model keep the phase
+    np.testing.assert_allclose(model.predict(end + 5, 10), history[:, -WEEK + 5:-WEEK + 15])
+
+    averaged = SeasonalNaive(season=DAY, seasons=2)
+    history[0, -DAY + 3] = np.nan
+    forecast = averaged.fit(history, end).predict(end, DAY)
+    np.testing.assert_allclose(forecast[0, 3], history[0, -2 * DAY + 3])
+    np.testing.assert_allclose(forecast[1], (history[1, -2 * DAY:-DAY] + history[1, -DAY:]) / 2)
+
+
+def test_regression_recovers_seasonal_loads():
+    end = 2000 * WEEK
+    history = weekly_loads(50, 4 * WEEK, end, noise=0.5)
+    model = FourierRegression(harmonics=1).fit(history, end)
+    expected = weekly_loads(50, WEEK, end + WEEK)
+    assert np.abs(model.predict(end, WEEK) - expected).max() < 0.5
+
+    with_trend = FourierRegression(trend=True).fit(history, end)
+    assert with_trend.predict(end, 3).shape == (50, 3)
+
+
+def test_missing_history_and_errors():
+    history = np.full((2, WEEK), np.nan)
+    history[0] = 4.0
+    forecast = get_model('seasonal_naive').fit(history, WEEK).predict(WEEK, 4)
+    np.testing.assert_allclose(forecast, [[4.0] * 4, [0.0] * 4])
+
+    with pytest.raises(ValueError):
+        get_model('prophet')
+    with pytest.raises(ValueError):
+        SeasonalNaive().fit(np.ones((1, 10)), 10)
+    with pytest.raises(ValueError):
+        FourierRegression().predict(0, 1)
+
+
+def test_model_cache_refits_when_stale():
+    cache = ModelCache(refit_interval=60)
+    history = weekly_loads(4, WEEK, WEEK)
+    first = cache.get('seasonal_naive', history, WEEK, now=0)
+    assert cache.get('seasonal_naive', history, WEEK, now=59) is first
+    assert cache.get('seasonal_naive', history, WEEK, now=60) is not first
+    cache.get('seasonal_naive', weekly_loads(5, WEEK, WEEK), WEEK, now=61)
+    cache.get('seasonal_naive', history, WEEK, now=61, seasons=1)
+    assert (cache.fits, cache.hits) == (4, 1)
+
+
+def test_history_buffer():
+    history = LoadHistory(step=900, capacity=4)
+    assert history.add('b1', 0, 1.0)
+    assert history.add('b1', 100, 3.0)
+    assert history.add('b2', 1800, 5.0)
+    names, loads, end = history.matrix()
+    assert names == ['b1', 'b2'] and end == 3
+    np.testing.assert_array_equal(loads[:, -3:], [[2.0, np.nan, np.nan], [np.nan, np.nan, 5.0]])
+
+    # Moving past the capacity clears the reused steps
+    assert history.add_many('b1', [4 * 900, 5 * 900, 0], [7.0, 8.0, 9.0]) == 2
+    assert history.late == 1
+    assert not history.add('b2', 900, 1.0)
+    names, loads, end = history.matrix(3)
+    assert end == 6
+    np.testing.assert_array_equal(loads, [[np.nan, 7.0, 8.0], [np.nan, np.nan, np.nan]])
+
+    # Late readings of new buildings do not add empty rows
+    assert not history.add('b3', 0, 1.0)
+    assert history.add_many('b4', [0, 900], [1.0, 2.0]) == 0
+    assert len(history) == 2 and history.late == 5
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('name', ['seasonal_naive', 'regression'])
+def test_thousand_buildings_in_a_second(name):
+    end = 3000 * WEEK
+    history = weekly_loads(1000, 4 * WEEK, end, noise=1.0)
+    start = time.perf_counter()
+    forecast = get_model(name).fit(history, end).predict(end, WEEK)
+    forecast.sum(axis=0)
+    assert forecast.shape == (1000, WEEK)
+    assert time.perf_counter() - start < 1.0
@@ -7,15 +7,31 @@ __docformat__ = 'reStructuredText'
 import logging
 import sys
 from volttron.platform.agent import utils
+from volttron.platform.messaging import headers as headers_mod
+from volttron.platform.messaging.timeseries import decode, encode_frame, is_timeseries
 from volttron.platform.vip.agent import Agent, Core, RPC
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from .cache import SimulationCache
+from .dispatch import simulate
+from .generation import chp_profile, solar_profile, wind_profile
+from .optimizer import MpcDispatcher
+from .pv import PvModel
+from .strategies import get_strategy
+
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
 
+# Step length in seconds of the time resolutions run_simulation supports
+RESOLUTIONS = {3600: 'hourly', 900: '15-min'}
+
+# Seconds between weather forecast requests and hours requested for the PV model
+WEATHER_INTERVAL = 3600
+WEATHER_HOURS = 24 * 7
+
 
 def microgrid(config_path, **kwargs):
     """
@@ -49,31 +65,24 @@ def microgrid(config_path, **kwargs):
     setting12 = bool(config.get('setting12'))
     setting13 = bool(config.get('setting13'))
     setting14 = bool(config.get('setting14'))
+    setting15 = config.get('setting15', 'default')
+    setting16 = config.get('setting16', {})
+    setting17 = config.get('setting17', 'rule')
+    setting18 = config.get('setting18', {})
+    setting19 = int(config.get('setting19', 32))
+    setting20 = config.get('setting20')
+    setting21 = config.get('setting21')
+    setting22 = config.get('setting22', {})
 
     return Microgrid(setting1, setting2, setting3, setting4, setting5, setting6, setting7, setting8, setting9,
-                     setting10, setting11, setting12, setting13, setting14, **kwargs)
-
-
-def simulate_wind_generation(time_steps, wind_capacity):
-    np.random.seed(0)
-    wind_generation = wind_capacity * np.abs(np.random.randn(len(time_steps)))
-    return wind_generation
-
-
-def simulate_solar_generation(time_steps, solar_capacity):
-    solar_generation = []
-    for time in time_steps:
-        hour = time.hour
-        if 6 <= hour <= 18:  # Annahme, dass Solarstromerzeugung nur von 6 Uhr bis 18 Uhr erfolgt
-            solar_gen = solar_capacity * np.sin((hour - 6) * np.pi / 12)
-        else:
-            solar_gen = 0
-        solar_generation.append(solar_gen)
-    return np.array(solar_generation)
+                     setting10, setting11, setting12, setting13, setting14, setting15, setting16, setting17,
+                     setting18, setting19, setting20, setting21, setting22, **kwargs)
 
 
 def run_simulation(num_time_points, time_resolution, solar_capacity, wind_capacity, chp_capacity, battery_capacity,
-                   battery_efficiency, demand_series, use_solar=True, use_wind=True, use_chp=True):
+                   battery_efficiency, demand_series, use_solar=True, use_wind=True, use_chp=True,
+                   thermal_storage_capacity=0, thermal_storage_efficiency=1.0, thermal_demand=None,
+                   battery_mode='default', strategy_params=None, optimizer=None, cache=None, pv=None, start=None):
     if time_resolution == 'hourly':
         freq = 'H'
     elif time_resolution == '15-min':
@@ -81,80 +90,49 @@ def run_simulation(num_time_points, time_resolution, solar_capacity, wind_capaci
     else:
         raise ValueError("Invalid time_resolution. Choose 'hourly' or '15-min'.")
 
-    time_steps = pd.date_range(start=pd.Timestamp.now().normalize(), periods=num_time_points, freq=freq)
+    # Forecasts bring their own start, anything else is simulated from today's midnight
+    if start is None:
+        start = pd.Timestamp.now().normalize()
+    time_steps = pd.date_range(start=start, periods=num_time_points, freq=freq)
 
     # Initialisierung der Erzeugungsdaten
-    if use_solar:
-        solar_generation = simulate_solar_generation(time_steps, solar_capacity)
+    if use_solar and pv is not None:
+        # Forecast driven output of a PvModel, in units of its capacity
+        solar_generation = solar_capacity * pv.profile(time_steps)
+    elif use_solar:
+        solar_generation = solar_profile(time_steps, solar_capacity)
     else:
         solar_generation = np.zeros(len(time_steps))
 
     if use_wind:
-        wind_generation = simulate_wind_generation(time_steps, wind_capacity)
+        wind_generation = wind_profile(time_steps, wind_capacity)
     else:
         wind_generation = np.zeros(len(time_steps))
 
     if use_chp:
-        chp_generation = np.full(len(time_steps), chp_capacity)
+        chp_generation = chp_profile(time_steps, chp_capacity)
     else:
         chp_generation = np.zeros(len(time_steps))
 
     if len(demand_series) != len(time_steps):
         raise ValueError("Length of demand_series must match the number of time steps.")
 
-    df = pd.DataFrame({
-        'Solar_Generation': solar_generation,
-        'Wind_Generation': wind_generation,
-        'CHP_Generation': chp_generation,
-        'Demand': demand_series
-    }, index=time_steps)
-    df['Total_Generation'] = df['Solar_Generation'] + df['Wind_Generation'] + df['CHP_Generation']
-
-    df['Battery_Storage'] = 0
-    df['Battery_Change'] = 0
-
-    battery_storage = 0
-    thermal_storage = 0
-    generation_off = False
-
-    for j, i in enumerate(df.index):
-        net_generation = df.at[i, 'Total_Generation']
-        net_demand = df.at[i, 'Demand']
-
-        if generation_off:
-            net_generation = 0
-
-        # Aktualisierung der Batteriekapazität
-        if net_generation > net_demand:
-            excess_energy = net_generation - net_demand
-            charge = min(excess_energy * battery_efficiency, battery_capacity - battery_storage)
-            battery_storage += charge
-            df.at[i, 'Battery_Change'] = charge
-        else:
-            energy_deficit = net_demand - net_generation
-            discharge = min(energy_deficit, battery_storage)
-            battery_storage -= discharge
-            df.at[i, 'Battery_Change'] = -discharge
-
-        df.at[i, 'Battery_Storage'] = battery_storage
-
-        # Steuerung der Erzeugung basierend auf dem Batteriekapazitätsniveau
-        if battery_storage >= battery_capacity:
-            generation_off = True
-        elif battery_storage <= 0:
-            generation_off = False
-
-        if generation_off:
-            df.at[i, 'Solar_Generation'] = 0
-            df.at[i, 'Wind_Generation'] = 0
-            df.at[i, 'CHP_Generation'] = 0
-        else:
-            if use_solar:
-                df.at[i, 'Solar_Generation'] = solar_generation[j]
-            if use_wind:
-                df.at[i, 'Wind_Generation'] = wind_generation[j]
-            if use_chp:
-                df.at[i, 'CHP_Generation'] = chp_capacity
+    if optimizer is not None:
+        # The CHP runs as scheduled, up to its capacity, instead of following a fixed profile. The LP
+        # replaces battery_mode and strategy_params, and it is not cached: every re-solve starts from
+        # the storage the previous one planned for this horizon's start.
+        initial_storage, initial_thermal_storage = optimizer.planned_storage(time_steps[0])
+        return optimizer.dispatch_frame(time_steps, solar_generation, wind_generation, demand_series,
+                                        thermal_demand=thermal_demand, initial_storage=initial_storage,
+                                        initial_thermal_storage=initial_thermal_storage)
+
+    # Generation is switched off while the battery is full and back on once it is empty
+    simulator = simulate if cache is None else cache.simulate
+    df = simulator(time_steps, solar_generation, wind_generation, chp_generation, demand_series,
+                   battery_capacity, battery_efficiency, thermal_demand=thermal_demand,
+                   thermal_storage_capacity=thermal_storage_capacity,
+                   thermal_storage_efficiency=thermal_storage_efficiency, battery_mode=battery_mode,
+                   curtail_when_full=True, **(strategy_params or {}))
     return df
 
     # plt.figure(figsize=(14, 10))
@@ -189,7 +167,9 @@ class Microgrid(Agent):
 
     def __init__(self, setting1=1, setting2="neighborhood/totalEnergy", setting3="microgrid/data", setting4='hourly',
                  setting5=3000, setting6=3000, setting7=3000, setting8=10000, setting9=0.9, setting10=5000,
-                 setting11=0.85, setting12="true", setting13="true", setting14="true", **kwargs):
+                 setting11=0.85, setting12="true", setting13="true", setting14="true", setting15="default",
+                 setting16=None, setting17="rule", setting18=None, setting19=32, setting20=None,
+                 setting21=None, setting22=None, **kwargs):
         super(Microgrid, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
@@ -207,6 +187,18 @@ class Microgrid(Agent):
         self.setting12 = setting12
         self.setting13 = setting13
         self.setting14 = setting14
+        self.setting15 = setting15
+        self.setting16 = setting16 or {}
+        self.setting17 = setting17
+        self.setting18 = setting18 or {}
+        self.setting19 = setting19
+        self.setting20 = setting20
+        self.setting21 = setting21
+        self.setting22 = setting22 or {}
+        self.optimizer = None
+        self.cache = None
+        self.pv = None
+        self.weather_greenlet = None
 
         self.default_config = {"setting1": setting1,
                                "setting2": setting2,
@@ -221,7 +213,15 @@ class Microgrid(Agent):
                                "setting11": setting11,
                                "setting12": setting12,
                                "setting13": setting13,
-                               "setting14": setting14}
+                               "setting14": setting14,
+                               "setting15": setting15,
+                               "setting16": setting16 or {},
+                               "setting17": setting17,
+                               "setting18": setting18 or {},
+                               "setting19": setting19,
+                               "setting20": setting20,
+                               "setting21": setting21,
+                               "setting22": setting22 or {}}
 
         self.message_received = 0
         self.num_time_points = 0
@@ -258,7 +258,25 @@ class Microgrid(Agent):
             setting12 = bool(config["setting12"])
             setting13 = bool(config["setting13"])
             setting14 = bool(config["setting14"])
-        except ValueError as e:
+            setting15 = str(config["setting15"])
+            setting16 = dict(config["setting16"])
+            get_strategy(setting15, **setting16)
+            setting17 = str(config["setting17"])
+            setting18 = dict(config["setting18"])
+            optimizer = self._create_optimizer(setting17, setting18, setting7 if setting14 else 0, setting8,
+                                               setting9, setting10, setting11)
+            setting19 = int(config["setting19"])
+            setting20 = config["setting20"]
+            setting20 = str(setting20) if setting20 else None
+            cache = self.cache
+            if cache is None or (setting19, setting20) != (self.setting19, self.setting20):
+                # Results stay valid across reconfigurations, the parameters are part of the key
+                cache = SimulationCache(setting19, setting20) if setting19 > 0 else None
+            setting21 = config["setting21"]
+            setting21 = str(setting21) if setting21 else None
+            setting22 = dict(config["setting22"])
+            pv = self._create_pv(setting21, setting22)
+        except (ValueError, TypeError, OSError) as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
@@ -276,9 +294,79 @@ class Microgrid(Agent):
         self.setting12 = setting12
         self.setting13 = setting13
         self.setting14 = setting14
+        self.setting15 = setting15
+        self.setting16 = setting16
+        self.setting17 = setting17
+        self.setting18 = setting18
+        self.optimizer = optimizer
+        if self.cache is not None and self.cache is not cache:
+            # Finish the writes of the replaced cache
+            self.cache.close()
+        self.cache = cache
+        self.setting19 = setting19
+        self.setting20 = setting20
+        self.setting21 = setting21
+        self.setting22 = setting22
+        self.pv = pv
+
+        if self.weather_greenlet is not None:
+            self.weather_greenlet.kill()
+            self.weather_greenlet = None
+        if self.pv is not None:
+            self.weather_greenlet = self.core.periodic(WEATHER_INTERVAL, self._update_weather)
 
         self._create_subscriptions(self.setting2)
 
+    def _create_optimizer(self, mode, params, chp_capacity, battery_capacity, battery_efficiency,
+                          thermal_storage_capacity, thermal_storage_efficiency):
+        """
+        Create the LP dispatcher for the "mpc" dispatch mode, None for the rule based dispatch.
+
+        The dispatcher is kept between messages so that the solver can start
+        from its previous solution.
+        """
+        if mode == 'rule':
+            return None
+        if mode != 'mpc':
+            raise ValueError("Invalid dispatch mode {!r}. Choose 'rule' or 'mpc'.".format(mode))
+        return MpcDispatcher(battery_capacity, battery_efficiency, chp_capacity=chp_capacity,
+                             thermal_storage_capacity=thermal_storage_capacity,
+                             thermal_storage_efficiency=thermal_storage_efficiency, **params)
+
+    @staticmethod
+    def _create_pv(identity, location):
+        """
+        Create the PV model of the location, None to use the fixed solar profile.
+
+        The location is passed to the weather agent as it is and also gives the
+        coordinates ("lat" and "long") and an optional time zone ("tz") of the
+        simulated time steps.
+        """
+        if identity is None:
+            return None
+        try:
+            return PvModel(float(location['lat']), float(location['long']), tz=location.get('tz', 'UTC'))
+        except KeyError as e:
+            raise ValueError("Location needs {} for the PV model".format(e))
+
+    def _update_weather(self):
+        """
+        Fetch the hourly forecast for the PV model from the weather agent.
+        """
+        location = {key: value for key, value in self.setting22.items() if key != 'tz'}
+        try:
+            result = self.vip.rpc.call(self.setting21, 'get_hourly_forecast', [location],
+                                       hours=WEATHER_HOURS).get(timeout=30)
+        except Exception as e:
+            _log.warning("Weather forecast from {} failed: {}".format(self.setting21, e))
+            return
+        if not result or 'weather_results' not in result[0]:
+            _log.warning("No weather forecast from {}: {}".format(
+                self.setting21, result[0].get('weather_error') if result else None))
+            return
+        if self.pv.update_forecast(result[0]['weather_results'], result[0].get('generation_time')):
+            _log.debug("New weather forecast from {}".format(self.setting21))
+
     def _create_subscriptions(self, topic):
         """
         Unsubscribe from all pub/sub topics and create a subscription to a topic in the configuration which triggers
@@ -293,28 +381,54 @@ class Microgrid(Agent):
     def _handle_publish(self, peer, sender, bus, topic, headers, message):
         """
         Callback triggered by the subscription setup using the topic from the agent's config file
+
+        A columnar time-series message, e.g. a load forecast of the Forecast agent, is simulated over its own
+        horizon and resolution with its "total" column (or its only column) as demand.
         """
         if self.setting4 == 'hourly':
             self.num_time_points = 24 * 7
         elif self.setting4 == '15-min':
             self.num_time_points = 96 * 7
+        time_resolution = 'hourly'
+        start = None
+
+        if is_timeseries(message):
+            try:
+                series = decode(message)
+            except ValueError as e:
+                _log.error("Bad time-series payload on {}: {}".format(topic, e))
+                return
+            if 'total' in series.columns:
+                message = series.values[series.columns.index('total')]
+            elif len(series.columns) == 1:
+                message = series.values[0]
+            else:
+                _log.error("Time series on {} has no total column".format(topic))
+                return
+            step = int(series.index[1] - series.index[0]) // 10 ** 9 if len(series.index) > 1 else None
+            time_resolution = RESOLUTIONS.get(step)
+            if time_resolution is None:
+                _log.error("Unsupported time series resolution on {}".format(topic))
+                return
+            self.num_time_points = len(message)
+            # The index is in UTC, naive unless the payload names a time zone
+            start = pd.Timestamp(int(series.index[0]), tz='UTC')
+            start = start.tz_convert(series.tz) if series.tz is not None else start.tz_localize(None)
 
         if self.message_received == 0:
             message_received = 1
             data_dict = message
-            data = run_simulation(self.num_time_points, 'hourly', self.setting5, self.setting6, self.setting7,
-                           self.setting8, self.setting9, data_dict, True, True, True)
-
-            #maybe need to transform the df to message it
-            #dict_of_dfs = {col: df[[col]] for col in df.columns}
-
-            #if multi index
-            #dict_of_dicts = df.groupby(level=0).apply(lambda x: x.droplevel(0).to_dict()).to_dict()
-
-            #convert whole df
-            #dict_from_df = df.to_dict()
-
-            self.vip.pubsub.publish('pubsub', self.setting3, message=data)
+            data = run_simulation(self.num_time_points, time_resolution, self.setting5, self.setting6, self.setting7,
+                                  self.setting8, self.setting9, data_dict, True, True, True,
+                                  thermal_storage_capacity=self.setting10,
+                                  thermal_storage_efficiency=self.setting11,
+                                  battery_mode=self.setting15, strategy_params=self.setting16,
+                                  optimizer=self.optimizer, cache=self.cache, pv=self.pv, start=start)
+
+            # Columnar payload, see volttron.platform.messaging.timeseries
+            now = utils.format_timestamp(utils.get_aware_utc_now())
+            headers = {headers_mod.DATE: now, headers_mod.TIMESTAMP: now}
+            self.vip.pubsub.publish('pubsub', self.setting3, headers=headers, message=encode_frame(data))
 
         pass
 
@@ -341,7 +455,11 @@ class Microgrid(Agent):
         This method is called when the Agent is about to shutdown, but before it disconnects from
         the message bus.
         """
-        pass
+        if self.weather_greenlet is not None:
+            self.weather_greenlet.kill()
+        if self.cache is not None:
+            # Wait for the cache files still being written
+            self.cache.close()
 
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
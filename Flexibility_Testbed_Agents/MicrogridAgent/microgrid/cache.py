@@ -0,0 +1,235 @@
+"""
+Memoized microgrid simulations.
+
+:class:`SimulationCache` has the signature of :func:`microgrid.dispatch.simulate`
+and keeps its results in a least recently used cache keyed by a hash of all
+parameters, the time index and the input series. Entries can additionally
+be written to a directory so they survive a restart of the agent. The files
+are written by a background thread, so a cache miss does not wait for the
+disk.
+
+When a simulation with the same parameters and time index ran before and
+only a suffix of the inputs changed (e.g. a new demand forecast for the
+second half of the week), the cached result is kept up to the first changed
+step and only the rest is simulated, starting from the battery and thermal
+state of charge and the curtailment state of the last unchanged step. The
+strategy plan is prepared for the whole new series, so strategies looking
+at the whole series (e.g. peak shaving by a percentile of all demand) move
+the first changed step back as far as their plan changed.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .dispatch import COLUMNS, simulate
+from .strategies import BaseStrategy, DispatchPlan, get_strategy
+
+_log = logging.getLogger(__name__)
+
+#: One cached simulation: the time index, the stacked input series (solar, wind, chp, demand, thermal demand),
+#: the stacked plan (discharge threshold, grid charge), its export_residual flag and the result columns.
+CacheEntry = namedtuple('CacheEntry', ['index', 'inputs', 'plan', 'export_residual', 'values'])
+
+
+class _PreparedPlan(BaseStrategy):
+    """Strategy handing out a slice of a plan prepared for the whole series."""
+    name = 'prepared'
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def prepare(self, demand, time_steps=None):
+        return self.plan
+
+
+def _first_change(old, new):
+    changed = np.flatnonzero((old != new).any(axis=0))
+    return int(changed[0]) if len(changed) else old.shape[1]
+
+
+def _curtailed_after(storage, capacity):
+    """Whether generation is switched off after the last step, it only toggles at a full or empty battery."""
+    toggles = np.flatnonzero((storage >= capacity) | (storage <= 0))
+    return bool(len(toggles)) and bool(storage[toggles[-1]] >= capacity)
+
+
+class SimulationCache(object):
+    """
+    LRU cache in front of :func:`microgrid.dispatch.simulate`.
+
+    :param max_entries: Number of results kept in memory.
+    :param directory: Directory results are also written to and read from, None to keep them in memory only.
+    """
+
+    def __init__(self, max_entries=32, directory=None):
+        self.max_entries = int(max_entries)
+        self.directory = directory
+        self._writer = None
+        self._writes = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1)
+        self.hits = 0
+        self.misses = 0
+        self.partial = 0
+        self.simulated_steps = 0
+        self._entries = OrderedDict()
+        # Parameter hash to the key of the most recent result with those parameters
+        self._latest = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'partial': self.partial,
+                'simulated_steps': self.simulated_steps}
+
+    def flush(self):
+        """Wait until all results are written to the directory."""
+        writes, self._writes = self._writes, []
+        for write in writes:
+            write.result()
+
+    def close(self):
+        """Wait for pending writes and stop the writer thread, the cache is only kept in memory afterwards."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    def clear(self):
+        """Empty the in memory cache, files in the directory are kept."""
+        self._entries.clear()
+        self._latest.clear()
+
+    def simulate(self, time_steps, solar_generation, wind_generation, chp_generation, demand_series,
+                 battery_capacity, battery_efficiency, thermal_demand=None, thermal_storage_capacity=0.0,
+                 thermal_storage_efficiency=1.0, battery_mode='default', curtail_when_full=False, **strategy_params):
+        """
+        Same as :func:`microgrid.dispatch.simulate`, answered from the cache where possible.
+
+        :returns: A new frame, changing it does not change the cache.
+        :rtype: pandas.DataFrame
+        """
+        time_steps = pd.DatetimeIndex(time_steps)
+        size = len(time_steps)
+        series = [solar_generation, wind_generation, chp_generation, demand_series,
+                  np.zeros(size) if thermal_demand is None else thermal_demand]
+        for name, values in zip(('solar_generation', 'wind_generation', 'chp_generation', 'demand_series',
+                                 'thermal_demand'), series):
+            if len(values) != size:
+                raise ValueError("Length of {} must match the number of time steps.".format(name))
+        inputs = np.stack([np.asarray(values, dtype=np.float64) for values in series])
+
+        strategy = get_strategy(battery_mode, **strategy_params)
+        params = (float(battery_capacity), float(battery_efficiency), float(thermal_storage_capacity),
+                  float(thermal_storage_efficiency), repr(strategy), bool(curtail_when_full))
+        param_key = hashlib.blake2b(repr(params).encode(), digest_size=16)
+        param_key.update(time_steps.asi8.tobytes())
+        param_key.update(str(time_steps.tz).encode())
+        key = param_key.copy()
+        key.update(inputs.tobytes())
+        param_key, key = param_key.hexdigest(), key.hexdigest()
+
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            self._latest[param_key] = key
+            return self._frame(entry)
+
+        self.misses += 1
+        prepared = strategy.prepare(inputs[3], time_steps)
+        plan = np.stack([np.broadcast_to(np.asarray(prepared.discharge_threshold, dtype=np.float64), (size,)),
+                         np.broadcast_to(np.asarray(prepared.grid_charge, dtype=np.float64), (size,))])
+        export_residual = bool(prepared.export_residual)
+
+        previous = self._entries.get(self._latest.get(param_key))
+        start = 0
+        if previous is not None and previous.export_residual == export_residual:
+            start = min(_first_change(previous.inputs, inputs), _first_change(previous.plan, plan))
+
+        if start > 0:
+            self.partial += 1
+            state = previous.values[start - 1]
+            battery = state[COLUMNS.index('Battery_Storage')]
+            thermal = state[COLUMNS.index('Thermal_Storage')]
+            curtailed = curtail_when_full and _curtailed_after(
+                previous.values[:start, COLUMNS.index('Battery_Storage')], float(battery_capacity))
+            suffix = simulate(time_steps[start:], *inputs[:4, start:], battery_capacity, battery_efficiency,
+                              thermal_demand=inputs[4, start:], thermal_storage_capacity=thermal_storage_capacity,
+                              thermal_storage_efficiency=thermal_storage_efficiency,
+                              battery_mode=_PreparedPlan(DispatchPlan(plan[0, start:], plan[1, start:],
+                                                                      export_residual)),
+                              curtail_when_full=curtail_when_full, initial_storage=battery,
+                              initial_thermal_storage=thermal, initial_curtailed=curtailed)
+            values = np.concatenate([previous.values[:start], suffix.to_numpy(dtype=np.float64)])
+        else:
+            values = simulate(time_steps, *inputs[:4], battery_capacity, battery_efficiency,
+                              thermal_demand=inputs[4], thermal_storage_capacity=thermal_storage_capacity,
+                              thermal_storage_efficiency=thermal_storage_efficiency, battery_mode=strategy,
+                              curtail_when_full=curtail_when_full).to_numpy(dtype=np.float64)
+        self.simulated_steps += size - start
+
+        entry = CacheEntry(time_steps, inputs, plan, export_residual, values)
+        self._put(key, entry)
+        self._latest[param_key] = key
+        return self._frame(entry)
+
+    @staticmethod
+    def _frame(entry):
+        return pd.DataFrame(entry.values.copy(), index=entry.index, columns=COLUMNS)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key + '.npz')
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                index = pd.DatetimeIndex(data['index'])
+                tz = str(data['tz'])
+                if tz != 'None':
+                    index = index.tz_localize('UTC').tz_convert(tz)
+                freq = str(data['freq'])
+                if freq != 'None':
+                    index = pd.DatetimeIndex(index, freq=freq)
+                entry = CacheEntry(index, data['inputs'], data['plan'], bool(data['export_residual']),
+                                   data['values'])
+        except (OSError, KeyError, ValueError) as e:
+            _log.warning("Ignoring unreadable cache file {}: {}".format(path, e))
+            return None
+        self._put(key, entry, write=False)
+        return entry
+
+    def _put(self, key, entry, write=True):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if write and self._writer is not None:
+            self._writes = [write for write in self._writes if not write.done()]
+            self._writes.append(self._writer.submit(self._write, key, entry))
+
+    def _write(self, key, entry):
+        path = os.path.join(self.directory, key + '.npz')
+        temp_path = path + '.tmp.npz'
+        try:
+            np.savez(temp_path, index=entry.index.asi8, tz=str(entry.index.tz), freq=str(entry.index.freqstr),
+                     inputs=entry.inputs, plan=entry.plan, export_residual=entry.export_residual,
+                     values=entry.values)
+            os.replace(temp_path, path)
+        except OSError as e:
+            _log.warning("Could not write cache file {}: {}".format(path, e))
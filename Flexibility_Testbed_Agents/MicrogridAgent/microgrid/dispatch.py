@@ -0,0 +1,330 @@
+"""
+Array based dispatch engine for the microgrid simulation.
+
+The battery and thermal storage state of charge is path dependent, so the
+dispatch is a scan over the time axis. The scan runs over plain float
+sequences (or a numba compiled kernel when numba is installed) and never
+touches the pandas frame per cell; the frame is only assembled once at the
+end from whole columns.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .strategies import get_strategy
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+COLUMNS = ['Solar_Generation', 'Wind_Generation', 'CHP_Generation', 'Demand', 'Thermal_Demand',
+           'Total_Generation', 'Battery_Storage', 'Battery_Change', 'Thermal_Storage', 'Thermal_Change',
+           'Surplus_Deficit', 'Grid_Export']
+
+BatteryDispatch = namedtuple('BatteryDispatch', ['storage', 'change', 'grid_export', 'curtailed'])
+ThermalDispatch = namedtuple('ThermalDispatch', ['storage', 'change'])
+
+
+def _battery_kernel(generation, demand, discharge_threshold, grid_charge, capacity, efficiency, export_residual,
+                    curtail_when_full, initial_storage, initial_curtailed, storage, change, grid_export, curtailed):
+    soc = initial_storage
+    generation_off = initial_curtailed
+    for i in range(len(generation)):
+        gen = 0.0 if generation_off else generation[i]
+        load = demand[i]
+        surplus = gen - load
+        if surplus > 0 and soc < capacity:
+            delta = min(surplus * efficiency, capacity - soc)
+            grid_export[i] = surplus - delta
+        elif surplus < 0 and load > discharge_threshold[i] and soc > 0:
+            delta = -min(-surplus, soc)
+            if export_residual:
+                grid_export[i] = surplus - delta
+        elif surplus <= 0 and grid_charge[i] > 0 and soc < capacity and efficiency > 0:
+            delta = min(grid_charge[i] * efficiency, capacity - soc)
+            if export_residual:
+                grid_export[i] = surplus - delta / efficiency
+        else:
+            delta = 0.0
+            if export_residual:
+                grid_export[i] = surplus
+        soc += delta
+        change[i] = delta
+        storage[i] = soc
+
+        if curtail_when_full:
+            if soc >= capacity:
+                generation_off = True
+            elif soc <= 0:
+                generation_off = False
+            curtailed[i] = generation_off
+    return soc
+
+
+def _thermal_kernel(surplus, capacity, efficiency, initial_storage, storage, change):
+    soc = initial_storage
+    for i in range(len(surplus)):
+        net = surplus[i]
+        if net > 0:
+            delta = min(net * efficiency, capacity - soc)
+        else:
+            delta = -min(-net, soc)
+        soc += delta
+        change[i] = delta
+        storage[i] = soc
+    return soc
+
+
+if njit is not None:
+    _battery_kernel = njit(cache=True)(_battery_kernel)
+    _thermal_kernel = njit(cache=True)(_thermal_kernel)
+
+
+def _run_kernel(kernel, inputs, params, dtypes):
+    """
+    Run a scan kernel either compiled on arrays or interpreted on lists.
+
+    Indexing numpy scalars from the interpreter is several times slower than
+    indexing a list of floats, so the interpreted path converts once on the
+    way in and once on the way out.
+    """
+    size = len(inputs[0])
+    if njit is not None:
+        outputs = [np.zeros(size, dtype=dtype) for dtype in dtypes]
+        kernel(*inputs, *params, *outputs)
+        return outputs
+    outputs = [[0.0] * size for _ in dtypes]
+    kernel(*[array.tolist() for array in inputs], *params, *outputs)
+    return [np.array(output, dtype=dtype) for output, dtype in zip(outputs, dtypes)]
+
+
+def _prepare_plan(strategy, demand, time_steps):
+    plan = strategy.prepare(demand, time_steps)
+    return (np.broadcast_to(np.asarray(plan.discharge_threshold, dtype=np.float64), demand.shape),
+            np.broadcast_to(np.asarray(plan.grid_charge, dtype=np.float64), demand.shape),
+            bool(plan.export_residual))
+
+
+def dispatch_battery(generation, demand, battery_capacity, battery_efficiency, battery_mode='default',
+                     curtail_when_full=False, initial_storage=0.0, time_steps=None, initial_curtailed=False,
+                     **strategy_params):
+    """
+    Dispatch a battery against a generation and a demand series.
+
+    Surplus generation charges the battery (scaled by the efficiency) and
+    whatever does not fit is exported to the grid. When and how far the
+    battery covers a deficit, and whether it charges from the grid, is up to
+    the strategy (see :mod:`microgrid.strategies`), which prepares its rules
+    once for the whole series.
+
+    When ``curtail_when_full`` is set all generation is switched off once the
+    battery is full and switched on again once it is empty.
+
+    :param generation: Total generation per time step.
+    :param demand: Electrical demand per time step.
+    :param battery_capacity: Usable battery capacity.
+    :param battery_efficiency: Charging efficiency between 0 and 1.
+    :param battery_mode: Registered strategy name or a strategy instance.
+    :param curtail_when_full: Switch off generation while the battery is full.
+    :param initial_storage: Battery state of charge before the first step.
+    :param time_steps: DatetimeIndex of the series, needed by time dependent strategies.
+    :param initial_curtailed: Whether generation is switched off before the first step.
+    :param strategy_params: Parameters for the strategy when it is given by name.
+    :returns: Storage level, storage change, grid export and curtailment flag per step.
+    :rtype: BatteryDispatch
+    """
+    strategy = get_strategy(battery_mode, **strategy_params)
+    generation = np.asarray(generation, dtype=np.float64)
+    demand = np.asarray(demand, dtype=np.float64)
+    if generation.shape != demand.shape:
+        raise ValueError("generation and demand must have the same length.")
+    discharge_threshold, grid_charge, export_residual = _prepare_plan(strategy, demand, time_steps)
+
+    storage, change, grid_export, curtailed = _run_kernel(
+        _battery_kernel, (generation, demand, discharge_threshold, grid_charge),
+        (float(battery_capacity), float(battery_efficiency), export_residual, bool(curtail_when_full),
+         float(initial_storage), bool(initial_curtailed)),
+        (np.float64, np.float64, np.float64, np.bool_))
+    return BatteryDispatch(storage, change, grid_export, curtailed)
+
+
+def dispatch_battery_batch(generation, demand, battery_capacity, battery_efficiency, battery_mode='default',
+                           curtail_when_full=False, initial_storage=0.0, time_steps=None, **strategy_params):
+    """
+    Dispatch many independent batteries at once along a leading scenario axis.
+
+    Same rules as :func:`dispatch_battery`, but the scan over time steps
+    updates every scenario with one set of array operations, so the cost of a
+    batch is nearly independent of the number of scenarios in it.
+
+    :param generation: Total generation, shape ``(scenarios, steps)``.
+    :param demand: Demand, shape ``(steps,)`` or ``(scenarios, steps)``.
+    :param battery_capacity: Scalar or per scenario battery capacity.
+    :param battery_efficiency: Scalar or per scenario charging efficiency.
+    :param battery_mode: Registered strategy name or a strategy instance.
+    :param curtail_when_full: Switch off generation while the battery is full.
+    :param initial_storage: Scalar or per scenario state of charge before the first step.
+    :param time_steps: DatetimeIndex of the series, needed by time dependent strategies.
+    :param strategy_params: Parameters for the strategy when it is given by name.
+    :returns: Arrays of shape ``(scenarios, steps)``.
+    :rtype: BatteryDispatch
+    """
+    strategy = get_strategy(battery_mode, **strategy_params)
+    generation = np.atleast_2d(np.asarray(generation, dtype=np.float64))
+    num_scenarios, num_steps = generation.shape
+    demand = np.asarray(demand, dtype=np.float64)
+    capacity = np.broadcast_to(np.asarray(battery_capacity, dtype=np.float64), (num_scenarios,))
+    efficiency = np.broadcast_to(np.asarray(battery_efficiency, dtype=np.float64), (num_scenarios,))
+
+    # A shared demand series is planned once, per scenario demand once per row.
+    if demand.ndim == 1:
+        threshold, grid_charge, export_residual = _prepare_plan(strategy, demand, time_steps)
+        threshold_t = threshold[:, np.newaxis]
+        grid_charge_t = grid_charge[:, np.newaxis]
+        demand = np.broadcast_to(demand, generation.shape)
+    else:
+        demand = np.broadcast_to(demand, generation.shape)
+        plans = [_prepare_plan(strategy, row, time_steps) for row in demand]
+        threshold_t = np.stack([plan[0] for plan in plans], axis=1)
+        grid_charge_t = np.stack([plan[1] for plan in plans], axis=1)
+        export_residual = plans[0][2] if plans else False
+
+    # Time major copies so every step reads one contiguous row.
+    generation_t = np.ascontiguousarray(generation.T)
+    demand_t = np.ascontiguousarray(demand.T)
+    storage = np.empty((num_steps, num_scenarios))
+    change = np.empty((num_steps, num_scenarios))
+    grid_export = np.empty((num_steps, num_scenarios))
+    curtailed = np.zeros((num_steps, num_scenarios), dtype=bool)
+
+    soc = np.array(np.broadcast_to(np.asarray(initial_storage, dtype=np.float64), (num_scenarios,)))
+    generation_off = np.zeros(num_scenarios, dtype=bool)
+    can_grid_charge = efficiency > 0
+    safe_efficiency = np.where(can_grid_charge, efficiency, 1.0)
+    for i in range(num_steps):
+        gen = np.where(generation_off, 0.0, generation_t[i])
+        load = demand_t[i]
+        surplus = gen - load
+        charging = (surplus > 0) & (soc < capacity)
+        discharging = ~charging & (surplus < 0) & (load > threshold_t[i]) & (soc > 0)
+        grid_charging = (~charging & ~discharging & (surplus <= 0) & (grid_charge_t[i] > 0) &
+                         (soc < capacity) & can_grid_charge)
+
+        charge = np.minimum(surplus * efficiency, capacity - soc)
+        discharge = -np.minimum(-surplus, soc)
+        from_grid = np.minimum(grid_charge_t[i] * efficiency, capacity - soc)
+        delta = np.where(charging, charge, np.where(discharging, discharge, np.where(grid_charging, from_grid, 0.0)))
+
+        soc = soc + delta
+        change[i] = delta
+        storage[i] = soc
+        if export_residual:
+            grid_export[i] = np.where(grid_charging, surplus - delta / safe_efficiency, surplus - delta)
+        else:
+            grid_export[i] = np.where(charging, surplus - delta, 0.0)
+
+        if curtail_when_full:
+            generation_off = np.where(soc >= capacity, True, np.where(soc <= 0, False, generation_off))
+            curtailed[i] = generation_off
+
+    return BatteryDispatch(storage.T, change.T, grid_export.T, curtailed.T)
+
+
+def dispatch_thermal(thermal_generation, thermal_demand, thermal_storage_capacity, thermal_storage_efficiency,
+                     initial_storage=0.0):
+    """
+    Dispatch a thermal storage against thermal generation and demand.
+
+    :param thermal_generation: Thermal generation per time step (CHP output).
+    :param thermal_demand: Thermal demand per time step.
+    :param thermal_storage_capacity: Usable thermal storage capacity.
+    :param thermal_storage_efficiency: Charging efficiency between 0 and 1.
+    :param initial_storage: Thermal state of charge before the first step.
+    :returns: Storage level and storage change per step.
+    :rtype: ThermalDispatch
+    """
+    surplus = np.asarray(thermal_generation, dtype=np.float64) - np.asarray(thermal_demand, dtype=np.float64)
+    storage, change = _run_kernel(
+        _thermal_kernel, (surplus,),
+        (float(thermal_storage_capacity), float(thermal_storage_efficiency), float(initial_storage)),
+        (np.float64, np.float64))
+    return ThermalDispatch(storage, change)
+
+
+def simulate(time_steps, solar_generation, wind_generation, chp_generation, demand_series, battery_capacity,
+             battery_efficiency, thermal_demand=None, thermal_storage_capacity=0.0, thermal_storage_efficiency=1.0,
+             battery_mode='default', curtail_when_full=False, initial_storage=0.0, initial_thermal_storage=0.0,
+             initial_curtailed=False, **strategy_params):
+    """
+    Run the battery and thermal dispatch and assemble the result frame.
+
+    The initial states allow to continue an earlier simulation, see
+    :mod:`microgrid.cache`.
+
+    :param time_steps: Index of the resulting frame.
+    :param solar_generation: Solar generation per time step.
+    :param wind_generation: Wind generation per time step.
+    :param chp_generation: CHP generation per time step, also used as thermal generation.
+    :param demand_series: Electrical demand per time step.
+    :param battery_capacity: Usable battery capacity.
+    :param battery_efficiency: Charging efficiency between 0 and 1.
+    :param thermal_demand: Thermal demand per time step, zero if omitted.
+    :param thermal_storage_capacity: Usable thermal storage capacity.
+    :param thermal_storage_efficiency: Thermal charging efficiency between 0 and 1.
+    :param battery_mode: Registered strategy name or a strategy instance.
+    :param curtail_when_full: Switch off generation while the battery is full.
+    :param initial_storage: Battery state of charge before the first step.
+    :param initial_thermal_storage: Thermal state of charge before the first step.
+    :param initial_curtailed: Whether generation is switched off before the first step.
+    :param strategy_params: Parameters for the strategy when it is given by name.
+    :returns: Frame with the columns listed in :data:`COLUMNS`.
+    :rtype: pandas.DataFrame
+    """
+    size = len(time_steps)
+    solar = np.asarray(solar_generation, dtype=np.float64)
+    wind = np.asarray(wind_generation, dtype=np.float64)
+    chp = np.asarray(chp_generation, dtype=np.float64)
+    demand = np.asarray(demand_series, dtype=np.float64)
+    if thermal_demand is None:
+        thermal = np.zeros(size)
+    else:
+        thermal = np.asarray(thermal_demand, dtype=np.float64)
+
+    for name, series in (('demand_series', demand), ('thermal_demand', thermal), ('solar_generation', solar),
+                         ('wind_generation', wind), ('chp_generation', chp)):
+        if len(series) != size:
+            raise ValueError("Length of {} must match the number of time steps.".format(name))
+
+    total = solar + wind + chp
+    battery = dispatch_battery(total, demand, battery_capacity, battery_efficiency, battery_mode,
+                               curtail_when_full, initial_storage=initial_storage, time_steps=time_steps,
+                               initial_curtailed=initial_curtailed, **strategy_params)
+    heat = dispatch_thermal(chp, thermal, thermal_storage_capacity, thermal_storage_efficiency,
+                            initial_storage=initial_thermal_storage)
+
+    if curtail_when_full:
+        running = ~battery.curtailed
+        solar_out, wind_out, chp_out = solar * running, wind * running, chp * running
+    else:
+        solar_out, wind_out, chp_out = solar, wind, chp
+
+    return pd.DataFrame({
+        'Solar_Generation': solar_out,
+        'Wind_Generation': wind_out,
+        'CHP_Generation': chp_out,
+        'Demand': demand,
+        'Thermal_Demand': thermal,
+        'Total_Generation': total,
+        'Battery_Storage': battery.storage,
+        'Battery_Change': battery.change,
+        'Thermal_Storage': heat.storage,
+        'Thermal_Change': heat.change,
+        'Surplus_Deficit': total - demand,
+        'Grid_Export': battery.grid_export
+    }, index=time_steps, columns=COLUMNS)
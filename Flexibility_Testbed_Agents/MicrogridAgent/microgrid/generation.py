@@ -0,0 +1,163 @@
+"""
+Generation profiles of the microgrid units.
+
+Shared by the Microgrid agent, the parameter sweep and the offline
+distribution scripts so all of them produce the same series for the same
+inputs.
+
+Solar follows a sine between 6:00 and 18:00 that only depends on the hour of
+the day. The shape of one day is computed once per time resolution and the
+profile is a lookup of every time step's slot in that day. Wind is a seeded
+random draw and both wind and CHP can be ramp limited. The ramp limit is a
+scan over the time axis that runs compiled when numba is installed and on
+plain float lists otherwise.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+SUNRISE = 6
+SUNSET = 18
+
+DISTRIBUTIONS = ('normal', 'uniform')
+
+_NS_PER_HOUR = 3600 * 10**9
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+
+
+@lru_cache(maxsize=16)
+def daily_shape(step_seconds=3600):
+    """
+    Solar output of a 1 kW unit for every slot of one day.
+
+    :param step_seconds: Slot length, must divide one hour.
+    :returns: Read only array with ``86400 / step_seconds`` values.
+    :rtype: numpy.ndarray
+    """
+    step_ns = int(step_seconds * 10**9)
+    if step_ns <= 0 or _NS_PER_HOUR % step_ns:
+        raise ValueError("Slot length must divide one hour, got {} s".format(step_seconds))
+    hours = np.arange(0, _NS_PER_DAY, step_ns) // _NS_PER_HOUR
+    shape = np.where((hours >= SUNRISE) & (hours <= SUNSET), np.sin((hours - SUNRISE) * np.pi / 12), 0.0)
+    shape.flags.writeable = False
+    return shape
+
+
+def _wall_clock_ns(time_steps):
+    time_steps = pd.DatetimeIndex(time_steps)
+    if time_steps.tz is not None:
+        time_steps = time_steps.tz_localize(None)
+    return time_steps.asi8
+
+
+def solar_profile(time_steps, capacity=1.0):
+    """
+    Solar generation for every time step.
+
+    Regular series whose steps divide one hour are looked up in the
+    :func:`daily_shape` of their resolution, anything else in the hourly one.
+
+    :param time_steps: DatetimeIndex of the simulation, local wall clock time is used.
+    :param capacity: Peak output of the unit.
+    :rtype: numpy.ndarray
+    """
+    ns = _wall_clock_ns(time_steps)
+    ns_of_day = ns % _NS_PER_DAY
+    step_ns = _NS_PER_HOUR
+    if len(ns) > 1:
+        steps = np.diff(ns)
+        if steps[0] > 0 and _NS_PER_HOUR % steps[0] == 0 and (steps == steps[0]).all() \
+                and ns_of_day[0] % steps[0] == 0:
+            step_ns = int(steps[0])
+    return capacity * daily_shape(step_ns / 1e9)[ns_of_day // step_ns]
+
+
+def wind_profile(time_steps, capacity=1.0, seed=0, distribution='normal', ramp_rate=None):
+    """
+    Random wind generation for every time step.
+
+    The same seed always gives the same profile, independent of the global
+    NumPy random state.
+
+    :param time_steps: DatetimeIndex of the simulation or the number of steps.
+    :param capacity: Scale of the draw.
+    :param seed: Seed of the draw, None for a fresh one.
+    :param distribution: ``"normal"`` for the absolute value of a standard
+                         normal draw, ``"uniform"`` for a draw from [0, 1).
+    :param ramp_rate: Maximum change between two steps, None for no limit.
+    :rtype: numpy.ndarray
+    """
+    size = time_steps if isinstance(time_steps, int) else len(time_steps)
+    rng = np.random.RandomState(seed)
+    if distribution == 'normal':
+        draw = rng.randn(size)
+    elif distribution == 'uniform':
+        draw = rng.uniform(0, 1, size)
+    else:
+        raise ValueError("Unknown wind distribution {}, available: {}".format(distribution, ", ".join(DISTRIBUTIONS)))
+    generation = capacity * np.abs(draw)
+    return generation if ramp_rate is None else apply_ramp(generation, ramp_rate)
+
+
+def chp_profile(time_steps, capacity=1.0, ramp_rate=None):
+    """
+    Constant CHP generation for every time step.
+
+    :param time_steps: DatetimeIndex of the simulation or the number of steps.
+    :param ramp_rate: Maximum change between two steps, None for no limit.
+    :rtype: numpy.ndarray
+    """
+    size = time_steps if isinstance(time_steps, int) else len(time_steps)
+    generation = np.full(size, capacity)
+    return generation if ramp_rate is None else apply_ramp(generation, ramp_rate)
+
+
+def _ramp_kernel(generation, ramp_rate, ramped):
+    previous = generation[0]
+    ramped[0] = previous
+    for i in range(1, len(generation)):
+        value = generation[i]
+        if value > previous + ramp_rate:
+            value = previous + ramp_rate
+        elif value < previous - ramp_rate:
+            value = previous - ramp_rate
+        ramped[i] = value
+        previous = value
+
+
+if njit is not None:
+    _ramp_kernel = njit(cache=True)(_ramp_kernel)
+
+
+def apply_ramp(generation, ramp_rate):
+    """
+    Limit the change of a generation series between two steps to ``ramp_rate``.
+
+    Every step follows the original series as far as the limit allows,
+    starting from the first value. Series that never change faster than the
+    limit are returned as a copy without running the scan.
+
+    :rtype: numpy.ndarray
+    """
+    generation = np.asarray(generation)
+    previous, current = generation[:-1], generation[1:]
+    if ((current <= previous + ramp_rate) & (current >= previous - ramp_rate)).all():
+        return generation.copy()
+
+    if njit is not None:
+        ramped = np.empty(len(generation), dtype=np.float64)
+        _ramp_kernel(generation.astype(np.float64), float(ramp_rate), ramped)
+    else:
+        ramped = [0.0] * len(generation)
+        _ramp_kernel(generation.tolist(), ramp_rate, ramped)
+        ramped = np.array(ramped, dtype=np.float64)
+    return ramped
@@ -0,0 +1,375 @@
+"""
+Heat pump surrogate built from pre-solved TESPy operating points.
+
+Solving the TESPy network of the two stage NH3 heat pump (see
+``Python test files/heatpump.py``) takes a nonlinear solve per operating
+point, far too slow to run per building and time step. Instead the network
+is solved once over a grid of heat source temperatures, sink (supply)
+temperatures and thermal loads, spread over a process pool, and the COP and
+electrical power of every point are stored in a table. At run time
+:class:`HeatPumpTable` interpolates the table for whole arrays of operating
+points at once.
+
+Build a table from the agent directory (requires ``tespy``)::
+
+    python -m microgrid.heatpump heatpump_table.npz --source -10 20 7 --sink 35 75 5 --load 50 250 5 --workers 8
+
+The three axes are given as ``start stop number`` of evenly spaced values.
+Points the solver does not converge for are stored as NaN and logged.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import logging
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+_log = logging.getLogger(__name__)
+
+AXES = ('source_temperatures', 'sink_temperatures', 'loads')
+
+WORKING_FLUID = 'NH3'
+
+# Tables loaded by HeatPumpTable.load, keyed by path and modification time.
+_tables = {}
+
+
+class HeatPumpTable(object):
+    """
+    COP and electrical power of a heat pump over a regular grid of operating points.
+
+    :param source_temperatures: Heat source inlet temperatures in degC, ascending.
+    :param sink_temperatures: Supply temperatures of the heating circuit in degC, ascending.
+    :param loads: Thermal loads in kW, ascending.
+    :param cop: COP of every grid point, shape ``(sources, sinks, loads)``.
+    :param power: Electrical power in kW of every grid point, same shape as ``cop``.
+    """
+
+    def __init__(self, source_temperatures, sink_temperatures, loads, cop, power):
+        self.axes = tuple(np.asarray(axis, dtype=np.float64) for axis in
+                          (source_temperatures, sink_temperatures, loads))
+        shape = tuple(len(axis) for axis in self.axes)
+        self.cop = np.asarray(cop, dtype=np.float64)
+        self.power = np.asarray(power, dtype=np.float64)
+        for name, axis in zip(AXES, self.axes):
+            if axis.ndim != 1 or not len(axis) or (np.diff(axis) <= 0).any():
+                raise ValueError("Heat pump table axis {} must be one dimensional and strictly ascending".format(name))
+        if self.cop.shape != shape or self.power.shape != shape:
+            raise ValueError("Heat pump tables must have shape {}, got {} and {}".format(shape, self.cop.shape,
+                                                                                        self.power.shape))
+
+    @property
+    def source_temperatures(self):
+        return self.axes[0]
+
+    @property
+    def sink_temperatures(self):
+        return self.axes[1]
+
+    @property
+    def loads(self):
+        return self.axes[2]
+
+    @property
+    def failed(self):
+        """Number of grid points the solver did not converge for."""
+        return int(np.isnan(self.cop).sum())
+
+    def save(self, path):
+        """Write the table to an ``.npz`` file."""
+        with open(path, 'wb') as table_file:
+            np.savez(table_file, cop=self.cop, power=self.power, **dict(zip(AXES, self.axes)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a table written by :meth:`save`, reading the file only again once it changed.
+        """
+        path = os.path.abspath(path)
+        key = (path, os.stat(path).st_mtime_ns)
+        table = _tables.get(key)
+        if table is not None:
+            return table
+
+        with np.load(path) as data:
+            table = cls(*(data[name] for name in AXES), cop=data['cop'], power=data['power'])
+        for old_key in [k for k in _tables if k[0] == path]:
+            del _tables[old_key]
+        _tables[key] = table
+        return table
+
+    def lookup(self, source_temperature, sink_temperature, load):
+        """
+        Interpolate COP and electrical power for arrays of operating points.
+
+        The inputs are broadcast against each other. Points outside the grid
+        are clamped to its edges. Corners the solver failed for (NaN) are left
+        out and the weights of the others renormalised, so a point is only NaN
+        if all corners around it failed.
+
+        :returns: COP and electrical power in kW, both with the broadcast shape.
+        :rtype: tuple
+        """
+        points = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in
+                                       (source_temperature, sink_temperature, load)))
+        corners = [_locate(axis, point) for axis, point in zip(self.axes, points)]
+        shape = points[0].shape
+        sums = [np.zeros(shape), np.zeros(shape)]
+        weights = [np.zeros(shape), np.zeros(shape)]
+        for index in np.ndindex(2, 2, 2):
+            weight = 1.0
+            position = []
+            for (low, high, fraction), upper in zip(corners, index):
+                weight = weight * (fraction if upper else 1.0 - fraction)
+                position.append(high if upper else low)
+            position = tuple(position)
+            for table, total, total_weight in zip((self.cop, self.power), sums, weights):
+                value = table[position]
+                # 0 * NaN is NaN, failed and zero weight corners must not be multiplied in
+                valid = (weight > 0) & ~np.isnan(value)
+                total += np.where(valid, weight * value, 0.0)
+                total_weight += np.where(valid, weight, 0.0)
+        cop, power = (np.divide(total, total_weight, out=np.full(shape, np.nan), where=total_weight > 0)
+                      for total, total_weight in zip(sums, weights))
+        return cop, power
+
+    def electrical_power(self, thermal_load, source_temperature, sink_temperature):
+        """
+        Electrical power in kW needed to cover a thermal load in kW.
+
+        The load is divided by the COP interpolated at that load, so loads
+        above the largest grid load run at its COP instead of being capped.
+        """
+        thermal_load = np.asarray(thermal_load, dtype=np.float64)
+        cop, _ = self.lookup(source_temperature, sink_temperature, np.maximum(thermal_load, 0))
+        return np.where(thermal_load > 0, thermal_load / cop, 0.0)
+
+
+def _locate(axis, values):
+    """Lower and upper grid index and the interpolation fraction of each value."""
+    if len(axis) == 1:
+        zeros = np.zeros(values.shape, dtype=np.intp)
+        return zeros, zeros, np.zeros(values.shape)
+    values = np.clip(values, axis[0], axis[-1])
+    low = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+    fraction = (values - axis[low]) / (axis[low + 1] - axis[low])
+    return low, low + 1, fraction
+
+
+def carnot_point(source_temperature, sink_temperature, load, efficiency=0.5, approach=5.0):
+    """
+    COP and electrical power of an idealised heat pump.
+
+    A fraction ``efficiency`` of the Carnot COP between the source and the
+    sink, each shifted by the ``approach`` temperature difference. Useful as
+    a stand-in when TESPy is not installed.
+
+    :returns: COP and electrical power in kW.
+    :rtype: tuple
+    """
+    hot = sink_temperature + approach + 273.15
+    cold = source_temperature - approach + 273.15
+    cop = efficiency * hot / max(hot - cold, 1.0)
+    return cop, load / cop
+
+
+def tespy_point(source_temperature, sink_temperature, load, return_spread=30.0):
+    """
+    Solve the two stage NH3 heat pump network for one operating point.
+
+    The network matches ``Python test files/heatpump.py``, with the heat
+    source inlet, the supply temperature and the consumer heat flow taken
+    from the operating point. The return temperature of the heating circuit
+    is ``return_spread`` below the supply temperature.
+
+    :param source_temperature: Heat source inlet temperature in degC.
+    :param sink_temperature: Supply temperature in degC.
+    :param load: Thermal load in kW.
+    :returns: COP and electrical power in kW, NaN if the solve fails.
+    :rtype: tuple
+    """
+    from CoolProp.CoolProp import PropsSI
+    from tespy.components import (Compressor, Condenser, CycleCloser, Drum, HeatExchanger, Merge, Pump,
+                                  SimpleHeatExchanger, Sink, Source, Splitter, Valve)
+    from tespy.connections import Connection
+    from tespy.networks import Network
+
+    nw = Network(T_unit="C", p_unit="bar", h_unit="kJ / kg", m_unit="kg / s", iterinfo=False)
+
+    # consumer system
+    cons_closer = CycleCloser("consumer cycle closer")
+    cd = Condenser("condenser")
+    rp = Pump("recirculation pump")
+    cons = SimpleHeatExchanger("consumer")
+
+    # evaporator system
+    va = Valve("valve")
+    dr = Drum("drum")
+    ev = HeatExchanger("evaporator")
+    su = HeatExchanger("superheater")
+    amb_out = Sink("sink ambient")
+
+    # compressor system
+    cp1 = Compressor("compressor 1")
+    cp2 = Compressor("compressor 2")
+    ic = HeatExchanger("intermittent cooling")
+    hsp = Pump("heat source pump")
+    sp = Splitter("splitter")
+    me = Merge("merge")
+    cv = Valve("control valve")
+    hs = Source("ambient intake")
+    cc = CycleCloser("heat pump cycle closer")
+
+    c0 = Connection(cc, "out1", cd, "in1", label="0")
+    c1 = Connection(cd, "out1", va, "in1", label="1")
+    c2 = Connection(va, "out1", dr, "in1", label="2")
+    c3 = Connection(dr, "out1", ev, "in2", label="3")
+    c4 = Connection(ev, "out2", dr, "in2", label="4")
+    c5 = Connection(dr, "out2", su, "in2", label="5")
+    c6 = Connection(su, "out2", cp1, "in1", label="6")
+    c7 = Connection(cp1, "out1", ic, "in1", label="7")
+    c8 = Connection(ic, "out1", cp2, "in1", label="8")
+    c9 = Connection(cp2, "out1", cc, "in1", label="9")
+
+    c11 = Connection(hs, "out1", hsp, "in1", label="11")
+    c12 = Connection(hsp, "out1", sp, "in1", label="12")
+    c13 = Connection(sp, "out1", ic, "in2", label="13")
+    c14 = Connection(ic, "out2", me, "in1", label="14")
+    c15 = Connection(sp, "out2", cv, "in1", label="15")
+    c16 = Connection(cv, "out1", me, "in2", label="16")
+    c17 = Connection(me, "out1", su, "in1", label="17")
+    c18 = Connection(su, "out1", ev, "in1", label="18")
+    c19 = Connection(ev, "out1", amb_out, "in1", label="19")
+
+    c20 = Connection(cons_closer, "out1", rp, "in1", label="20")
+    c21 = Connection(rp, "out1", cd, "in2", label="21")
+    c22 = Connection(cd, "out2", cons, "in1", label="22")
+    c23 = Connection(cons, "out1", cons_closer, "in1", label="23")
+
+    nw.add_conns(c0, c1, c2, c3, c4, c5, c6, c7, c8, c9, c11, c12, c13, c14, c15, c16, c17, c18, c19,
+                 c20, c21, c22, c23)
+
+    evaporation = source_temperature - 10
+    p_cond = PropsSI("P", "Q", 1, "T", 273.15 + sink_temperature + 5, WORKING_FLUID) / 1e5
+    p_evap = PropsSI("P", "Q", 1, "T", 273.15 + evaporation, WORKING_FLUID) / 1e5
+    h_evap = PropsSI("H", "Q", 1, "T", 273.15 + evaporation, WORKING_FLUID) / 1e3
+
+    cd.set_attr(pr1=0.99, pr2=0.99)
+    rp.set_attr(eta_s=0.75)
+    cons.set_attr(pr=0.99, Q=-load * 1e3)
+    ev.set_attr(pr1=0.99)
+    su.set_attr(pr1=0.99, pr2=0.99)
+    cp1.set_attr(pr=(p_cond / p_evap) ** 0.5)
+    ic.set_attr(pr1=0.99, pr2=0.98)
+    hsp.set_attr(eta_s=0.75)
+
+    c0.set_attr(T=sink_temperature + 80, p=p_cond, fluid={WORKING_FLUID: 1})
+    c20.set_attr(T=sink_temperature - return_spread, p=2, fluid={"water": 1})
+    c22.set_attr(T=sink_temperature)
+    c4.set_attr(x=0.9, T=evaporation)
+    c6.set_attr(h=h_evap + 10)
+    c7.set_attr(h=h_evap * 1.2)
+    c8.set_attr(h=h_evap + 10)
+    c9.set_attr(h=h_evap * 1.2)
+    c11.set_attr(p=1.013, T=source_temperature, fluid={"water": 1})
+    c14.set_attr(T=source_temperature + 15)
+    c19.set_attr(T=source_temperature - 6, p=1.013)
+
+    try:
+        nw.solve("design")
+
+        # Replace the starting values by the design specification
+        c0.set_attr(p=None)
+        cd.set_attr(ttd_u=5)
+        c4.set_attr(T=None)
+        ev.set_attr(ttd_l=5)
+        c6.set_attr(h=None)
+        su.set_attr(ttd_u=5)
+        c7.set_attr(h=None)
+        cp1.set_attr(eta_s=0.8)
+        c9.set_attr(h=None)
+        cp2.set_attr(eta_s=0.8)
+        c8.set_attr(h=None, Td_bp=4)
+        nw.solve("design")
+    except Exception as e:
+        _log.debug("TESPy solve failed at {}: {}".format((source_temperature, sink_temperature, load), e))
+        return np.nan, np.nan
+
+    if not getattr(nw, 'converged', True):
+        return np.nan, np.nan
+    power = (cp1.P.val + cp2.P.val + rp.P.val + hsp.P.val) / 1e3
+    if not np.isfinite(power) or power <= 0:
+        return np.nan, np.nan
+    return abs(cons.Q.val) / 1e3 / power, power
+
+
+def _solve_points(solver, points):
+    return [solver(*point) for point in points]
+
+
+def build_table(source_temperatures, sink_temperatures, loads, solver=tespy_point, max_workers=None,
+                chunk_size=16):
+    """
+    Solve every grid point and collect the results in a :class:`HeatPumpTable`.
+
+    :param solver: Picklable callable ``(source, sink, load) -> (cop, power)``,
+                   :func:`tespy_point` by default.
+    :param max_workers: Worker processes, ``0`` solves in the calling process.
+    :param chunk_size: Number of points solved per task.
+    :rtype: HeatPumpTable
+    """
+    axes = [np.asarray(axis, dtype=np.float64) for axis in (source_temperatures, sink_temperatures, loads)]
+    shape = tuple(len(axis) for axis in axes)
+    indices = list(np.ndindex(*shape))
+    points = [tuple(float(axis[i]) for axis, i in zip(axes, index)) for index in indices]
+    chunks = [(start, points[start:start + chunk_size]) for start in range(0, len(points), chunk_size)]
+
+    cop = np.full(shape, np.nan)
+    power = np.full(shape, np.nan)
+
+    def store(start, results):
+        for index, (point_cop, point_power) in zip(indices[start:], results):
+            cop[index] = point_cop
+            power[index] = point_power
+
+    if max_workers == 0:
+        for start, chunk in chunks:
+            store(start, _solve_points(solver, chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_solve_points, solver, chunk): start for start, chunk in chunks}
+            for future in as_completed(futures):
+                store(futures[future], future.result())
+
+    table = HeatPumpTable(*axes, cop=cop, power=power)
+    if table.failed:
+        _log.warning("{} of {} heat pump operating points did not converge".format(table.failed, len(points)))
+    return table
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('output', help='.npz file the table is written to.')
+    for name, default, unit in (('source', [-10, 20, 7], 'degC'), ('sink', [35, 75, 5], 'degC'),
+                                ('load', [50, 250, 5], 'kW')):
+        parser.add_argument('--' + name, type=float, nargs=3, default=default, metavar=('START', 'STOP', 'NUM'),
+                            help='{} axis in {}, default {}.'.format(name.capitalize(), unit, default))
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes, 0 runs in this process. Defaults to the CPU count.')
+    parser.add_argument('--carnot', action='store_true',
+                        help='Fill the table from the idealised Carnot model instead of TESPy.')
+    args = parser.parse_args(argv)
+
+    axes = [np.linspace(start, stop, int(num)) for start, stop, num in (args.source, args.sink, args.load)]
+    _log.info("Solving {} heat pump operating points".format(int(np.prod([len(axis) for axis in axes]))))
+    table = build_table(*axes, solver=carnot_point if args.carnot else tespy_point, max_workers=args.workers)
+    table.save(args.output)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
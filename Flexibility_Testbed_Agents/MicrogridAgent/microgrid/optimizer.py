@@ -0,0 +1,387 @@
+"""
+Optimization based (LP / MPC) dispatch for the microgrid.
+
+Where :mod:`microgrid.dispatch` follows fixed rules, :class:`MpcDispatcher`
+schedules the battery, the CHP unit, the thermal storage with a backup
+boiler and the grid exchange over the whole horizon by solving one linear
+program, minimizing either the energy cost or the grid import.
+
+Per time step ``t`` the program has the variables battery charge and
+discharge power, battery energy, CHP output, boiler heat, dumped heat,
+thermal storage charge and discharge, grid import and export, curtailed
+renewable power and thermal storage energy, and the constraints::
+
+    renewable - curtailed + chp + discharge - charge + import - export = demand
+    battery[t] = battery[t-1] + step * (efficiency * charge - discharge)
+    heat_ratio * chp + boiler - dump - thermal_charge + thermal_discharge = thermal_demand
+    thermal[t] = thermal[t-1] + step * (thermal_efficiency * thermal_charge - thermal_discharge)
+    |chp[t] - chp[t-1]| <= chp_ramp                    (only with a ramp limit)
+
+Powers are in kW, energies in kWh and ``step`` is the step length in hours.
+Both storages end the horizon at least as full as they started.
+
+The constraint matrix only depends on the horizon length, the step length
+and the unit parameters. It is built once and kept, together with the
+solver, while only forecasts, prices and initial states change between
+rolling horizon re-solves; those only touch costs and bounds. With
+``highspy`` installed the same HiGHS instance is re-run, starting from the
+basis of the previous solve, otherwise every solve goes through
+:func:`scipy.optimize.linprog` with the cached sparse matrices.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+VARIABLES = ('charge', 'discharge', 'battery', 'chp', 'boiler', 'dump', 'thermal_charge', 'thermal_discharge',
+             'grid_import', 'grid_export', 'curtailed', 'thermal')
+
+OBJECTIVES = ('cost', 'self_sufficiency')
+
+Schedule = namedtuple('Schedule', VARIABLES + ('objective', 'solve_time'))
+
+# Keeps the solver from charging and discharging at once or dumping heat for free
+_TIE_BREAK = 1e-6
+
+
+class OptimizationError(Exception):
+    pass
+
+
+class _Structure(object):
+    """Constraint matrix and index helpers of one horizon."""
+
+    def __init__(self, num_steps, step_hours, dispatcher):
+        self.num_steps = num_steps
+        self.step_hours = step_hours
+        self.num_cols = len(VARIABLES) * num_steps
+        self.offsets = {name: i * num_steps for i, name in enumerate(VARIABLES)}
+
+        rows, cols, values = [], [], []
+        steps = np.arange(num_steps)
+
+        def add(row_offset, variable, coefficient, shift=0):
+            mask = steps >= shift
+            rows.append(row_offset + steps[mask])
+            cols.append(self.offsets[variable] + steps[mask] - shift)
+            values.append(np.broadcast_to(np.asarray(coefficient, dtype=np.float64), (num_steps,))[mask])
+
+        # Electric balance
+        row = 0
+        for variable, coefficient in (('curtailed', -1), ('chp', 1), ('discharge', 1), ('charge', -1),
+                                      ('grid_import', 1), ('grid_export', -1)):
+            add(row, variable, coefficient)
+        # Battery energy
+        row += num_steps
+        add(row, 'battery', 1)
+        add(row, 'battery', -1, shift=1)
+        add(row, 'charge', -step_hours * dispatcher.battery_efficiency)
+        add(row, 'discharge', step_hours)
+        # Heat balance
+        row += num_steps
+        for variable, coefficient in (('chp', dispatcher.chp_heat_ratio), ('boiler', 1), ('dump', -1),
+                                      ('thermal_charge', -1), ('thermal_discharge', 1)):
+            add(row, variable, coefficient)
+        # Thermal storage energy
+        row += num_steps
+        add(row, 'thermal', 1)
+        add(row, 'thermal', -1, shift=1)
+        add(row, 'thermal_charge', -step_hours * dispatcher.thermal_storage_efficiency)
+        add(row, 'thermal_discharge', step_hours)
+        row += num_steps
+        self.num_balance_rows = row
+        # CHP ramp
+        if dispatcher.chp_ramp is not None and num_steps > 1:
+            ramp_rows = row + steps[1:] - 1
+            rows.extend([ramp_rows, ramp_rows])
+            cols.extend([self.offsets['chp'] + steps[1:], self.offsets['chp'] + steps[:-1]])
+            values.extend([np.ones(num_steps - 1), -np.ones(num_steps - 1)])
+            row += num_steps - 1
+        self.num_rows = row
+
+        self.matrix = sparse.csc_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                        shape=(self.num_rows, self.num_cols))
+        self.ramp = np.full(self.num_rows - self.num_balance_rows,
+                            np.inf if dispatcher.chp_ramp is None else float(dispatcher.chp_ramp))
+
+    def block(self, vector, name):
+        start = self.offsets[name]
+        return vector[start:start + self.num_steps]
+
+
+class _HighsBackend(object):
+    """One HiGHS instance per structure, re-run with new costs and bounds."""
+
+    def __init__(self, structure):
+        lp = highspy.HighsLp()
+        lp.num_col_ = structure.num_cols
+        lp.num_row_ = structure.num_rows
+        lp.col_cost_ = np.zeros(structure.num_cols)
+        lp.col_lower_ = np.zeros(structure.num_cols)
+        lp.col_upper_ = np.zeros(structure.num_cols)
+        lp.row_lower_ = np.zeros(structure.num_rows)
+        lp.row_upper_ = np.zeros(structure.num_rows)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = structure.matrix.indptr
+        lp.a_matrix_.index_ = structure.matrix.indices
+        lp.a_matrix_.value_ = structure.matrix.data
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue('output_flag', False)
+        self.highs.passModel(lp)
+        self.cols = np.arange(structure.num_cols, dtype=np.int32)
+        self.rows = np.arange(structure.num_rows, dtype=np.int32)
+
+    def solve(self, cost, col_lower, col_upper, row_lower, row_upper):
+        highs = self.highs
+        highs.changeColsCost(len(self.cols), self.cols, cost)
+        highs.changeColsBounds(len(self.cols), self.cols, col_lower, col_upper)
+        highs.changeRowsBounds(len(self.rows), self.rows, row_lower, row_upper)
+        highs.run()
+        status = highs.getModelStatus()
+        if status != highspy.HighsModelStatus.kOptimal:
+            raise OptimizationError("HiGHS finished with status {}".format(highs.modelStatusToString(status)))
+        return np.asarray(highs.getSolution().col_value), highs.getInfo().objective_function_value
+
+
+class _LinprogBackend(object):
+    """Cold starts through scipy's HiGHS interface, reusing the split matrices."""
+
+    def __init__(self, structure):
+        balance = structure.num_balance_rows
+        matrix = structure.matrix.tocsr()
+        self.a_eq = matrix[:balance]
+        ramp = matrix[balance:]
+        self.a_ub = sparse.vstack([ramp, -ramp]).tocsr() if ramp.shape[0] else None
+        self.balance = balance
+
+    def solve(self, cost, col_lower, col_upper, row_lower, row_upper):
+        b_ub = None
+        if self.a_ub is not None:
+            b_ub = np.concatenate([row_upper[self.balance:], -row_lower[self.balance:]])
+        result = linprog(cost, A_ub=self.a_ub, b_ub=b_ub, A_eq=self.a_eq, b_eq=row_lower[:self.balance],
+                         bounds=np.column_stack([col_lower, np.where(np.isinf(col_upper), None, col_upper)]),
+                         method='highs')
+        if result.status != 0:
+            raise OptimizationError("linprog failed: {}".format(result.message))
+        return result.x, result.fun
+
+
+class MpcDispatcher(object):
+    """
+    Linear program dispatch of one microgrid, reusable across rolling horizon re-solves.
+
+    :param battery_capacity: Battery energy in kWh.
+    :param battery_efficiency: Share of the charged energy that is stored.
+    :param chp_capacity: Electric CHP power in kW.
+    :param thermal_storage_capacity: Thermal storage energy in kWh.
+    :param thermal_storage_efficiency: Share of the charged heat that is stored.
+    :param battery_power: Battery charge and discharge power in kW, defaults to one hour of capacity.
+    :param chp_ramp: Largest CHP power change between two steps in kW, None for no limit.
+    :param chp_heat_ratio: CHP heat per unit of electric output.
+    :param boiler_capacity: Backup boiler heat in kW, None for no limit.
+    :param import_price: Grid price per kWh, scalar or per step.
+    :param export_price: Feed-in tariff per kWh, scalar or per step.
+    :param chp_cost: Fuel cost per kWh of CHP electricity.
+    :param boiler_cost: Fuel cost per kWh of boiler heat.
+    :param objective: ``"cost"`` or ``"self_sufficiency"`` (minimize the grid import).
+    :param backend: ``"highs"`` (needs ``highspy``), ``"linprog"`` or None for the best one available.
+    """
+
+    def __init__(self, battery_capacity, battery_efficiency=0.9, chp_capacity=0.0, thermal_storage_capacity=0.0,
+                 thermal_storage_efficiency=1.0, battery_power=None, chp_ramp=None, chp_heat_ratio=1.0,
+                 boiler_capacity=None, import_price=0.30, export_price=0.08, chp_cost=0.12, boiler_cost=0.10,
+                 objective='cost', backend=None):
+        if objective not in OBJECTIVES:
+            raise ValueError("Invalid objective {!r}. Choose one of {}.".format(objective, OBJECTIVES))
+        if backend is None:
+            backend = 'highs' if highspy is not None else 'linprog'
+        if backend not in ('highs', 'linprog'):
+            raise ValueError("Invalid backend {!r}. Choose 'highs' or 'linprog'.".format(backend))
+        if backend == 'highs' and highspy is None:
+            raise ValueError("The highs backend needs the highspy package.")
+
+        self.battery_capacity = float(battery_capacity)
+        self.battery_efficiency = float(battery_efficiency)
+        self.chp_capacity = float(chp_capacity)
+        self.thermal_storage_capacity = float(thermal_storage_capacity)
+        self.thermal_storage_efficiency = float(thermal_storage_efficiency)
+        self.battery_power = self.battery_capacity if battery_power is None else float(battery_power)
+        self.chp_ramp = chp_ramp
+        self.chp_heat_ratio = float(chp_heat_ratio)
+        self.boiler_capacity = np.inf if boiler_capacity is None else float(boiler_capacity)
+        self.import_price = import_price
+        self.export_price = export_price
+        self.chp_cost = chp_cost
+        self.boiler_cost = boiler_cost
+        self.objective = objective
+        self.backend = backend
+
+        self.solves = 0
+        self.builds = 0
+        self._structure = None
+        self._solver = None
+        self._planned = None
+
+    def _prepare(self, num_steps, step_hours):
+        structure = self._structure
+        if structure is None or structure.num_steps != num_steps or structure.step_hours != step_hours:
+            structure = self._structure = _Structure(num_steps, step_hours, self)
+            backend = _HighsBackend if self.backend == 'highs' else _LinprogBackend
+            self._solver = backend(structure)
+            self.builds += 1
+        return structure
+
+    def _cost(self, structure, import_price, export_price):
+        cost = np.zeros(structure.num_cols)
+        step = structure.step_hours
+
+        def set_block(name, value):
+            start = structure.offsets[name]
+            cost[start:start + structure.num_steps] = value
+
+        set_block('charge', _TIE_BREAK)
+        set_block('discharge', _TIE_BREAK)
+        set_block('dump', _TIE_BREAK)
+        set_block('thermal_charge', _TIE_BREAK)
+        set_block('thermal_discharge', _TIE_BREAK)
+        if self.objective == 'cost':
+            set_block('grid_import', step * np.asarray(import_price, dtype=np.float64))
+            set_block('grid_export', -step * np.asarray(export_price, dtype=np.float64))
+            set_block('chp', step * self.chp_cost)
+            set_block('boiler', step * self.boiler_cost)
+        else:
+            set_block('grid_import', step)
+            set_block('boiler', _TIE_BREAK)
+            set_block('grid_export', _TIE_BREAK)
+        return cost
+
+    def solve(self, renewable, demand, thermal_demand=None, initial_storage=0.0, initial_thermal_storage=0.0,
+              step_hours=1.0, import_price=None, export_price=None):
+        """
+        Schedule one horizon.
+
+        :param renewable: Forecast solar plus wind power per step in kW.
+        :param demand: Forecast electric demand per step in kW.
+        :param thermal_demand: Forecast heat demand per step in kW, zero if not given.
+        :param initial_storage: Battery energy at the start of the horizon in kWh.
+        :param initial_thermal_storage: Thermal storage energy at the start of the horizon in kWh.
+        :param step_hours: Step length in hours.
+        :param import_price: Prices for this horizon, overriding the constructor values.
+        :param export_price: Prices for this horizon, overriding the constructor values.
+        :rtype: Schedule
+        :raises OptimizationError: if the program is infeasible, e.g. heat demand above the boiler capacity.
+        """
+        renewable = np.clip(np.asarray(renewable, dtype=np.float64), 0, None)
+        demand = np.asarray(demand, dtype=np.float64)
+        num_steps = len(demand)
+        if len(renewable) != num_steps:
+            raise ValueError("Length of the renewable forecast must match the demand forecast.")
+        thermal_demand = np.zeros(num_steps) if thermal_demand is None else \
+            np.asarray(thermal_demand, dtype=np.float64)
+        if len(thermal_demand) != num_steps:
+            raise ValueError("Length of the thermal demand forecast must match the demand forecast.")
+        initial_storage = min(max(float(initial_storage), 0.0), self.battery_capacity)
+        initial_thermal_storage = min(max(float(initial_thermal_storage), 0.0), self.thermal_storage_capacity)
+
+        structure = self._prepare(num_steps, float(step_hours))
+        cost = self._cost(structure, self.import_price if import_price is None else import_price,
+                          self.export_price if export_price is None else export_price)
+
+        col_lower = np.zeros(structure.num_cols)
+        col_upper = np.full(structure.num_cols, np.inf)
+        for name, upper in (('charge', self.battery_power), ('discharge', self.battery_power),
+                            ('battery', self.battery_capacity), ('chp', self.chp_capacity),
+                            ('boiler', self.boiler_capacity), ('curtailed', renewable),
+                            ('thermal', self.thermal_storage_capacity)):
+            structure.block(col_upper, name)[:] = upper
+        # Leave the storages at least as full as they were
+        structure.block(col_lower, 'battery')[-1] = initial_storage
+        structure.block(col_lower, 'thermal')[-1] = initial_thermal_storage
+
+        balance = np.concatenate([demand - renewable, np.zeros(num_steps), thermal_demand, np.zeros(num_steps)])
+        balance[num_steps] = initial_storage
+        balance[3 * num_steps] = initial_thermal_storage
+        row_lower = np.concatenate([balance, -structure.ramp])
+        row_upper = np.concatenate([balance, structure.ramp])
+
+        start = time.perf_counter()
+        x, objective = self._solver.solve(cost, col_lower, col_upper, row_lower, row_upper)
+        solve_time = time.perf_counter() - start
+        self.solves += 1
+        x = np.asarray(x)
+        blocks = [np.clip(structure.block(x, name), 0, None) for name in VARIABLES]
+        return Schedule(*blocks, objective=objective, solve_time=solve_time)
+
+    def dispatch_frame(self, time_steps, solar_generation, wind_generation, demand_series, thermal_demand=None,
+                       initial_storage=0.0, initial_thermal_storage=0.0, **kwargs):
+        """
+        Solve a horizon and lay the schedule out like :func:`microgrid.dispatch.simulate`.
+
+        Curtailment is split between solar and wind in proportion to their
+        output. ``Grid_Export`` is the net exchange (negative while
+        importing) and ``Grid_Import``, ``Curtailed`` and ``Boiler`` are added.
+
+        :param time_steps: DatetimeIndex of the horizon, its frequency sets the step length.
+        :rtype: pandas.DataFrame
+        """
+        solar = np.asarray(solar_generation, dtype=np.float64)
+        wind = np.asarray(wind_generation, dtype=np.float64)
+        demand = np.asarray(demand_series, dtype=np.float64)
+        thermal = np.zeros(len(demand)) if thermal_demand is None else np.asarray(thermal_demand, dtype=np.float64)
+        step_hours = (time_steps[1] - time_steps[0]).total_seconds() / 3600 if len(time_steps) > 1 else 1.0
+
+        schedule = self.solve(solar + wind, demand, thermal, initial_storage, initial_thermal_storage,
+                              step_hours=step_hours, **kwargs)
+        renewable = solar + wind
+        used = np.divide(renewable - schedule.curtailed, renewable, out=np.zeros_like(renewable),
+                         where=renewable > 0)
+        solar, wind = solar * used, wind * used
+        total = solar + wind + schedule.chp
+        battery_change = np.diff(schedule.battery, prepend=initial_storage)
+        thermal_change = np.diff(schedule.thermal, prepend=initial_thermal_storage)
+        self._planned = (pd.DatetimeIndex(time_steps), np.append(initial_storage, schedule.battery),
+                         np.append(initial_thermal_storage, schedule.thermal))
+        return pd.DataFrame({'Solar_Generation': solar,
+                             'Wind_Generation': wind,
+                             'CHP_Generation': schedule.chp,
+                             'Demand': demand,
+                             'Thermal_Demand': thermal,
+                             'Total_Generation': total,
+                             'Battery_Storage': schedule.battery,
+                             'Battery_Change': battery_change,
+                             'Thermal_Storage': schedule.thermal,
+                             'Thermal_Change': thermal_change,
+                             'Surplus_Deficit': total - demand,
+                             'Grid_Export': schedule.grid_export - schedule.grid_import,
+                             'Grid_Import': schedule.grid_import,
+                             'Curtailed': schedule.curtailed,
+                             'Boiler': schedule.boiler},
+                            index=time_steps)
+
+    def planned_storage(self, timestamp):
+        """
+        Battery and thermal storage energy the last :meth:`dispatch_frame` planned for the start of ``timestamp``.
+
+        A rolling horizon re-solve starts from these, so the storages carry
+        over between solves. Before the first horizon this is ``(0.0, 0.0)``
+        and after its end the storages stay as the horizon left them.
+
+        :rtype: tuple
+        """
+        if self._planned is None:
+            return 0.0, 0.0
+        time_steps, battery, thermal = self._planned
+        # Entry i is the energy after i steps of the horizon
+        done = min(time_steps.searchsorted(pd.Timestamp(timestamp)), len(time_steps))
+        return float(battery[done]), float(thermal[done])
@@ -0,0 +1,262 @@
+"""
+Weather driven PV production.
+
+Clear sky irradiance follows the sun position of every time step, computed
+for the whole series at once: solar declination and equation of time after
+Spencer (1971), the zenith angle from the hour angle at the middle of the
+step, and global horizontal irradiance after Haurwitz::
+
+    GHI_clear = 1098 * cos(z) * exp(-0.057 / cos(z))
+
+Cloud cover from a forecast derates it after Kasten and Czeplak::
+
+    GHI = GHI_clear * (1 - 0.75 * cloud_cover ** 3.4)
+
+and the air temperature, where the forecast has one, lowers the module
+efficiency through the cell temperature (NOCT model).
+
+Forecasts are the records of ``BaseWeatherAgent.get_hourly_forecast``
+(e.g. the WeatherDotGov agent). Weather.gov hourly periods carry no
+numeric sky cover, so besides a ``cloud_cover`` or ``skyCover`` value in
+percent the NWS sky condition words of ``shortForecast`` ("Sunny",
+"Mostly Cloudy", ...) are understood.
+
+:class:`PvModel` belongs to one location. It caches the clear sky
+irradiance per horizon for good and the derated output per horizon until
+a forecast with a new generation time arrives.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+SOLAR_CONSTANT = 1098.0
+
+STC_IRRADIANCE = 1000.0
+
+# Cloud fraction of the NWS sky condition terms, checked in this order
+SKY_CONDITIONS = (('mostly sunny', 0.25), ('mostly clear', 0.25), ('partly sunny', 0.6), ('partly cloudy', 0.4),
+                  ('mostly cloudy', 0.8), ('sunny', 0.05), ('clear', 0.05), ('fair', 0.1), ('overcast', 1.0),
+                  ('cloudy', 0.95), ('fog', 0.9), ('rain', 0.9), ('showers', 0.85), ('thunderstorms', 0.85),
+                  ('snow', 0.95), ('drizzle', 0.9))
+
+
+def cos_zenith(time_steps, latitude, longitude, tz='UTC'):
+    """
+    Cosine of the solar zenith angle at the middle of every time step.
+
+    :param time_steps: DatetimeIndex, naive indexes are taken to be in ``tz``.
+    :param latitude: Degrees north.
+    :param longitude: Degrees east.
+    :rtype: numpy.ndarray
+    """
+    time_steps = pd.DatetimeIndex(time_steps)
+    if time_steps.tz is None:
+        time_steps = time_steps.tz_localize(tz)
+    utc = time_steps.tz_convert('UTC')
+    if len(utc) > 1:
+        utc = utc + (utc[1] - utc[0]) / 2
+
+    ns_of_day = utc.asi8 % (86400 * 10**9)
+    minutes = ns_of_day / 6e10
+    day_angle = 2 * np.pi / 365 * (utc.dayofyear.values - 1 + (minutes / 60 - 12) / 24)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(day_angle) - 0.032077 * np.sin(day_angle) -
+                                 0.014615 * np.cos(2 * day_angle) - 0.040849 * np.sin(2 * day_angle))
+    declination = (0.006918 - 0.399912 * np.cos(day_angle) + 0.070257 * np.sin(day_angle) -
+                   0.006758 * np.cos(2 * day_angle) + 0.000907 * np.sin(2 * day_angle) -
+                   0.002697 * np.cos(3 * day_angle) + 0.00148 * np.sin(3 * day_angle))
+    true_solar_minutes = minutes + equation_of_time + 4 * longitude
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    lat = np.radians(latitude)
+    return np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+
+
+def clear_sky_irradiance(cos_z):
+    """
+    Global horizontal clear sky irradiance in W/m² (Haurwitz), zero while the sun is down.
+
+    :rtype: numpy.ndarray
+    """
+    cos_z = np.asarray(cos_z, dtype=np.float64)
+    up = cos_z > 0.01
+    safe = np.where(up, cos_z, 1.0)
+    return np.where(up, SOLAR_CONSTANT * safe * np.exp(-0.057 / safe), 0.0)
+
+
+def _percent(value):
+    if isinstance(value, dict):
+        value = value.get('value')
+    if value is None:
+        return None
+    value = float(value)
+    return value / 100.0 if value > 1 else value
+
+
+def _sky_condition(text):
+    text = text.lower()
+    for words, cloud_cover in SKY_CONDITIONS:
+        if words in text:
+            return cloud_cover
+    return None
+
+
+def parse_forecast(records):
+    """
+    Cloud cover and air temperature of forecast records.
+
+    :param records: ``weather_results`` of ``get_hourly_forecast``, ``[[time, {point: value}], ...]``.
+    :returns: Start times in epoch seconds, cloud cover (0 to 1) and air temperature in °C, NaN where unknown,
+              sorted by time.
+    :rtype: tuple
+    """
+    times, clouds, temperatures = [], [], []
+    for forecast_time, points in records:
+        cloud_cover = None
+        for name in ('cloud_cover', 'skyCover', 'cloud_area_fraction'):
+            if points.get(name) is not None:
+                cloud_cover = _percent(points[name])
+                break
+        if cloud_cover is None and points.get('shortForecast'):
+            cloud_cover = _sky_condition(points['shortForecast'])
+
+        temperature = points.get('air_temperature', points.get('temperature'))
+        if isinstance(temperature, dict):
+            temperature = temperature.get('value')
+        if temperature is not None:
+            temperature = float(temperature)
+            if str(points.get('temperatureUnit', 'C')).upper().startswith('F'):
+                temperature = (temperature - 32) * 5 / 9
+
+        # Naive times are UTC, Timestamp.value is nanoseconds since the epoch either way
+        times.append(pd.Timestamp(forecast_time).value / 1e9)
+        clouds.append(np.nan if cloud_cover is None else min(max(cloud_cover, 0.0), 1.0))
+        temperatures.append(np.nan if temperature is None else temperature)
+
+    order = np.argsort(times, kind='stable')
+    return (np.asarray(times, dtype=np.float64)[order], np.asarray(clouds)[order],
+            np.asarray(temperatures, dtype=np.float64)[order])
+
+
+class PvModel(object):
+    """
+    PV production of one location.
+
+    :param latitude: Degrees north.
+    :param longitude: Degrees east.
+    :param capacity: Peak output at 1000 W/m² and 25 °C.
+    :param tz: Time zone of naive time steps.
+    :param temperature_coefficient: Relative power change per kelvin of cell temperature.
+    :param noct: Nominal operating cell temperature in °C.
+    :param default_cloud_cover: Cloud cover for steps without forecast.
+    :param max_entries: Number of horizons kept in each cache.
+    """
+
+    def __init__(self, latitude, longitude, capacity=1.0, tz='UTC', temperature_coefficient=-0.004, noct=45.0,
+                 default_cloud_cover=0.3, max_entries=16):
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.capacity = float(capacity)
+        self.tz = tz
+        self.temperature_coefficient = float(temperature_coefficient)
+        self.noct = float(noct)
+        self.default_cloud_cover = float(default_cloud_cover)
+        self.max_entries = int(max_entries)
+        self.generation_time = None
+        self.hits = 0
+        self.misses = 0
+        self._forecast = None
+        self._clear_sky = OrderedDict()
+        self._profiles = OrderedDict()
+
+    def update_forecast(self, records, generation_time=None):
+        """
+        Use a new forecast, dropping the cached profiles.
+
+        :param records: ``weather_results`` of ``get_hourly_forecast``.
+        :param generation_time: Generation time of the forecast, a forecast with the same time is ignored.
+        :returns: True if the forecast was new.
+        """
+        if generation_time is not None and generation_time == self.generation_time:
+            return False
+        self._forecast = parse_forecast(records)
+        self.generation_time = generation_time
+        self._profiles.clear()
+        return True
+
+    @staticmethod
+    def _key(time_steps):
+        index = time_steps.asi8
+        return (str(time_steps.tz), len(index), int(index[0]) if len(index) else 0,
+                int(index[1] - index[0]) if len(index) > 1 else 0)
+
+    @staticmethod
+    def _remember(cache, key, value, max_entries):
+        cache[key] = value
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+
+    def clear_sky(self, time_steps):
+        """
+        Clear sky irradiance of every time step in W/m², cached per horizon.
+
+        :rtype: numpy.ndarray
+        """
+        time_steps = pd.DatetimeIndex(time_steps)
+        regular = time_steps.freq is not None or len(time_steps) <= 2
+        key = self._key(time_steps)
+        irradiance = self._clear_sky.get(key) if regular else None
+        if irradiance is None:
+            irradiance = clear_sky_irradiance(cos_zenith(time_steps, self.latitude, self.longitude, self.tz))
+            irradiance.flags.writeable = False
+            if regular:
+                self._remember(self._clear_sky, key, irradiance, self.max_entries)
+        return irradiance
+
+    def profile(self, time_steps):
+        """
+        PV output of every time step, derated by the current forecast.
+
+        Regular horizons are cached until the next forecast; irregular ones
+        are recomputed on every call.
+
+        :param time_steps: DatetimeIndex of the horizon.
+        :returns: Read only array in units of ``capacity``.
+        :rtype: numpy.ndarray
+        """
+        time_steps = pd.DatetimeIndex(time_steps)
+        regular = time_steps.freq is not None or len(time_steps) <= 2
+        key = self._key(time_steps)
+        output = self._profiles.get(key) if regular else None
+        if output is not None:
+            self.hits += 1
+            self._profiles.move_to_end(key)
+            return output
+        self.misses += 1
+
+        irradiance = self.clear_sky(time_steps)
+        cloud_cover = np.full(len(time_steps), self.default_cloud_cover)
+        temperature = np.full(len(time_steps), np.nan)
+        if self._forecast is not None and len(self._forecast[0]):
+            times, clouds, temperatures = self._forecast
+            localized = time_steps if time_steps.tz is not None else time_steps.tz_localize(self.tz)
+            seconds = localized.tz_convert('UTC').asi8 / 1e9
+            # Every forecast record holds until the next one, the last one for an hour
+            position = np.searchsorted(times, seconds, side='right') - 1
+            covered = (position >= 0) & (seconds < times[-1] + 3600)
+            position = np.clip(position, 0, None)
+            known = covered & ~np.isnan(clouds[position])
+            cloud_cover[known] = clouds[position[known]]
+            temperature = np.where(covered, temperatures[position], np.nan)
+
+        irradiance = irradiance * (1 - 0.75 * cloud_cover ** 3.4)
+        cell_temperature = temperature + irradiance / 800.0 * (self.noct - 20.0)
+        factor = np.where(np.isnan(cell_temperature), 1.0,
+                          1 + self.temperature_coefficient * (cell_temperature - 25.0))
+        output = np.clip(self.capacity * irradiance / STC_IRRADIANCE * factor, 0.0, None)
+        output.flags.writeable = False
+        if regular:
+            self._remember(self._profiles, key, output, self.max_entries)
+        return output
@@ -0,0 +1,157 @@
+"""
+Battery dispatch strategies for the microgrid simulation.
+
+A strategy does not run the dispatch itself. It looks at the whole demand
+series (and the time index) once and turns its rules into per step arrays,
+a :class:`DispatchPlan`, which the scan in :mod:`microgrid.dispatch`
+consumes in linear time. Percentiles, rolling windows and tariff masks are
+therefore computed exactly once per simulation.
+
+Strategies are registered by name so agent configurations can select them::
+
+    strategy = get_strategy('peak_shaving', percentile=90)
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+#: Per step dispatch rules.
+#:
+#: ``discharge_threshold`` -- the battery only covers a deficit while the demand is above this value.
+#: ``grid_charge`` -- power drawn from the grid to charge the battery when there is no surplus.
+#: ``export_residual`` -- record the net grid exchange in every step instead of only the charging surplus.
+DispatchPlan = namedtuple('DispatchPlan', ['discharge_threshold', 'grid_charge', 'export_residual'])
+
+STRATEGIES = {}
+
+
+def register_strategy(cls):
+    """Class decorator adding a strategy to :data:`STRATEGIES` under its ``name``."""
+    STRATEGIES[cls.name] = cls
+    return cls
+
+
+def get_strategy(strategy, **params):
+    """
+    Look up and instantiate a strategy.
+
+    :param strategy: Registered strategy name or an existing strategy instance.
+    :param params: Strategy parameters, only used when a name is given.
+    :rtype: BaseStrategy
+    """
+    if isinstance(strategy, BaseStrategy):
+        return strategy
+    try:
+        cls = STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError("Invalid battery strategy {!r}. Choose one of {}.".format(strategy, sorted(STRATEGIES)))
+    return cls(**params)
+
+
+class BaseStrategy(object):
+    """
+    Base class for battery dispatch strategies.
+
+    Subclasses set ``name`` and implement :meth:`prepare`.
+    """
+    name = None
+
+    def prepare(self, demand, time_steps=None):
+        """
+        Precompute the dispatch plan for a demand series.
+
+        :param demand: Demand per time step as a float array.
+        :param time_steps: DatetimeIndex of the series, required by time dependent strategies.
+        :rtype: DispatchPlan
+        """
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__,
+                               ", ".join("{}={!r}".format(k, v) for k, v in sorted(vars(self).items())))
+
+
+@register_strategy
+class DefaultStrategy(BaseStrategy):
+    """
+    Charge from every surplus and discharge on every deficit.
+
+    Only the part of a surplus that does not fit into the battery is
+    recorded as grid export.
+    """
+    name = 'default'
+
+    def prepare(self, demand, time_steps=None):
+        size = len(demand)
+        return DispatchPlan(np.full(size, -np.inf), np.zeros(size), False)
+
+
+@register_strategy
+class PeakShavingStrategy(BaseStrategy):
+    """
+    Keep the battery for demand peaks.
+
+    The battery only discharges while the demand is above a percentile of the
+    demand series. Without a ``window`` the percentile is taken over the whole
+    series, otherwise over a trailing window of that many steps.
+    """
+    name = 'peak_shaving'
+
+    def __init__(self, percentile=80, window=None):
+        self.percentile = float(percentile)
+        self.window = int(window) if window else None
+
+    def prepare(self, demand, time_steps=None):
+        size = len(demand)
+        if not size:
+            threshold = np.zeros(0)
+        elif self.window is None:
+            threshold = np.full(size, np.percentile(demand, self.percentile))
+        else:
+            threshold = (pd.Series(demand).rolling(self.window, min_periods=1)
+                         .quantile(self.percentile / 100.0).to_numpy())
+        return DispatchPlan(threshold, np.zeros(size), True)
+
+
+@register_strategy
+class SelfConsumptionStrategy(BaseStrategy):
+    """
+    Maximise the use of local generation.
+
+    Charges from every surplus, discharges on every deficit and records the
+    net grid exchange (negative for imports) in every step.
+    """
+    name = 'self_consumption_max'
+
+    def prepare(self, demand, time_steps=None):
+        size = len(demand)
+        return DispatchPlan(np.full(size, -np.inf), np.zeros(size), True)
+
+
+@register_strategy
+class TimeOfUseStrategy(BaseStrategy):
+    """
+    Shift grid energy from off-peak to peak tariff hours.
+
+    The battery only discharges during ``peak_hours`` and, in ``off_peak_hours``
+    without a local surplus, charges from the grid with up to
+    ``grid_charge_power`` per step. Surplus generation is always stored.
+    """
+    name = 'time_of_use'
+
+    def __init__(self, peak_hours=(17, 18, 19, 20), off_peak_hours=(0, 1, 2, 3, 4, 5), grid_charge_power=0.0):
+        self.peak_hours = tuple(int(hour) for hour in peak_hours)
+        self.off_peak_hours = tuple(int(hour) for hour in off_peak_hours)
+        self.grid_charge_power = float(grid_charge_power)
+
+    def prepare(self, demand, time_steps=None):
+        if time_steps is None:
+            raise ValueError("The time_of_use strategy needs the time steps of the demand series.")
+        hours = pd.DatetimeIndex(time_steps).hour.values
+        threshold = np.where(np.isin(hours, self.peak_hours), -np.inf, np.inf)
+        grid_charge = np.where(np.isin(hours, self.off_peak_hours), self.grid_charge_power, 0.0)
+        return DispatchPlan(threshold, grid_charge, True)
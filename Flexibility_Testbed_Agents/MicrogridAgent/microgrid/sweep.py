@@ -0,0 +1,333 @@
+"""
+Multi-scenario sizing sweep for the microgrid simulation.
+
+Scenarios combine solar, wind, CHP and battery sizes (``setting5`` to
+``setting9`` of the Microgrid agent). They come either from a parameter grid
+or from Monte Carlo draws and are evaluated in batches along a scenario axis
+with :func:`microgrid.dispatch.dispatch_battery_batch`. Batches are spread
+over a process pool and the per-scenario KPIs are streamed back as they
+finish.
+
+Run from the agent directory::
+
+    python -m microgrid.sweep sweep.json demand.csv --output results.csv --workers 8
+
+where ``sweep.json`` holds a ``grid`` or a ``monte_carlo`` section, for example::
+
+    {
+        "time_resolution": "15-min",
+        "battery_mode": "peak_shaving",
+        "strategy_params": {"percentile": 90},
+        "grid": {"solar_capacity": [1000, 2000, 3000], "battery_capacity": [0, 10000, 50000]},
+        "fixed": {"chp_capacity": 1600}
+    }
+
+    {
+        "monte_carlo": {"num_scenarios": 5000, "seed": 1,
+                        "distributions": {"solar_capacity": ["uniform", 1000, 5000],
+                                          "wind_capacity": ["normal", 2000, 300]}}
+    }
+"""
+
+__docformat__ = 'reStructuredText'
+
+import csv
+import itertools
+import json
+import logging
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .dispatch import dispatch_battery_batch
+from .generation import chp_profile, solar_profile, wind_profile
+
+_log = logging.getLogger(__name__)
+
+#: Sweepable parameters and their defaults, matching the Microgrid agent defaults.
+PARAMETERS = {'solar_capacity': 3000.0,
+              'wind_capacity': 3000.0,
+              'chp_capacity': 3000.0,
+              'battery_capacity': 10000.0,
+              'battery_efficiency': 0.9}
+
+KPIS = ['self_sufficiency', 'self_consumption', 'grid_export', 'grid_import', 'battery_cycles']
+
+DISTRIBUTIONS = ('uniform', 'normal', 'lognormal', 'triangular', 'choice')
+
+_FREQUENCIES = {'hourly': 'H', '15-min': '15min'}
+
+# Inputs shared by every batch, set once per worker process by _init_worker.
+_shared_inputs = None
+
+
+def parameter_grid(**grid):
+    """
+    Build the cartesian product of parameter values.
+
+    :param grid: Parameter name to list of values.
+    :returns: One dictionary per scenario.
+    :rtype: list
+    """
+    _check_parameters(grid)
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def monte_carlo(num_scenarios, distributions, seed=None):
+    """
+    Draw scenarios from independent parameter distributions.
+
+    Each distribution is a list ``[kind, *args]`` where ``kind`` is one of
+    ``uniform`` (low, high), ``normal`` (mean, std), ``lognormal``
+    (mean, sigma), ``triangular`` (left, mode, right) or ``choice``
+    (values...). Negative draws are clipped to zero.
+
+    :param num_scenarios: Number of scenarios to draw.
+    :param distributions: Parameter name to distribution.
+    :param seed: Seed for a reproducible draw.
+    :returns: One dictionary per scenario.
+    :rtype: list
+    """
+    _check_parameters(distributions)
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name in sorted(distributions):
+        kind, *args = distributions[name]
+        if kind not in DISTRIBUTIONS:
+            raise ValueError("Unknown distribution {!r} for {}. Choose one of {}.".format(kind, name,
+                                                                                        DISTRIBUTIONS))
+        if kind == 'choice':
+            values = rng.choice(np.asarray(args, dtype=np.float64), size=num_scenarios)
+        else:
+            values = getattr(rng, kind)(*args, size=num_scenarios)
+        columns[name] = np.clip(values, 0, None)
+    return [{name: float(columns[name][i]) for name in columns} for i in range(num_scenarios)]
+
+
+def _check_parameters(parameters):
+    unknown = set(parameters) - set(PARAMETERS)
+    if unknown:
+        raise ValueError("Unknown sweep parameters {}. Choose from {}.".format(sorted(unknown), sorted(PARAMETERS)))
+
+
+def sweep_time_steps(num_time_points, time_resolution='hourly', start=None):
+    """Time index of a sweep horizon, starting today at midnight unless ``start`` is given."""
+    if time_resolution not in _FREQUENCIES:
+        raise ValueError("Invalid time_resolution. Choose 'hourly' or '15-min'.")
+    if start is None:
+        start = pd.Timestamp.now().normalize()
+    return pd.date_range(start=start, periods=num_time_points, freq=_FREQUENCIES[time_resolution])
+
+
+def unit_profiles(time_steps):
+    """
+    Generation profiles of a 1 kW solar, wind and CHP unit.
+
+    Uses the same :mod:`microgrid.generation` profiles as the Microgrid agent.
+
+    :returns: Array of shape ``(3, len(time_steps))`` ordered solar, wind, CHP.
+    :rtype: numpy.ndarray
+    """
+    return np.stack([solar_profile(time_steps), wind_profile(time_steps), chp_profile(time_steps)])
+
+
+def evaluate_batch(scenarios, demand, profiles, battery_mode='default', curtail_when_full=False, time_steps=None,
+                   strategy_params=None):
+    """
+    Simulate a batch of scenarios and compute their KPIs.
+
+    Self-sufficiency is the share of demand covered by local generation and
+    battery discharge, self-consumption the share of used generation that
+    was consumed directly or stored. Grid export is the generation left
+    after direct use and charging, the same for every battery strategy.
+    Battery cycles are equivalent full cycles (charged energy over capacity).
+
+    :param scenarios: List of parameter dictionaries.
+    :param demand: Demand series shared by all scenarios.
+    :param profiles: Unit profiles as returned by :func:`unit_profiles`.
+    :param battery_mode: Battery strategy passed to the dispatch engine.
+    :param curtail_when_full: Switch off generation while the battery is full.
+    :param time_steps: Time index of the horizon, needed by time dependent strategies.
+    :param strategy_params: Parameters for the battery strategy.
+    :returns: One row per scenario with the parameters and :data:`KPIS`.
+    :rtype: list
+    """
+    params = {name: np.array([scenario.get(name, default) for scenario in scenarios], dtype=np.float64)
+              for name, default in PARAMETERS.items()}
+    demand = np.asarray(demand, dtype=np.float64)
+
+    sizes = np.stack([params['solar_capacity'], params['wind_capacity'], params['chp_capacity']], axis=1)
+    generation = sizes @ profiles
+    result = dispatch_battery_batch(generation, demand, params['battery_capacity'],
+                                    params['battery_efficiency'], battery_mode, curtail_when_full,
+                                    time_steps=time_steps, **(strategy_params or {}))
+
+    if curtail_when_full:
+        # Generation of a step is switched off when the battery was full after the previous step.
+        running = np.ones_like(result.curtailed)
+        running[:, 1:] = ~result.curtailed[:, :-1]
+        generation = generation * running
+
+    direct = np.minimum(generation, demand)
+    charge = np.clip(result.change, 0, None)
+    # Grid charging (time_of_use) is not self-consumed generation.
+    stored = np.minimum(charge, np.clip(generation - demand, 0, None))
+    discharge = np.clip(-result.change, 0, None)
+    total_demand = demand.sum()
+    total_generation = generation.sum(axis=1)
+
+    kpis = {
+        'self_sufficiency': _ratio((direct + discharge).sum(axis=1), total_demand),
+        'self_consumption': _ratio((direct + stored).sum(axis=1), total_generation),
+        'grid_export': np.clip(generation - direct - stored, 0, None).sum(axis=1),
+        'grid_import': np.clip(demand - direct - discharge, 0, None).sum(axis=1),
+        'battery_cycles': _ratio(charge.sum(axis=1), params['battery_capacity'])
+    }
+
+    rows = []
+    for i, scenario in enumerate(scenarios):
+        row = dict(scenario)
+        for name, default in PARAMETERS.items():
+            row.setdefault(name, default)
+        for name in KPIS:
+            row[name] = float(kpis[name][i])
+        rows.append(row)
+    return rows
+
+
+def _ratio(numerator, denominator):
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=np.float64),
+                                                 np.asarray(denominator, dtype=np.float64))
+    out = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _init_worker(shared_inputs):
+    global _shared_inputs
+    _shared_inputs = shared_inputs
+
+
+def _evaluate_shared(scenarios):
+    return evaluate_batch(scenarios, *_shared_inputs)
+
+
+def iter_sweep(scenarios, demand_series, time_resolution='hourly', battery_mode='default', curtail_when_full=False,
+               fixed=None, batch_size=256, max_workers=None, start=None, strategy_params=None):
+    """
+    Evaluate scenarios on a process pool and yield result rows as batches finish.
+
+    :param scenarios: Parameter dictionaries from :func:`parameter_grid` or :func:`monte_carlo`.
+    :param demand_series: Demand series shared by all scenarios.
+    :param time_resolution: ``'hourly'`` or ``'15-min'``.
+    :param battery_mode: Battery strategy passed to the dispatch engine.
+    :param curtail_when_full: Switch off generation while the battery is full.
+    :param fixed: Parameter values applied to every scenario unless it sets its own.
+    :param batch_size: Number of scenarios simulated together in one batch.
+    :param max_workers: Worker processes, ``0`` evaluates in the calling process.
+    :param start: First time step, defaults to today at midnight.
+    :param strategy_params: Parameters for the battery strategy.
+    :returns: Generator of result rows in completion order.
+    """
+    demand = np.asarray(demand_series, dtype=np.float64)
+    time_steps = sweep_time_steps(len(demand), time_resolution, start)
+    profiles = unit_profiles(time_steps)
+    if fixed:
+        _check_parameters(fixed)
+        scenarios = [dict(fixed, **scenario) for scenario in scenarios]
+    batches = [scenarios[i:i + batch_size] for i in range(0, len(scenarios), batch_size)]
+    shared_inputs = (demand, profiles, battery_mode, curtail_when_full, time_steps, strategy_params)
+
+    if max_workers == 0:
+        for batch in batches:
+            yield from evaluate_batch(batch, *shared_inputs)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(shared_inputs,)) as executor:
+        futures = [executor.submit(_evaluate_shared, batch) for batch in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def run_sweep(scenarios, demand_series, output=None, **kwargs):
+    """
+    Evaluate all scenarios and collect the results in a table.
+
+    :param scenarios: Parameter dictionaries from :func:`parameter_grid` or :func:`monte_carlo`.
+    :param demand_series: Demand series shared by all scenarios.
+    :param output: Optional CSV path; rows are appended as they arrive.
+    :param kwargs: Passed on to :func:`iter_sweep`.
+    :returns: One row per scenario.
+    :rtype: pandas.DataFrame
+    """
+    columns = sorted(PARAMETERS) + KPIS
+    rows = []
+    writer = None
+    output_file = open(output, 'w', newline='') if output else None
+    try:
+        if output_file:
+            writer = csv.DictWriter(output_file, fieldnames=columns)
+            writer.writeheader()
+        for row in iter_sweep(scenarios, demand_series, **kwargs):
+            rows.append(row)
+            if writer:
+                writer.writerow(row)
+                output_file.flush()
+    finally:
+        if output_file:
+            output_file.close()
+    return pd.DataFrame(rows, columns=columns)
+
+
+def scenarios_from_config(config):
+    """
+    Build the scenario list described by a sweep configuration.
+
+    :param config: Dictionary with a ``grid`` or ``monte_carlo`` section.
+    :rtype: list
+    """
+    if 'grid' in config:
+        return parameter_grid(**config['grid'])
+    if 'monte_carlo' in config:
+        settings = config['monte_carlo']
+        return monte_carlo(int(settings['num_scenarios']), settings['distributions'], settings.get('seed'))
+    raise ValueError("Sweep configuration needs a 'grid' or a 'monte_carlo' section.")
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('config', help='JSON sweep configuration.')
+    parser.add_argument('demand', help='CSV file with the demand series in its last column.')
+    parser.add_argument('--output', help='CSV file the results are streamed to.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes, 0 runs in this process. Defaults to the CPU count.')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='Number of scenarios simulated together in one batch.')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    demand = pd.read_csv(args.demand).iloc[:, -1].to_numpy(dtype=np.float64)
+    scenarios = scenarios_from_config(config)
+
+    _log.info("Evaluating {} scenarios over {} time steps".format(len(scenarios), len(demand)))
+    results = run_sweep(scenarios, demand, output=args.output,
+                        time_resolution=config.get('time_resolution', 'hourly'),
+                        battery_mode=config.get('battery_mode', 'default'),
+                        curtail_when_full=config.get('curtail_when_full', False),
+                        strategy_params=config.get('strategy_params'),
+                        fixed=config.get('fixed'),
+                        batch_size=args.batch_size,
+                        max_workers=args.workers)
+    if not args.output:
+        results.to_csv(sys.stdout, index=False)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Reduced order thermal model of a fleet of buildings.
+
+Every building is a single thermal capacity ``C`` (kWh/K) behind a
+resistance ``R`` (K/kW) to the outdoor air, heated by an ideal controller
+that holds the setpoint as far as the heating capacity allows. Solar gains
+through an effective aperture (m²) and internal gains (kW) warm the
+building for free. With the exact discretisation over a step of ``dt``
+hours, ``a = exp(-dt / (R * C))``::
+
+    T[k+1] = a * T[k] + (1 - a) * T_out[k] + R * (1 - a) * (Q[k] + gains[k])
+
+and ``Q[k]`` is the heat that brings ``T[k+1]`` to the setpoint, clipped to
+``[0, heating_capacity]``.
+
+The state of all buildings is one array, so a time step is a handful of
+array operations over the fleet. Steps are processed in blocks; per
+building results are only reduced to fleet totals per block, so a year of
+quarter hours for thousands of buildings never holds a buildings by time
+steps matrix unless asked for.
+
+The fleet heat demand is the ``thermal_demand`` of
+:func:`microgrid.dispatch.simulate` (thermal storage) and, with a
+:class:`~microgrid.heatpump.HeatPumpTable`, the electrical power of a heat
+pump per building supplied at :func:`heating_curve` temperatures is added
+to the electrical demand.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import namedtuple
+
+import numpy as np
+
+ThermalResult = namedtuple('ThermalResult', ['heating', 'temperature', 'electrical'])
+
+#: Ranges :meth:`ThermalFleet.sample` draws buildings from, uniform between the bounds.
+SAMPLE_RANGES = {'resistance': (3.0, 12.0),
+                 'capacitance': (5.0, 30.0),
+                 'heating_capacity': (8.0, 20.0),
+                 'solar_aperture': (2.0, 10.0),
+                 'internal_gains': (0.2, 0.8)}
+
+
+def heating_curve(outdoor_temperature, design_outdoor=-12.0, design_supply=55.0, base_supply=35.0,
+                  heating_limit=15.0):
+    """
+    Supply temperature of a weather compensated heating circuit.
+
+    Rises linearly from ``base_supply`` at the heating limit to
+    ``design_supply`` at the design outdoor temperature.
+
+    :rtype: numpy.ndarray
+    """
+    slope = (design_supply - base_supply) / (heating_limit - design_outdoor)
+    outdoor_temperature = np.asarray(outdoor_temperature, dtype=np.float64)
+    return np.clip(base_supply + slope * (heating_limit - outdoor_temperature), base_supply, design_supply)
+
+
+class ThermalFleet(object):
+    """
+    RC models of a fleet of buildings stepped together.
+
+    Parameters are scalars for the whole fleet or one value per building.
+
+    :param resistance: Thermal resistance to the outdoor air in K/kW.
+    :param capacitance: Thermal capacity in kWh/K.
+    :param heating_capacity: Largest heat output in kW.
+    :param solar_aperture: Effective solar aperture in m².
+    :param internal_gains: Internal gains in kW.
+    :param initial_temperature: Indoor temperature in degC before the first step.
+    :param num_buildings: Fleet size, only needed if every parameter is a scalar.
+    """
+
+    def __init__(self, resistance, capacitance, heating_capacity=np.inf, solar_aperture=0.0, internal_gains=0.0,
+                 initial_temperature=20.0, num_buildings=None):
+        params = [np.asarray(value, dtype=np.float64) for value in
+                  (resistance, capacitance, heating_capacity, solar_aperture, internal_gains, initial_temperature)]
+        if num_buildings is None:
+            num_buildings = max([param.size for param in params if param.ndim] or [1])
+        try:
+            params = [np.array(np.broadcast_to(param, (num_buildings,))) for param in params]
+        except ValueError:
+            raise ValueError("Building parameters must be scalars or have one value per building")
+        (self.resistance, self.capacitance, self.heating_capacity, self.solar_aperture, self.internal_gains,
+         self.temperature) = params
+        if (self.resistance <= 0).any() or (self.capacitance <= 0).any():
+            raise ValueError("Thermal resistance and capacitance must be positive")
+        if (self.heating_capacity < 0).any():
+            raise ValueError("Heating capacity must not be negative")
+
+    @classmethod
+    def sample(cls, num_buildings, seed=None, initial_temperature=20.0, **ranges):
+        """
+        Fleet with parameters drawn uniformly from :data:`SAMPLE_RANGES`.
+
+        :param ranges: Replacement ``(low, high)`` bounds by parameter name.
+        :rtype: ThermalFleet
+        """
+        unknown = set(ranges) - set(SAMPLE_RANGES)
+        if unknown:
+            raise ValueError("Unknown building parameters {}".format(sorted(unknown)))
+        rng = np.random.default_rng(seed)
+        bounds = dict(SAMPLE_RANGES, **ranges)
+        params = {name: rng.uniform(low, high, num_buildings) for name, (low, high) in sorted(bounds.items())}
+        return cls(initial_temperature=initial_temperature, num_buildings=num_buildings, **params)
+
+    def __len__(self):
+        return len(self.temperature)
+
+    def _input(self, name, value, num_steps):
+        """View of an input as (time steps, buildings), without copying shared series."""
+        value = np.asarray(value, dtype=np.float64)
+        if value.ndim == 1 and len(value) == num_steps:
+            value = value[:, np.newaxis]
+        elif value.ndim == 2:
+            value = value.T
+        elif value.ndim > 2:
+            raise ValueError("{} must be a scalar, a series or a buildings by time steps array".format(name))
+        try:
+            return np.broadcast_to(value, (num_steps, len(self)))
+        except ValueError:
+            raise ValueError("{} of shape {} does not fit {} buildings and {} time steps".format(
+                name, value.T.shape, len(self), num_steps))
+
+    def simulate(self, outdoor_temperature, setpoint=20.0, step_hours=0.25, solar_irradiance=None,
+                 internal_gains=None, heat_pump=None, supply_temperature=heating_curve, per_building=False,
+                 block=96):
+        """
+        Step the fleet through a weather series.
+
+        Series of one value per time step are shared by all buildings,
+        arrays of shape ``(buildings, time steps)`` or ``(buildings, 1)``
+        are per building. The indoor temperatures at the end are kept for
+        the next call.
+
+        :param outdoor_temperature: Outdoor air temperature in degC.
+        :param setpoint: Indoor setpoint in degC.
+        :param step_hours: Step length in hours.
+        :param solar_irradiance: Global irradiance in W/m², e.g. from :mod:`microgrid.pv`.
+        :param internal_gains: Internal gains in kW, the fleet's constant gains if omitted.
+        :param heat_pump: :class:`~microgrid.heatpump.HeatPumpTable` supplying every building.
+        :param supply_temperature: Callable mapping the outdoor temperature to the heat pump supply temperature.
+        :param per_building: Return ``(buildings, time steps)`` arrays instead of fleet totals.
+        :param block: Time steps reduced at once.
+        :returns: Heat demand in kW, indoor temperature in degC (the fleet mean unless ``per_building``) and
+                  heat pump electrical power in kW (None without ``heat_pump``).
+        :rtype: ThermalResult
+        """
+        outdoor_temperature = np.asarray(outdoor_temperature, dtype=np.float64)
+        num_steps = outdoor_temperature.shape[-1]
+        outdoor = self._input('outdoor_temperature', outdoor_temperature, num_steps)
+        setpoint = self._input('setpoint', setpoint, num_steps)
+        gains = self._input('internal_gains', self.internal_gains if internal_gains is None else internal_gains,
+                            num_steps)
+        irradiance = None if solar_irradiance is None else \
+            self._input('solar_irradiance', solar_irradiance, num_steps)
+
+        decay = np.exp(-step_hours / (self.resistance * self.capacitance))
+        gain = self.resistance * (1 - decay)
+        inverse_gain = 1 / gain
+        capacity = self.heating_capacity
+
+        shape = (len(self), num_steps) if per_building else (num_steps,)
+        heating = np.empty(shape)
+        temperature = np.empty(shape)
+        electrical = None if heat_pump is None else np.empty(shape)
+
+        state = self.temperature.copy()
+        free = np.empty(len(self))
+        heat = np.empty((min(block, num_steps), len(self)))
+        indoor = np.empty_like(heat)
+        for start in range(0, num_steps, block):
+            stop = min(start + block, num_steps)
+            size = stop - start
+            # Everything that does not depend on the state, for the whole block at once
+            drive = (1 - decay) * outdoor[start:stop] + gain * gains[start:stop]
+            if irradiance is not None:
+                drive += gain * self.solar_aperture * irradiance[start:stop] / 1000.0
+            target = (setpoint[start:stop] - drive) * inverse_gain
+            for k in range(size):
+                step_heat = heat[k]
+                np.multiply(decay, state, out=free)
+                np.multiply(free, inverse_gain, out=step_heat)
+                np.subtract(target[k], step_heat, out=step_heat)
+                # np.clip is several times slower than the two ufuncs on arrays this size
+                np.maximum(step_heat, 0.0, out=step_heat)
+                np.minimum(step_heat, capacity, out=step_heat)
+                free += drive[k]
+                np.multiply(gain, step_heat, out=state)
+                state += free
+                indoor[k] = state
+
+            if heat_pump is not None:
+                source = outdoor[start:stop]
+                power = heat_pump.electrical_power(heat[:size], source, supply_temperature(source))
+            if per_building:
+                heating[:, start:stop] = heat[:size].T
+                temperature[:, start:stop] = indoor[:size].T
+                if heat_pump is not None:
+                    electrical[:, start:stop] = power.T
+            else:
+                heating[start:stop] = heat[:size].sum(axis=1)
+                temperature[start:stop] = indoor[:size].mean(axis=1)
+                if heat_pump is not None:
+                    electrical[start:stop] = power.sum(axis=1)
+
+        self.temperature = state
+        return ThermalResult(heating, temperature, electrical)
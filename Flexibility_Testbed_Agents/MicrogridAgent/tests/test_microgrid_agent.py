@@ -0,0 +1,44 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from mock import MagicMock
+
+pytest.importorskip('matplotlib')
+
+from microgrid.agent import Microgrid
+
+
+def test_stopping_waits_for_pending_cache_writes(tmp_path, monkeypatch):
+    agent = Microgrid(setting19=4, setting20=str(tmp_path))
+    agent.vip = MagicMock()
+    agent.configure('config', 'NEW', {})
+    cache = agent.cache
+
+    release = threading.Event()
+    write = cache._write
+
+    def slow_write(key, entry):
+        release.wait(5)
+        write(key, entry)
+
+    monkeypatch.setattr(cache, '_write', slow_write)
+    time_steps = pd.date_range('2024-03-04', periods=24, freq='H')
+    cache.simulate(time_steps, np.full(24, 10.0), np.zeros(24), np.zeros(24), np.full(24, 20.0), 100, 0.9)
+    assert list(tmp_path.glob('*.npz')) == []
+
+    threading.Timer(0.2, release.set).start()
+    agent.onstop(None)
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+    assert cache._writer is None
+
+
+def test_replacing_the_cache_closes_the_old_one(tmp_path):
+    agent = Microgrid(setting19=4, setting20=str(tmp_path))
+    agent.vip = MagicMock()
+    agent.configure('config', 'NEW', {})
+    old = agent.cache
+    agent.configure('config', 'UPDATE', {'setting19': 8})
+    assert agent.cache is not old and old._writer is None
+    assert agent.cache._writer is not None
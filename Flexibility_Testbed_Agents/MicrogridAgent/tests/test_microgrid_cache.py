@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.cache import SimulationCache
+from microgrid.dispatch import simulate
+from microgrid.generation import chp_profile, solar_profile, wind_profile
+
+
+def inputs(num_time_points=96 * 7, seed=0):
+    time_steps = pd.date_range('2024-03-04', periods=num_time_points, freq='15min')
+    demand = np.random.default_rng(seed).uniform(2000, 9000, num_time_points)
+    thermal = np.random.default_rng(seed + 1).uniform(0, 3000, num_time_points)
+    return (time_steps, solar_profile(time_steps, 3000), wind_profile(time_steps, 3000),
+            chp_profile(time_steps, 1500), demand, thermal)
+
+
+def run(function, time_steps, solar, wind, chp, demand, thermal, **kwargs):
+    params = dict(battery_capacity=10000, battery_efficiency=0.9, thermal_storage_capacity=5000,
+                  thermal_storage_efficiency=0.85, curtail_when_full=True)
+    params.update(kwargs)
+    return function(time_steps, solar, wind, chp, demand, thermal_demand=thermal, **params)
+
+
+def test_repeated_requests_are_hits():
+    cache = SimulationCache(max_entries=4)
+    data = inputs()
+    first = run(cache.simulate, *data)
+    pd.testing.assert_frame_equal(first, run(simulate, *data))
+
+    first.iloc[0, 0] = -1.0
+    second = run(cache.simulate, *data)
+    assert second.iloc[0, 0] != -1.0
+    assert (cache.hits, cache.misses, cache.partial) == (1, 1, 0)
+
+    run(cache.simulate, *data, battery_capacity=20000)
+    run(cache.simulate, *data, battery_mode='peak_shaving', percentile=60)
+    assert cache.misses == 3
+
+
+@pytest.mark.parametrize('battery_mode, params', [('default', {}),
+                                                  ('peak_shaving', {'percentile': 70, 'window': 96}),
+                                                  ('peak_shaving', {'percentile': 70}),
+                                                  ('time_of_use', {'grid_charge_power': 500})])
+def test_suffix_changes_match_a_full_simulation(battery_mode, params):
+    cache = SimulationCache()
+    time_steps, solar, wind, chp, demand, thermal = inputs()
+    run(cache.simulate, time_steps, solar, wind, chp, demand, thermal, battery_mode=battery_mode, **params)
+
+    changed = demand.copy()
+    changed[500:] *= 1.3
+    result = run(cache.simulate, time_steps, solar, wind, chp, changed, thermal, battery_mode=battery_mode,
+                 **params)
+    expected = run(simulate, time_steps, solar, wind, chp, changed, thermal, battery_mode=battery_mode, **params)
+    pd.testing.assert_frame_equal(result, expected)
+    if 'window' in params or battery_mode != 'peak_shaving':
+        assert cache.partial == 1
+        assert cache.simulated_steps == len(time_steps) + len(time_steps) - 500
+
+
+def test_curtailment_state_is_resumed():
+    time_steps, solar, wind, chp, demand, thermal = inputs(96 * 2)
+    demand = np.full(len(time_steps), 1000.0)
+    cache = SimulationCache()
+    run(cache.simulate, time_steps, solar, wind, chp, demand, thermal, battery_capacity=3000)
+    for start in (30, 60, 120):
+        demand = demand.copy()
+        demand[start:] += 200
+        result = run(cache.simulate, time_steps, solar, wind, chp, demand, thermal, battery_capacity=3000)
+        expected = run(simulate, time_steps, solar, wind, chp, demand, thermal, battery_capacity=3000)
+        pd.testing.assert_frame_equal(result, expected)
+    assert cache.partial == 3
+
+
+def test_lru_eviction_and_disk_persistence(tmp_path):
+    cache = SimulationCache(max_entries=2, directory=str(tmp_path))
+    runs = [inputs(96, seed) for seed in range(3)]
+    for data in runs:
+        run(cache.simulate, *data)
+    assert len(cache) == 2
+    cache.flush()
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+
+    restarted = SimulationCache(max_entries=2, directory=str(tmp_path))
+    pd.testing.assert_frame_equal(run(restarted.simulate, *runs[0]), run(simulate, *runs[0]))
+    assert (restarted.hits, restarted.misses) == (1, 0)
+
+    with pytest.raises(ValueError):
+        run(cache.simulate, *runs[0][:4], np.zeros(3), runs[0][5])
+
+    # A closed cache keeps working in memory only
+    cache.close()
+    run(cache.simulate, *inputs(96, 3))
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+
+
+@pytest.mark.slow
+def test_hits_and_partial_updates_are_cheap():
+    cache = SimulationCache()
+    time_steps, solar, wind, chp, demand, thermal = inputs(96 * 365)
+    start = time.perf_counter()
+    run(cache.simulate, time_steps, solar, wind, chp, demand, thermal)
+    full = time.perf_counter() - start
+
+    demand = demand.copy()
+    demand[-96:] += 100
+    start = time.perf_counter()
+    run(cache.simulate, time_steps, solar, wind, chp, demand, thermal)
+    partial = time.perf_counter() - start
+    start = time.perf_counter()
+    run(cache.simulate, time_steps, solar, wind, chp, demand, thermal)
+    hit = time.perf_counter() - start
+    assert partial < full / 2
+    assert hit < full / 5
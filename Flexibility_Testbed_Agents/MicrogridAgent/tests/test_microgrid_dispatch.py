@@ -0,0 +1,159 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.dispatch import COLUMNS, dispatch_battery, dispatch_thermal, simulate
+
+
+def reference_simulation(time_steps, solar_generation, wind_generation, chp_generation, demand_series,
+                         thermal_demand, battery_capacity, battery_efficiency, thermal_storage_capacity,
+                         thermal_storage_efficiency, battery_mode='default', curtail_when_full=False):
+    """The original per row df.at loop the dispatch engine replaces."""
+    df = pd.DataFrame({
+        'Solar_Generation': solar_generation,
+        'Wind_Generation': wind_generation,
+        'CHP_Generation': chp_generation,
+        'Demand': demand_series,
+        'Thermal_Demand': thermal_demand
+    }, index=time_steps, dtype=float)
+    df['Total_Generation'] = df['Solar_Generation'] + df['Wind_Generation'] + df['CHP_Generation']
+    df['Battery_Storage'] = 0.0
+    df['Battery_Change'] = 0.0
+    df['Thermal_Storage'] = 0.0
+    df['Thermal_Change'] = 0.0
+    df['Surplus_Deficit'] = df['Total_Generation'] - df['Demand']
+    df['Grid_Export'] = 0.0
+
+    battery_storage = 0
+    thermal_storage = 0
+    generation_off = False
+
+    for j, i in enumerate(df.index):
+        net_generation = df.at[i, 'Total_Generation']
+        net_thermal_generation = df.at[i, 'CHP_Generation'] - df.at[i, 'Thermal_Demand']
+        net_demand = df.at[i, 'Demand']
+
+        if generation_off:
+            net_generation = 0
+
+        if net_generation > net_demand and battery_storage < battery_capacity:
+            charge = min((net_generation - net_demand) * battery_efficiency, battery_capacity - battery_storage)
+            battery_storage += charge
+            df.at[i, 'Battery_Change'] = charge
+            df.at[i, 'Grid_Export'] = net_generation - net_demand - charge
+        elif (net_generation < net_demand and battery_storage > 0 and
+              (battery_mode == 'default' or net_demand > np.percentile(demand_series, 80))):
+            discharge = min(net_demand - net_generation, battery_storage)
+            battery_storage -= discharge
+            df.at[i, 'Battery_Change'] = -discharge
+            if battery_mode == 'peak_shaving':
+                df.at[i, 'Grid_Export'] = net_generation - net_demand + discharge
+        elif battery_mode == 'peak_shaving':
+            df.at[i, 'Grid_Export'] = net_generation - net_demand
+
+        df.at[i, 'Battery_Storage'] = battery_storage
+
+        if curtail_when_full:
+            if battery_storage >= battery_capacity:
+                generation_off = True
+            elif battery_storage <= 0:
+                generation_off = False
+            if generation_off:
+                df.at[i, 'Solar_Generation'] = 0
+                df.at[i, 'Wind_Generation'] = 0
+                df.at[i, 'CHP_Generation'] = 0
+
+        if net_thermal_generation > 0:
+            thermal_charge = min(net_thermal_generation * thermal_storage_efficiency,
+                                 thermal_storage_capacity - thermal_storage)
+            thermal_storage += thermal_charge
+            df.at[i, 'Thermal_Change'] = thermal_charge
+        else:
+            thermal_discharge = min(-net_thermal_generation, thermal_storage)
+            thermal_storage -= thermal_discharge
+            df.at[i, 'Thermal_Change'] = -thermal_discharge
+
+        df.at[i, 'Thermal_Storage'] = thermal_storage
+
+    return df
+
+
+def make_inputs(num_time_points, seed=42):
+    rng = np.random.default_rng(seed)
+    time_steps = pd.date_range(start='2024-01-01', periods=num_time_points, freq='15min')
+    hours = time_steps.hour.values
+    solar = np.where((hours >= 6) & (hours <= 18), 4000 * np.sin((hours - 6) * np.pi / 12), 0.0)
+    wind = 2000 * rng.uniform(0, 1, num_time_points)
+    chp = np.full(num_time_points, 1600.0)
+    demand = rng.integers(3000, 10001, size=num_time_points).astype(float)
+    thermal = rng.integers(1000, 2500, size=num_time_points).astype(float)
+    return time_steps, solar, wind, chp, demand, thermal
+
+
+@pytest.mark.parametrize("battery_mode", ['default', 'peak_shaving'])
+@pytest.mark.parametrize("curtail_when_full", [False, True])
+def test_simulate_matches_reference_loop(battery_mode, curtail_when_full):
+    time_steps, solar, wind, chp, demand, thermal = make_inputs(24 * 4 * 7)
+    expected = reference_simulation(time_steps, solar, wind, chp, demand, thermal, 20000, 0.9, 3000, 0.85,
+                                    battery_mode, curtail_when_full)
+    result = simulate(time_steps, solar, wind, chp, demand, 20000, 0.9, thermal_demand=thermal,
+                      thermal_storage_capacity=3000, thermal_storage_efficiency=0.85,
+                      battery_mode=battery_mode, curtail_when_full=curtail_when_full)
+
+    assert list(result.columns) == COLUMNS
+    pd.testing.assert_frame_equal(result, expected[COLUMNS], check_freq=False)
+
+
+def test_battery_stays_within_capacity():
+    generation = np.array([10.0, 10.0, 10.0, 0.0, 0.0, 0.0])
+    demand = np.array([0.0, 0.0, 0.0, 4.0, 4.0, 4.0])
+    result = dispatch_battery(generation, demand, battery_capacity=12, battery_efficiency=0.5)
+
+    np.testing.assert_allclose(result.storage, [5.0, 10.0, 12.0, 8.0, 4.0, 0.0])
+    np.testing.assert_allclose(result.change, [5.0, 5.0, 2.0, -4.0, -4.0, -4.0])
+    np.testing.assert_allclose(result.grid_export, [5.0, 5.0, 8.0, 0.0, 0.0, 0.0])
+    assert not result.curtailed.any()
+
+
+def test_initial_storage_is_carried_over():
+    generation = np.zeros(3)
+    demand = np.full(3, 2.0)
+    result = dispatch_battery(generation, demand, battery_capacity=10, battery_efficiency=1.0,
+                              initial_storage=5.0)
+    np.testing.assert_allclose(result.storage, [3.0, 1.0, 0.0])
+
+    thermal = dispatch_thermal(np.zeros(3), np.full(3, 2.0), 10, 1.0, initial_storage=3.0)
+    np.testing.assert_allclose(thermal.storage, [1.0, 0.0, 0.0])
+
+
+def test_invalid_battery_mode():
+    with pytest.raises(ValueError):
+        dispatch_battery(np.zeros(2), np.zeros(2), 1, 1, battery_mode='unknown')
+
+
+def test_length_mismatch():
+    time_steps, solar, wind, chp, demand, thermal = make_inputs(10)
+    with pytest.raises(ValueError):
+        simulate(time_steps, solar, wind, chp, demand[:-1], 10, 0.9)
+
+
+@pytest.mark.slow
+def test_year_horizon_speedup():
+    # A year at 15 minutes; the reference loop is timed on a slice to keep the test short.
+    time_steps, solar, wind, chp, demand, thermal = make_inputs(96 * 365)
+    reference_steps = 96 * 14
+
+    start = time.perf_counter()
+    reference_simulation(time_steps[:reference_steps], solar[:reference_steps], wind[:reference_steps],
+                         chp[:reference_steps], demand[:reference_steps], thermal[:reference_steps],
+                         20000, 0.9, 3000, 0.85, curtail_when_full=True)
+    reference_per_step = (time.perf_counter() - start) / reference_steps
+
+    start = time.perf_counter()
+    simulate(time_steps, solar, wind, chp, demand, 20000, 0.9, thermal_demand=thermal,
+             thermal_storage_capacity=3000, thermal_storage_efficiency=0.85, curtail_when_full=True)
+    engine_per_step = (time.perf_counter() - start) / len(time_steps)
+
+    assert reference_per_step / engine_per_step > 20
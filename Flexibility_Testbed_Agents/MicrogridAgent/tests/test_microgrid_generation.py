@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.generation import apply_ramp, chp_profile, daily_shape, solar_profile, wind_profile
+
+
+def reference_solar(time_steps, solar_capacity):
+    solar_generation = []
+    for step in time_steps:
+        hour = step.hour
+        if 6 <= hour <= 18:
+            solar_generation.append(solar_capacity * np.sin((hour - 6) * np.pi / 12))
+        else:
+            solar_generation.append(0)
+    return np.array(solar_generation)
+
+
+def reference_ramp(generation, ramp_rate):
+    ramped_generation = np.copy(generation)
+    for i in range(1, len(generation)):
+        ramped_generation[i] = max(min(ramped_generation[i - 1] + ramp_rate, generation[i]),
+                                   ramped_generation[i - 1] - ramp_rate)
+    return ramped_generation
+
+
+@pytest.mark.parametrize("start,freq", [
+    ('2024-06-01', 'H'),
+    ('2024-06-01', '15min'),
+    ('2024-06-01 00:10', '20min'),
+    ('2024-06-01', '90min'),
+    ('2024-06-01 05:30', '7min'),
+])
+def test_solar_matches_hourly_loop(start, freq):
+    time_steps = pd.date_range(start=start, periods=500, freq=freq)
+    np.testing.assert_array_equal(solar_profile(time_steps, 3000), reference_solar(time_steps, 3000))
+
+
+def test_solar_uses_wall_clock_time():
+    time_steps = pd.date_range(start='2024-03-30', periods=96, freq='H', tz='Europe/Berlin')
+    np.testing.assert_array_equal(solar_profile(time_steps, 1.0), reference_solar(time_steps, 1.0))
+
+
+def test_daily_shape_is_cached_per_resolution():
+    assert daily_shape(900) is daily_shape(900)
+    assert len(daily_shape(900)) == 96
+    assert not daily_shape(900).flags.writeable
+    with pytest.raises(ValueError):
+        daily_shape(7 * 3600)
+
+
+def test_wind_is_seeded():
+    time_steps = pd.date_range(start='2024-06-01', periods=100, freq='H')
+    np.random.seed(0)
+    expected_normal = 2000 * np.abs(np.random.randn(100))
+    np.random.seed(0)
+    expected_uniform = 2000 * np.abs(np.random.uniform(0, 1, 100))
+
+    np.random.seed(1)
+    np.testing.assert_array_equal(wind_profile(time_steps, 2000), expected_normal)
+    np.testing.assert_array_equal(wind_profile(100, 2000, distribution='uniform'), expected_uniform)
+    assert not np.array_equal(wind_profile(100, seed=1), wind_profile(100, seed=2))
+    with pytest.raises(ValueError):
+        wind_profile(100, distribution='weibull')
+
+
+@pytest.mark.parametrize("ramp_rate", [0.1, 0.5, 50.0, 1e6])
+def test_ramp_matches_loop(ramp_rate):
+    generation = 1000 * np.abs(np.random.RandomState(3).randn(2000))
+    np.testing.assert_array_equal(apply_ramp(generation, ramp_rate), reference_ramp(generation, ramp_rate))
+    np.testing.assert_array_equal(wind_profile(2000, 1000, ramp_rate=ramp_rate),
+                                  reference_ramp(wind_profile(2000, 1000), ramp_rate))
+
+
+def test_chp_profile():
+    np.testing.assert_array_equal(chp_profile(5, 1000, ramp_rate=0.5), np.full(5, 1000))
+    np.testing.assert_array_equal(apply_ramp(np.array([0.0, 10.0, 10.0, 0.0]), 4), [0, 4, 8, 4])
+    assert len(apply_ramp(np.array([]), 1)) == 0
+
+
+@pytest.mark.slow
+def test_profiles_of_100k_steps_take_milliseconds():
+    time_steps = pd.date_range(start='2024-01-01', periods=100000, freq='15min')
+    start = time.perf_counter()
+    solar_profile(time_steps, 3000)
+    wind_profile(time_steps, 2000, ramp_rate=0.5)
+    chp_profile(time_steps, 1000, ramp_rate=0.5)
+    assert time.perf_counter() - start < 0.1
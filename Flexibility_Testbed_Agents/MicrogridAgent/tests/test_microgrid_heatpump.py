@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+import pytest
+
+from microgrid.heatpump import HeatPumpTable, build_table, carnot_point, main
+
+SOURCES = np.linspace(-10, 20, 7)
+SINKS = np.linspace(35, 75, 5)
+LOADS = np.linspace(50, 250, 5)
+
+
+@pytest.fixture(scope='module')
+def table():
+    return build_table(SOURCES, SINKS, LOADS, solver=carnot_point, max_workers=0)
+
+
+def test_grid_points_are_exact(table):
+    cop, power = table.lookup(SOURCES[:, None, None], SINKS[None, :, None], LOADS[None, None, :])
+    np.testing.assert_allclose(cop, table.cop)
+    np.testing.assert_allclose(power, table.power)
+    expected_cop, expected_power = carnot_point(SOURCES[2], SINKS[3], LOADS[1])
+    assert table.cop[2, 3, 1] == pytest.approx(expected_cop)
+    assert table.power[2, 3, 1] == pytest.approx(expected_power)
+
+
+def test_lookup_interpolates_and_clamps(table):
+    cop, _ = table.lookup([2.5, 100.0], [45.0, 45.0], [100.0, 100.0])
+    low, _ = carnot_point(0, 45, 100)
+    high, _ = carnot_point(5, 45, 100)
+    assert cop[0] == pytest.approx((low + high) / 2)
+    assert cop[1] == pytest.approx(carnot_point(20, 45, 100)[0])
+
+
+def test_electrical_power(table):
+    thermal = np.array([0.0, 100.0, 500.0])
+    power = table.electrical_power(thermal, 5.0, 55.0)
+    assert power[0] == 0
+    assert power[1] == pytest.approx(100 / carnot_point(5, 55, 100)[0])
+    assert power[2] == pytest.approx(500 / carnot_point(5, 55, 250)[0])
+
+
+def test_pool_matches_inline_and_round_trips(table, tmp_path):
+    pooled = build_table(SOURCES, SINKS, LOADS, solver=carnot_point, max_workers=2, chunk_size=7)
+    np.testing.assert_array_equal(pooled.cop, table.cop)
+
+    path = str(tmp_path / 'table.npz')
+    table.save(path)
+    loaded = HeatPumpTable.load(path)
+    assert HeatPumpTable.load(path) is loaded
+    np.testing.assert_array_equal(loaded.power, table.power)
+    np.testing.assert_array_equal(loaded.loads, LOADS)
+
+
+def test_failed_points_and_invalid_axes():
+    def solver(source, sink, load):
+        return (np.nan, np.nan) if load > 1 else (3.0, load / 3.0)
+
+    table = build_table([0], [40], [1, 2], solver=solver, max_workers=0)
+    assert table.failed == 1
+    with pytest.raises(ValueError):
+        HeatPumpTable([1, 0], [40], [1], np.ones((2, 1, 1)), np.ones((2, 1, 1)))
+    with pytest.raises(ValueError):
+        HeatPumpTable([0], [40], [1], np.ones((2, 1, 1)), np.ones((1, 1, 1)))
+
+
+def test_failed_corners_are_left_out(table):
+    cop = table.cop.copy()
+    power = table.power.copy()
+    cop[2, 3, 2] = power[2, 3, 2] = np.nan
+    holey = HeatPumpTable(SOURCES, SINKS, LOADS, cop, power)
+
+    # On a grid point next to the failed one, and between them
+    on_point = holey.lookup(SOURCES[2], SINKS[3], LOADS[1])
+    assert on_point[0] == pytest.approx(table.cop[2, 3, 1])
+    assert on_point[1] == pytest.approx(table.power[2, 3, 1])
+    between, _ = holey.lookup(SOURCES[2], SINKS[3], (LOADS[1] + LOADS[2]) / 2)
+    assert between == pytest.approx(table.cop[2, 3, 1])
+
+    assert np.isnan(holey.lookup(SOURCES[2], SINKS[3], LOADS[2])[0])
+    assert np.isfinite(holey.lookup(SOURCES[:, None, None], SINKS[None, :, None], LOADS[None, None, :])[0]).sum() \
+        == cop.size - 1
+
+
+def test_main_carnot(tmp_path):
+    output = str(tmp_path / 'carnot.npz')
+    main([output, '--source', '0', '10', '3', '--sink', '40', '50', '2', '--load', '10', '20', '2',
+          '--workers', '0', '--carnot'])
+    assert HeatPumpTable.load(output).cop.shape == (3, 2, 2)
+
+
+@pytest.mark.slow
+def test_year_of_steps_in_milliseconds(table):
+    rng = np.random.default_rng(0)
+    thermal = rng.uniform(0, 200, 96 * 365)
+    source = rng.uniform(-10, 20, 96 * 365)
+    start = time.perf_counter()
+    table.electrical_power(thermal, source, 55.0)
+    assert time.perf_counter() - start < 0.05
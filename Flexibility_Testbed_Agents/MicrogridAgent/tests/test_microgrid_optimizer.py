@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.dispatch import COLUMNS
+from microgrid.optimizer import MpcDispatcher, OptimizationError, highspy
+
+BACKENDS = ['linprog'] + (['highs'] if highspy is not None else [])
+
+
+def forecast(num_steps=96, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(num_steps) * 24.0 / num_steps
+    renewable = np.clip(60 * np.sin((hours - 6) / 12 * np.pi), 0, None) + rng.uniform(0, 10, num_steps)
+    demand = 30 + 10 * np.cos(hours / 24 * 2 * np.pi) + rng.uniform(0, 5, num_steps)
+    thermal = rng.uniform(0, 20, num_steps)
+    return renewable, demand, thermal
+
+
+def dispatcher(backend, **kwargs):
+    params = dict(battery_capacity=100, battery_efficiency=0.9, chp_capacity=20, thermal_storage_capacity=50,
+                  thermal_storage_efficiency=0.95, chp_ramp=5, backend=backend)
+    params.update(kwargs)
+    return MpcDispatcher(**params)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_schedule_balances_and_respects_limits(backend):
+    renewable, demand, thermal = forecast()
+    schedule = dispatcher(backend).solve(renewable, demand, thermal, initial_storage=20, step_hours=0.25)
+
+    electric = renewable - schedule.curtailed + schedule.chp + schedule.discharge - schedule.charge + \
+        schedule.grid_import - schedule.grid_export
+    np.testing.assert_allclose(electric, demand, atol=1e-6)
+    heat = schedule.chp + schedule.boiler - schedule.dump - schedule.thermal_charge + schedule.thermal_discharge
+    np.testing.assert_allclose(heat, thermal, atol=1e-6)
+    battery = 20 + np.cumsum(0.25 * (0.9 * schedule.charge - schedule.discharge))
+    np.testing.assert_allclose(schedule.battery, battery, atol=1e-6)
+
+    assert schedule.battery.max() <= 100 + 1e-6
+    assert schedule.battery[-1] >= 20 - 1e-6
+    assert np.abs(np.diff(schedule.chp)).max() <= 5 + 1e-6
+    assert (schedule.curtailed <= renewable + 1e-6).all()
+
+
+def test_backends_agree():
+    if highspy is None:
+        pytest.skip("highspy is not installed")
+    renewable, demand, thermal = forecast(seed=3)
+    objectives = [dispatcher(backend).solve(renewable, demand, thermal, initial_storage=50,
+                                            step_hours=0.25).objective for backend in ('linprog', 'highs')]
+    assert objectives[0] == pytest.approx(objectives[1], rel=1e-6)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_structure_is_reused_for_new_forecasts(backend):
+    optimizer = dispatcher(backend)
+    fresh = dispatcher(backend)
+    for seed in range(3):
+        renewable, demand, thermal = forecast(seed=seed)
+        schedule = optimizer.solve(renewable, demand, thermal, initial_storage=10 * seed, step_hours=0.25,
+                                   import_price=0.3 + 0.01 * seed)
+        expected = fresh.solve(renewable, demand, thermal, initial_storage=10 * seed, step_hours=0.25,
+                               import_price=0.3 + 0.01 * seed)
+        assert schedule.objective == pytest.approx(expected.objective, rel=1e-6)
+        fresh._structure = None
+    assert (optimizer.builds, optimizer.solves) == (1, 3)
+
+    optimizer.solve(*forecast(48), step_hours=0.5)
+    assert optimizer.builds == 2
+
+
+def test_self_sufficiency_minimizes_import():
+    renewable, demand, thermal = forecast()
+    cost = dispatcher('linprog', chp_cost=1.0).solve(renewable, demand, thermal, step_hours=0.25)
+    autarky = dispatcher('linprog', chp_cost=1.0, objective='self_sufficiency').solve(renewable, demand, thermal,
+                                                                                      step_hours=0.25)
+    assert autarky.grid_import.sum() <= cost.grid_import.sum() + 1e-6
+    assert autarky.grid_import.sum() < cost.grid_import.sum()
+
+
+def test_dispatch_frame_and_errors():
+    time_steps = pd.date_range('2024-06-01', periods=24, freq='H')
+    solar = np.clip(80 * np.sin((np.arange(24) - 6) / 12 * np.pi), 0, None)
+    wind = np.full(24, 10.0)
+    demand = np.full(24, 30.0)
+    frame = dispatcher('linprog').dispatch_frame(time_steps, solar, wind, demand, initial_storage=10)
+    assert list(frame.columns[:len(COLUMNS)]) == COLUMNS
+    np.testing.assert_allclose(frame['Solar_Generation'] + frame['Wind_Generation'],
+                               solar + wind - frame['Curtailed'], atol=1e-6)
+    np.testing.assert_allclose(frame['Battery_Change'].sum(), frame['Battery_Storage'].iloc[-1] - 10, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        MpcDispatcher(100, objective='profit')
+    with pytest.raises(ValueError):
+        dispatcher('linprog').solve(np.ones(3), np.ones(4))
+    with pytest.raises(OptimizationError):
+        dispatcher('linprog', boiler_capacity=1).solve(np.zeros(4), np.zeros(4), np.full(4, 100.0))
+
+
+def test_storage_carries_over_between_solves():
+    optimizer = dispatcher('linprog')
+    assert optimizer.planned_storage(pd.Timestamp('2024-06-01')) == (0.0, 0.0)
+    renewable, demand, thermal = forecast(24)
+    time_steps = pd.date_range('2024-06-01', periods=24, freq='H')
+    frame = optimizer.dispatch_frame(time_steps, renewable, np.zeros(24), demand, thermal, initial_storage=20,
+                                     initial_thermal_storage=5)
+
+    assert optimizer.planned_storage(time_steps[0]) == (20.0, 5.0)
+    battery, heat = optimizer.planned_storage(time_steps[6])
+    assert battery == pytest.approx(frame['Battery_Storage'].iloc[5])
+    assert heat == pytest.approx(frame['Thermal_Storage'].iloc[5])
+    assert optimizer.planned_storage(time_steps[-1] + pd.Timedelta(hours=5)) == (
+        pytest.approx(frame['Battery_Storage'].iloc[-1]), pytest.approx(frame['Thermal_Storage'].iloc[-1]))
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_day_ahead_resolve_under_100ms(backend):
+    optimizer = dispatcher(backend)
+    renewable, demand, thermal = forecast()
+    optimizer.solve(renewable, demand, thermal, step_hours=0.25)
+    times = []
+    for seed in range(5):
+        renewable, demand, thermal = forecast(seed=seed)
+        times.append(optimizer.solve(renewable, demand, thermal, initial_storage=30, step_hours=0.25).solve_time)
+    assert min(times) < 0.1
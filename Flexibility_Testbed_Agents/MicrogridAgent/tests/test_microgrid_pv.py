@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.pv import PvModel, clear_sky_irradiance, cos_zenith, parse_forecast
+
+LAT, LONG = 39.0693, -94.6716
+
+
+def hourly_records(start, hours, **points):
+    times = pd.date_range(start, periods=hours, freq='H', tz='America/Chicago')
+    return [[t.isoformat(), dict(points)] for t in times]
+
+
+def test_sun_position():
+    day = pd.date_range('2024-06-21', periods=24, freq='H', tz='America/Chicago')
+    irradiance = clear_sky_irradiance(cos_zenith(day, LAT, LONG))
+    assert (irradiance[:5] == 0).all() and (irradiance[22:] == 0).all()
+    # Solar noon is around 13:20 daylight saving time in Kansas City
+    assert irradiance.argmax() == 13
+    assert 850 < irradiance.max() < 1000
+
+    winter = pd.date_range('2024-12-21', periods=24, freq='H', tz='America/Chicago')
+    assert clear_sky_irradiance(cos_zenith(winter, LAT, LONG)).max() < 0.6 * irradiance.max()
+
+    # Naive time steps are taken in the given time zone
+    naive = cos_zenith(day.tz_localize(None), LAT, LONG, tz='America/Chicago')
+    np.testing.assert_allclose(naive, cos_zenith(day, LAT, LONG))
+
+
+def test_forecast_parsing():
+    records = [['2024-06-21T13:00:00-05:00', {'shortForecast': 'Mostly Cloudy', 'temperature': 86,
+                                              'temperatureUnit': 'F'}],
+               ['2024-06-21T12:00:00-05:00', {'shortForecast': 'Sunny', 'air_temperature': 30,
+                                              'temperatureUnit': 'C'}],
+               ['2024-06-21T14:00:00-05:00', {'skyCover': {'value': 40}}],
+               ['2024-06-21T15:00:00-05:00', {'shortForecast': 'Chance Showers And Thunderstorms'}],
+               ['2024-06-21T16:00:00-05:00', {'shortForecast': 'Hot'}]]
+    times, clouds, temperatures = parse_forecast(records)
+    assert times[0] == pd.Timestamp('2024-06-21T17:00:00Z').value / 1e9
+    assert (np.diff(times) == 3600).all()
+    np.testing.assert_allclose(clouds, [0.05, 0.8, 0.4, 0.85, np.nan])
+    np.testing.assert_allclose(temperatures, [30.0, 30.0, np.nan, np.nan, np.nan])
+
+
+def test_forecast_derates_the_clear_sky():
+    day = pd.date_range('2024-06-21', periods=96, freq='15min', tz='America/Chicago')
+    model = PvModel(LAT, LONG, capacity=2.0, default_cloud_cover=0.0)
+    clear = model.profile(day)
+    np.testing.assert_allclose(clear, 2.0 * model.clear_sky(day) / 1000)
+
+    assert model.update_forecast(hourly_records('2024-06-21 12:00', 3, shortForecast='Cloudy'), 'a')
+    cloudy = model.profile(day)
+    np.testing.assert_allclose(cloudy[48:60], clear[48:60] * (1 - 0.75 * 0.95 ** 3.4))
+    # Outside of the forecast the default cloud cover is used
+    np.testing.assert_array_equal(cloudy[:48], clear[:48])
+    np.testing.assert_array_equal(cloudy[60:], clear[60:])
+
+    model.update_forecast(hourly_records('2024-06-21 12:00', 3, shortForecast='Sunny', temperature=95,
+                                         temperatureUnit='F'), 'b')
+    hot = model.profile(day)
+    assert (hot[48:60] < clear[48:60] * (1 - 0.75 * 0.05 ** 3.4)).all()
+    with pytest.raises(ValueError):
+        hot[0] = 1.0
+
+
+def test_profiles_are_cached_until_the_next_forecast():
+    model = PvModel(LAT, LONG, tz='America/Chicago')
+    week = pd.date_range('2024-06-17', periods=7 * 24, freq='H')
+    first = model.profile(week)
+    assert model.profile(pd.date_range('2024-06-17', periods=7 * 24, freq='H')) is first
+    assert (model.hits, model.misses) == (1, 1)
+
+    records = hourly_records('2024-06-17', 48, shortForecast='Rain')
+    assert model.update_forecast(records, '2024-06-17T00:00:00+00:00')
+    assert not model.update_forecast(records, '2024-06-17T00:00:00+00:00')
+    second = model.profile(week)
+    assert second is not first and second.sum() < first.sum()
+    assert model.misses == 2
+    # The clear sky irradiance of the horizon is reused
+    assert len(model._clear_sky) == 1
+
+
+@pytest.mark.slow
+def test_year_of_quarter_hours_is_vectorized():
+    year = pd.date_range('2024-01-01', periods=366 * 96, freq='15min', tz='America/Chicago')
+    model = PvModel(LAT, LONG)
+    model.update_forecast(hourly_records('2024-06-01', 24 * 7, shortForecast='Partly Cloudy'), 'a')
+    start = time.perf_counter()
+    output = model.profile(year)
+    assert time.perf_counter() - start < 0.5
+    assert output.shape == (len(year),) and output.max() <= 1.0
@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.dispatch import dispatch_battery
+from microgrid.strategies import STRATEGIES, BaseStrategy, DispatchPlan, PeakShavingStrategy, get_strategy
+
+
+def make_series(num_time_points, seed=3):
+    rng = np.random.default_rng(seed)
+    time_steps = pd.date_range(start='2024-03-01', periods=num_time_points, freq='15min')
+    hours = time_steps.hour.values
+    generation = np.where((hours >= 6) & (hours <= 18), 6000 * np.sin((hours - 6) * np.pi / 12), 0.0) + 1600
+    demand = rng.integers(3000, 10001, size=num_time_points).astype(float)
+    return time_steps, generation, demand
+
+
+def test_registry():
+    assert set(STRATEGIES) >= {'default', 'peak_shaving', 'self_consumption_max', 'time_of_use'}
+    strategy = get_strategy('peak_shaving', percentile=90)
+    assert isinstance(strategy, PeakShavingStrategy)
+    assert strategy.percentile == 90
+    assert get_strategy(strategy) is strategy
+
+    with pytest.raises(ValueError):
+        get_strategy('unknown')
+
+
+def test_peak_shaving_only_discharges_above_threshold():
+    time_steps, generation, demand = make_series(96 * 7)
+    result = dispatch_battery(generation, demand, 20000, 0.9, 'peak_shaving', percentile=70)
+
+    threshold = np.percentile(demand, 70)
+    assert (result.change[demand <= threshold] >= 0).all()
+    assert (result.change[demand > threshold] < 0).any()
+
+
+def test_peak_shaving_rolling_window():
+    demand = np.random.default_rng(1).uniform(0, 100, 50)
+    plan = PeakShavingStrategy(percentile=80, window=8).prepare(demand)
+
+    expected = [np.percentile(demand[max(0, i - 7):i + 1], 80) for i in range(len(demand))]
+    np.testing.assert_allclose(plan.discharge_threshold, expected)
+
+
+def test_self_consumption_max_records_net_exchange():
+    time_steps, generation, demand = make_series(96 * 7)
+    result = dispatch_battery(generation, demand, 20000, 1.0, 'self_consumption_max')
+
+    np.testing.assert_allclose(result.grid_export, generation - demand - result.change)
+    assert (result.grid_export < 0).any()
+
+
+def test_time_of_use():
+    time_steps, generation, demand = make_series(96 * 7)
+    peak_hours = (17, 18, 19, 20)
+    result = dispatch_battery(generation, demand, 20000, 0.9, 'time_of_use', time_steps=time_steps,
+                              peak_hours=peak_hours, off_peak_hours=(1, 2, 3), grid_charge_power=1000)
+
+    hours = time_steps.hour.values
+    in_peak = np.isin(hours, peak_hours)
+    assert (result.change[~in_peak] >= 0).all()
+    assert (result.change[in_peak] < 0).any()
+
+    grid_charged = np.isin(hours, (1, 2, 3)) & (generation <= demand) & (result.change > 0)
+    assert grid_charged.any()
+    np.testing.assert_allclose(result.grid_export[grid_charged],
+                               (generation - demand - result.change / 0.9)[grid_charged])
+
+    with pytest.raises(ValueError):
+        dispatch_battery(generation, demand, 20000, 0.9, 'time_of_use')
+
+
+def test_custom_strategy():
+    class NeverDischarge(BaseStrategy):
+        name = 'never_discharge'
+
+        def prepare(self, demand, time_steps=None):
+            size = len(demand)
+            return DispatchPlan(np.full(size, np.inf), np.zeros(size), True)
+
+    time_steps, generation, demand = make_series(96)
+    result = dispatch_battery(generation, demand, 20000, 0.9, NeverDischarge())
+    assert (result.change >= 0).all()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("battery_mode,strategy_params", [
+    ('default', {}),
+    ('peak_shaving', {}),
+    ('peak_shaving', {'window': 96}),
+    ('self_consumption_max', {}),
+    ('time_of_use', {'grid_charge_power': 1000}),
+])
+def test_per_step_cost_is_flat(battery_mode, strategy_params):
+    def per_step_cost(num_time_points):
+        time_steps, generation, demand = make_series(num_time_points)
+        start = time.perf_counter()
+        for _ in range(3):
+            dispatch_battery(generation, demand, 20000, 0.9, battery_mode, time_steps=time_steps,
+                             **strategy_params)
+        return (time.perf_counter() - start) / (3 * num_time_points)
+
+    week = per_step_cost(96 * 7)
+    year = per_step_cost(96 * 365)
+    assert year < 3 * week
@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.dispatch import dispatch_battery, dispatch_battery_batch
+from microgrid.sweep import (KPIS, PARAMETERS, evaluate_batch, main, monte_carlo, parameter_grid, run_sweep,
+                             sweep_time_steps, unit_profiles)
+
+NUM_TIME_POINTS = 24 * 7
+
+
+@pytest.fixture
+def demand():
+    return np.random.default_rng(42).integers(3000, 10001, size=NUM_TIME_POINTS).astype(float)
+
+
+@pytest.mark.parametrize("battery_mode,strategy_params", [
+    ('default', {}),
+    ('peak_shaving', {}),
+    ('peak_shaving', {'percentile': 60, 'window': 24}),
+    ('self_consumption_max', {}),
+    ('time_of_use', {'grid_charge_power': 2000}),
+])
+@pytest.mark.parametrize("curtail_when_full", [False, True])
+def test_batch_matches_single_dispatch(demand, battery_mode, strategy_params, curtail_when_full):
+    time_steps = sweep_time_steps(NUM_TIME_POINTS, start='2024-06-01')
+    profiles = unit_profiles(time_steps)
+    sizes = np.array([[0, 0, 1000], [2000, 1000, 1600], [8000, 3000, 3000]], dtype=float)
+    generation = sizes @ profiles
+    capacities = np.array([0.0, 5000.0, 50000.0])
+    efficiencies = np.array([0.9, 0.8, 1.0])
+
+    batch = dispatch_battery_batch(generation, demand, capacities, efficiencies, battery_mode, curtail_when_full,
+                                   time_steps=time_steps, **strategy_params)
+    for i in range(len(sizes)):
+        single = dispatch_battery(generation[i], demand, capacities[i], efficiencies[i], battery_mode,
+                                  curtail_when_full, time_steps=time_steps, **strategy_params)
+        for expected, result in zip(single, batch):
+            np.testing.assert_array_equal(result[i], expected)
+
+
+def test_parameter_grid():
+    scenarios = parameter_grid(solar_capacity=[1000, 2000], battery_capacity=[0, 10, 20])
+    assert len(scenarios) == 6
+    assert {'solar_capacity': 2000, 'battery_capacity': 20} in scenarios
+
+    with pytest.raises(ValueError):
+        parameter_grid(unknown=[1])
+
+
+def test_monte_carlo_is_reproducible():
+    distributions = {'solar_capacity': ['uniform', 1000, 5000],
+                     'wind_capacity': ['normal', 2000, 300],
+                     'battery_capacity': ['choice', 0, 10000, 20000]}
+    first = monte_carlo(100, distributions, seed=7)
+    second = monte_carlo(100, distributions, seed=7)
+
+    assert first == second
+    assert all(1000 <= scenario['solar_capacity'] <= 5000 for scenario in first)
+    assert {scenario['battery_capacity'] for scenario in first} <= {0, 10000, 20000}
+
+    with pytest.raises(ValueError):
+        monte_carlo(1, {'solar_capacity': ['poisson', 3]})
+
+
+def test_kpis(demand):
+    profiles = unit_profiles(sweep_time_steps(NUM_TIME_POINTS, start='2024-06-01'))
+    no_generation, oversized = evaluate_batch(
+        [{'solar_capacity': 0, 'wind_capacity': 0, 'chp_capacity': 0, 'battery_capacity': 0},
+         {'chp_capacity': 20000, 'battery_capacity': 1000}], demand, profiles)
+
+    assert no_generation['self_sufficiency'] == 0
+    assert no_generation['self_consumption'] == 0
+    assert no_generation['grid_import'] == pytest.approx(demand.sum())
+    assert no_generation['battery_cycles'] == 0
+
+    assert oversized['self_sufficiency'] == pytest.approx(1.0)
+    assert 0 < oversized['self_consumption'] < 1
+    assert oversized['grid_export'] > 0
+    assert oversized['grid_import'] == pytest.approx(0)
+
+
+@pytest.mark.parametrize("battery_mode", ['default', 'peak_shaving', 'self_consumption_max'])
+def test_grid_export_without_battery(demand, battery_mode):
+    time_steps = sweep_time_steps(NUM_TIME_POINTS, start='2024-06-01')
+    profiles = unit_profiles(time_steps)
+    row, = evaluate_batch([{'chp_capacity': 20000, 'battery_capacity': 0}], demand, profiles, battery_mode,
+                          time_steps=time_steps)
+
+    generation = np.array([PARAMETERS['solar_capacity'], PARAMETERS['wind_capacity'], 20000]) @ profiles
+    assert row['grid_export'] == pytest.approx(np.clip(generation - demand, 0, None).sum())
+    assert row['grid_export'] > 0
+
+
+def test_run_sweep_process_pool_matches_inline(demand, tmpdir):
+    scenarios = parameter_grid(solar_capacity=[0, 2000, 4000], battery_capacity=[0, 10000, 40000])
+    output = str(tmpdir.join('results.csv'))
+
+    inline = run_sweep(scenarios, demand, max_workers=0, batch_size=4)
+    pooled = run_sweep(scenarios, demand, output=output, max_workers=2, batch_size=4)
+
+    assert list(inline.columns) == sorted(PARAMETERS) + KPIS
+    key = ['solar_capacity', 'battery_capacity']
+    pd.testing.assert_frame_equal(inline.sort_values(key).reset_index(drop=True),
+                                  pooled.sort_values(key).reset_index(drop=True))
+    assert len(pd.read_csv(output)) == len(scenarios)
+
+
+def test_cli(demand, tmpdir):
+    config = tmpdir.join('sweep.json')
+    config.write(json.dumps({'monte_carlo': {'num_scenarios': 10, 'seed': 1,
+                                             'distributions': {'solar_capacity': ['uniform', 0, 5000]}},
+                             'fixed': {'chp_capacity': 1600}}))
+    demand_file = tmpdir.join('demand.csv')
+    pd.DataFrame({'Demand': demand}).to_csv(str(demand_file), index=False)
+    output = tmpdir.join('results.csv')
+
+    main([str(config), str(demand_file), '--output', str(output), '--workers', '0'])
+
+    results = pd.read_csv(str(output))
+    assert len(results) == 10
+    assert (results['chp_capacity'] == 1600).all()
@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from microgrid.dispatch import simulate
+from microgrid.heatpump import HeatPumpTable, carnot_point
+from microgrid.thermal import ThermalFleet, heating_curve
+
+
+def reference_building(outdoor, setpoint, resistance, capacitance, heating_capacity, gains, step_hours,
+                       temperature=20.0):
+    decay = np.exp(-step_hours / (resistance * capacitance))
+    heating, indoor = [], []
+    for t_out, t_set, gain in zip(outdoor, setpoint, gains):
+        free = decay * temperature + (1 - decay) * (t_out + resistance * gain)
+        heat = min(max((t_set - free) / (resistance * (1 - decay)), 0.0), heating_capacity)
+        temperature = free + resistance * (1 - decay) * heat
+        heating.append(heat)
+        indoor.append(temperature)
+    return np.array(heating), np.array(indoor)
+
+
+def winter_week(num_steps=7 * 96):
+    steps = np.arange(num_steps)
+    return -2 + 6 * np.sin(2 * np.pi * (steps % 96) / 96)
+
+
+def test_matches_the_single_building_recursion():
+    outdoor = winter_week()
+    setpoint = np.where((np.arange(len(outdoor)) % 96) < 24, 17.0, 21.0)
+    fleet = ThermalFleet([5.0, 8.0, 3.0], [10.0, 25.0, 6.0], heating_capacity=[20.0, 3.0, 10.0],
+                         internal_gains=[0.5, 0.2, 0.0])
+    result = fleet.simulate(outdoor, setpoint, block=50, per_building=True)
+    for i in range(3):
+        heating, indoor = reference_building(outdoor, setpoint, fleet.resistance[i], fleet.capacitance[i],
+                                             fleet.heating_capacity[i], [fleet.internal_gains[i]] * len(outdoor),
+                                             0.25)
+        np.testing.assert_allclose(result.heating[i], heating, atol=1e-9)
+        np.testing.assert_allclose(result.temperature[i], indoor, atol=1e-9)
+    assert result.electrical is None
+    # The undersized building cannot hold the setpoint, the others can once they recovered from the setback
+    assert result.temperature[1][-1] < 19
+    afternoon = (np.arange(len(outdoor)) % 96) >= 48
+    assert np.abs(result.temperature[0][afternoon] - 21.0).max() < 1e-9
+    np.testing.assert_array_equal(fleet.temperature, result.temperature[:, -1])
+
+
+def test_totals_match_per_building_results():
+    fleet = ThermalFleet.sample(40, seed=3)
+    outdoor = winter_week(500)
+    irradiance = np.clip(800 * np.sin(2 * np.pi * (np.arange(500) % 96 - 24) / 96), 0, None)
+    setpoint = np.linspace(19, 22, 40)[:, np.newaxis]
+    table = HeatPumpTable(*[np.linspace(*axis) for axis in ((-10, 20, 4), (35, 55, 3), (0, 20, 3))],
+                          **dict(zip(('cop', 'power'), np.vectorize(carnot_point)(
+                              *np.meshgrid(np.linspace(-10, 20, 4), np.linspace(35, 55, 3), np.linspace(0, 20, 3),
+                                           indexing='ij')))))
+
+    per_building = ThermalFleet.sample(40, seed=3).simulate(outdoor, setpoint, solar_irradiance=irradiance,
+                                                            heat_pump=table, per_building=True)
+    totals = fleet.simulate(outdoor, setpoint, solar_irradiance=irradiance, heat_pump=table, block=96)
+    np.testing.assert_allclose(totals.heating, per_building.heating.sum(axis=0))
+    np.testing.assert_allclose(totals.temperature, per_building.temperature.mean(axis=0))
+    np.testing.assert_allclose(totals.electrical, per_building.electrical.sum(axis=0))
+    assert (totals.electrical < totals.heating).all()
+
+    # Solar gains reduce the heat demand
+    no_sun = ThermalFleet.sample(40, seed=3).simulate(outdoor, setpoint)
+    assert totals.heating.sum() < no_sun.heating.sum()
+
+
+def test_heat_demand_feeds_the_dispatch():
+    fleet = ThermalFleet.sample(20, seed=1)
+    outdoor = winter_week(96)
+    result = fleet.simulate(outdoor)
+    time_steps = pd.date_range('2024-01-08', periods=96, freq='15min')
+    frame = simulate(time_steps, np.zeros(96), np.zeros(96), np.full(96, 50.0), np.full(96, 10.0), 100, 0.9,
+                     thermal_demand=result.heating, thermal_storage_capacity=50, thermal_storage_efficiency=0.9)
+    np.testing.assert_allclose(frame['Thermal_Demand'].values, result.heating)
+
+
+def test_heating_curve_and_errors():
+    np.testing.assert_allclose(heating_curve([20, 15, 1.5, -12, -20]), [35, 35, 45, 55, 55])
+    with pytest.raises(ValueError):
+        ThermalFleet([1.0, 2.0], [1.0, 2.0, 3.0])
+    with pytest.raises(ValueError):
+        ThermalFleet(0.0, 1.0)
+    with pytest.raises(ValueError):
+        ThermalFleet.sample(3, volume=(1, 2))
+    with pytest.raises(ValueError):
+        ThermalFleet.sample(3).simulate(np.zeros(10), setpoint=np.zeros((4, 10)))
+
+
+@pytest.mark.slow
+def test_year_of_five_thousand_buildings():
+    fleet = ThermalFleet.sample(5000, seed=0)
+    steps = np.arange(366 * 96)
+    outdoor = 8 - 10 * np.cos(2 * np.pi * steps / len(steps)) + 4 * np.sin(2 * np.pi * (steps % 96) / 96)
+    start = time.perf_counter()
+    result = fleet.simulate(outdoor, 21.0)
+    assert time.perf_counter() - start < 10.0
+    assert result.heating.shape == (len(steps),) and (result.heating >= 0).all()
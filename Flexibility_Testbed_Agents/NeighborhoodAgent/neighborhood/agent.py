@@ -6,11 +6,19 @@ __docformat__ = 'reStructuredText'
 
 import logging
 import sys
-from threading import Timer
+import time
+from datetime import datetime
+
+import pytz
 
 from volttron.platform.agent import utils
+from volttron.platform.messaging import headers as headers_mod
+from volttron.platform.messaging.timeseries import is_timeseries, iter_readings
 from volttron.platform.vip.agent import Agent, Core, RPC
 
+from .aggregator import IntervalAggregator, LatencyStats
+from .powerflow import Feeder
+
 logging.basicConfig(level=logging.INFO)
 _log = logging.getLogger(__name__)
 utils.setup_logging()
@@ -38,8 +46,16 @@ def neighborhood(config_path, **kwargs):
     setting1 = int(config.get('setting1'))
     setting2 = config.get('setting2')
     setting3 = config.get('setting3')
+    setting4 = float(config.get('setting4', 30))
+    setting5 = float(config.get('setting5', 10))
+    setting6 = config.get('setting6', 'energyConsumption')
+    setting7 = config.get('setting7', 'neighborhood')
+    setting8 = config.get('setting8')
+    setting9 = config.get('setting9', 'neighborhood/powerflow')
+    setting10 = float(config.get('setting10', 1.0))
 
-    return Neighborhood(setting1, setting2, setting3, **kwargs)
+    return Neighborhood(setting1, setting2, setting3, setting4, setting5, setting6, setting7, setting8, setting9,
+                        setting10, **kwargs)
 
 
 class Neighborhood(Agent):
@@ -47,25 +63,44 @@ class Neighborhood(Agent):
     Document agent constructor here.
     """
 
-    def __init__(self, setting1, setting2, setting3, timeout=10, **kwargs):
+    def __init__(self, setting1, setting2, setting3, setting4=30, setting5=10, setting6="energyConsumption",
+                 setting7="neighborhood", setting8=None, setting9="neighborhood/powerflow", setting10=1.0,
+                 **kwargs):
         super(Neighborhood, self).__init__(**kwargs)
         _log.debug("vip_identity: " + self.core.identity)
 
         self.setting1 = setting1
         self.setting2 = setting2
         self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        self.setting7 = setting7
+        self.setting8 = setting8
+        self.setting9 = setting9
+        self.setting10 = setting10
 
         self.default_config = {"setting1": setting1,
                                "setting2": setting2,
-                               "setting3": setting3}
-
-        #Dictionary that holds all Messages from the device buildings
-        #each device sends their building data as a dictionary -> so this is a dictionary of dictionarys
-        self.message_store = {}
-        self.expected_messages = setting1  #adjust in config to number of buildings
+                               "setting3": setting3,
+                               "setting4": setting4,
+                               "setting5": setting5,
+                               "setting6": setting6,
+                               "setting7": setting7,
+                               "setting8": setting8,
+                               "setting9": setting9,
+                               "setting10": setting10}
+
+        # Running totals per interval, indexed by building; see aggregator.py
+        self.aggregator = IntervalAggregator(setting4, setting1)
         self.received_messages = 0  # counter for received messages
-        self.timeout = timeout
-        self.timer = Timer(self.timeout, self.on_timeout)  # Timer to wait for message delay
+        # Interval start -> scheduled deadline event that publishes a partial total
+        self._deadlines = {}
+        # Interval start -> worst latency per level reported by lower level aggregators
+        self._child_latency = {}
+        self.latency = LatencyStats()
+        self.feeder = None
+        self.last_power_flow = None
 
         # Set a default configuration to ensure that self.configure is called immediately to setup
         # the agent.
@@ -89,16 +124,55 @@ class Neighborhood(Agent):
             setting1 = int(config["setting1"])
             setting2 = str(config["setting2"])
             setting3 = str(config["setting3"])
-        except ValueError as e:
+            setting4 = float(config["setting4"])
+            setting5 = float(config["setting5"])
+            setting6 = str(config["setting6"])
+            setting7 = str(config["setting7"])
+            aggregator = IntervalAggregator(setting4, setting1)
+            setting8 = config["setting8"]
+            setting9 = str(config["setting9"])
+            setting10 = float(config["setting10"])
+            feeder = self._create_feeder(setting8)
+        except (ValueError, TypeError) as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             return
 
         self.setting1 = setting1
         self.setting2 = setting2
         self.setting3 = setting3
+        self.setting4 = setting4
+        self.setting5 = setting5
+        self.setting6 = setting6
+        self.setting7 = setting7
+        self.setting8 = setting8
+        self.setting9 = setting9
+        self.setting10 = setting10
+        self.feeder = feeder
+        self.last_power_flow = None
+
+        for event in self._deadlines.values():
+            event.cancel()
+        self._deadlines = {}
+        self._child_latency = {}
+        self.aggregator = aggregator
 
         self._create_subscriptions(self.setting2)
 
+    @staticmethod
+    def _create_feeder(feeder_config):
+        """
+        Feeder for the power flow from a configuration dictionary or the path of a configuration file, None to
+        disable the power flow.
+        """
+        if not feeder_config:
+            return None
+        if isinstance(feeder_config, str):
+            try:
+                feeder_config = utils.load_config(feeder_config)
+            except Exception as e:
+                raise ValueError("Cannot read feeder configuration {}: {}".format(feeder_config, e))
+        return Feeder.from_config(dict(feeder_config))
+
     def _create_subscriptions(self, topic):
         """
         Unsubscribe from all pub/sub topics and create a subscription to a topic in the configuration which triggers
@@ -113,19 +187,177 @@ class Neighborhood(Agent):
     def _handle_publish(self, peer, sender, bus, topic, headers, message):
         """
         Callback triggered by the subscription setup using the topic from the agent's config file
+
+        Adds the building reading to the running total of its interval. The total is published as soon as all
+        expected buildings have reported, or at the interval deadline with whatever has arrived by then.
+        Columnar time-series messages add one reading per row.
+
+        Messages published by another Neighborhood agent (leaf) are partial sums and are added with the number of
+        buildings they cover, which makes this agent the next level of an aggregation tree.
         """
-        #get all building data dictionaries and merge them to get one dictionary that gets forwarded to the microgrid agent and the flex agent
-        print("Neighborhood joined the battle")
-        if topic not in self.message_store:
-            self.message_store[topic] = message
-            _log.info(f"Stored message from {topic}: {message}")
-
-        #check if all expected messages have been received
-        if self.received_messages >= self.expected_messages and self.timer.is_alive():
-            self.timer.cancel()
-            merged_building_data = self.handle_building_data()
-            self.vip.pubsub.publish('pubsub', self.setting3, message=merged_building_data)
-        pass
+        if self._is_partial_sum(message):
+            self.received_messages += 1
+            self._add_partial_sum(topic, self._get_timestamp(headers), message)
+            return
+
+        if is_timeseries(message):
+            readings = self._get_series(message)
+        else:
+            readings = [(self._get_timestamp(headers), self._get_value(message))]
+        if not readings or readings[0][1] is None:
+            _log.warning("No {} value in message from {}".format(self.setting6, topic))
+            return
+
+        self.received_messages += 1
+        for timestamp, value in readings:
+            self._add_reading(topic, timestamp, value)
+
+    @staticmethod
+    def _is_partial_sum(message):
+        return isinstance(message, dict) and "totalEnergy" in message and "buildings" in message
+
+    def _add_partial_sum(self, topic, timestamp, message):
+        try:
+            value = float(message["totalEnergy"])
+            buildings = int(message["buildings"])
+            expected = int(message.get("expected", buildings))
+            child_latency = {level: float(latency) for level, latency in (message.get("latency") or {}).items()}
+        except (AttributeError, TypeError, ValueError):
+            _log.warning("Invalid partial sum from {}: {}".format(topic, message))
+            return
+        # Recorded before adding, the reading may complete and publish the interval
+        start = self.aggregator.interval_start(timestamp)
+        latencies = self._child_latency.setdefault(start, {})
+        for level, latency in child_latency.items():
+            latencies[level] = max(latencies.get(level, latency), latency)
+        if self._add_reading(topic, timestamp, value, buildings=buildings, expected=expected,
+                             complete=bool(message.get("complete", True))) is None:
+            self._child_latency.pop(start, None)
+
+    def _add_reading(self, topic, timestamp, value, **kwargs):
+        result = self.aggregator.add(topic, timestamp, value, **kwargs)
+        if result is None:
+            _log.warning("Dropping late message from {}".format(topic))
+            return None
+
+        start, complete = result
+        if complete:
+            self._publish_interval(start)
+        elif start not in self._deadlines:
+            now = utils.get_utc_seconds_from_epoch(utils.get_aware_utc_now())
+            deadline = max(start + self.aggregator.interval, now) + self.setting5
+            self._deadlines[start] = self.core.schedule(datetime.fromtimestamp(deadline, pytz.utc),
+                                                        self._publish_interval, start)
+        return start
+
+    def _get_series(self, message):
+        """
+        Readings of the configured point from a columnar time-series message, as (epoch seconds, value) pairs.
+        """
+        try:
+            for column, readings in iter_readings(message):
+                if column == self.setting6:
+                    return [(utils.get_utc_seconds_from_epoch(timestamp), value) for timestamp, value in readings]
+        except (ValueError, KeyError, TypeError) as e:
+            _log.error("Bad time-series payload: {}".format(e))
+        return []
+
+    def _get_value(self, message):
+        """
+        Extract the configured point from a building message, a device "all" message or a bare number.
+        """
+        if isinstance(message, list) and message:
+            message = message[0]
+        if isinstance(message, dict):
+            message = message.get(self.setting6)
+        try:
+            return float(message)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _get_timestamp(headers):
+        """
+        Seconds since the epoch from the message Date header, or now if it is missing.
+        """
+        date = headers.get(headers_mod.DATE) if headers else None
+        if date:
+            try:
+                return utils.get_utc_seconds_from_epoch(utils.parse_timestamp_string(date))
+            except (TypeError, ValueError):
+                _log.warning("Invalid {} header: {}".format(headers_mod.DATE, date))
+        return utils.get_utc_seconds_from_epoch(utils.get_aware_utc_now())
+
+    def _publish_interval(self, start):
+        """
+        Close an interval and publish the neighborhood total.
+
+        The message carries the publish latency of this level (setting7) and the worst latency of every level
+        below it, in seconds after the end of the interval. Open intervals older than this one are closed and
+        published first, readings for them would be dropped as late from now on.
+        """
+        for older in self.aggregator.open_intervals:
+            if older >= start:
+                break
+            self._publish_interval(older)
+        event = self._deadlines.pop(start, None)
+        if event is not None:
+            event.cancel()
+        latencies = self._child_latency.pop(start, {})
+        readings = self.aggregator.readings(start) if self.feeder is not None else None
+        result = self.aggregator.close(start)
+        if result is None:
+            return
+
+        if result.count < result.expected:
+            _log.info("Deadline reached with {} of {} sources.".format(result.count, result.expected))
+        now = utils.get_utc_seconds_from_epoch(utils.get_aware_utc_now())
+        latencies[self.setting7] = now - (result.start + self.aggregator.interval)
+        for level, latency in latencies.items():
+            self.latency.add(level, latency)
+
+        timestamp = utils.format_timestamp(datetime.fromtimestamp(result.start, pytz.utc))
+        headers = {headers_mod.DATE: timestamp, headers_mod.TIMESTAMP: timestamp}
+        message = {"totalEnergy": result.total,
+                   "buildings": result.buildings,
+                   "expected": result.expected_buildings,
+                   "complete": result.count >= result.expected and not result.partial,
+                   "sources": result.count,
+                   "expectedSources": result.expected,
+                   "level": self.setting7,
+                   "latency": latencies}
+        self.vip.pubsub.publish('pubsub', self.setting3, headers=headers, message=message)
+
+        if readings is not None:
+            self._publish_power_flow(readings, headers)
+
+    def _publish_power_flow(self, readings, headers):
+        """
+        Run the feeder power flow for the readings of one interval and publish voltages and line loadings.
+
+        Readings are scaled to kW by setting10; sources that did not report are left out.
+        """
+        begin = time.perf_counter()
+        loads = self.feeder.load_vector(self.aggregator.sources, readings * self.setting10)
+        flow = self.feeder.solve(loads)
+        elapsed = time.perf_counter() - begin
+        if not flow.converged:
+            _log.warning("Power flow did not converge after {} sweeps".format(flow.iterations))
+
+        lowest = int(flow.voltage.argmin())
+        busiest = int(flow.loading.argmax()) if len(flow.loading) else None
+        message = {"converged": flow.converged,
+                   "iterations": flow.iterations,
+                   "minVoltage": float(flow.voltage[lowest]),
+                   "minVoltageBus": self.feeder.buses[lowest],
+                   "maxLoading": float(flow.loading[busiest]) if busiest is not None else 0.0,
+                   "maxLoadingLine": self.feeder.lines[busiest] if busiest is not None else None,
+                   "losses": float(flow.losses),
+                   "voltage": dict(zip(self.feeder.buses, flow.voltage.tolist())),
+                   "loading": dict(zip(self.feeder.lines, flow.loading.tolist())),
+                   "solveTime": elapsed}
+        self.last_power_flow = message
+        self.vip.pubsub.publish('pubsub', self.setting9, headers=headers, message=message)
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
@@ -152,6 +384,28 @@ class Neighborhood(Agent):
         """
         pass
 
+    @RPC.export
+    def get_metrics(self):
+        """
+        RPC method
+
+        Message counters and the publish latency per aggregation level.
+        """
+        return {"received": self.received_messages,
+                "readings": self.aggregator.received,
+                "late": self.aggregator.late,
+                "open_intervals": len(self.aggregator.open_intervals),
+                "latency": self.latency.snapshot()}
+
+    @RPC.export
+    def get_power_flow(self):
+        """
+        RPC method
+
+        The latest published power flow result, None before the first one or without a feeder.
+        """
+        return self.last_power_flow
+
     @RPC.export
     def rpc_method(self, arg1, arg2, kwarg1=None, kwarg2=None):
         """
@@ -161,30 +415,6 @@ class Neighborhood(Agent):
         """
         return self.setting1 + arg1 - arg2
 
-    def handle_building_data(self):
-        merged_message = {}  # dictionary that holds the neighborhood energy consumption for time interval
-        for topic, message in self.message_store.items():
-            for key, value in message.items():
-                if key in merged_message:
-                    # handle duplicate keys as needed
-                    # here we assume the latest messages value
-                    _log.warning(f"Duplicate key {key} in {topic}")
-                merged_message[key] = value
-        # handle missing keys be setting them to None
-        all_keys = set()
-        for message in self.message_store.values():
-            all_keys.update(message.keys())
-
-        for key in all_keys:
-            if key not in merged_message:
-                merged_message[key] = None  # or set default value
-
-        return merged_message
-
-    def on_timeout(self):
-        _log.info("Timeout reached. Proceeding with available messages.")
-        self.handle_building_data()
-
 
 def main():
     """Main method called to start the agent."""
@@ -0,0 +1,211 @@
+"""
+Streaming, interval aligned aggregation of building values.
+
+Every building gets a fixed slot the first time it reports. Each open
+interval keeps preallocated value arrays and a seen mask indexed by that
+slot plus running sums, so adding a reading is O(1) no matter how many
+buildings report. Closed intervals hand their arrays back to a free list for
+the next interval.
+
+A source can also be another aggregator reporting the partial sum of its
+own buildings. Its reading then carries the number of buildings it covers,
+the number it expected and whether its interval was complete, so
+aggregators can be stacked into a tree (buildings -> street -> district).
+Sources that never reported count as one expected building.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import namedtuple
+
+import numpy as np
+
+IntervalTotal = namedtuple('IntervalTotal', ['start', 'total', 'count', 'expected', 'buildings',
+                                             'expected_buildings', 'partial'])
+
+
+class _Interval(object):
+    __slots__ = ('start', 'values', 'buildings', 'seen', 'partial', 'total', 'count', 'building_count',
+                 'partial_count')
+
+    def __init__(self, start, values, buildings, seen, partial):
+        self.start = start
+        self.values = values
+        self.buildings = buildings
+        self.seen = seen
+        self.partial = partial
+        self.total = 0.0
+        self.count = 0
+        self.building_count = 0
+        self.partial_count = 0
+
+
+class IntervalAggregator(object):
+    """
+    Running per interval totals of the values reported by many buildings.
+
+    :param interval: Interval length in seconds; readings are keyed by the
+                     start of the interval their timestamp falls into.
+    :param expected: Number of sources (buildings or lower level aggregators) expected per interval.
+    """
+
+    def __init__(self, interval, expected):
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        self.interval = float(interval)
+        self.expected = int(expected)
+        self.received = 0
+        self.late = 0
+        self._slots = {}
+        self._keys = []
+        self._capacity = max(self.expected, 1)
+        self._expected_buildings = np.zeros(self._capacity)
+        self._open = {}
+        self._free = []
+        self._last_closed = float('-inf')
+
+    def interval_start(self, timestamp):
+        """Start of the interval, in seconds since the epoch, containing ``timestamp``."""
+        return timestamp - timestamp % self.interval
+
+    @property
+    def open_intervals(self):
+        return sorted(self._open)
+
+    def add(self, building, timestamp, value, buildings=1, expected=None, complete=True):
+        """
+        Add one building reading or the partial sum of a lower level aggregator.
+
+        A second reading from the same source in the same interval replaces
+        the first one.
+
+        :param building: Source key, e.g. the publishing topic.
+        :param timestamp: Reading time in seconds since the epoch.
+        :param value: Reading value.
+        :param buildings: Number of buildings the value covers.
+        :param expected: Number of buildings the source expected, defaults to ``buildings``.
+        :param complete: False if the source closed its interval without all of its buildings.
+        :returns: ``(interval_start, complete)`` or None when the interval has
+                  already been closed. An interval is complete once all
+                  expected sources reported and none of them was partial.
+        """
+        start = self.interval_start(timestamp)
+        if start <= self._last_closed:
+            self.late += 1
+            return None
+
+        slot = self._slots.get(building)
+        if slot is None:
+            slot = self._slots[building] = len(self._slots)
+            self._keys.append(building)
+            if slot >= self._capacity:
+                self._grow()
+
+        interval = self._open.get(start)
+        if interval is None:
+            interval = self._open[start] = self._new_interval(start)
+
+        partial = not complete
+        if interval.seen[slot]:
+            interval.total += value - interval.values[slot]
+            interval.building_count += buildings - int(interval.buildings[slot])
+            interval.partial_count += partial - bool(interval.partial[slot])
+        else:
+            interval.seen[slot] = True
+            interval.count += 1
+            interval.total += value
+            interval.building_count += buildings
+            interval.partial_count += partial
+        interval.values[slot] = value
+        interval.buildings[slot] = buildings
+        interval.partial[slot] = partial
+        self._expected_buildings[slot] = buildings if expected is None else expected
+        self.received += 1
+        return start, interval.count >= self.expected and not interval.partial_count
+
+    @property
+    def sources(self):
+        """Source keys in slot order, new sources are appended."""
+        return self._keys
+
+    def readings(self, start):
+        """
+        Latest value of every source in an open interval, NaN for sources that did not report.
+
+        :param start: Interval start as returned by :meth:`add`.
+        :returns: Values in :attr:`sources` order or None if the interval is not open.
+        :rtype: numpy.ndarray
+        """
+        interval = self._open.get(start)
+        if interval is None:
+            return None
+        known = len(self._keys)
+        return np.where(interval.seen[:known], interval.values[:known], np.nan)
+
+    def close(self, start):
+        """
+        Close an interval and return its total.
+
+        Readings for this or any earlier interval arriving afterwards are
+        counted as late and dropped.
+
+        :param start: Interval start as returned by :meth:`add`.
+        :rtype: IntervalTotal or None if the interval is not open.
+        """
+        interval = self._open.pop(start, None)
+        if interval is None:
+            return None
+        self._last_closed = max(self._last_closed, start)
+        if len(interval.values) == self._capacity:
+            interval.seen[:] = False
+            interval.partial[:] = False
+            self._free.append((interval.values, interval.buildings, interval.seen, interval.partial))
+        known = len(self._slots)
+        expected_buildings = int(self._expected_buildings[:known].sum()) + max(self.expected - known, 0)
+        return IntervalTotal(start, interval.total, interval.count, self.expected, interval.building_count,
+                             expected_buildings, interval.partial_count)
+
+    def _new_interval(self, start):
+        if self._free:
+            arrays = self._free.pop()
+        else:
+            arrays = (np.zeros(self._capacity), np.zeros(self._capacity), np.zeros(self._capacity, dtype=bool),
+                      np.zeros(self._capacity, dtype=bool))
+        return _Interval(start, *arrays)
+
+    def _grow(self):
+        self._capacity *= 2
+        self._free = []
+        self._expected_buildings = _extend(self._expected_buildings, self._capacity)
+        for interval in self._open.values():
+            interval.values = _extend(interval.values, self._capacity)
+            interval.buildings = _extend(interval.buildings, self._capacity)
+            interval.seen = _extend(interval.seen, self._capacity)
+            interval.partial = _extend(interval.partial, self._capacity)
+
+
+def _extend(array, capacity):
+    return np.concatenate([array, np.zeros(capacity - len(array), dtype=array.dtype)])
+
+
+class LatencyStats(object):
+    """
+    Publish latency per aggregation level, in seconds after the end of the interval.
+    """
+
+    def __init__(self):
+        self._levels = {}
+
+    def add(self, level, latency):
+        stats = self._levels.get(level)
+        if stats is None:
+            stats = self._levels[level] = [0, 0.0, latency, latency]
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+        stats[3] = latency
+
+    def snapshot(self):
+        """``{level: {"count", "mean", "max", "last"}}``"""
+        return {level: {"count": count, "mean": total / count, "max": maximum, "last": last}
+                for level, (count, total, maximum, last) in self._levels.items()}
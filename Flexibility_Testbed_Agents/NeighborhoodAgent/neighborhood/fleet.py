@@ -0,0 +1,247 @@
+"""
+Synthetic building fleet for load testing the neighborhood pipeline.
+
+Derives any number of building load profiles from a few recorded ones
+(``Python test files/TEC_PEL_1W.csv`` by default) and writes everything the
+Platform Driver needs to replay them with the replay driver:
+
+* ``profiles.csv`` with a timestamp column and one column per building,
+* ``registry_configs/<building>.csv`` mapping that column to the point,
+* ``devices/<prefix>/<building>`` device configurations,
+* ``config``, the Platform Driver main configuration,
+* ``neighborhood.config``, a Neighborhood agent configuration expecting the fleet.
+
+The directory layout matches ``scripts/install_platform_driver_configs.py``.
+Every building is a base profile scaled by a lognormal factor, shifted in
+time by a whole number of steps and overlaid with multiplicative noise, all
+drawn at once for the whole fleet from one seeded generator, so the same
+seed always yields the same fleet.
+
+Run from the agent directory::
+
+    python -m neighborhood.fleet fleet --buildings 1000 --seed 1 --push
+
+``--push`` stores all configurations in the Platform Driver configuration
+store with a single ``manage_store_many`` call on a running platform.
+"""
+
+__docformat__ = 'reStructuredText'
+
+import json
+import logging
+import os
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import numpy as np
+import pandas as pd
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir,
+                               'Python test files', 'TEC_PEL_1W.csv')
+
+PROFILES_FILE = 'profiles.csv'
+
+REGISTRY_HEADER = 'Point Name,Volttron Point Name,Units,Writable,Type,Scale\n'
+
+DRIVER_CONFIG = {"driver_scrape_interval": 0.05,
+                 "publish_breadth_first_all": False,
+                 "publish_depth_first": False,
+                 "publish_breadth_first": False}
+
+
+def load_base_profiles(paths):
+    """
+    Read the base profiles, one per file, each with a timestamp and a value column.
+
+    Files without a header (like ``TEC_PEL_1W.csv``) and files with one are
+    accepted. Longer profiles are cut to the length of the shortest.
+
+    :returns: Timestamps of the first profile as strings and the values, shape ``(profiles, steps)``.
+    :rtype: tuple
+    """
+    timestamps = None
+    profiles = []
+    for path in paths:
+        frame = pd.read_csv(path, header=None, usecols=[0, 1], dtype=str)
+        try:
+            pd.Timestamp(frame.iat[0, 0])
+        except ValueError:
+            frame = frame.iloc[1:]
+        profiles.append(pd.to_numeric(frame[1]).to_numpy(dtype=np.float64))
+        if timestamps is None:
+            timestamps = frame[0].str.strip().tolist()
+
+    length = min(len(profile) for profile in profiles)
+    return timestamps[:length], np.stack([profile[:length] for profile in profiles])
+
+
+def generate_profiles(base, num_buildings, seed=None, scale_sigma=0.3, max_shift=4, noise=0.05):
+    """
+    Derive building profiles from base profiles.
+
+    :param base: Base profiles, shape ``(profiles, steps)``.
+    :param num_buildings: Number of buildings to generate.
+    :param seed: Seed for a reproducible fleet.
+    :param scale_sigma: Sigma of the lognormal scaling factor (median 1).
+    :param max_shift: Largest shift in time steps, in either direction, wrapping around.
+    :param noise: Standard deviation of the multiplicative per step noise.
+    :returns: Profiles of shape ``(num_buildings, steps)``, never negative.
+    :rtype: numpy.ndarray
+    """
+    base = np.atleast_2d(np.asarray(base, dtype=np.float64))
+    num_profiles, num_steps = base.shape
+    rng = np.random.default_rng(seed)
+
+    choice = rng.integers(num_profiles, size=num_buildings)
+    scale = rng.lognormal(0.0, scale_sigma, size=num_buildings)
+    shift = rng.integers(-max_shift, max_shift + 1, size=num_buildings)
+    steps = (np.arange(num_steps) - shift[:, None]) % num_steps
+
+    profiles = base[choice[:, None], steps]
+    profiles *= scale[:, None]
+    profiles *= 1.0 + noise * rng.standard_normal((num_buildings, num_steps))
+    return np.clip(profiles, 0.0, None, out=profiles)
+
+
+def building_names(num_buildings):
+    width = max(4, len(str(num_buildings)))
+    return ['building_{:0{}d}'.format(i + 1, width) for i in range(num_buildings)]
+
+
+def write_fleet(output_dir, timestamps, profiles, prefix='neighborhood/fleet', interval=30,
+                point_name='energyConsumption', units='kW', speed_up=1, timezone='UTC'):
+    """
+    Write the profiles and the driver configurations for a fleet.
+
+    :param output_dir: Directory to write to, created if needed.
+    :param timestamps: Timestamp strings of the profile rows.
+    :param profiles: Building profiles, shape ``(buildings, steps)``.
+    :param prefix: Device topic prefix of the buildings.
+    :param interval: Scrape interval of the building devices in seconds.
+    :param point_name: Point the buildings publish their load as.
+    :param speed_up: Profile seconds replayed per wall clock second.
+    :returns: Names of the building devices, ``devices/<prefix>/<building>``.
+    :rtype: list
+    """
+    names = building_names(len(profiles))
+    os.makedirs(os.path.join(output_dir, 'registry_configs'), exist_ok=True)
+    device_dir = os.path.join(output_dir, 'devices', *prefix.split('/'))
+    os.makedirs(device_dir, exist_ok=True)
+
+    profile_path = os.path.abspath(os.path.join(output_dir, PROFILES_FILE))
+    frame = pd.DataFrame(np.asarray(profiles).T, columns=names)
+    frame.insert(0, 'Timestamp', timestamps)
+    frame.to_csv(profile_path, index=False, float_format='%.3f')
+
+    for name in names:
+        with open(os.path.join(output_dir, 'registry_configs', name + '.csv'), 'w') as registry_file:
+            registry_file.write(REGISTRY_HEADER)
+            registry_file.write('{},{},{},FALSE,float,\n'.format(name, point_name, units))
+
+        device_config = {"driver_config": {"profile_path": profile_path,
+                                           "speed_up": speed_up,
+                                           "interpolate": False,
+                                           "loop": True},
+                         "driver_type": "replay",
+                         "registry_config": "config://registry_configs/{}.csv".format(name),
+                         "interval": interval,
+                         "timezone": timezone}
+        with open(os.path.join(device_dir, name), 'w') as device_file:
+            json.dump(device_config, device_file, indent=4)
+
+    with open(os.path.join(output_dir, 'config'), 'w') as config_file:
+        json.dump(DRIVER_CONFIG, config_file, indent=4)
+
+    neighborhood_config = {"setting1": len(names),
+                           "setting2": "devices/" + prefix,
+                           "setting3": "neighborhood/totalEnergy",
+                           "setting4": interval,
+                           "setting5": 10,
+                           "setting6": point_name}
+    with open(os.path.join(output_dir, 'neighborhood.config'), 'w') as config_file:
+        json.dump(neighborhood_config, config_file, indent=4)
+
+    return ['devices/{}/{}'.format(prefix, name) for name in names]
+
+
+def collect_configs(output_dir):
+    """
+    Configuration store entries of a fleet directory, registries before devices.
+
+    :returns: ``[config_name, raw_contents, config_type]`` entries.
+    :rtype: list
+    """
+    configs = []
+    with open(os.path.join(output_dir, 'config')) as config_file:
+        configs.append(['config', config_file.read(), 'json'])
+    for file_name in sorted(os.listdir(os.path.join(output_dir, 'registry_configs'))):
+        with open(os.path.join(output_dir, 'registry_configs', file_name)) as registry_file:
+            configs.append(['registry_configs/' + file_name, registry_file.read(), 'csv'])
+    for dir_path, _, files in sorted(os.walk(os.path.join(output_dir, 'devices'))):
+        for file_name in sorted(files):
+            path = os.path.join(dir_path, file_name)
+            with open(path) as device_file:
+                name = os.path.relpath(path, output_dir).replace(os.sep, '/')
+                configs.append([name, device_file.read(), 'json'])
+    return configs
+
+
+def push_fleet(output_dir, keep=False, timeout=60):
+    """
+    Store a fleet directory in the Platform Driver configuration store of the running platform.
+
+    :param keep: Keep the existing Platform Driver configurations instead of deleting them first.
+    """
+    from volttron.platform.agent.known_identities import CONFIGURATION_STORE, PLATFORM, PLATFORM_DRIVER
+    from volttron.platform.keystore import KeyStore
+    from volttron.platform.vip.agent.utils import build_agent
+
+    configs = collect_configs(output_dir)
+    ks = KeyStore()
+    agent = build_agent(identity=PLATFORM, publickey=ks.public, secretkey=ks.secret, enable_store=True,
+                        timeout=30)
+    try:
+        if not keep:
+            agent.vip.rpc.call(CONFIGURATION_STORE, 'manage_delete_store', PLATFORM_DRIVER).get(timeout=timeout)
+        agent.vip.rpc.call(CONFIGURATION_STORE, 'manage_store_many', PLATFORM_DRIVER, configs).get(timeout=timeout)
+    finally:
+        agent.core.stop()
+    return len(configs)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('output', help='Directory the fleet is written to.')
+    parser.add_argument('--buildings', type=int, default=1000, help='Number of buildings.')
+    parser.add_argument('--profiles', nargs='+', default=[DEFAULT_PROFILE],
+                        help='Base profile CSV files with a timestamp and a value column.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for a reproducible fleet.')
+    parser.add_argument('--scale-sigma', type=float, default=0.3, help='Sigma of the lognormal scaling factor.')
+    parser.add_argument('--max-shift', type=int, default=4, help='Largest time shift in profile steps.')
+    parser.add_argument('--noise', type=float, default=0.05, help='Standard deviation of the multiplicative noise.')
+    parser.add_argument('--prefix', default='neighborhood/fleet', help='Device topic prefix.')
+    parser.add_argument('--interval', type=int, default=30, help='Scrape interval of the buildings in seconds.')
+    parser.add_argument('--speed-up', type=float, default=1, help='Profile seconds replayed per second.')
+    parser.add_argument('--push', action='store_true',
+                        help='Store the configurations in the Platform Driver configuration store.')
+    parser.add_argument('--keep-old', action='store_true',
+                        help='Do not remove existing Platform Driver configurations when pushing.')
+    args = parser.parse_args(argv)
+
+    timestamps, base = load_base_profiles(args.profiles)
+    profiles = generate_profiles(base, args.buildings, seed=args.seed, scale_sigma=args.scale_sigma,
+                                 max_shift=args.max_shift, noise=args.noise)
+    devices = write_fleet(args.output, timestamps, profiles, prefix=args.prefix, interval=args.interval,
+                          speed_up=args.speed_up)
+    _log.info("Wrote {} buildings with {} steps to {}".format(len(devices), len(timestamps), args.output))
+
+    if args.push:
+        stored = push_fleet(args.output, keep=args.keep_old)
+        _log.info("Stored {} configurations".format(stored))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Power flow of a radial distribution feeder.
+
+The feeder is a tree of lines below one source bus. Numbering the buses in
+breadth first order from the source, line ``i`` feeds bus ``i + 1`` and the
+branch current of every line is the sum of the load currents of all buses
+below it. That relation is a sparse ``lines x buses`` matrix, the branch
+injection to branch current matrix ``B``, built once per topology. One
+backward/forward sweep is then two sparse products::
+
+    I_load   = conj(S / V)
+    I_branch = B @ I_load                      (backward sweep)
+    V        = V_source - B.T @ (Z * I_branch)  (forward sweep)
+
+repeated until the voltages settle. Loads may carry a time axis, all steps
+are swept together.
+
+Quantities are per unit of ``base_kva`` (three phase) and ``base_kv`` (line
+to line), a balanced feeder is assumed. Line impedances are given in ohm,
+loads in kW and ampacities in A.
+
+A feeder configuration looks like::
+
+    {
+        "source": "transformer",
+        "base_kv": 0.4,
+        "base_kva": 630,
+        "power_factor": 0.95,
+        "lines": [
+            {"name": "l1", "from": "transformer", "to": "cabinet1", "r": 0.02, "x": 0.01, "ampacity": 400},
+            {"name": "l2", "from": "cabinet1", "to": "house1", "r": 0.05, "x": 0.005, "ampacity": 100}
+        ],
+        "loads": {"building1": "house1"}
+    }
+
+``loads`` maps source keys (e.g. building topics, or their last topic
+level) to the bus they are connected to.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from collections import deque, namedtuple
+
+import numpy as np
+from scipy import sparse
+
+PowerFlowResult = namedtuple('PowerFlowResult', ['voltage', 'current', 'loading', 'losses', 'iterations',
+                                                 'converged'])
+
+
+class Feeder(object):
+    """
+    Topology and impedances of a radial feeder with its cached sweep matrices.
+
+    :param lines: ``(name, from_bus, to_bus, r, x, ampacity)`` tuples, impedances in ohm and ampacity in A
+                  (None for no limit).
+    :param source: Source bus (substation or transformer secondary).
+    :param base_kv: Line to line base voltage in kV.
+    :param base_kva: Three phase base power in kVA.
+    :param power_factor: Power factor of loads given without reactive power.
+    :param loads: Source key to bus mapping used by :meth:`load_vector`.
+    :param source_voltage: Source bus voltage in per unit.
+    """
+
+    def __init__(self, lines, source, base_kv=0.4, base_kva=1000.0, power_factor=0.95, loads=None,
+                 source_voltage=1.0):
+        if not 0 < power_factor <= 1:
+            raise ValueError("Power factor must be in (0, 1]")
+        self.source = source
+        self.base_kv = float(base_kv)
+        self.base_kva = float(base_kva)
+        self.power_factor = float(power_factor)
+        self.source_voltage = float(source_voltage)
+        self.loads = dict(loads or {})
+
+        children = {}
+        for line in lines:
+            children.setdefault(line[1], []).append(line)
+        # Breadth first from the source, every bus but the source is reached through exactly one line
+        buses = [source]
+        parents = [-1]
+        ordered = []
+        position = {source: 0}
+        queue = deque([source])
+        while queue:
+            bus = queue.popleft()
+            for line in children.get(bus, ()):
+                if line[2] in position:
+                    raise ValueError("Feeder is not radial, bus {} is fed twice".format(line[2]))
+                position[line[2]] = len(buses)
+                buses.append(line[2])
+                parents.append(position[bus])
+                ordered.append(line)
+                queue.append(line[2])
+        if len(ordered) != len(lines):
+            unreached = sorted(str(line[0]) for line in lines if line[2] not in position or line[1] not in position)
+            raise ValueError("Lines {} are not connected to the source {}".format(unreached, source))
+
+        self.buses = buses
+        self.lines = [line[0] for line in ordered]
+        self.parents = np.array(parents, dtype=np.intp)
+        self._position = position
+
+        base_impedance = self.base_kv ** 2 * 1000.0 / self.base_kva
+        self.impedance = np.array([complex(line[3], line[4]) for line in ordered]) / base_impedance
+        self.resistance = self.impedance.real.copy()
+        base_current = self.base_kva / (np.sqrt(3) * self.base_kv)
+        ampacity = np.array([np.inf if line[5] is None else float(line[5]) for line in ordered])
+        self.ampacity = ampacity / base_current
+        self.base_current = base_current
+
+        # Line i feeds bus i + 1. B[line, bus - 1] is 1 for every line on the path from the source to the bus.
+        rows, cols = [], []
+        paths = [[]]
+        for bus in range(1, len(buses)):
+            path = paths[parents[bus]] + [bus - 1]
+            paths.append(path)
+            rows.extend(path)
+            cols.extend([bus - 1] * len(path))
+        num_lines = len(ordered)
+        self._injection = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_lines, num_lines))
+        self._injection_t = self._injection.T.tocsr()
+        self._load_index = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a feeder from a configuration dictionary, see the module documentation.
+
+        :rtype: Feeder
+        """
+        try:
+            lines = [(line.get('name', '{}-{}'.format(line['from'], line['to'])), line['from'], line['to'],
+                      float(line['r']), float(line.get('x', 0.0)), line.get('ampacity'))
+                     for line in config['lines']]
+            source = config['source']
+        except KeyError as e:
+            raise ValueError("Feeder configuration is missing {}".format(e))
+        return cls(lines, source, base_kv=float(config.get('base_kv', 0.4)),
+                   base_kva=float(config.get('base_kva', 1000.0)),
+                   power_factor=float(config.get('power_factor', 0.95)), loads=config.get('loads'),
+                   source_voltage=float(config.get('source_voltage', 1.0)))
+
+    def _bus_of(self, key):
+        bus = self.loads.get(key)
+        if bus is None:
+            name = key[:-4] if key.endswith('/all') else key
+            bus = self.loads.get(name.rsplit('/', 1)[-1])
+        return self._position.get(bus, -1)
+
+    def load_vector(self, keys, values):
+        """
+        Active power per bus from values reported by source keys.
+
+        Keys that map to no bus and NaN values are ignored. The key to bus
+        lookup is cached; ``keys`` is expected to only ever grow at the end,
+        like the slots of :class:`~neighborhood.aggregator.IntervalAggregator`.
+
+        :param keys: Source keys.
+        :param values: Active power in kW per key.
+        :rtype: numpy.ndarray
+        """
+        if self._load_index is None or len(self._load_index) != len(keys):
+            known = 0 if self._load_index is None else len(self._load_index)
+            extra = np.array([self._bus_of(key) for key in keys[known:]], dtype=np.intp)
+            self._load_index = extra if self._load_index is None else np.concatenate([self._load_index, extra])
+        index = self._load_index
+        values = np.asarray(values, dtype=np.float64)
+        mapped = (index >= 0) & ~np.isnan(values)
+        return np.bincount(index[mapped], weights=values[mapped], minlength=len(self.buses))
+
+    def solve(self, active_power, reactive_power=None, tolerance=1e-8, max_iterations=30):
+        """
+        Run the backward/forward sweep.
+
+        :param active_power: Load in kW per bus in :attr:`buses` order, shape ``(buses,)`` or
+                             ``(buses, time steps)``. The source bus entry is ignored.
+        :param reactive_power: Reactive load in kvar, from :attr:`power_factor` if omitted.
+        :param tolerance: Largest voltage change in per unit between sweeps at convergence.
+        :returns: Bus voltage magnitude in per unit, line current magnitude in A, line loading as a fraction
+                  of the ampacity, losses in kW per time step, the number of sweeps and whether they converged.
+        :rtype: PowerFlowResult
+        """
+        active_power = np.asarray(active_power, dtype=np.float64)
+        if active_power.shape[0] != len(self.buses):
+            raise ValueError("Expected {} bus loads, got {}".format(len(self.buses), active_power.shape[0]))
+        if reactive_power is None:
+            reactive_power = active_power * np.tan(np.arccos(self.power_factor))
+        power = (active_power[1:] + 1j * np.asarray(reactive_power, dtype=np.float64)[1:]) / self.base_kva
+        impedance = self.impedance if power.ndim == 1 else self.impedance[:, np.newaxis]
+
+        voltage = np.full(power.shape, self.source_voltage, dtype=np.complex128)
+        branch = np.zeros(power.shape, dtype=np.complex128)
+        converged = False
+        iterations = 0
+        while iterations < max_iterations:
+            iterations += 1
+            branch = self._injection @ np.conj(power / voltage)
+            updated = self.source_voltage - self._injection_t @ (impedance * branch)
+            change = np.abs(updated - voltage).max() if updated.size else 0.0
+            voltage = updated
+            if change < tolerance:
+                converged = True
+                break
+
+        magnitude = np.abs(branch)
+        source = np.full((1,) + power.shape[1:], self.source_voltage)
+        resistance = self.resistance if power.ndim == 1 else self.resistance[:, np.newaxis]
+        ampacity = self.ampacity if power.ndim == 1 else self.ampacity[:, np.newaxis]
+        return PowerFlowResult(np.concatenate([source, np.abs(voltage)]), magnitude * self.base_current,
+                               magnitude / ampacity, (resistance * magnitude ** 2).sum(axis=0) * self.base_kva,
+                               iterations, converged)
@@ -17,7 +17,7 @@ setup(
     version=__version__,
     author="christian caus",
     description="Agent that represents a neighborhood consisting of multiple buildings. It's purpose is to gather the consumption data from all buildings and forward it to the microgrid.",
-    install_requires=['volttron'],
+    install_requires=['volttron', 'numpy', 'scipy'],
     packages=packages,
     entry_points={
         'setuptools.installation': [
@@ -0,0 +1,21 @@
+from unittest import mock
+
+from neighborhood.agent import Neighborhood
+
+START = 1700000010.0
+
+
+def test_closing_an_interval_publishes_older_open_intervals():
+    agent = Neighborhood(2, 'neighborhood/energyconsumption', 'neighborhood/total', setting4=30)
+    agent.vip = mock.MagicMock()
+    agent.core.schedule = mock.MagicMock()
+
+    agent._add_reading('building1', START - 30, 1.0)
+    agent._add_reading('building1', START, 2.0)
+    agent._add_reading('building2', START, 3.0)
+
+    published = [(call[1]['headers'], call[1]['message']) for call in agent.vip.pubsub.publish.call_args_list]
+    assert [message['totalEnergy'] for headers, message in published] == [1.0, 5.0]
+    assert [message['complete'] for headers, message in published] == [False, True]
+    assert agent.aggregator.open_intervals == []
+    assert agent._deadlines == {}
@@ -0,0 +1,117 @@
+import pytest
+
+from neighborhood.aggregator import IntervalAggregator, LatencyStats
+
+START = 1700000010.0  # multiple of 30
+
+
+def test_readings_are_keyed_by_interval_start():
+    aggregator = IntervalAggregator(30, 2)
+    assert aggregator.add('building1', START + 29.9, 500) == (START, False)
+    assert aggregator.add('building1', START + 30, 100) == (START + 30, False)
+    assert aggregator.open_intervals == [START, START + 30]
+
+
+def test_complete_when_all_buildings_reported():
+    aggregator = IntervalAggregator(30, 3)
+    aggregator.add('building1', START, 500)
+    aggregator.add('building2', START + 5, 250)
+    assert aggregator.add('building3', START + 10, 125) == (START, True)
+
+    result = aggregator.close(START)
+    assert result.total == 875
+    assert result.count == result.expected == 3
+    assert aggregator.open_intervals == []
+
+
+def test_duplicate_reading_replaces_previous_value():
+    aggregator = IntervalAggregator(30, 2)
+    aggregator.add('building1', START, 500)
+    assert aggregator.add('building1', START + 1, 300) == (START, False)
+
+    result = aggregator.close(START)
+    assert result.total == 300
+    assert result.count == 1
+
+
+def test_partial_interval_and_late_readings():
+    aggregator = IntervalAggregator(30, 3)
+    aggregator.add('building1', START, 500)
+    aggregator.add('building2', START + 30, 200)
+
+    result = aggregator.close(START)
+    assert (result.total, result.count) == (500, 1)
+
+    assert aggregator.add('building2', START + 2, 100) is None
+    assert aggregator.late == 1
+    assert aggregator.close(START) is None
+    assert aggregator.close(START + 30).total == 200
+
+
+def test_more_buildings_than_expected():
+    aggregator = IntervalAggregator(30, 2)
+    aggregator.add('building0', START + 30, 1)
+    for i in range(10):
+        aggregator.add('building{}'.format(i), START, i)
+    assert aggregator.close(START).total == sum(range(10))
+    assert aggregator.close(START + 30).total == 1
+
+
+def test_closed_interval_arrays_are_reused():
+    aggregator = IntervalAggregator(30, 2)
+    aggregator.add('building1', START, 500)
+    aggregator.add('building2', START, 500)
+    aggregator.close(START)
+
+    aggregator.add('building2', START + 30, 7)
+    result = aggregator.close(START + 30)
+    assert (result.total, result.count) == (7, 1)
+
+
+def test_invalid_interval():
+    with pytest.raises(ValueError):
+        IntervalAggregator(0, 2)
+
+
+def test_tree_of_aggregators():
+    leaves = [IntervalAggregator(30, 2), IntervalAggregator(30, 3)]
+    root = IntervalAggregator(30, 2)
+    for i in range(2):
+        leaves[0].add('a{}'.format(i), START, 100)
+    leaves[1].add('b0', START, 10)
+    leaves[1].add('b1', START, 20)
+
+    for name, leaf in zip(('street1', 'street2'), leaves):
+        result = leaf.close(START)
+        status = root.add(name, START, result.total, buildings=result.buildings,
+                          expected=result.expected_buildings, complete=result.count >= result.expected)
+    # street2 closed with two of three buildings
+    assert status == (START, False)
+
+    result = root.close(START)
+    assert (result.total, result.count, result.expected) == (230, 2, 2)
+    assert (result.buildings, result.expected_buildings, result.partial) == (4, 5, 1)
+
+
+def test_replaced_partial_sum():
+    root = IntervalAggregator(30, 1)
+    assert root.add('street1', START, 10, buildings=1, expected=2, complete=False) == (START, False)
+    assert root.add('street1', START, 25, buildings=2, expected=2) == (START, True)
+    result = root.close(START)
+    assert (result.total, result.buildings, result.partial) == (25, 2, 0)
+
+
+def test_missing_sources_count_as_one_building():
+    aggregator = IntervalAggregator(30, 4)
+    aggregator.add('street1', START, 10, buildings=5, expected=6)
+    result = aggregator.close(START)
+    assert (result.buildings, result.expected_buildings) == (5, 9)
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    stats.add('street', 1.0)
+    stats.add('street', 3.0)
+    stats.add('district', 0.5)
+    assert stats.snapshot() == {'street': {'count': 2, 'mean': 2.0, 'max': 3.0, 'last': 3.0},
+                                'district': {'count': 1, 'mean': 0.5, 'max': 0.5, 'last': 0.5}}
@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from neighborhood.fleet import (DEFAULT_PROFILE, collect_configs, generate_profiles, load_base_profiles, main,
+                                write_fleet)
+
+BASE = np.array([[1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+                 [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]])
+
+
+def test_default_profile_loads():
+    timestamps, base = load_base_profiles([DEFAULT_PROFILE])
+    assert base.shape == (1, len(timestamps))
+    assert timestamps[0] == '2018-01-01 00:00:00+01:00'
+    assert base[0, 0] == pytest.approx(3467.6334989387765)
+
+
+def test_profiles_are_scaled_and_shifted_base_profiles():
+    profiles = generate_profiles(BASE, 50, seed=3, noise=0.0, max_shift=2)
+    assert profiles.shape == (50, 6)
+    for profile in profiles:
+        matches = [np.allclose(profile / np.roll(base, shift), (profile / np.roll(base, shift))[0])
+                   for base in BASE for shift in range(-2, 3)]
+        assert any(matches)
+
+
+def test_fleet_is_reproducible():
+    first = generate_profiles(BASE, 20, seed=1)
+    np.testing.assert_array_equal(first, generate_profiles(BASE, 20, seed=1))
+    assert not np.array_equal(first, generate_profiles(BASE, 20, seed=2))
+    assert (generate_profiles(BASE, 20, seed=1, noise=5.0) >= 0).all()
+
+
+def test_write_fleet(tmp_path):
+    timestamps = ['2018-01-01 00:{:02d}:00+01:00'.format(15 * i % 60) for i in range(6)]
+    devices = write_fleet(str(tmp_path), timestamps, generate_profiles(BASE, 3, seed=1), interval=15)
+    assert devices == ['devices/neighborhood/fleet/building_000{}'.format(i) for i in (1, 2, 3)]
+
+    profiles = pd.read_csv(str(tmp_path / 'profiles.csv'))
+    assert list(profiles.columns) == ['Timestamp', 'building_0001', 'building_0002', 'building_0003']
+    with open(str(tmp_path / 'devices' / 'neighborhood' / 'fleet' / 'building_0002')) as device_file:
+        device = json.load(device_file)
+    assert device['driver_type'] == 'replay'
+    assert device['registry_config'] == 'config://registry_configs/building_0002.csv'
+    assert os.path.isfile(device['driver_config']['profile_path'])
+    with open(str(tmp_path / 'neighborhood.config')) as config_file:
+        assert json.load(config_file)['setting1'] == 3
+
+    configs = collect_configs(str(tmp_path))
+    assert [name for name, _, _ in configs] == ['config'] + \
+        ['registry_configs/building_000{}.csv'.format(i) for i in (1, 2, 3)] + devices
+    assert configs[1][1].splitlines()[1].startswith('building_0001,energyConsumption')
+
+
+def test_main(tmp_path):
+    main([str(tmp_path), '--buildings', '12', '--seed', '4'])
+    assert len(os.listdir(str(tmp_path / 'registry_configs'))) == 12
+    assert pd.read_csv(str(tmp_path / 'profiles.csv')).shape[1] == 13
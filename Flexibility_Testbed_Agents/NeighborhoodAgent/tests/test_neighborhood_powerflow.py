@@ -0,0 +1,115 @@
+import time
+
+import numpy as np
+import pytest
+
+from neighborhood.aggregator import IntervalAggregator
+from neighborhood.powerflow import Feeder
+
+START = 1700000010.0
+
+
+def random_feeder(num_buses, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = []
+    for bus in range(1, num_buses):
+        parent = int(rng.integers(0, bus))
+        lines.append(('l{}'.format(bus), 'b{}'.format(parent), 'b{}'.format(bus), rng.uniform(0.002, 0.01),
+                      rng.uniform(0.0005, 0.002), 250.0))
+    rng.shuffle(lines)
+    return Feeder(lines, 'b0', base_kv=0.4, base_kva=630)
+
+
+def reference_sweep(feeder, active_power, sweeps=50):
+    """Scalar backward/forward sweep, bus by bus."""
+    power = active_power * (1 + 1j * np.tan(np.arccos(feeder.power_factor))) / feeder.base_kva
+    voltage = np.ones(len(feeder.buses), dtype=complex)
+    branch = np.zeros(len(feeder.lines), dtype=complex)
+    for _ in range(sweeps):
+        branch[:] = np.conj(power[1:] / voltage[1:])
+        for bus in range(len(feeder.buses) - 1, 1, -1):
+            if feeder.parents[bus] > 0:
+                branch[feeder.parents[bus] - 1] += branch[bus - 1]
+        for bus in range(1, len(feeder.buses)):
+            voltage[bus] = voltage[feeder.parents[bus]] - feeder.impedance[bus - 1] * branch[bus - 1]
+    return np.abs(voltage), np.abs(branch) * feeder.base_current
+
+
+def test_sweep_matches_the_scalar_recursion():
+    feeder = random_feeder(60, seed=1)
+    loads = np.random.default_rng(2).uniform(0, 10, len(feeder.buses))
+    result = feeder.solve(loads)
+    voltage, current = reference_sweep(feeder, loads)
+    assert result.converged and result.iterations < 10
+    np.testing.assert_allclose(result.voltage, voltage, atol=1e-7)
+    np.testing.assert_allclose(result.current, current, rtol=1e-6)
+    assert result.voltage[0] == 1.0 and (result.voltage[1:] < 1.0).all()
+
+
+def test_two_bus_feeder():
+    feeder = Feeder([('l1', 'station', 'house', 0.1, 0.0, 100)], 'station', base_kv=0.4, base_kva=100,
+                    power_factor=1.0)
+    result = feeder.solve([0.0, 50.0])
+    # V = 1 - R * P / V in per unit, R = 0.1 / 1.6 ohm
+    r = 0.1 / 1.6
+    v = (1 + np.sqrt(1 - 4 * r * 0.5)) / 2
+    np.testing.assert_allclose(result.voltage, [1.0, v])
+    np.testing.assert_allclose(result.current, [0.5 / v * 100 / (np.sqrt(3) * 0.4)])
+    np.testing.assert_allclose(result.loading, result.current / 100)
+    np.testing.assert_allclose(result.losses, r * (0.5 / v) ** 2 * 100)
+
+
+def test_time_steps_are_solved_together():
+    feeder = random_feeder(30)
+    loads = np.random.default_rng(0).uniform(0, 20, (len(feeder.buses), 8))
+    together = feeder.solve(loads)
+    for step in range(8):
+        single = feeder.solve(loads[:, step])
+        np.testing.assert_allclose(together.voltage[:, step], single.voltage, atol=1e-8)
+        np.testing.assert_allclose(together.loading[:, step], single.loading, rtol=1e-6)
+        np.testing.assert_allclose(together.losses[step], single.losses, rtol=1e-6)
+
+
+def test_loads_from_aggregator_readings():
+    feeder = Feeder.from_config({"source": "t", "base_kva": 100,
+                                 "lines": [{"from": "t", "to": "a", "r": 0.01, "ampacity": 100},
+                                           {"from": "a", "to": "b", "r": 0.01}],
+                                 "loads": {"building1": "a", "building2": "b",
+                                           "neighborhood/energyconsumption/building3": "b"}})
+    assert feeder.lines == ['t-a', 'a-b']
+    aggregator = IntervalAggregator(30, 4)
+    for name, value in (('building1', 5.0), ('building2', 2.0), ('building3', 1.0), ('unknown', 9.0)):
+        aggregator.add('neighborhood/energyconsumption/' + name, START, value)
+    np.testing.assert_allclose(feeder.load_vector(aggregator.sources, aggregator.readings(START)), [0, 5, 3])
+
+    # A new source and a missing reading in the next interval
+    aggregator.add('neighborhood/energyconsumption/building2/all', START + 30, 4.0)
+    aggregator.add('neighborhood/energyconsumption/building1', START + 30, 1.0)
+    readings = aggregator.readings(START + 30)
+    assert np.isnan(readings[2])
+    np.testing.assert_allclose(feeder.load_vector(aggregator.sources, readings), [0, 1, 4])
+    assert aggregator.readings(START - 30) is None
+    assert np.isinf(feeder.ampacity[1])
+
+
+def test_invalid_topologies():
+    with pytest.raises(ValueError):
+        Feeder([('l1', 's', 'a', 0.1, 0, None), ('l2', 'a', 'b', 0.1, 0, None), ('l3', 's', 'b', 0.1, 0, None)], 's')
+    with pytest.raises(ValueError):
+        Feeder([('l1', 's', 'a', 0.1, 0, None), ('l2', 'x', 'y', 0.1, 0, None)], 's')
+    with pytest.raises(ValueError):
+        Feeder.from_config({"lines": []})
+    with pytest.raises(ValueError):
+        random_feeder(3).solve(np.zeros(5))
+
+
+@pytest.mark.slow
+def test_few_hundred_buses_within_ten_milliseconds():
+    feeder = random_feeder(400)
+    loads = np.random.default_rng(0).uniform(0, 2, len(feeder.buses))
+    feeder.solve(loads)
+    start = time.perf_counter()
+    for _ in range(10):
+        result = feeder.solve(loads)
+    assert (time.perf_counter() - start) / 10 < 0.01
+    assert result.converged
@@ -1,7 +1,13 @@
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Flexibility_Testbed_Agents', 'MicrogridAgent'))
+from microgrid.dispatch import simulate  # noqa: E402
+
 def run_simulation(start_date, end_date, solar_capacity, wind_capacity, chp_capacity, battery_capacity, battery_efficiency, thermal_storage_capacity, thermal_storage_efficiency, demand_profile, thermal_demand_profile, use_solar=True, use_wind=True, use_chp=True):
     time_steps = pd.date_range(start=start_date, end=end_date, freq='H')
     
@@ -26,54 +32,10 @@ def run_simulation(start_date, end_date, solar_capacity, wind_capacity, chp_capa
     if use_chp:
         chp_generation = np.full(len(time_steps), chp_capacity)
     
-    # Store in a DataFrame
-    df = pd.DataFrame({
-        'Solar_Generation': solar_generation,
-        'Wind_Generation': wind_generation,
-        'CHP_Generation': chp_generation,
-        'Demand': demand_profile,
-        'Thermal_Demand': thermal_demand_profile
-    }, index=time_steps)
-    df['Total_Generation'] = df['Solar_Generation'] + df['Wind_Generation'] + df['CHP_Generation']
-
-    # Initialize storage variables
-    df['Battery_Storage'] = 0  # Initial battery storage
-    df['Battery_Change'] = 0  # Change in battery storage (positive for charging, negative for discharging)
-    df['Thermal_Storage'] = 0  # Initial thermal storage
-    df['Thermal_Change'] = 0  # Change in thermal storage (positive for charging, negative for discharging)
-
-    battery_storage = 0  # Current battery storage
-    thermal_storage = 0  # Current thermal storage
-
-    for i in df.index:
-        net_generation = df.at[i, 'Total_Generation'] - df.at[i, 'Demand']
-        net_thermal_generation = df.at[i, 'CHP_Generation'] - df.at[i, 'Thermal_Demand']
-        
-        if net_generation > 0:
-            # Excess electrical generation, charge the battery
-            charge = min(net_generation * battery_efficiency, battery_capacity - battery_storage)
-            battery_storage += charge
-            df.at[i, 'Battery_Change'] = charge
-        else:
-            # Electrical demand exceeds generation, discharge the battery if possible
-            discharge = max(net_generation, -battery_storage)
-            battery_storage += discharge  # discharge is negative
-            df.at[i, 'Battery_Change'] = discharge
-            
-        df.at[i, 'Battery_Storage'] = battery_storage
-        
-        if net_thermal_generation > 0:
-            # Excess thermal generation, charge the thermal storage
-            thermal_charge = min(net_thermal_generation * thermal_storage_efficiency, thermal_storage_capacity - thermal_storage)
-            thermal_storage += thermal_charge
-            df.at[i, 'Thermal_Change'] = thermal_charge
-        else:
-            # Thermal demand exceeds generation, discharge the thermal storage if possible
-            thermal_discharge = max(net_thermal_generation, -thermal_storage)
-            thermal_storage += thermal_discharge  # discharge is negative
-            df.at[i, 'Thermal_Change'] = thermal_discharge
-            
-        df.at[i, 'Thermal_Storage'] = thermal_storage
+    df = simulate(time_steps, solar_generation, wind_generation, chp_generation, demand_profile,
+                  battery_capacity, battery_efficiency, thermal_demand=thermal_demand_profile,
+                  thermal_storage_capacity=thermal_storage_capacity,
+                  thermal_storage_efficiency=thermal_storage_efficiency)
 
     # Plotting the results with battery and thermal storage
     plt.figure(figsize=(14, 10))
@@ -1,7 +1,14 @@
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'Flexibility_Testbed_Agents', 'MicrogridAgent'))
+from microgrid.dispatch import simulate  # noqa: E402
+from microgrid.generation import chp_profile, solar_profile, wind_profile  # noqa: E402
+
 # Function to calculate realistic capacities based on demand
 def calculate_realistic_capacities(demand_series):
     average_demand = demand_series.mean()
@@ -12,31 +19,6 @@ def calculate_realistic_capacities(demand_series):
 
     return solar_capacity, wind_capacity, chp_capacity, battery_capacity
 
-# Function to simulate solar generation with a diurnal pattern
-def simulate_solar_generation(time_steps, solar_capacity):
-    solar_generation = []
-    for time in time_steps:
-        hour = time.hour
-        if 6 <= hour <= 18:  # Assume solar generation only occurs from 6 AM to 6 PM
-            solar_gen = solar_capacity * np.sin((hour - 6) * np.pi / 12)
-        else:
-            solar_gen = 0
-        solar_generation.append(solar_gen)
-    return np.array(solar_generation)
-
-# Function to simulate wind generation with randomness
-def simulate_wind_generation(time_steps, wind_capacity):
-    np.random.seed(0)
-    wind_generation = wind_capacity * np.abs(np.random.uniform(0, 1, len(time_steps)))
-    return wind_generation
-
-# Function to simulate ramped generation
-def apply_ramp(generation, ramp_rate):
-    ramped_generation = np.copy(generation)
-    for i in range(1, len(generation)):
-        ramped_generation[i] = max(min(ramped_generation[i-1] + ramp_rate, generation[i]), ramped_generation[i-1] - ramp_rate)
-    return ramped_generation
-
 # Function to run the simulation
 def run_simulation(num_time_points, time_resolution, solar_capacity, wind_capacity, chp_capacity, battery_capacity, battery_efficiency, thermal_storage_capacity, thermal_storage_efficiency, demand_series, thermal_demand_profile, use_solar=True, use_wind=True, use_chp=True, ramp_rate=0.5):
     if time_resolution == 'hourly':
@@ -50,95 +32,28 @@ def run_simulation(num_time_points, time_resolution, solar_capacity, wind_capaci
 
     # Initialize generation data
     if use_solar:
-        solar_generation = simulate_solar_generation(time_steps, solar_capacity)
+        solar_generation = solar_profile(time_steps, solar_capacity)
         #solar_generation = apply_ramp(solar_generation, ramp_rate)
     else:
         solar_generation = np.zeros(len(time_steps))
 
     if use_wind:
-        wind_generation = simulate_wind_generation(time_steps, wind_capacity)
-        wind_generation = apply_ramp(wind_generation, ramp_rate)
+        wind_generation = wind_profile(time_steps, wind_capacity, distribution='uniform', ramp_rate=ramp_rate)
     else:
         wind_generation = np.zeros(len(time_steps))
 
     if use_chp:
-        chp_generation = np.full(len(time_steps), chp_capacity)
-        chp_generation = apply_ramp(chp_generation, ramp_rate)
+        chp_generation = chp_profile(time_steps, chp_capacity, ramp_rate=ramp_rate)
     else:
         chp_generation = np.zeros(len(time_steps))
 
     if len(demand_series) != len(time_steps) or len(thermal_demand_profile) != len(time_steps):
         raise ValueError("Length of demand_series and thermal_demand_profile must match the number of time steps.")
 
-    df = pd.DataFrame({
-        'Solar_Generation': solar_generation,
-        'Wind_Generation': wind_generation,
-        'CHP_Generation': chp_generation,
-        'Demand': demand_series,
-        'Thermal_Demand': thermal_demand_profile
-    }, index=time_steps)
-    df['Total_Generation'] = df['Solar_Generation'] + df['Wind_Generation'] + df['CHP_Generation']
-
-    df['Battery_Storage'] = 0
-    df['Battery_Change'] = 0
-    df['Thermal_Storage'] = 0
-    df['Thermal_Change'] = 0
-
-    battery_storage = 0
-    thermal_storage = 0
-    generation_off = False
-
-    for j, i in enumerate(df.index):
-        net_generation = df.at[i, 'Total_Generation']
-        net_thermal_generation = df.at[i, 'CHP_Generation'] - df.at[i, 'Thermal_Demand']
-        net_demand = df.at[i, 'Demand']
-
-        if generation_off:
-            net_generation = 0
-
-        # Update battery capacity
-        if net_generation > net_demand and battery_storage < battery_capacity:
-            excess_energy = net_generation - net_demand
-            charge = min(excess_energy * battery_efficiency, battery_capacity - battery_storage)
-            battery_storage += charge
-            df.at[i, 'Battery_Change'] = charge
-        elif net_generation < net_demand and battery_storage > 0:
-            energy_deficit = net_demand - net_generation
-            discharge = min(energy_deficit, battery_storage)
-            battery_storage -= discharge
-            df.at[i, 'Battery_Change'] = -discharge
-
-        df.at[i, 'Battery_Storage'] = battery_storage
-
-        # Control generation based on battery capacity level
-        if battery_storage >= battery_capacity:
-            generation_off = True
-        elif battery_storage <= 0:
-            generation_off = False
-
-        if generation_off:
-            df.at[i, 'Solar_Generation'] = 0
-            df.at[i, 'Wind_Generation'] = 0
-            df.at[i, 'CHP_Generation'] = 0
-        else:
-            if use_solar:
-                df.at[i, 'Solar_Generation'] = solar_generation[j]
-            if use_wind:
-                df.at[i, 'Wind_Generation'] = wind_generation[j]
-            if use_chp:
-                df.at[i, 'CHP_Generation'] = chp_capacity
-
-        # Update thermal storage
-        if net_thermal_generation > 0:
-            thermal_charge = min(net_thermal_generation * thermal_storage_efficiency, thermal_storage_capacity - thermal_storage)
-            thermal_storage += thermal_charge
-            df.at[i, 'Thermal_Change'] = thermal_charge
-        else:
-            thermal_discharge = min(-net_thermal_generation, thermal_storage)
-            thermal_storage -= thermal_discharge
-            df.at[i, 'Thermal_Change'] = -thermal_discharge
-
-        df.at[i, 'Thermal_Storage'] = thermal_storage
+    df = simulate(time_steps, solar_generation, wind_generation, chp_generation, demand_series,
+                  battery_capacity, battery_efficiency, thermal_demand=thermal_demand_profile,
+                  thermal_storage_capacity=thermal_storage_capacity,
+                  thermal_storage_efficiency=thermal_storage_efficiency, curtail_when_full=True)
 
     plt.figure(figsize=(14, 10))
 
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2020, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+
+"""Micro-benchmark of subscriber matching in the router's PubSubService.
+
+Subscribes a number of agents to device topics, then publishes device
+topics through ``PubSubService._distribute_internal`` with a socket that
+drops every message, so only the router side work is measured. The same
+topics are also matched with the linear prefix scan the service used
+before the subscription index, for comparison.
+
+The agent side is measured by pushing the same topics into the callback
+dispatch of a single ``PubSub`` subsystem holding all subscriptions, like
+a historian subscribed to many device prefixes::
+
+    python scripts/scalability-testing/pubsub_benchmark.py --subscriptions 10000 --publishes 20000
+"""
+
+import argparse
+import random
+import time
+from unittest.mock import MagicMock
+
+from volttron.platform.vip.agent.subsystems.pubsub import PubSub
+from volttron.platform.vip.pubsubservice import PubSubService
+
+
+class NullSocket(object):
+    def send_multipart(self, frames, flags=0, copy=True):
+        pass
+
+
+def device_topics(num_topics):
+    return ['devices/campus{}/building{}/device{}/all'.format(i % 7, i % 113, i) for i in range(num_topics)]
+
+
+def subscription_prefixes(num_subscriptions, topics, seed=0):
+    """Mostly full device topics, some building and campus prefixes and a few catch-all ones."""
+    rng = random.Random(seed)
+    prefixes = []
+    for i in range(num_subscriptions):
+        topic = rng.choice(topics)
+        kind = i % 100
+        if kind == 0:
+            prefixes.append('devices')
+        elif kind < 5:
+            prefixes.append(topic.rsplit('/', 3)[0])
+        elif kind < 20:
+            prefixes.append(topic.rsplit('/', 2)[0])
+        else:
+            prefixes.append(topic[:-len('/all')])
+    return prefixes
+
+
+def linear_match(subscriptions, topic):
+    """Matching as done before the index, testing every prefix of both platforms."""
+    subscribers = set()
+    for platform in ('all', 'internal'):
+        for prefix, subscription in subscriptions[platform][''].items():
+            if subscription and topic.startswith(prefix):
+                subscribers |= subscription
+    return subscribers
+
+
+def linear_callbacks(subscriptions, topic):
+    """Agent side dispatch as done before the index."""
+    callbacks = []
+    for platform in subscriptions:
+        buses = subscriptions[platform]
+        if '' in buses:
+            for prefix, subscribed in buses[''].items():
+                if topic.startswith(prefix):
+                    callbacks.extend(subscribed)
+    return callbacks
+
+
+def run_agent(prefixes, published):
+    pubsub = PubSub(core=MagicMock(), rpc_subsys=MagicMock(), peerlist_subsys=MagicMock(), owner=MagicMock())
+    pubsub.vip_socket = MagicMock()
+    calls = [0]
+
+    def callback(peer, sender, bus, topic, headers, message):
+        calls[0] += 1
+
+    for prefix in prefixes:
+        pubsub._add_subscription(prefix, callback)
+
+    start = time.perf_counter()
+    for topic in published:
+        pubsub._process_callback('publisher', '', topic, {}, 0)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear_calls = 0
+    for topic in published:
+        linear_calls += len(linear_callbacks(pubsub._my_subscriptions, topic))
+    linear = time.perf_counter() - start
+
+    print("agent dispatch: {:10.0f} messages/s ({} subscriptions)".format(len(published) / indexed,
+                                                                            len(set(prefixes))))
+    print("agent linear:   {:10.0f} messages/s".format(len(published) / linear))
+    if calls[0] != linear_calls:
+        print("Mismatch: linear scan found {} callbacks, the index {}".format(linear_calls, calls[0]))
+
+
+def run(num_subscriptions, num_agents, num_topics, num_publishes, seed=0):
+    topics = device_topics(num_topics)
+    service = PubSubService(socket=NullSocket(), protected_topics=MagicMock(), routing_service=None)
+    service._check_if_protected_topic = lambda user_id, topic: None
+    rng = random.Random(seed)
+    prefixes = subscription_prefixes(num_subscriptions, topics, seed)
+    for index, prefix in enumerate(prefixes):
+        peer = 'agent{}'.format(index % num_agents)
+        msg = dict(prefix=prefix, bus='', all_platforms=rng.random() < 0.1)
+        service._peer_subscribe([peer, '', 'VIP1', '', '', 'pubsub', 'subscribe', msg])
+
+    published = [rng.choice(topics) for _ in range(num_publishes)]
+    message = dict(bus='', headers={}, message=0)
+
+    start = time.perf_counter()
+    delivered = 0
+    for topic in published:
+        frames = ['publisher', '', 'VIP1', '', '', 'pubsub', 'publish', topic, message]
+        delivered += service._distribute_internal(frames)
+    indexed = time.perf_counter() - start
+
+    index = service._subscription_index['']
+    start = time.perf_counter()
+    for topic in published:
+        index.match(topic)
+    matching = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matched = 0
+    for topic in published:
+        matched += len(linear_match(service._peer_subscriptions, topic))
+    linear = time.perf_counter() - start
+
+    print("{} subscriptions of {} agents, {} publishes, {:.1f} deliveries per publish".format(
+        num_subscriptions, num_agents, num_publishes, delivered / num_publishes))
+    print("publish:        {:10.0f} publishes/s (index and delivery)".format(num_publishes / indexed))
+    print("index match:    {:10.0f} topics/s".format(num_publishes / matching))
+    print("linear match:   {:10.0f} topics/s".format(num_publishes / linear))
+    if matched != delivered:
+        print("Mismatch: linear scan found {} subscribers, the index {}".format(matched, delivered))
+
+    run_agent(prefixes, published)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--subscriptions', type=int, default=10000)
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--topics', type=int, default=5000)
+    parser.add_argument('--publishes', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.subscriptions, args.agents, args.topics, args.publishes, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2020, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Micro-benchmark of the jsonapi serializers on device "all" publishes.
+
+Encodes and decodes the payload of a driver "all" publish, a dictionary
+of point values and one of point metadata, with every serializer
+available in this environment. The JSON serializers are also measured
+through ``serialize_frames`` and ``deserialize_frames``, the path a
+publish takes through the VIP socket::
+
+    python scripts/scalability-testing/serializer_benchmark.py --points 500 --repeat 2000
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import pytz
+from zmq import Frame
+
+from volttron.platform import jsonapi
+from volttron.utils.frame_serialization import deserialize_frames, serialize_frames
+
+
+def device_all_payload(num_points):
+    values = {'Point{}'.format(i): 70.0 + (i % 17) * 0.37 for i in range(num_points)}
+    meta = {name: {'type': 'float', 'tz': 'US/Pacific', 'units': 'degreesFahrenheit'} for name in values}
+    headers = {'Date': datetime(2024, 1, 1, 12, 0, tzinfo=pytz.utc).isoformat(),
+               'TimeStamp': datetime(2024, 1, 1, 12, 0, tzinfo=pytz.utc).isoformat(),
+               'min_compatible_version': '3.0', 'max_compatible_version': ''}
+    return dict(bus='', headers=headers, message=[values, meta])
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(num_points, repeat):
+    payload = device_all_payload(num_points)
+    selected = jsonapi.serializer().name
+    print("{} points, {} repetitions".format(num_points, repeat))
+    print("{:10} {:>10} {:>12} {:>12} {:>14}".format('serializer', 'bytes', 'encode [us]', 'decode [us]',
+                                                     'frames [us]'))
+    for name in jsonapi.available_serializers():
+        serializer = jsonapi.get_serializer(name)
+        encoded = serializer.dumpb(payload)
+        assert serializer.loadb(encoded) == payload
+        encode = timed(lambda: serializer.dumpb(payload), repeat)
+        decode = timed(lambda: serializer.loadb(encoded), repeat)
+        frames = ''
+        if serializer.format == 'json':
+            # Round trip through the frame (de)serialization of the VIP socket
+            jsonapi.set_serializer(name)
+            message = ['publish', 'devices/campus/building/device/all', payload]
+            frames = '{:14.1f}'.format(1e6 * timed(
+                lambda: deserialize_frames([Frame(f) for f in serialize_frames(message)]), repeat))
+        print("{:10} {:10d} {:12.1f} {:12.1f} {:>14}".format(name, len(encoded), 1e6 * encode, 1e6 * decode,
+                                                             frames))
+    jsonapi.set_serializer(selected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--points', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.points, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
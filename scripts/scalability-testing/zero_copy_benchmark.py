@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2020, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Benchmark of large VIP messages with and without zero-copy frames.
+
+Sends messages of 1 to 50 MB, a JSON encoded result series (e.g. a week of
+microgrid simulation results) and an opaque binary blob, from a DEALER to a
+ROUTER VIP socket and decodes them with ``recv_vip_object(copy=False)``, the
+way the platform and agents receive messages. Each size is measured with
+``ZERO_COPY_THRESHOLD`` in effect and with zero-copy disabled, reporting
+the CPU time of the fastest message and the peak of Python allocations (tracemalloc,
+which does not see copies made inside zmq)::
+
+    python scripts/scalability-testing/zero_copy_benchmark.py --sizes 1 10 50 --repeat 5
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import zmq
+
+from volttron.platform import jsonapi
+from volttron.platform.vip import Socket
+from volttron.utils import frame_serialization
+
+MB = 1024 * 1024
+
+
+def result_series(size):
+    """Minute values of several result columns, about size bytes once encoded."""
+    columns = ['load', 'pv', 'battery_power', 'battery_soc', 'grid_import', 'grid_export']
+    # Values are encoded as 1000.xyz with a separator, about 10 bytes
+    rows = max(1, size // (len(columns) * 10))
+    return {'index': 0, 'step': 60,
+            'columns': {name: [1000.0 + (i * 7 + n) % 997 * 0.001 for i in range(rows)]
+                        for n, name in enumerate(columns)}}
+
+
+def transfer(sender, receiver, args):
+    sender.send_vip('', 'pubsub', args=args, msg_id='1')
+    message = receiver.recv_vip_object(copy=False)
+    return message.args
+
+
+def measure(sender, receiver, args, repeat):
+    # Fastest of the repetitions, garbage collections of the decoded objects make the rest noisy
+    cpu = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        transfer(sender, receiver, args)
+        cpu = min(cpu, time.process_time() - start)
+    tracemalloc.start()
+    transfer(sender, receiver, args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def run(sizes, repeat):
+    context = zmq.Context()
+    receiver = Socket(context, zmq.ROUTER)
+    sender = Socket(context, zmq.DEALER)
+    receiver.bind('inproc://zero-copy-benchmark?domain=vip')
+    sender.connect('inproc://zero-copy-benchmark')
+    threshold = frame_serialization.ZERO_COPY_THRESHOLD
+    print("serializer {}, {} repetitions".format(jsonapi.serializer().name, repeat))
+    print("{:8} {:>9} {:>14} {:>14} {:>15} {:>15}".format('payload', 'size [MB]', 'copy CPU [ms]', 'zero CPU [ms]',
+                                                       'copy peak [MB]', 'zero peak [MB]'))
+    try:
+        for size in sizes:
+            series = result_series(size * MB)
+            payloads = [('json', ['publish', 'results', series]),
+                        ('binary', bytes(range(256)) * (size * MB // 256))]
+            for name, args in payloads:
+                encoded = len(jsonapi.dumpb(series)) if name == 'json' else len(args)
+                results = []
+                for zero_copy in (False, True):
+                    frame_serialization.ZERO_COPY_THRESHOLD = threshold if zero_copy else sys.maxsize
+                    results.extend(measure(sender, receiver, args, repeat))
+                print("{:8} {:9.1f} {:14.1f} {:14.1f} {:15.1f} {:15.1f}".format(
+                    name, encoded / MB, 1e3 * results[0], 1e3 * results[2], results[1] / MB, results[3] / MB))
+    finally:
+        frame_serialization.ZERO_COPY_THRESHOLD = threshold
+        sender.close(linger=0)
+        receiver.close(linger=0)
+        context.term()
+    print("zero-copy frames: {}".format(frame_serialization.zero_copy_stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help="payload sizes in MB")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--serializer', default=jsonapi.serializer().name,
+                        choices=[name for name in jsonapi.available_serializers()
+                                 if jsonapi.get_serializer(name).format == 'json'])
+    args = parser.parse_args()
+    jsonapi.set_serializer(args.serializer)
+    run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,7 +40,7 @@ import logging
 import sys
 import gevent
 from collections import defaultdict
-from volttron.platform.vip.agent import Agent, RPC
+from volttron.platform.vip.agent import Agent, Core, RPC
 from volttron.platform.agent import utils
 from volttron.platform.agent import math_utils
 from volttron.platform.agent.known_identities import PLATFORM_DRIVER
@@ -335,6 +335,12 @@ class PlatformDriverAgent(Agent):
                                         self.publish_depth_first,
                                         self.publish_breadth_first)
 
+    @Core.receiver('onstop')
+    def onstop(self, sender, **kwargs):
+        # Stopping the drivers lets their interfaces write out buffered changes
+        for device_topic in list(self.instances):
+            self.stop_driver(device_topic)
+
     def derive_device_topic(self, config_name):
         _, topic = config_name.split('/', 1)
         return topic
@@ -72,6 +72,7 @@ class DriverAgent(BasicAgent):
         self.vip = parent.vip
         self.config = config
         self.device_path = device_path
+        self.interface = None
 
         self.update_publish_types(default_publish_depth_first_all ,
                                  default_publish_breadth_first_all,
@@ -172,6 +173,11 @@ class DriverAgent(BasicAgent):
         self.all_path_depth, self.all_path_breadth = self.get_paths_for_point(DRIVER_TOPIC_ALL)
 
 
+    @Core.receiver('onstop')
+    def stopping(self, sender, **kwargs):
+        if self.interface is not None:
+            self.interface.close()
+
     def setup_device(self):
 
         config = self.config
@@ -266,19 +272,19 @@ class DriverAgent(BasicAgent):
         }
 
         if self.publish_depth_first or self.publish_breadth_first:
+            # All point topics of the scrape go out as one batch
+            messages = []
             for point, value in results.items():
                 depth_first_topic, breadth_first_topic = self.get_paths_for_point(point)
                 message = [value, self.meta_data[point]]
 
                 if self.publish_depth_first:
-                    self._publish_wrapper(depth_first_topic,
-                                          headers=headers,
-                                          message=message)
+                    messages.append((depth_first_topic, headers, message))
 
                 if self.publish_breadth_first:
-                    self._publish_wrapper(breadth_first_topic,
-                                          headers=headers,
-                                          message=message)
+                    messages.append((breadth_first_topic, headers, message))
+
+            self._publish_many_wrapper(messages)
 
         message = [results, self.meta_data]
         if self.publish_depth_first_all:
@@ -316,6 +322,26 @@ class DriverAgent(BasicAgent):
             else:
                 break
 
+    def _publish_many_wrapper(self, messages):
+        while True:
+            try:
+                with publish_lock():
+                    _log.debug("publishing {} point topics of {}".format(len(messages), self.device_name))
+                    self.vip.pubsub.publish_many('pubsub', messages).get(timeout=10.0)
+
+                    _log.debug("finish publishing point topics of " + self.device_name)
+            except gevent.Timeout:
+                _log.warning("Did not receive confirmation of publish of point topics of " + self.device_name)
+                break
+            except Again:
+                _log.warning("publish delayed: point topics of " + self.device_name + " pubsub is busy")
+                gevent.sleep(random.random())
+            except VIPError as ex:
+                _log.warning("driver failed to publish point topics of " + self.device_name + ": " + str(ex))
+                break
+            else:
+                break
+
     def heart_beat(self):
         if self.heart_beat_point is None:
             return
@@ -383,15 +409,14 @@ class DriverAgent(BasicAgent):
             depth_first_topic, breadth_first_topic = self.get_paths_for_point(
                 point_name)
 
+            messages = []
             if self.publish_depth_first:
-                self._publish_wrapper(depth_first_topic,
-                                      headers=headers,
-                                      message=individual_point_message)
+                messages.append((depth_first_topic, headers, individual_point_message))
             #
             if self.publish_breadth_first:
-                self._publish_wrapper(breadth_first_topic,
-                                      headers=headers,
-                                      message=individual_point_message)
+                messages.append((breadth_first_topic, headers, individual_point_message))
+            if messages:
+                self._publish_many_wrapper(messages)
 
             if self.publish_depth_first_all:
                 self._publish_wrapper(self.all_path_depth,
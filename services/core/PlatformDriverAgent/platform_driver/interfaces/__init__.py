@@ -283,6 +283,13 @@ class BaseInterface(object, metaclass=abc.ABCMeta):
         """
         pass
         
+    def close(self):
+        """
+        Called when the driver of the device stops. Interfaces that buffer
+        writes or hold connections should flush and release them here.
+        """
+        pass
+
     def get_register_by_name(self, name):
         """
         Get a register by it's point name.
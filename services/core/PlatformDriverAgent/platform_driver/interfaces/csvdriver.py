@@ -25,6 +25,9 @@
 from csv import DictReader, DictWriter
 import logging
 import os
+import tempfile
+
+import gevent
 
 from services.core.PlatformDriverAgent.platform_driver.interfaces import BaseRegister, BasicRevert, BaseInterface
 
@@ -53,24 +56,165 @@ type_mapping = {"string": str,
                 "bool": bool,
                 "boolean": bool}
 
+# Cached CSV devices shared by every interface using the same file, keyed by absolute path
+_devices = {}
+
+
+def get_device(csv_path, flush_interval=1.0):
+    """
+    Get the shared cached device for a CSV file, creating it on first use
+    :param csv_path: Path to the CSV "device"
+    :param flush_interval: Seconds to collect writes before rewriting the file
+    :return: CsvDevice for the path
+    """
+    path = os.path.abspath(csv_path)
+    device = _devices.get(path)
+    if device is None:
+        device = _devices[path] = CsvDevice(path, flush_interval)
+    else:
+        device.flush_interval = flush_interval
+    return device
+
+
+class CsvDevice:
+    """
+    In memory index of the rows of a CSV "device"
+
+    The file is parsed once into a point name -> row index and parsed again only when its modification time or size
+    changes. Writes update the index right away and are written out together, by rewriting a temporary file and
+    renaming it over the device, flush_interval seconds after the first pending write.
+    """
+    def __init__(self, csv_path, flush_interval=1.0):
+        self.csv_path = csv_path
+        self.flush_interval = flush_interval
+        self.fieldnames = None
+        self.rows = []
+        self.index = {}
+        self.parses = 0
+        self.flushes = 0
+        self._stat = None
+        self._pending = {}
+        self._flush_greenlet = None
+
+    def _load(self):
+        """
+        Parse the file again if it changed on disk since the last parse or flush
+        """
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            # Our device hasn't been created, or the path to this device is incorrect
+            raise RuntimeError("CSV device at {} does not exist".format(self.csv_path))
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat:
+            return
+        with open(self.csv_path, "r") as csv_device:
+            reader = DictReader(csv_device)
+            self.fieldnames = reader.fieldnames
+            self.rows = list(reader)
+        self.index = {}
+        for row_index, point in enumerate(self.rows):
+            # The first row of a point wins, like the linear scan did
+            self.index.setdefault(point.get("Point Name"), row_index)
+        self._stat = stat_key
+        self.parses += 1
+        # Writes that were not flushed yet still apply on top of the new contents
+        for point_name, value in self._pending.items():
+            if point_name in self.index:
+                self.rows[self.index[point_name]]["Point Value"] = value
+
+    def get(self, point_name):
+        """
+        :return: The Point Value of the row that matches the point name
+        """
+        self._load()
+        return self._value(point_name)
+
+    def _value(self, point_name):
+        row_index = self.index.get(point_name)
+        if row_index is None:
+            raise RuntimeError("Point {} not found on CSV Device".format(point_name))
+        point_value = self.rows[row_index].get("Point Value")
+        # The "device" doesn't have the correct fields or is missing a value
+        if not point_value and point_value != 0:
+            raise RuntimeError("Point {} not set on CSV Device".format(point_name))
+        return point_value
+
+    def get_all(self, point_names):
+        """
+        Read several points from a single parse of the file
+        :return: Dictionary of point name to Point Value
+        """
+        self._load()
+        return {point_name: self._value(point_name) for point_name in point_names}
+
+    def set(self, point_name, value):
+        """
+        Update the value of a point and schedule the file to be rewritten
+        :return: The new value of the point
+        """
+        self._load()
+        row_index = self.index.get(point_name)
+        if row_index is None:
+            raise RuntimeError("Point {} not found on CSV Device".format(point_name))
+        self.rows[row_index]["Point Value"] = value
+        self._pending[point_name] = value
+        if self._flush_greenlet is None:
+            self._flush_greenlet = gevent.spawn_later(self.flush_interval, self.flush)
+        return self._value(point_name)
+
+    def flush(self):
+        """
+        Write all pending changes with one atomic rewrite of the file
+        """
+        if self._flush_greenlet is not None:
+            if self._flush_greenlet is not gevent.getcurrent():
+                self._flush_greenlet.kill()
+            self._flush_greenlet = None
+        if not self._pending:
+            return
+        # Pick up changes made by others before writing the file back
+        self._load()
+        directory = os.path.dirname(self.csv_path)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".csv")
+        try:
+            with os.fdopen(descriptor, "w") as csv_device:
+                writer = DictWriter(csv_device, fieldnames=self.fieldnames)
+                writer.writeheader()
+                writer.writerows(self.rows)
+            if os.path.exists(self.csv_path):
+                os.chmod(temp_path, os.stat(self.csv_path).st_mode & 0o777)
+            os.replace(temp_path, self.csv_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        stat = os.stat(self.csv_path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        self._pending = {}
+        self.flushes += 1
+
 
 class CsvRegister(BaseRegister):
     """
     Register class for reading and writing to specific lines of a CSV file
     """
     def __init__(self, csv_path, read_only, pointName, units, reg_type,
-                 default_value=None, description=''):
+                 default_value=None, description='', device=None):
         # set inherited values
         super(CsvRegister, self).__init__("byte", read_only, pointName, units,
                                           description=description)
         # set the path to the CSV this register belongs to
         self.csv_path = csv_path
+        # shared in memory index of the CSV, if the interface is configured to cache it
+        self.device = device
 
     def get_state(self):
         """
         Iterate over the CSV, find the row where the Point Name matches the name of this register
         :return: The Point Value of the row that matches the register
         """
+        if self.device is not None:
+            return self.device.get(self.point_name)
         # Iterate over the lines of the CSV
         if os.path.isfile(self.csv_path):
             with open(self.csv_path, "r") as csv_device:
@@ -97,6 +241,8 @@ class CsvRegister(BaseRegister):
         :param value: the value to set in the row
         :return: The new value of the row
         """
+        if self.device is not None:
+            return self.device.set(self.point_name, value)
         # We're going to have to re-write the data, so keep track of the points that are in the file
         points = []
         # Keep track of if we encountered the correct register
@@ -139,6 +285,8 @@ class Interface(BasicRevert, BaseInterface):
         super(Interface, self).__init__(**kwargs)
         # We wont have a path to our "device" until we've been configured
         self.csv_path = None
+        # Shared in memory index of the CSV when "cache" is configured
+        self.device = None
 
     def configure(self, config_dict, registry_config_str):
         """
@@ -157,9 +305,19 @@ class Interface(BasicRevert, BaseInterface):
                 writer = DictWriter(csv_device, fieldnames=CSV_FIELDNAMES)
                 writer.writeheader()
                 writer.writerows(CSV_DEFAULT)
+        # Index the file in memory instead of rescanning it for every point, with writes batched into rewrites
+        if config_dict.get("cache", False):
+            self.device = get_device(self.csv_path, float(config_dict.get("flush_interval", 1.0)))
         # Then parse the registry configuration to create our registers
         self.parse_config(registry_config_str)
 
+    def close(self):
+        """
+        Write out pending changes of a cached device
+        """
+        if self.device is not None:
+            self.device.flush()
+
     def get_point(self, point_name):
         """
         Read the value of the register which matches the passed point name
@@ -196,6 +354,9 @@ class Interface(BasicRevert, BaseInterface):
         # Get all of the registers that are configured for this device, whether they can be written to or not
         read_registers = self.get_registers_by_type("byte", True)
         write_registers = self.get_registers_by_type("byte", False)
+        # A cached device answers all of them from a single parse
+        if self.device is not None:
+            return self.device.get_all([register.point_name for register in read_registers + write_registers])
         # For each register, create an entry in the results dictionary with its name as the key and state as the value
         for register in read_registers + write_registers:
             result[register.point_name] = register.get_state()
@@ -242,7 +403,8 @@ class Interface(BasicRevert, BaseInterface):
                 units,
                 reg_type,
                 default_value=default_value,
-                description=description)
+                description=description,
+                device=self.device)
             # Update the register's value if there is a default value provided
             if default_value is not None:
                 self.set_default(point_name, register.value)
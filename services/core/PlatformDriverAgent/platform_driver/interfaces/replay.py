@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+
+"""
+Replay driver: serves points from recorded load profiles as if they were live.
+
+A profile is a CSV file with a timestamp column followed by value columns,
+e.g. the 15 minute building profiles ``TEC_PEL_1W.csv``. It is parsed once
+into a float64 array (epoch seconds in column 0, one column per profile
+column) that is saved as a ``.npy`` file in the agent-data directory of the
+platform driver, or in ``$VOLTTRON_HOME/replay_cache`` when the driver runs
+from a source tree, and memory mapped from then on. All devices replaying the same file share one
+:class:`Profile`, so hundreds of buildings can replay multi-year profiles
+without parsing anything per scrape.
+
+Each scrape maps the current wall clock time to a profile time,
+``start + offset + elapsed * speed_up``, wrapping around at the end of the
+profile when ``loop`` is set, and looks the row up by offset calculation on
+regular profiles or binary search otherwise. Values are held until the next
+row or linearly interpolated.
+
+Example driver_config::
+
+    {
+        "profile_path": "/path/to/TEC_PEL_1W.csv",
+        "start": "2018-01-01 00:00:00+01:00",
+        "speed_up": 60,
+        "interpolate": true,
+        "loop": true,
+        "offset": 0,
+        "timezone": "UTC"
+    }
+
+Registry columns: ``Point Name`` is the profile column name (the column
+number as a string for files without a header), ``Volttron Point Name``,
+``Units``, ``Type`` and an optional ``Scale`` factor. A point named
+``Timestamp`` returns the current profile time as an ISO 8601 string.
+
+``profile_path`` and ``cache_dir`` may use ``~`` and environment variables;
+relative paths are taken from the working directory of the agent, which is
+its install directory, so profiles outside the agent need an absolute path.
+The sample device ``devices/neighborhood/replay`` replays
+``$VOLTTRON_ROOT/Python test files/TEC_PEL_1W.csv`` and needs ``VOLTTRON_ROOT``
+set to the source checkout. ``cache_dir`` may point the cache somewhere else.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from csv import reader
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pytz
+from dateutil.parser import parse
+
+from platform_driver.interfaces import BaseInterface, BaseRegister, BasicRevert
+from volttron.platform import get_home
+
+_log = logging.getLogger(__name__)
+type_mapping = {"string": str,
+                "int": int,
+                "integer": int,
+                "float": float,
+                "bool": bool,
+                "boolean": bool}
+
+TIMESTAMP_POINT = "Timestamp"
+
+# Profiles already loaded in this process, keyed by file identity
+_profiles = {}
+
+# Install directory of the platform driver agent, which holds its agent-data directory once installed
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def default_cache_dir():
+    """
+    The agent-data directory of the installed agent, ``$VOLTTRON_HOME/replay_cache``
+    when the agent is run from a source tree.
+    """
+    for name in sorted(os.listdir(AGENT_DIR)):
+        path = os.path.join(AGENT_DIR, name)
+        if name.endswith(".agent-data") and os.path.isdir(path):
+            return path
+    path = os.path.join(get_home(), "replay_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def resolve_path(path):
+    """Absolute path with ``~`` and environment variables expanded, relative to the working directory."""
+    expanded = os.path.expanduser(os.path.expandvars(path))
+    if "$" in expanded:
+        raise ValueError("Path {} uses an environment variable that is not set".format(path))
+    return os.path.abspath(expanded)
+
+
+def _parse_time(value, tz):
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        timestamp = parse(value)
+    if timestamp.tzinfo is None:
+        timestamp = tz.localize(timestamp)
+    return timestamp.timestamp()
+
+
+def _is_time(value):
+    try:
+        _parse_time(value, pytz.utc)
+        return True
+    except (ValueError, OverflowError):
+        return False
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class Profile(object):
+    """
+    Timestamp indexed profile values.
+
+    :param data: ``(rows, 1 + len(columns))`` array with epoch seconds in
+                 the first column, usually a read only memory map.
+    :param columns: Names of the value columns.
+    """
+
+    def __init__(self, data, columns):
+        if len(data) == 0:
+            raise ValueError("Profile has no rows")
+        self.data = data
+        self.times = data[:, 0]
+        self.columns = {name: i + 1 for i, name in enumerate(columns)}
+
+        steps = np.diff(self.times)
+        if len(steps) and (steps <= 0).any():
+            raise ValueError("Profile timestamps must be strictly increasing")
+        self.start = self.times[0]
+        self.regular = bool(len(steps)) and bool((steps == steps[0]).all())
+        self.step = float(steps[0]) if self.regular else float(np.median(steps)) if len(steps) else 0.0
+        # Length of one pass over the profile, the last row lasts one step
+        self.span = self.times[-1] - self.start + self.step
+
+    def __len__(self):
+        return len(self.times)
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise ValueError("Profile has no column {}, available: {}".format(name, ", ".join(self.columns)))
+
+    def locate(self, timestamp, loop=True):
+        """
+        Find the rows around a profile time.
+
+        :returns: ``(time, row, next_row, fraction)`` with ``time`` the
+                  profile time after wrapping or clamping and ``fraction``
+                  the position between ``row`` and ``next_row``.
+        """
+        last = len(self.times) - 1
+        if loop and self.span > 0:
+            timestamp = self.start + (timestamp - self.start) % self.span
+        elif timestamp <= self.start:
+            return self.start, 0, 0, 0.0
+        elif timestamp >= self.times[-1]:
+            return self.times[-1], last, last, 0.0
+
+        if self.regular:
+            position = (timestamp - self.start) / self.step
+            row = min(int(position), last)
+        else:
+            row = int(np.searchsorted(self.times, timestamp, side='right')) - 1
+
+        if row < last:
+            next_row, length = row + 1, self.times[row + 1] - self.times[row]
+        elif loop:
+            next_row, length = 0, self.step
+        else:
+            next_row, length = row, 0
+        fraction = (timestamp - self.times[row]) / length if length else 0.0
+        return timestamp, row, next_row, fraction
+
+    def value(self, column, row, next_row=None, fraction=0.0):
+        value = self.data[row, column]
+        if fraction and next_row is not None:
+            value += fraction * (self.data[next_row, column] - value)
+        return float(value)
+
+
+def load_profile(path, timezone="UTC", cache_dir=None):
+    """
+    Load a profile CSV, parsing it only the first time.
+
+    The parsed array is cached in ``cache_dir`` (default: the agent-data
+    directory) and reused while the file's size and modification time are
+    unchanged.
+
+    :param path: CSV file with a timestamp first column, see :func:`resolve_path`.
+    :param timezone: Time zone of timestamps without an offset.
+    :param cache_dir: Directory for the ``.npy`` cache file.
+    :rtype: Profile
+    """
+    path = os.path.realpath(resolve_path(path))
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, timezone)
+    profile = _profiles.get(key)
+    if profile is not None:
+        return profile
+
+    tz = pytz.timezone(timezone)
+    with open(path, newline='') as profile_file:
+        head = list(islice(reader(profile_file), 2))
+    if not head:
+        raise ValueError("Profile {} is empty".format(path))
+    header = None if _is_time(head[0][0]) else head[0]
+    first_row = head[0] if header is None else head[1]
+    columns = header[1:] if header is not None else [str(i) for i in range(1, len(first_row))]
+
+    cache_path = _cache_path(key, cache_dir)
+    if cache_path is not None and os.path.isfile(cache_path):
+        data = np.load(cache_path, mmap_mode='r')
+    else:
+        data = _parse_profile(path, header is not None, len(columns), tz)
+        if cache_path is not None:
+            try:
+                temp_path = cache_path + ".tmp"
+                np.save(temp_path, data)
+                # np.save appends .npy to names without it
+                os.replace(temp_path + ".npy", cache_path)
+                data = np.load(cache_path, mmap_mode='r')
+            except OSError as e:
+                _log.warning("Could not cache profile {} at {}: {}".format(path, cache_path, e))
+
+    profile = Profile(data, columns)
+    for old_key in [k for k in _profiles if k[0] == path]:
+        del _profiles[old_key]
+    _profiles[key] = profile
+    return profile
+
+
+def _cache_path(key, cache_dir):
+    path = key[0]
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    try:
+        if cache_dir:
+            directory = resolve_path(cache_dir)
+            os.makedirs(directory, exist_ok=True)
+        else:
+            directory = default_cache_dir()
+    except OSError as e:
+        _log.warning("No cache directory for profile {}: {}".format(path, e))
+        return None
+    return os.path.join(directory, "{}.{}.npy".format(os.path.basename(path), digest))
+
+
+def _parse_profile(path, has_header, num_columns, tz):
+    rows = []
+    with open(path, newline='') as profile_file:
+        csv_reader = reader(profile_file)
+        if has_header:
+            next(csv_reader)
+        for line in csv_reader:
+            if not line or not line[0].strip():
+                continue
+            values = [_to_float(value) for value in line[1:num_columns + 1]]
+            values.extend([np.nan] * (num_columns - len(values)))
+            rows.append([_parse_time(line[0].strip(), tz)] + values)
+    return np.array(rows, dtype=np.float64).reshape(-1, num_columns + 1)
+
+
+class ReplayRegister(BaseRegister):
+    """
+    Register for one column of a replayed profile
+    """
+    def __init__(self, column, pointName, units, reg_type, scale=1.0, description=''):
+        super(ReplayRegister, self).__init__("byte", True, pointName, units, description=description)
+        self.column = column
+        self.reg_type = reg_type
+        self.scale = scale
+
+    def get_state(self, profile, row, next_row, fraction):
+        return self.reg_type(profile.value(self.column, row, next_row, fraction) * self.scale)
+
+
+class TimestampRegister(BaseRegister):
+    """
+    Register returning the profile time that is currently replayed
+    """
+    def __init__(self, pointName, tz, description=''):
+        super(TimestampRegister, self).__init__("byte", True, pointName, None, description=description)
+        self.tz = tz
+
+    def get_state(self, timestamp):
+        return datetime.fromtimestamp(timestamp, self.tz).isoformat()
+
+
+class Interface(BasicRevert, BaseInterface):
+    """
+    "Device Interface" replaying a recorded profile
+    """
+    def __init__(self, **kwargs):
+        super(Interface, self).__init__(**kwargs)
+        self.profile = None
+        self.clock = time.time
+
+    def configure(self, config_dict, registry_config_str):
+        """
+        Load the profile and create a register per configured column.
+        """
+        profile_path = config_dict.get("profile_path")
+        if not profile_path:
+            raise ValueError("Replay driver requires a profile_path")
+        timezone = config_dict.get("timezone", "UTC")
+        self.tz = pytz.timezone(timezone)
+        self.profile = load_profile(profile_path, timezone, config_dict.get("cache_dir"))
+
+        start = config_dict.get("start")
+        self.start = _parse_time(start, self.tz) if start else self.profile.start
+        self.offset = float(config_dict.get("offset", 0))
+        self.speed_up = float(config_dict.get("speed_up", 1))
+        self.interpolate = bool(config_dict.get("interpolate", False))
+        self.loop = bool(config_dict.get("loop", True))
+        self.wall_start = self.clock()
+
+        self.parse_config(registry_config_str)
+
+    def profile_time(self):
+        """
+        Profile time, in epoch seconds, replayed at the current wall clock time.
+        """
+        return self.start + self.offset + (self.clock() - self.wall_start) * self.speed_up
+
+    def get_point(self, point_name):
+        register = self.get_register_by_name(point_name)
+        return self._read([register])[point_name]
+
+    def _set_point(self, point_name, value):
+        raise IOError("Trying to write to a point configured read only: " + point_name)
+
+    def _scrape_all(self):
+        return self._read(self.get_registers_by_type("byte", True))
+
+    def _read(self, registers):
+        timestamp, row, next_row, fraction = self.profile.locate(self.profile_time(), self.loop)
+        if not self.interpolate:
+            fraction = 0.0
+
+        result = {}
+        for register in registers:
+            if isinstance(register, TimestampRegister):
+                result[register.point_name] = register.get_state(timestamp)
+            else:
+                result[register.point_name] = register.get_state(self.profile, row, next_row, fraction)
+        return result
+
+    def parse_config(self, config_dict):
+        if config_dict is None:
+            return
+
+        for index, regDef in enumerate(config_dict):
+            column_name = regDef.get('Point Name')
+            if not column_name:
+                continue
+            point_name = regDef.get('Volttron Point Name') or column_name
+            description = regDef.get('Notes', '')
+
+            if column_name == TIMESTAMP_POINT:
+                self.insert_register(TimestampRegister(point_name, self.tz, description=description))
+                continue
+
+            units = regDef.get('Units', None)
+            reg_type = type_mapping.get(regDef.get("Type", 'float'), float)
+            scale = float(regDef.get('Scale') or 1.0)
+            register = ReplayRegister(self.profile.column(column_name), point_name, units, reg_type,
+                                      scale=scale, description=description)
+            self.insert_register(register)
@@ -0,0 +1,125 @@
+import os
+from csv import DictReader
+
+import gevent
+import pytest
+
+from platform_driver.interfaces import csvdriver
+from platform_driver.interfaces.csvdriver import Interface
+from volttron.platform.store import process_raw_config
+
+NUM_POINTS = 50
+
+registry_config = process_raw_config(
+    "Point Name,Volttron Point Name,Units,Writable,Type\n" +
+    "".join("point{0},point{0},kW,TRUE,float\n".format(i) for i in range(NUM_POINTS)), config_type="csv")
+
+
+@pytest.fixture
+def csv_path(tmpdir):
+    path = tmpdir.join("csv_device.csv")
+    path.write("Point Name,Point Value\n" + "".join("point{0},{0}\n".format(i) for i in range(NUM_POINTS)))
+    csvdriver._devices.clear()
+    return str(path)
+
+
+def make_interface(csv_path, **config):
+    interface = Interface()
+    config["csv_path"] = csv_path
+    interface.configure(config, registry_config)
+    return interface
+
+
+def read_file(csv_path):
+    with open(csv_path) as csv_device:
+        return {row["Point Name"]: row["Point Value"] for row in DictReader(csv_device)}
+
+
+def touch(csv_path, content):
+    stat = os.stat(csv_path)
+    with open(csv_path, "w") as csv_device:
+        csv_device.write(content)
+    # Make sure the change is visible even on file systems with coarse timestamps
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.mark.driver
+def test_scrape_parses_the_file_once(csv_path):
+    interface = make_interface(csv_path, cache=True)
+    for _ in range(10):
+        result = interface.scrape_all()
+    assert result == {"point{}".format(i): str(i) for i in range(NUM_POINTS)}
+    assert interface.get_point("point7") == "7"
+    assert interface.device.parses == 1
+
+
+@pytest.mark.driver
+def test_external_changes_invalidate_the_index(csv_path):
+    interface = make_interface(csv_path, cache=True)
+    interface.scrape_all()
+
+    touch(csv_path, "Point Name,Point Value\npoint0,42\n")
+    assert interface.get_point("point0") == "42"
+    assert interface.device.parses == 2
+    with pytest.raises(RuntimeError):
+        interface.get_point("point1")
+
+
+@pytest.mark.driver
+def test_writes_are_batched(csv_path):
+    interface = make_interface(csv_path, cache=True, flush_interval=0.05)
+    for i in range(NUM_POINTS):
+        assert interface.set_point("point{}".format(i), i * 10) == i * 10
+    assert interface.get_point("point3") == 30
+    # Nothing is written before the flush timer fires
+    assert read_file(csv_path)["point3"] == "3"
+
+    gevent.sleep(0.2)
+    assert interface.device.flushes == 1
+    assert read_file(csv_path) == {"point{}".format(i): str(i * 10) for i in range(NUM_POINTS)}
+    assert os.listdir(os.path.dirname(csv_path)) == ["csv_device.csv"]
+    # Our own rewrite does not trigger another parse
+    interface.scrape_all()
+    assert interface.device.parses == 1
+
+
+@pytest.mark.driver
+def test_pending_writes_survive_external_changes(csv_path):
+    interface = make_interface(csv_path, cache=True, flush_interval=60)
+    interface.set_point("point0", 5)
+    touch(csv_path, "Point Name,Point Value,Notes\npoint0,1,a\npoint1,2,b\n")
+
+    assert interface.get_point("point1") == "2"
+    assert interface.get_point("point0") == 5
+    interface.device.flush()
+    with open(csv_path) as csv_device:
+        assert list(DictReader(csv_device)) == [{"Point Name": "point0", "Point Value": "5", "Notes": "a"},
+                                               {"Point Name": "point1", "Point Value": "2", "Notes": "b"}]
+
+
+@pytest.mark.driver
+def test_devices_are_shared(csv_path):
+    first = make_interface(csv_path, cache=True)
+    second = make_interface(csv_path, cache=True)
+    assert first.device is second.device
+
+
+@pytest.mark.driver
+def test_uncached_mode(csv_path):
+    interface = make_interface(csv_path)
+    assert interface.device is None
+    assert interface.set_point("point1", 11) == "11"
+    assert read_file(csv_path)["point1"] == "11"
+    assert interface.scrape_all()["point1"] == "11"
+
+
+@pytest.mark.driver
+def test_close_flushes_pending_writes(csv_path):
+    interface = make_interface(csv_path, cache=True, flush_interval=60)
+    interface.set_point("point0", 5)
+    assert read_file(csv_path)["point0"] == "0"
+
+    interface.close()
+    assert read_file(csv_path)["point0"] == "5"
+    assert interface.device.flushes == 1
+    make_interface(csv_path).close()
@@ -39,7 +39,7 @@
 import logging
 import contextlib
 from datetime import datetime, date, time
-from mock import create_autospec
+from mock import create_autospec, Mock
 
 import pytest
 import pytz
@@ -160,6 +160,17 @@ def test_starting_should_succeed():
         assert isinstance(driver_agent.periodic_read_event, ScheduledEvent)
 
 
+@pytest.mark.driver_unit
+def test_stopping_should_close_interface():
+    with get_driver_agent() as driver_agent:
+        driver_agent.stopping("somesender")
+
+        driver_agent.setup_device()
+        driver_agent.interface = Mock(wraps=driver_agent.interface)
+        driver_agent.stopping("somesender")
+        driver_agent.interface.close.assert_called_once()
+
+
 @pytest.mark.driver_unit
 def test_setup_device_should_succeed():
     expected_base_topic = Topic("devices/path/to/my/device/{point}")
@@ -185,10 +196,36 @@ def test_periodic_read_should_succeed():
 
         driver_agent.parent.scrape_starting.assert_called_once()
         driver_agent.parent.scrape_ending.assert_called_once()
-        driver_agent._publish_wrapper.assert_called_once()
+        driver_agent._publish_many_wrapper.assert_called_once()
+        driver_agent._publish_wrapper.assert_not_called()
         assert isinstance(driver_agent.periodic_read_event, ScheduledEvent)
 
 
+@pytest.mark.driver_unit
+def test_periodic_read_should_publish_point_topics_in_one_batch():
+    now = pytz.UTC.localize(datetime.utcnow())
+    scrape = {"foo": 1, "bar": 2}
+
+    with get_driver_agent(has_core_schedule=True, meta_data={"foo": "foo_meta", "bar": "bar_meta"},
+                          has_base_topic=True, mock_publish_wrapper=True,
+                          interface_scrape_all=scrape) as driver_agent:
+        driver_agent.publish_breadth_first = True
+        driver_agent.publish_depth_first_all = True
+        driver_agent.all_path_depth = "devices/all"
+        driver_agent.periodic_read(now)
+
+        driver_agent._publish_many_wrapper.assert_called_once()
+        messages = driver_agent._publish_many_wrapper.call_args[0][0]
+        expected = []
+        for point, value in scrape.items():
+            depth_first, breadth_first = driver_agent.get_paths_for_point(point)
+            meta = driver_agent.meta_data[point]
+            expected.extend([(depth_first, [value, meta]), (breadth_first, [value, meta])])
+        assert [(topic, message) for topic, headers, message in messages] == expected
+        driver_agent._publish_wrapper.assert_called_once_with("devices/all", headers=messages[0][1],
+                                                              message=[scrape, driver_agent.meta_data])
+
+
 @pytest.mark.driver_unit
 @pytest.mark.parametrize("scrape_all_response", [{}, Exception()])
 def test_periodic_read_should_return_none_on_scrape_response(scrape_all_response):
@@ -202,6 +239,7 @@ def test_periodic_read_should_return_none_on_scrape_response(scrape_all_response
         driver_agent.parent.scrape_starting.assert_called_once()
         driver_agent.parent.scrape_ending.assert_not_called()
         driver_agent._publish_wrapper.assert_not_called()
+        driver_agent._publish_many_wrapper.assert_not_called()
         assert isinstance(driver_agent.periodic_read_event, ScheduledEvent)
 
 
@@ -303,7 +341,8 @@ def test_publish_cov_value_should_succeed_when_publish_depth_first_is_true():
                           has_base_topic=True) as driver_agent:
         driver_agent.publish_cov_value(point_name, point_values)
 
-        driver_agent._publish_wrapper.assert_called_once()
+        driver_agent._publish_many_wrapper.assert_called_once()
+        driver_agent._publish_wrapper.assert_not_called()
 
 
 class MockedParent:
@@ -324,6 +363,11 @@ class MockedPublishWrapper:
         pass
 
 
+class MockedPublishManyWrapper:
+    def __call__(self, messages):
+        pass
+
+
 @contextlib.contextmanager
 def get_driver_agent(has_base_topic: bool = False,
                      has_periodic_read_event: bool = False,
@@ -395,6 +439,7 @@ def get_driver_agent(has_base_topic: bool = False,
 
     if mock_publish_wrapper:
         driver_agent._publish_wrapper = create_autospec(MockedPublishWrapper)
+        driver_agent._publish_many_wrapper = create_autospec(MockedPublishManyWrapper)
 
     if has_heart_beat_point:
         driver_agent.heart_beat_point = 42
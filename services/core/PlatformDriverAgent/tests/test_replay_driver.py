@@ -0,0 +1,190 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from platform_driver.interfaces import replay
+from platform_driver.interfaces.replay import Interface, load_profile
+from volttron.platform.store import process_raw_config
+
+# Same layout as the TEC_PEL building profiles: no header, timestamp, value, weekday, time of day
+PROFILE = """2018-01-01 00:00:00+01:00,100.0,Monday,00:00:00
+2018-01-01 00:15:00+01:00,200.0,Monday,00:15:00
+2018-01-01 00:30:00+01:00,300.0,Monday,00:30:00
+2018-01-01 00:45:00+01:00,400.0,Monday,00:45:00
+"""
+
+registry_config_string = """Point Name,Volttron Point Name,Units,Writable,Type,Scale
+1,Pel,kW,FALSE,float,
+1,PelScaled,kW,FALSE,float,2
+Timestamp,DateTime,,FALSE,string,
+"""
+
+registry_config = process_raw_config(registry_config_string, config_type="csv")
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_ROOT = os.path.abspath(os.path.join(TESTS_DIR, os.pardir, os.pardir, os.pardir, os.pardir))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def agent_dir(tmpdir, monkeypatch):
+    agent_dir = tmpdir.mkdir("platform_driveragent-4.0")
+    monkeypatch.setattr(replay, "AGENT_DIR", str(agent_dir))
+    monkeypatch.setenv("VOLTTRON_HOME", str(tmpdir.join("volttron_home")))
+    replay._profiles.clear()
+    return agent_dir
+
+
+@pytest.fixture
+def profile_path(tmpdir):
+    path = tmpdir.join("TEC_PEL_1W.csv")
+    path.write(PROFILE)
+    return str(path)
+
+
+def make_interface(profile_path, **config):
+    interface = Interface()
+    interface.clock = Clock()
+    config["profile_path"] = profile_path
+    interface.configure(config, registry_config)
+    return interface
+
+
+@pytest.mark.driver
+def test_scrape_follows_the_clock(profile_path):
+    interface = make_interface(profile_path)
+    assert interface.scrape_all() == {"Pel": 100.0, "PelScaled": 200.0, "DateTime": "2017-12-31T23:00:00+00:00"}
+
+    interface.clock.now += 899
+    assert interface.get_point("Pel") == 100.0
+    interface.clock.now += 1
+    assert interface.get_point("Pel") == 200.0
+
+
+@pytest.mark.driver
+def test_speed_up_start_and_offset(profile_path):
+    interface = make_interface(profile_path, speed_up=60, start="2018-01-01 00:15:00+01:00", offset=900)
+    assert interface.get_point("Pel") == 300.0
+    interface.clock.now += 15
+    assert interface.get_point("Pel") == 400.0
+
+
+@pytest.mark.driver
+def test_interpolate(profile_path):
+    interface = make_interface(profile_path, interpolate=True)
+    interface.clock.now += 450
+    assert interface.get_point("Pel") == 150.0
+
+    # The last row is interpolated towards the first one when looping
+    interface.clock.now += 2700
+    assert interface.get_point("Pel") == 250.0
+
+
+@pytest.mark.driver
+def test_loop_and_hold(profile_path):
+    interface = make_interface(profile_path)
+    interface.clock.now += 3600 + 900
+    assert interface.get_point("Pel") == 200.0
+
+    interface = make_interface(profile_path, loop=False, interpolate=True)
+    interface.clock.now += 3600 * 24
+    assert interface.get_point("Pel") == 400.0
+
+
+@pytest.mark.driver
+def test_irregular_profile_with_header(tmpdir):
+    path = tmpdir.join("irregular.csv")
+    path.write("Time,Load,Other\n"
+               "2018-01-01 00:00:00,1,10\n"
+               "2018-01-01 00:10:00,2,20\n"
+               "2018-01-01 01:00:00,3,30\n")
+    profile = load_profile(str(path))
+    assert not profile.regular
+    assert profile.locate(profile.start + 1800, loop=False)[1:] == (1, 2, 0.4)
+
+    registry = process_raw_config("Point Name,Volttron Point Name,Type\nOther,Other,int\n", config_type="csv")
+    interface = Interface()
+    interface.clock = Clock()
+    interface.configure({"profile_path": str(path)}, registry)
+    interface.clock.now += 700
+    assert interface.scrape_all() == {"Other": 20}
+
+    with pytest.raises(ValueError):
+        interface.parse_config(process_raw_config("Point Name\nMissing\n", config_type="csv"))
+
+
+@pytest.mark.driver
+def test_profile_is_parsed_once(profile_path, monkeypatch):
+    first = load_profile(profile_path)
+    assert load_profile(profile_path) is first
+
+    # Cached in VOLTTRON_HOME while not installed, not next to the profile or in the agent
+    assert [name for name in os.listdir(os.path.dirname(profile_path)) if name.endswith(".npy")] == []
+    data_dir = replay.default_cache_dir()
+    assert data_dir == os.path.join(os.environ["VOLTTRON_HOME"], "replay_cache")
+    assert os.listdir(replay.AGENT_DIR) == []
+    assert len([name for name in os.listdir(data_dir) if name.endswith(".npy")]) == 1
+
+    # A new process maps the cached array instead of parsing the CSV
+    replay._profiles.clear()
+    monkeypatch.setattr(replay, "_parse_profile", None)
+    second = load_profile(profile_path)
+    assert isinstance(second.data, np.memmap)
+    np.testing.assert_array_equal(second.data, first.data)
+
+
+@pytest.mark.driver
+def test_paths_are_relative_to_the_working_directory(agent_dir, monkeypatch):
+    # An installed agent runs in its install directory and caches in its agent-data directory
+    monkeypatch.chdir(agent_dir)
+    agent_dir.mkdir("profiles").join("TEC_PEL_1W.csv").write(PROFILE)
+    data_dir = agent_dir.mkdir("platform_driver.agent-data")
+
+    interface = make_interface("profiles/TEC_PEL_1W.csv")
+    assert interface.get_point("Pel") == 100.0
+    assert len(data_dir.listdir()) == 1
+
+    cache = make_interface("profiles/TEC_PEL_1W.csv", cache_dir="cache")
+    assert cache.profile is interface.profile
+    replay._profiles.clear()
+    make_interface("profiles/TEC_PEL_1W.csv", cache_dir="cache")
+    assert len(agent_dir.join("cache").listdir()) == 1
+
+    monkeypatch.setenv("PROFILES", str(agent_dir.join("profiles")))
+    assert make_interface("$PROFILES/TEC_PEL_1W.csv").get_point("Pel") == 100.0
+    monkeypatch.delenv("PROFILES")
+    with pytest.raises(ValueError):
+        make_interface("$PROFILES/TEC_PEL_1W.csv")
+
+
+@pytest.mark.driver
+def test_sample_device_config(monkeypatch):
+    device_dir = os.path.join(SOURCE_ROOT, "devices", "neighborhood", "replay")
+    with open(os.path.join(device_dir, "replay.config")) as config_file:
+        config = json.load(config_file)
+    with open(os.path.join(device_dir, "replay_registers.csv")) as registry_file:
+        registry = process_raw_config(registry_file.read(), config_type="csv")
+
+    monkeypatch.setenv("VOLTTRON_ROOT", SOURCE_ROOT)
+    interface = Interface()
+    interface.clock = Clock()
+    interface.configure(config["driver_config"], registry)
+    values = interface.scrape_all()
+    assert values["DateTime"] == "2017-12-31T23:00:00+00:00"
+    assert values["energyConsumption"] == pytest.approx(3467.6334989387765)
+
+
+@pytest.mark.driver
+def test_writes_are_rejected(profile_path):
+    interface = make_interface(profile_path)
+    with pytest.raises(IOError):
+        interface.set_point("Pel", 1.0)
@@ -237,6 +237,7 @@ from volttron.platform.agent.utils import process_timestamp, \
     fix_sqlite3_datetime, get_aware_utc_now, parse_timestamp_string
 from volttron.platform.async_ import AsyncCall
 from volttron.platform.messaging import topics, headers as headers_mod
+from volttron.platform.messaging.timeseries import is_timeseries, iter_readings
 from volttron.platform.messaging.health import (STATUS_BAD,
                                                 STATUS_UNKNOWN,
                                                 STATUS_GOOD,
@@ -246,10 +247,16 @@ from volttron.platform.vip.agent import Agent, compat
 from volttron.platform.vip.agent.core import Core
 from volttron.platform.vip.agent.subsystems import RPC
 from volttron.platform.vip.agent.subsystems.query import Query
+from volttron.platform import jsonapi
 
 
 try:
     import ujson
+except ImportError:
+    ujson = None
+
+# ujson only beats the standard library serializer, not the faster platform serializers
+if ujson is not None and jsonapi.serializer().name == 'json':
     from volttron.platform.jsonapi import dumps as _dumps, loads as _loads
 
     def dumps(data):
@@ -263,7 +270,7 @@ try:
             return ujson.loads(data_string, precise_float=True)
         except Exception:
             return _loads(data_string)
-except ImportError:
+else:
     from volttron.platform.jsonapi import dumps, loads
 
 from volttron.platform.agent import utils
@@ -1007,6 +1014,21 @@ class BaseHistorianAgent(Agent):
         if self.gather_timing_data:
             add_timing_data_to_header(headers, self.core.agent_uuid or self.core.identity, "collected")
 
+        if is_timeseries(message):
+            # Columnar payloads carry their own row times, one reading per row.
+            try:
+                columns = list(iter_readings(message))
+            except (ValueError, KeyError, TypeError) as e:
+                _log.error("message for {topic} bad time-series payload: {e}".format(topic=topic, e=e))
+                return
+            for key, readings in columns:
+                self._event_queue.put({'source': source,
+                                       'topic': device + '/' + key,
+                                       'readings': readings,
+                                       'meta': {},
+                                       'headers': headers})
+            return
+
         for key, value in values.items():
             point_topic = device + '/' + key
             self._event_queue.put({'source': source,
@@ -36,15 +36,275 @@
 # under Contract DE-AC05-76RL01830
 # }}}
 
-from json import dump, dumps, load, loads
+"""JSON serialization used for VIP frames, RPC payloads and stored data.
 
+The functions of this module delegate to the serializer selected for the
+process, by default the standard library ``json`` module. Faster backends
+are optional:
 
-__all__ = ('dump', 'dumpb', 'dumps', 'load', 'loadb', 'loads')
+``json``
+    Standard library, always available.
+``orjson``
+    Drop in replacement decoding to the same values as the standard
+    library. Its text is compact (no spaces after separators) and floats
+    may be written differently (``1e16`` rather than ``1e+16``). Calls with
+    keyword arguments (``indent``, ``default``, ...), values it cannot
+    represent the same way (NaN, infinity, non string keys, integers beyond
+    64 bit) and types the standard library rejects are passed to the
+    standard library, so those raise the same ``TypeError``. Only UUIDs and
+    enums are encoded by orjson where the standard library would fail.
+``msgpack``
+    Binary encoding. It is not JSON text, so it is only used on the wire
+    with peers that agreed to it during the VIP hello (see
+    :func:`negotiate`); everything else keeps using JSON.
+
+The serializer is chosen by the ``serializer`` platform option, which the
+platform exports to its agents as the ``VOLTTRON_SERIALIZER`` environment
+variable. Like the standard library, no backend encodes datetimes or NumPy
+values that are not Python numbers; convert those before publishing.
+"""
+
+import json
+import logging
+import math
+import os
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+__all__ = ('dump', 'dumpb', 'dumps', 'load', 'loadb', 'loads', 'get_serializer', 'set_serializer',
+           'serializer', 'available_serializers', 'wire_formats', 'negotiate', 'wire_serializer')
+
+_log = logging.getLogger(__name__)
+
+#: Environment variable holding the serializer of the process.
+SERIALIZER_ENV = 'VOLTTRON_SERIALIZER'
+
+
+def _non_finite(data):
+    """Whether ``data`` holds a NaN or infinite float, which orjson would write as null."""
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+class JsonSerializer(object):
+    """Standard library ``json``."""
+    name = 'json'
+    format = 'json'
+
+    def dumps(self, data, **kwargs):
+        return json.dumps(data, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return json.loads(s, **kwargs)
+
+    def dumpb(self, data, **kwargs):
+        return self.dumps(data, **kwargs).encode('utf-8')
+
+    def loadb(self, s, **kwargs):
+        # str() rather than decode() to also accept memoryviews of frames
+        return json.loads(str(s, 'utf-8'), **kwargs)
+
+    def dump(self, data, fp, **kwargs):
+        json.dump(data, fp, **kwargs)
+
+    def load(self, fp, **kwargs):
+        return json.load(fp, **kwargs)
+
+
+class OrjsonSerializer(JsonSerializer):
+    """``orjson``, compact JSON decoding to the values of the standard library."""
+    name = 'orjson'
+    format = 'json'
+
+    # Datetimes and dataclasses raise like in the standard library instead of being encoded
+    _options = 0 if orjson is None else orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumpb(self, data, **kwargs):
+        if not kwargs:
+            try:
+                encoded = orjson.dumps(data, option=self._options)
+            except TypeError:
+                pass
+            else:
+                # orjson writes NaN and infinity as null and does not escape non ASCII characters. The
+                # text only tells that a null might be such a float, the data decides.
+                if encoded.isascii() and (b'null' not in encoded or not _non_finite(data)):
+                    return encoded
+        return super().dumps(data, **kwargs).encode('utf-8')
+
+    def dumps(self, data, **kwargs):
+        if kwargs:
+            return super().dumps(data, **kwargs)
+        return self.dumpb(data).decode('ascii')
+
+    def loads(self, s, **kwargs):
+        if not kwargs:
+            try:
+                return orjson.loads(s)
+            except ValueError:
+                # NaN, infinity, huge integers or invalid JSON, the standard library decides
+                pass
+        return json.loads(s, **kwargs)
+
+    def loadb(self, s, **kwargs):
+        if not kwargs:
+            try:
+                return orjson.loads(s)
+            except ValueError:
+                pass
+        return super().loadb(s, **kwargs)
+
+    def dump(self, data, fp, **kwargs):
+        if kwargs:
+            super().dump(data, fp, **kwargs)
+        else:
+            fp.write(self.dumps(data))
+
+    def load(self, fp, **kwargs):
+        return self.loads(fp.read(), **kwargs)
+
+
+class MsgpackSerializer(object):
+    """``msgpack``, a binary wire format for negotiated connections."""
+    name = 'msgpack'
+    format = 'msgpack'
+
+    def dumpb(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loadb(self, s):
+        return msgpack.unpackb(s, raw=False, strict_map_key=False)
+
+
+_SERIALIZERS = OrderedDict([('json', JsonSerializer)])
+if orjson is not None:
+    _SERIALIZERS['orjson'] = OrjsonSerializer
+if msgpack is not None:
+    _SERIALIZERS['msgpack'] = MsgpackSerializer
+
+_instances = {}
+_serializer = None
+_wire_formats = ('json',)
+
+
+def available_serializers():
+    """Names of the serializers that can be used in this environment."""
+    return list(_SERIALIZERS)
+
+
+def get_serializer(name):
+    """Serializer instance by name.
+
+    :raises ValueError: if the serializer is unknown or not installed.
+    """
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    try:
+        cls = _SERIALIZERS[name]
+    except KeyError:
+        raise ValueError("Serializer {} is not available, choose one of {}".format(
+            name, ', '.join(_SERIALIZERS)))
+    instance = _instances[name] = cls()
+    return instance
+
+
+def set_serializer(name):
+    """Select the serializer of this process.
+
+    A binary serializer is offered as wire format during the VIP hello,
+    JSON text is then produced by the fastest available JSON serializer.
+
+    :raises ValueError: if the serializer is unknown or not installed.
+    """
+    global _serializer, _wire_formats
+    selected = get_serializer(name)
+    if selected.format == 'json':
+        _serializer = selected
+        _wire_formats = ('json',)
+    else:
+        _serializer = get_serializer('orjson' if 'orjson' in _SERIALIZERS else 'json')
+        _wire_formats = (selected.format, 'json')
+
+
+def serializer():
+    """The JSON serializer of this process."""
+    return _serializer
+
+
+def wire_formats():
+    """Wire formats this process offers to peers, most preferred first."""
+    return list(_wire_formats)
+
+
+def negotiate(offered):
+    """Pick the wire format for a peer offering ``offered``.
+
+    :returns: The first format of :func:`wire_formats` the peer offers, ``json`` otherwise.
+    """
+    if offered:
+        for name in _wire_formats:
+            if name in offered:
+                return name
+    return 'json'
+
+
+def wire_serializer(format_name):
+    """Serializer of a negotiated wire format, the JSON serializer for ``json``."""
+    if format_name == 'json' or not format_name:
+        return _serializer
+    for cls_name, cls in _SERIALIZERS.items():
+        if cls.format == format_name:
+            return get_serializer(cls_name)
+    raise ValueError("Unknown wire format {}".format(format_name))
+
+
+def dumps(data, **kwargs):
+    return _serializer.dumps(data, **kwargs)
+
+
+def loads(s, **kwargs):
+    return _serializer.loads(s, **kwargs)
 
 
 def dumpb(data, **kwargs):
-    return dumps(data, **kwargs).encode('utf-8')
+    return _serializer.dumpb(data, **kwargs)
 
 
 def loadb(s, **kwargs):
-    return loads(s.decode('utf-8'), **kwargs)
+    return _serializer.loadb(s, **kwargs)
+
+
+def dump(data, fp, **kwargs):
+    _serializer.dump(data, fp, **kwargs)
+
+
+def load(fp, **kwargs):
+    return _serializer.load(fp, **kwargs)
+
+
+try:
+    set_serializer(os.environ.get(SERIALIZER_ENV) or 'json')
+except ValueError as e:
+    _log.warning("%s, using json", e)
+    set_serializer('json')
@@ -301,6 +301,8 @@ class FramesFormatter:
 
 class Router(BaseRouter):
     '''Concrete VIP router.'''
+    negotiate_wire_formats = True
+    features = ('publish_many',)
     # Add ZMQClientAuthentication - for building address using public/secretkey ?
     def __init__(self, local_address, addresses=(),
                  context=None, secretkey=None, publickey=None,
@@ -387,7 +389,8 @@ class Router(BaseRouter):
 
         self.pubsub = PubSubService(self.socket,
                                     self._protected_topics,
-                                    self._ext_routing)
+                                    self._ext_routing,
+                                    peer_formats=self._peer_formats)
         self.ext_rpc = ExternalRPCService(self.socket,
                                           self._ext_routing)
         self._poller.register(sock, zmq.POLLIN)
@@ -702,6 +705,12 @@ def start_volttron_process(opts):
     # and opts.web_ssl_cert
 
     os.environ['MESSAGEBUS'] = opts.message_bus
+    try:
+        jsonapi.set_serializer(opts.serializer)
+    except ValueError as e:
+        _log.error(str(e))
+        sys.exit(1)
+    os.environ[jsonapi.SERIALIZER_ENV] = opts.serializer
     os.environ['AGENT_ISOLATION_MODE'] = opts.agent_isolation_mode
     os.environ['AUTH_ENABLED'] = opts.allow_auth
     opts.allow_auth = False if opts.allow_auth == 'False' else True
@@ -1306,6 +1315,10 @@ def main(argv=sys.argv):
     parser.add_argument(
         '--message-bus', action='store', default='zmq', dest='message_bus',
         help='set message to be used. valid values are zmq and rmq')
+    parser.add_argument(
+        '--serializer', action='store', default='json', dest='serializer',
+        help='serializer for message payloads. valid values are json, orjson and msgpack '
+             '(binary, used with agents that support it)')
     agents.add_argument(
         '--volttron-central-rmq-address', default=None,
         help='The AMQP address of a volttron central install instance')
@@ -1403,6 +1416,8 @@ def main(argv=sys.argv):
         setup_mode=False,
         # Type of underlying message bus to use - ZeroMQ or RabbitMQ
         message_bus='zmq',
+        # Serializer of message payloads, see volttron.platform.jsonapi
+        serializer='json',
         # Volttron Central in AMQP address format is needed if running on RabbitMQ message bus
         volttron_central_rmq_address=None,
         web_ssl_key=None,
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2020, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+"""Columnar time-series payloads for pubsub messages.
+
+A time series is published as a dictionary holding the column names, a
+time index and all values as a single column major float64 buffer::
+
+    {"format": "volttron.timeseries", "version": 1,
+     "columns": ["Solar_Generation", "Demand"], "length": 672,
+     "index": {"start": 1704067200, "step": 900, "tz": null},
+     "dtype": "<f8", "encoding": "base64", "data": "AAAA..."}
+
+Regular indexes are sent as a start and step in seconds since the epoch.
+Irregular ones carry an int64 buffer of epoch nanoseconds under
+``index["epoch_ns"]`` instead. Buffers are base64 strings so the payload
+survives the JSON serializer; ``encoding="raw"`` keeps them as bytes for
+serializers that carry binary data.
+
+Decoding wraps the decoded buffer without copying it, so the returned
+NumPy arrays and DataFrame columns are read only unless ``copy=True`` is
+passed. NumPy and pandas are only needed for :func:`encode`,
+:func:`decode` and the frame helpers; :func:`iter_readings` works with the
+standard library alone so historians can consume payloads without them.
+"""
+
+import base64
+import sys
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytz
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FORMAT = 'volttron.timeseries'
+VERSION = 1
+
+BASE64 = 'base64'
+RAW = 'raw'
+
+_NS = 1000000000
+_EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+TimeSeries = namedtuple('TimeSeries', ['columns', 'index', 'values', 'tz'])
+"""Decoded payload: ``index`` holds int64 epoch nanoseconds and ``values``
+is a ``(len(columns), length)`` float64 array."""
+
+
+def is_timeseries(message):
+    """Return True if ``message`` is a time-series payload."""
+    return isinstance(message, dict) and message.get('format') == FORMAT
+
+
+def encode(values, columns, start=None, step=None, index=None, tz=None, encoding=BASE64):
+    """Build a time-series payload from column arrays.
+
+    :param values: ``(len(columns), length)`` array or a sequence of
+                   equally long columns.
+    :param columns: Column names.
+    :param start: Time of the first row in seconds since the epoch.
+    :param step: Seconds between rows.
+    :param index: Row times in epoch nanoseconds, for irregular series.
+                  Mutually exclusive with ``start`` and ``step``.
+    :param tz: Time zone name the receiver should convert the index to, or
+               None for naive times.
+    :param encoding: ``"base64"`` or ``"raw"``.
+    :rtype: dict
+    """
+    _require_numpy()
+    columns = [str(column) for column in columns]
+    values = np.ascontiguousarray(values, dtype='<f8')
+    if values.ndim == 1 and len(columns) == 1:
+        values = values.reshape(1, -1)
+    if values.ndim != 2 or values.shape[0] != len(columns):
+        raise ValueError("values must have one row per column, got shape {} for {} columns".format(
+            values.shape, len(columns)))
+    length = values.shape[1]
+
+    if index is not None:
+        if start is not None or step is not None:
+            raise ValueError("Pass either index or start and step, not both.")
+        index = np.ascontiguousarray(index, dtype='<i8')
+        if index.shape != (length,):
+            raise ValueError("index has {} entries for {} rows".format(index.size, length))
+        index_info = {'epoch_ns': _encode_buffer(index, encoding)}
+    elif start is None or step is None:
+        raise ValueError("A regular series needs both start and step.")
+    else:
+        index_info = {'start': start, 'step': step}
+    index_info['tz'] = tz
+
+    return {'format': FORMAT,
+            'version': VERSION,
+            'columns': columns,
+            'length': length,
+            'index': index_info,
+            'dtype': '<f8',
+            'encoding': encoding,
+            'data': _encode_buffer(values, encoding)}
+
+
+def decode(message, copy=False):
+    """Decode a time-series payload into NumPy arrays.
+
+    :param message: Payload produced by :func:`encode`.
+    :param copy: Return writable copies instead of read only views of the
+                 received buffers.
+    :rtype: TimeSeries
+    """
+    _require_numpy()
+    columns, length, index_info = _validate(message)
+    values = _decode_buffer(message['data'], message['encoding'], '<f8')
+    if values.size != len(columns) * length:
+        raise ValueError("Payload holds {} values for {} columns of {} rows".format(
+            values.size, len(columns), length))
+    values = values.reshape(len(columns), length)
+
+    if 'epoch_ns' in index_info:
+        index = _decode_buffer(index_info['epoch_ns'], message['encoding'], '<i8')
+        if index.size != length:
+            raise ValueError("Payload index has {} entries for {} rows".format(index.size, length))
+    else:
+        start = int(round(index_info['start'] * _NS))
+        index = start + int(round(index_info['step'] * _NS)) * np.arange(length, dtype='<i8')
+
+    if copy:
+        values = values.copy()
+        index = index.copy()
+    return TimeSeries(columns, index, values, index_info.get('tz'))
+
+
+def encode_frame(df, encoding=BASE64):
+    """Encode a DataFrame with a DatetimeIndex as a time-series payload.
+
+    All columns are sent as float64. A regularly spaced index is sent as
+    start and step, anything else as explicit epoch nanoseconds.
+    """
+    import pandas as pd
+
+    if not isinstance(df.index, pd.DatetimeIndex):
+        raise ValueError("DataFrame index must be a DatetimeIndex")
+    index = df.index
+    tz = None
+    if index.tz is not None:
+        tz = str(index.tz)
+        index = index.tz_convert('UTC')
+    epoch_ns = index.asi8
+
+    # Transposing the float64 block is a view, so encoding copies the data once.
+    values = df.to_numpy(dtype='<f8').T
+    steps = np.diff(epoch_ns)
+    if len(epoch_ns) > 1 and (steps == steps[0]).all():
+        return encode(values, df.columns, start=_seconds(epoch_ns[0]), step=_seconds(steps[0]), tz=tz,
+                      encoding=encoding)
+    if len(epoch_ns) == 1:
+        return encode(values, df.columns, start=_seconds(epoch_ns[0]), step=0, tz=tz, encoding=encoding)
+    return encode(values, df.columns, index=epoch_ns, tz=tz, encoding=encoding)
+
+
+def decode_frame(message, copy=False):
+    """Decode a time-series payload into a DataFrame.
+
+    Without ``copy`` the frame's columns are read only views of the
+    received buffer.
+    """
+    import pandas as pd
+
+    series = decode(message, copy=copy)
+    index = pd.DatetimeIndex(series.index.view('datetime64[ns]'))
+    if series.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(series.tz)
+    return pd.DataFrame(series.values.T, index=index, columns=series.columns, copy=copy)
+
+
+def iter_readings(message):
+    """Yield ``(column, readings)`` with ``readings`` a list of
+    ``(timestamp, value)`` tuples and timezone aware UTC timestamps.
+
+    Only needs the standard library. Naive indexes are taken as UTC.
+    """
+    columns, length, index_info = _validate(message)
+    values = _decode_array(message['data'], message['encoding'], 'd')
+    if len(values) != len(columns) * length:
+        raise ValueError("Payload holds {} values for {} columns of {} rows".format(
+            len(values), len(columns), length))
+
+    if 'epoch_ns' in index_info:
+        epoch_ns = _decode_array(index_info['epoch_ns'], message['encoding'], 'q')
+        timestamps = [_EPOCH + timedelta(microseconds=ns // 1000) for ns in epoch_ns]
+    else:
+        start = _EPOCH + timedelta(seconds=index_info['start'])
+        step = timedelta(seconds=index_info['step'])
+        timestamps = [start + i * step for i in range(length)]
+
+    for i, column in enumerate(columns):
+        yield column, list(zip(timestamps, values[i * length:(i + 1) * length]))
+
+
+def _validate(message):
+    if not is_timeseries(message):
+        raise ValueError("Not a time-series payload")
+    if message.get('version') != VERSION:
+        raise ValueError("Unsupported time-series payload version: {}".format(message.get('version')))
+    if message.get('dtype') != '<f8':
+        raise ValueError("Unsupported time-series dtype: {}".format(message.get('dtype')))
+    if message.get('encoding') not in (BASE64, RAW):
+        raise ValueError("Unknown time-series encoding: {}".format(message.get('encoding')))
+    return message['columns'], int(message['length']), message['index']
+
+
+def _seconds(ns):
+    ns = int(ns)
+    return ns // _NS if ns % _NS == 0 else ns / _NS
+
+
+def _encode_buffer(values, encoding):
+    if encoding == BASE64:
+        return base64.b64encode(memoryview(values)).decode('ascii')
+    elif encoding == RAW:
+        return values.tobytes()
+    raise ValueError("Unknown time-series encoding: {}".format(encoding))
+
+
+def _raw_bytes(data, encoding):
+    if encoding == BASE64:
+        return base64.b64decode(data)
+    return data
+
+
+def _decode_buffer(data, encoding, dtype):
+    return np.frombuffer(_raw_bytes(data, encoding), dtype=dtype)
+
+
+def _decode_array(data, encoding, typecode):
+    values = array(typecode)
+    values.frombytes(_raw_bytes(data, encoding))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required to encode and decode time-series arrays")
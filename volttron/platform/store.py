@@ -167,6 +167,27 @@ class ConfigStoreService(Agent):
         self._add_config_to_store(identity, config_name, raw_contents, contents, config_type,
                                   trigger_callback=True)
 
+    @RPC.export
+    @RPC.allow('edit_config_store')
+    def manage_store_many(self, identity, configs):
+        """
+        Store several configurations for one agent with a single call.
+
+        All configurations are parsed before anything is stored, so a bad
+        entry leaves the store untouched. The store file is written once at
+        the end instead of once per configuration.
+
+        :param configs: List of ``[config_name, raw_contents, config_type]``, stored in order.
+        """
+        parsed = [(config_name, raw_contents, process_raw_config(raw_contents, config_type), config_type)
+                  for config_name, raw_contents, config_type in configs]
+        for config_name, raw_contents, contents, config_type in parsed:
+            self._add_config_to_store(identity, config_name, raw_contents, contents, config_type,
+                                      trigger_callback=True, sync=False)
+        agent_store = self.store.get(identity)
+        if agent_store is not None:
+            agent_store["store"].async_sync()
+
     @RPC.export
     @RPC.allow('edit_config_store')
     def manage_delete_config(self, identity, config_name):
@@ -394,7 +415,7 @@ class ConfigStoreService(Agent):
 
     def _add_config_to_store(self, identity, config_name, raw, parsed,
                              config_type, trigger_callback=False,
-                             send_update=True):
+                             send_update=True, sync=True):
         """Adds a processed configuration to the store."""
         agent_store = self.store.get(identity)
 
@@ -432,7 +453,8 @@ class ConfigStoreService(Agent):
                                          "modified": format_timestamp(get_aware_utc_now()),
                                          "data": raw}
 
-        agent_disk_store.async_sync()
+        if sync:
+            agent_disk_store.async_sync()
 
         _log.debug("Agent {} config {} stored.".format(identity, config_name))
 
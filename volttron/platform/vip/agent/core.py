@@ -509,6 +509,9 @@ class Core(BasicCore):
         self._reconnect_attempt = 0
         self.instance_name = instance_name
         self.messagebus = messagebus
+        # Format of pubsub payloads agreed with the router in the hello and the optional operations it supports
+        self.wire_format = 'json'
+        self.router_features = frozenset()
         self.subsystems = {'error': self.handle_error}
         self.__connected = False
         self._version = version
@@ -609,7 +612,7 @@ class Core(BasicCore):
             state.count += 1
             self.spawn(connection_failed_check)
             message = Message(peer='', subsystem='hello',
-                              id=ident, args=['hello'])
+                              id=ident, args=['hello', jsonapi.wire_formats()])
             self.connection.send_vip_object(message)
 
         def hello_response(sender, version='',
@@ -794,6 +797,9 @@ class ZMQCore(Core):
                         len(message.args) > 3 and
                         message.args[0] == 'welcome'):
                     version, server, identity = message.args[1:4]
+                    # Routers that do not negotiate wire formats only speak json
+                    self.wire_format = message.args[4] if len(message.args) > 4 else 'json'
+                    self.router_features = frozenset(message.args[5]) if len(message.args) > 5 else frozenset()
                     self.connected = True
                     self.onconnected.send(self, version=version,
                                           router=server, identity=identity)
@@ -50,15 +50,16 @@ import gevent
 from zmq import green as zmq
 from zmq import SNDMORE
 from volttron.platform import jsonapi
-from volttron.utils.frame_serialization import serialize_frames
+from volttron.utils.frame_serialization import serialize_frames, ENCODE_FORMAT
 from .base import SubsystemBase
 from ..decorators import annotate, annotations, dualmethod, spawn
 from ..errors import Unreachable, VIPError, UnknownSubsystem
 from .... import jsonrpc
 from volttron.platform.agent import utils
 from ..results import ResultsDictionary
+from ...topictrie import TopicTrie
 from gevent.queue import Queue, Empty
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime import timedelta
 
 __all__ = ['PubSub']
@@ -66,6 +67,9 @@ __all__ = ['PubSub']
 min_compatible_version = '3.0'
 max_compatible_version = ''
 
+# Number of (bus, topic) callback lists kept by the dispatch cache
+DISPATCH_CACHE_SIZE = 4096
+
 # utils.setup_logging()
 _log = logging.getLogger(__name__)
 
@@ -100,6 +104,10 @@ class PubSub(SubsystemBase):
             return defaultdict(set)
 
         self._my_subscriptions = defaultdict(platform_subscriptions)
+        # Index of the callback sets in _my_subscriptions: bus -> TopicTrie of prefix and platform
+        self._subscription_index = defaultdict(TopicTrie)
+        # (bus, topic) -> callbacks of every matching subscription, cleared on subscription changes
+        self._dispatch_cache = OrderedDict()
         self.protected_topics = ProtectedPubSubTopics()
         core.register('pubsub', self._handle_subsystem, self._handle_error)
         self.vip_socket = None
@@ -135,8 +143,8 @@ class PubSub(SubsystemBase):
         self.synchronize()
 
     def _process_callback(self, sender, bus, topic, headers, message):
-        """Handle incoming subscription pushes from PubSubService. It iterates over all subscriptions to find the
-        subscription matching the topic and bus. It then calls the corresponding callback on finding a match.
+        """Handle incoming subscription pushes from PubSubService. It looks up the callbacks of all subscriptions
+        matching the topic and bus and calls them.
         param sender: identity of the publisher
         type sender: str
         param bus: bus
@@ -150,21 +158,49 @@ class PubSub(SubsystemBase):
         """
         peer = 'pubsub'
 
-        handled = 0
-        for platform in self._my_subscriptions:
-            # _log.debug("SYNC: process callback subscriptions: {}".format(self._my_subscriptions[platform][bus]))
-            buses = self._my_subscriptions[platform]
-            if bus in buses:
-                subscriptions = buses[bus]
-                for prefix, callbacks in subscriptions.items():
-                    if topic.startswith(prefix):
-                        handled += 1
-                        for callback in callbacks:
-                            callback(peer, sender, bus, topic, headers, message)
-        if not handled:
+        callbacks = self._matching_callbacks(bus, topic)
+        for callback in callbacks:
+            callback(peer, sender, bus, topic, headers, message)
+        if not callbacks:
             # No callbacks for topic; synchronize with sender
             self.synchronize()
 
+    def _matching_callbacks(self, bus, topic):
+        """Callbacks of every subscription on bus with a prefix of topic, once per matching subscription.
+        Results are cached per bus and topic until the subscriptions change.
+        param bus: bus
+        type bus: str
+        param topic: publishing topic
+        type topic: str
+        :returns: callbacks
+        :rtype: tuple
+        """
+        key = bus, topic
+        cache = self._dispatch_cache
+        try:
+            callbacks = cache[key]
+        except KeyError:
+            index = self._subscription_index.get(bus)
+            if index is None:
+                callbacks = ()
+            else:
+                callbacks = tuple(callback for subscribers in index.match_sets(topic)
+                                  for callback in subscribers)
+            cache[key] = callbacks
+            if len(cache) > DISPATCH_CACHE_SIZE:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return callbacks
+
+    def _unindex_subscription(self, prefix, bus, platform):
+        """Remove a prefix whose callbacks were deleted from _my_subscriptions from the dispatch index."""
+        index = self._subscription_index.get(bus)
+        if index is not None:
+            index.remove(prefix, platform)
+            if not len(index):
+                del self._subscription_index[bus]
+
     def _viperror(self, sender, error, **kwargs):
         if isinstance(error, Unreachable):
             self._peer_drop(self, error.peer)
@@ -288,14 +324,17 @@ class PubSub(SubsystemBase):
         # _log.debug(f"Adding subscription prefix: {prefix} allplatforms: {all_platforms}")
         if not callable(callback):
             raise ValueError('callback %r is not callable' % (callback,))
+        platform = 'all' if all_platforms else 'internal'
         try:
-            if not all_platforms:
-                self._my_subscriptions['internal'][bus][prefix].add(callback)
-            else:
-                self._my_subscriptions['all'][bus][prefix].add(callback)
-                # _log.debug("SYNC: add subscriptions: {}".format(self._my_subscriptions['internal'][bus][prefix]))
+            callbacks = self._my_subscriptions[platform][bus][prefix]
+            # _log.debug("SYNC: add subscriptions: {}".format(self._my_subscriptions['internal'][bus][prefix]))
         except KeyError:
             _log.error("PUBSUB something went wrong in add subscriptions")
+            return
+        if not callbacks:
+            self._subscription_index[bus].add(prefix, platform, callbacks)
+        callbacks.add(callback)
+        self._dispatch_cache.clear()
 
     @dualmethod
     @spawn
@@ -359,6 +398,7 @@ class PubSub(SubsystemBase):
         :Return Values:
         List of prefixes
         """
+        self._dispatch_cache.clear()
         topics = []
         bus_subscriptions = dict()
         if prefix is None:
@@ -387,6 +427,7 @@ class PubSub(SubsystemBase):
                             remove.append(topic)
                     for topic in remove:
                         del subscriptions[topic]
+                        self._unindex_subscription(topic, bus, platform)
                     if not subscriptions:
                         del bus_subscriptions[bus]
                     if not bus_subscriptions:
@@ -406,6 +447,7 @@ class PubSub(SubsystemBase):
                             del subscriptions[prefix]
                         except KeyError:
                             return []
+                        self._unindex_subscription(prefix, bus, platform)
                     else:
                         try:
                             callbacks = subscriptions[prefix]
@@ -423,6 +465,7 @@ class PubSub(SubsystemBase):
                                 _log.debug(f"subscriptions: {subscriptions}")
                             except KeyError:
                                 return []
+                            self._unindex_subscription(prefix, bus, platform)
                     topics = [prefix]
                     if not subscriptions:
                         del bus_subscriptions[bus]
@@ -499,10 +542,64 @@ class PubSub(SubsystemBase):
             peer = 'pubsub'
 
         result = next(self._results)
-        args = ['publish', topic, dict(bus=bus, headers=headers, message=message)]
+        payload = dict(bus=bus, headers=headers, message=message)
+        wire_format = self.core().wire_format
+        if wire_format != 'json':
+            payload = jsonapi.wire_serializer(wire_format).dumpb(payload)
+        args = ['publish', topic, payload]
         self.vip_socket.send_vip('', 'pubsub', args, result.ident, copy=False)
         return result
 
+    def publish_many(self, peer: str, messages, bus=''):
+        """Publish several messages in a single VIP message.
+
+        The router delivers every message to the subscribers of its topic,
+        like separate calls to :meth:`publish`, sending each subscriber all
+        of its messages of the batch at once. If the agent may not publish
+        to one of the topics, nothing is delivered and the result raises.
+        Routers that do not support batches get one publish per message.
+        param peer: peer
+        type peer: str
+        param messages: (topic, headers, message) tuples, headers may be None
+        type messages: iterable
+        param bus: bus
+        type bus: str
+        return: Number of deliveries, summed over the messages.
+        :rtype: int
+
+        :Return Values:
+        Number of deliveries
+        """
+        batch = []
+        for topic, headers, message in messages:
+            if headers is None:
+                headers = {}
+            headers['min_compatible_version'] = min_compatible_version
+            headers['max_compatible_version'] = max_compatible_version
+            batch.append([topic, headers, message])
+
+        if peer is None:
+            peer = 'pubsub'
+
+        core = self.core()
+        result = next(self._results)
+        if 'publish_many' not in core.router_features:
+            gevent.spawn(self._publish_each, peer, batch, bus, result)
+            return result
+
+        payload = dict(bus=bus, messages=batch)
+        if core.wire_format != 'json':
+            payload = jsonapi.wire_serializer(core.wire_format).dumpb(payload)
+        self.vip_socket.send_vip('', 'pubsub', ['publish_many', payload], result.ident, copy=False)
+        return result
+
+    def _publish_each(self, peer, batch, bus, result):
+        try:
+            results = [self.publish(peer, topic, headers, message, bus) for topic, headers, message in batch]
+            result.set(sum(published.get() for published in results))
+        except Exception as exc:
+            result.set_exception(exc)
+
     def _check_if_protected_topic(self, topic):
         required_caps = self.protected_topics.get(topic)
         if required_caps:
@@ -555,15 +652,39 @@ class PubSub(SubsystemBase):
             except IndexError:
                 return
             try:
+                if isinstance(msg, str):
+                    # Binary wire format negotiated with the router
+                    msg = jsonapi.wire_serializer(self.core().wire_format).loadb(msg.encode(ENCODE_FORMAT))
                 headers = msg['headers']
                 message = msg['message']
                 sender = msg['sender']
                 bus = msg['bus']
             except KeyError as exc:
                 _log.error("Missing keys in pubsub message: {}".format(exc))
+            except ValueError as exc:
+                _log.error("Invalid pubsub message: {}".format(exc))
             else:
                 self._process_callback(sender, bus, topic, headers, message)
 
+        elif op == 'publish_many':
+            try:
+                batch = message.args[1]
+                if isinstance(batch, str):
+                    # Binary wire format negotiated with the router
+                    batch = jsonapi.wire_serializer(self.core().wire_format).loadb(batch.encode(ENCODE_FORMAT))
+                sender = batch['sender']
+                bus = batch['bus']
+                messages = batch['messages']
+            except IndexError:
+                return
+            except KeyError as exc:
+                _log.error("Missing keys in pubsub message: {}".format(exc))
+            except ValueError as exc:
+                _log.error("Invalid pubsub message: {}".format(exc))
+            else:
+                for topic, headers, message in messages:
+                    self._process_callback(sender, bus, topic, headers, message)
+
         elif op == 'list_response':
             result = None
             try:
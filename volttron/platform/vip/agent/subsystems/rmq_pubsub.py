@@ -412,6 +412,26 @@ class RMQPubSub(SubsystemBase):
                               'rabbitmq broker', 'pubsub')
         return result
 
+    def publish_many(self, peer, messages, bus=''):
+        """Publish several messages, see :meth:`PubSub.publish_many`. RabbitMQ publishes do not wait for the
+        broker, so the messages are published in turn.
+        param peer: peer
+        type peer: str
+        param messages: (topic, headers, message) tuples, headers may be None
+        type messages: iterable
+        param bus: bus
+        type bus: str
+        return: Number of messages published.
+        :rtype: int
+        """
+        count = 0
+        for topic, headers, message in messages:
+            self.publish(peer, topic, headers=headers, message=message, bus=bus)
+            count += 1
+        result = next(self._results)
+        self.core().spawn_later(0.01, self.set_result, result.ident, count)
+        return result
+
     def set_result(self, ident, value=None):
         try:
             result = self._results.pop(ident)
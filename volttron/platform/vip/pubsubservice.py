@@ -50,11 +50,12 @@ from collections import defaultdict
 
 # Create a context common to the green and non-green zmq modules.
 from volttron.platform.agent.utils import get_platform_instance_name
-from volttron.utils.frame_serialization import serialize_frames
+from volttron.utils.frame_serialization import serialize_frames, ENCODE_FORMAT
 
 green.Context._instance = green.Context.shadow(zmq.Context.instance().underlying)
 from volttron.platform import get_home
 from .agent.subsystems.pubsub import ProtectedPubSubTopics
+from .topictrie import TopicTrie
 from volttron.platform.jsonrpc import (INVALID_REQUEST, UNAUTHORIZED)
 from volttron.platform import jsonapi
 
@@ -68,8 +69,10 @@ _ROUTE_ERRORS = {
 _log = logging.getLogger(__name__)
 
 class PubSubService:
-    def __init__(self, socket, protected_topics, routing_service, *args, **kwargs):
+    def __init__(self, socket, protected_topics, routing_service, *args, peer_formats=None, **kwargs):
         self._logger = logging.getLogger(__name__)
+        # Peer -> wire format of publish payloads, for the peers that negotiated with the router in their hello
+        self._peer_formats = {} if peer_formats is None else peer_formats
 
         def platform_subscriptions():
             return defaultdict(subscriptions)
@@ -78,11 +81,14 @@ class PubSubService:
             return defaultdict(set)
 
         self._peer_subscriptions = defaultdict(platform_subscriptions)
+        # Per bus prefix index over the subscriber sets of both platforms, matched on every publish
+        self._subscription_index = defaultdict(TopicTrie)
         self._vip_sock = socket
         self._user_capabilities = {}
         self._protected_topics = ProtectedPubSubTopics()
         self._load_protected_topics(protected_topics)
         self._ext_subscriptions = defaultdict(set)
+        self._ext_index = TopicTrie()
         self._ext_router = routing_service
         if self._ext_router is not None:
             self._ext_router.register('on_connect', self.external_platform_add)
@@ -99,7 +105,25 @@ class PubSubService:
         :param prefix subscription prefix (peer is subscribing to all topics matching the prefix)
         :type str
         """
-        self._peer_subscriptions[platform][bus][prefix].add(peer)
+        subscriptions = self._peer_subscriptions[platform][bus]
+        subscribers = subscriptions.get(prefix)
+        if subscribers is None:
+            subscribers = subscriptions[prefix] = set()
+            self._subscription_index[bus].add(prefix, platform, subscribers)
+        subscribers.add(peer)
+
+    def _remove_peer_subscription(self, bus, prefix, platform='internal'):
+        """
+        Remove a subscription prefix, with all its subscribers, for specified bus.
+        :param bus bus.
+        :type str
+        :param prefix subscription prefix
+        :type str
+        :returns: set of the removed subscribers
+        """
+        subscribers = self._peer_subscriptions[platform][bus].pop(prefix, None)
+        self._subscription_index[bus].remove(prefix, platform)
+        return subscribers
 
     def peer_drop(self, peer, **kwargs):
         """
@@ -126,8 +150,20 @@ class PubSubService:
     def external_platform_drop(self, instance_name):
         if instance_name in self._ext_subscriptions:
             self._logger.debug("PUBSUBSERVICE dropping external subscriptions for {}".format(instance_name))
+            self._set_external_subscriptions(instance_name, [])
             del self._ext_subscriptions[instance_name]
 
+    def _set_external_subscriptions(self, instance_name, prefixes):
+        """
+        Replace the subscription prefixes of an external platform in the prefix index.
+        :param instance_name: name of the external platform
+        :param prefixes: subscription prefixes of the platform
+        """
+        for prefix in self._ext_subscriptions.get(instance_name, ()):
+            self._ext_index.remove(prefix, instance_name)
+        for prefix in prefixes:
+            self._ext_index.add(prefix, instance_name, {instance_name})
+
     def _sync(self, peer, items):
         """
         Synchronize the subscriptions with calling agent (peer) when it gets newly connected. OR Unsubscribe from
@@ -156,8 +192,10 @@ class PubSubService:
                     else:
                         subscribers.add(peer)
         for platform, bus, prefix in remove:
-            subscriptions = self._peer_subscriptions[platform][bus]
-            assert not subscriptions.pop(prefix)
+            # Only prefixes without subscribers are removed, removing one must not drop anybody
+            dropped = self._remove_peer_subscription(bus, prefix, platform)
+            if dropped:
+                _log.error("Sync of {} dropped subscribers {} of {}".format(peer, dropped, prefix))
 
         for platform, bus, prefix in items:
             self._add_peer_subscription(peer, bus, prefix, platform)
@@ -268,13 +306,13 @@ class PubSubService:
                         if not subscribers:
                             remove.append(topic)
                     for topic in remove:
-                        del subscriptions[topic]
+                        self._remove_peer_subscription(bus, topic, platform)
                 else:
                     for prefix in prefix if isinstance(prefix, list) else [prefix]:
-                        subscribers = subscriptions[prefix]
+                        subscribers = subscriptions.get(prefix, set())
                         subscribers.discard(peer)
                         if not subscribers:
-                            del subscriptions[prefix]
+                            self._remove_peer_subscription(bus, prefix, platform)
 
                 if platform == 'all' and self._ext_router is not None:
                     # Send updated subscription list to all connected platforms
@@ -296,7 +334,7 @@ class PubSubService:
         """
         if len(frames) > 8:
             try:
-                msg = frames[8]
+                msg = self._decode_payload(frames[0], frames[8])
                 headers = msg['headers']
                 message = msg['message']
                 peer = frames[0]
@@ -313,6 +351,78 @@ class PubSubService:
                 self._publish_on_rmq_bus(frames)
             return self._distribute(frames, user_id)
 
+    def _peer_publish_many(self, frames, user_id):
+        """Publish a batch of messages, each to the subscribers of its topic. Every subscriber receives its messages
+        of the batch in a single 'publish_many' frame set if it negotiated with the router, one 'publish' frame set
+        per message otherwise. The batch is all or nothing: if the publisher may not publish to one of the topics,
+        it gets an error and no message is delivered.
+        :param frames list of frames, frames[7] holds the bus and the list of [topic, headers, message]
+        :type frames list
+        :param user_id user id of the publishing agent. This is required for protected topics check.
+        :type user_id  UTF-8 encoded User-Id property
+        :returns: Count of deliveries, summed over the messages.
+        :rtype: int
+
+        :Return Values:
+        Number of subscribers the messages were sent to
+        """
+        if len(frames) < 8:
+            return 0
+        publisher, receiver, proto, auth_token, msg_id, subsystem = frames[:6]
+        try:
+            batch = self._decode_payload(publisher, frames[7])
+            bus = batch['bus']
+            messages = batch['messages']
+        except KeyError as exc:
+            self._logger.error("Missing key in _peer_publish_many message {}".format(exc))
+            return 0
+        except ValueError:
+            self._logger.error("JSON decode error. Invalid character")
+            return 0
+
+        # Check every topic before delivering anything, the publisher gets one error for the batch
+        for topic, headers, message in messages:
+            errmsg = self._check_if_protected_topic(user_id, topic)
+            if errmsg is not None:
+                self._send([publisher, '', proto, user_id, msg_id, 'error', str(UNAUTHORIZED), str(errmsg), '',
+                            subsystem], publisher)
+                return 0
+
+        index = self._subscription_index.get(bus)
+        pending = defaultdict(list)
+        count = 0
+        for topic, headers, message in messages:
+            pub_msg = dict(sender=publisher, bus=bus, headers=headers, message=message)
+            single = [publisher, receiver, proto, auth_token, msg_id, subsystem, 'publish', topic, pub_msg]
+            if self._rabbitmq_agent:
+                self._publish_on_rmq_bus(single)
+            count += self._distribute_external(single)
+            if index is not None:
+                for subscriber in index.match(topic):
+                    pending[subscriber].append((topic, pub_msg))
+
+        for subscriber, items in pending.items():
+            count += len(items)
+            wire_format = self._peer_formats.get(subscriber)
+            serializer = jsonapi.wire_serializer(wire_format or 'json')
+            if wire_format is None or len(items) == 1:
+                # Subscriber without batch support or nothing to coalesce
+                outgoing = [[subscriber, receiver, proto, auth_token, msg_id, subsystem, 'publish', topic,
+                             serializer.dumpb(pub_msg)] for topic, pub_msg in items]
+            else:
+                payload = dict(sender=publisher, bus=bus,
+                               messages=[[topic, pub_msg['headers'], pub_msg['message']] for topic, pub_msg in items])
+                outgoing = [[subscriber, receiver, proto, auth_token, msg_id, subsystem, 'publish_many',
+                             serializer.dumpb(payload)]]
+            for subscriber_frames in outgoing:
+                dropped = self._send(subscriber_frames, publisher)
+                for sub in dropped:
+                    # Drop the subscriber if unreachable
+                    self.peer_drop(sub)
+                if dropped:
+                    break
+        return count
+
     def _peer_list(self, frames):
         """Returns a list of subscriptions for a specific bus. If bus is None, then it returns list of subscriptions
         for all the buses.
@@ -423,31 +533,21 @@ class PubSubService:
             self._logger.error("JSON decode error. Invalid character")
             return 0
 
-        all_subscriptions = dict()
-        subscriptions = dict()
-        subs = dict()
-        # Get subscriptions for all platforms
-        try:
-            all_subscriptions = self._peer_subscriptions['all'][bus]
-        except KeyError:
-            pass
-        try:
-            subscriptions = self._peer_subscriptions['internal'][bus]
-        except KeyError:
-            pass
-
-        subs.update(all_subscriptions)
-        subs.update(subscriptions)
-        subscribers = set()
-        # Check for local subscribers
-        for prefix, subscription in subs.items():
-            if subscription and topic.startswith(prefix):
-                subscribers |= subscription
+        # Check for local subscribers of all platforms and this platform only
+        index = self._subscription_index.get(bus)
+        subscribers = index.match(topic) if index is not None else set()
 
         if subscribers:
             # self._logger.debug("PUBSUBSERVICE: found subscribers: {}".format(subscribers))
+            # Encode the payload once per wire format instead of once per subscriber
+            payloads = {}
             for subscriber in subscribers:
                 frames[0] = subscriber
+                wire_format = self._peer_formats.get(subscriber, 'json')
+                try:
+                    frames[8] = payloads[wire_format]
+                except KeyError:
+                    frames[8] = payloads[wire_format] = jsonapi.wire_serializer(wire_format).dumpb(msg)
                 try:
                     # Send the message to the subscriber
                     for sub in self._send(frames, publisher):
@@ -455,9 +555,22 @@ class PubSubService:
                         self.peer_drop(sub)
                 except ZMQError:
                     raise
+            frames[8] = msg
 
         return len(subscribers)
 
+    def _decode_payload(self, peer, payload):
+        """
+        Decode a publish payload sent in the binary wire format the peer negotiated.
+        :param peer: identity of the publishing agent
+        :param payload: publish frame as received, a dictionary for json
+        :return: payload dictionary
+        """
+        wire_format = self._peer_formats.get(peer, 'json')
+        if wire_format == 'json' or not isinstance(payload, str):
+            return payload
+        return jsonapi.wire_serializer(wire_format).loadb(payload.encode(ENCODE_FORMAT))
+
     def _distribute_external(self, frames):
         """
         Distribute the publish message to external subscribers (platforms)
@@ -467,12 +580,7 @@ class PubSubService:
         publisher, receiver, proto, user_id, msg_id, subsystem, op, topic, data = frames[0:9]
 
         success = False
-        external_subscribers = set()
-        topic = topic
-        for platform_id, subscriptions in self._ext_subscriptions.items():
-            for prefix in subscriptions:
-                if topic.startswith(prefix):
-                    external_subscribers.add(platform_id)
+        external_subscribers = self._ext_index.match(topic)
         # self._logger.debug("PUBSUBSERVICE External subscriptions {0}, {1}".format(topic, external_subscribers))
         if external_subscribers:
             frames[:] = []
@@ -634,6 +742,8 @@ class PubSubService:
                 except IndexError:
                     #send response back -- Todo
                     return []
+            elif op == 'publish_many':
+                result = self._peer_publish_many(frames, user_id)
             elif op == 'unsubscribe':
                 result = self._peer_unsubscribe(frames)
             elif op == 'list':
@@ -759,6 +869,7 @@ class PubSubService:
                         continue
                     prefixes = msg[instance_name]
                     # Store external subscription list for later use (during publish)
+                    self._set_external_subscriptions(instance_name, prefixes)
                     self._ext_subscriptions[instance_name] = prefixes
                     self._logger.debug("PUBSUBSERVICE New external list from {0}: List: {1}".
                                        format(instance_name, self._ext_subscriptions))
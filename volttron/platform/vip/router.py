@@ -46,6 +46,7 @@ from typing import Optional
 import zmq
 from zmq import Frame, NOBLOCK, ZMQError, EINVAL, EHOSTUNREACH
 
+from volttron.platform import jsonapi
 from volttron.platform.vip.servicepeer import ServicePeerNotifier
 from volttron.utils.frame_serialization import serialize_frames
 
@@ -88,6 +89,10 @@ class BaseRouter:
     _context_class = zmq.Context
     _socket_class = zmq.Socket
     _poller_class = zmq.Poller
+    # Set by routers whose subsystems decode the wire formats offered in the hello
+    negotiate_wire_formats = False
+    # Optional operations announced to peers that negotiate in the hello
+    features = ()
 
     def __init__(self, context=None, default_user_id=None, service_notifier=Optional[ServicePeerNotifier]):
         '''Initialize the object instance.
@@ -103,6 +108,8 @@ class BaseRouter:
         self._ext_sockets = []
         self._socket_id_mapping = {}
         self._service_notifier = service_notifier
+        # Peers that negotiated in their hello -> wire format
+        self._peer_formats = {}
 
     def run(self):
         '''Main router loop.'''
@@ -239,6 +246,7 @@ class BaseRouter:
             self._service_notifier.peer_added(peer)
 
     def _drop_peer(self, peer):
+        self._peer_formats.pop(peer, None)
         try:
             self._peers.remove(peer)
         except KeyError:
@@ -285,8 +293,16 @@ class BaseRouter:
             # Handle requests directed at the router
             name = subsystem
             if name == 'hello':
-                frames = [sender, recipient, proto, user_id, msg_id,
-                          'hello', 'welcome', '1.0', socket.identity, sender]
+                welcome = [sender, recipient, proto, user_id, msg_id,
+                           'hello', 'welcome', '1.0', socket.identity, sender]
+                if len(frames) > 7:
+                    # The peer offered wire formats, answer with the one to use and the router features
+                    wire_format = jsonapi.negotiate(frames[7]) if self.negotiate_wire_formats else 'json'
+                    self._peer_formats[sender] = wire_format
+                    welcome.extend([wire_format, list(self.features)])
+                else:
+                    self._peer_formats.pop(sender, None)
+                frames = welcome
             elif name == 'ping':
                 frames[:7] = [
                     sender, recipient, proto, user_id, msg_id, 'ping', 'pong']
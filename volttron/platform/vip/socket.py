@@ -65,6 +65,7 @@ from zmq import (SNDMORE, RCVMORE, NOBLOCK, POLLOUT, DEALER, ROUTER,
 from zmq.error import Again
 from zmq.utils import z85
 
+from volttron.utils import frame_serialization
 from volttron.utils.frame_serialization import deserialize_frames, serialize_frames
 
 __all__ = ['Address', 'ProtocolError', 'Message', 'nonblocking']
@@ -404,6 +405,9 @@ class _Socket:
                     super(_Socket, self).send(b'VIP1', flags=flags|SNDMORE)
                     state += 1
                 self._send_state = state + 1
+            if (not track and isinstance(frame, bytes)
+                    and len(frame) >= frame_serialization.ZERO_COPY_THRESHOLD):
+                frame = frame_serialization.zero_copy_frame(frame)
             try:
                 super(_Socket, self).send(
                     frame, flags=flags, copy=copy, track=track)
@@ -439,7 +443,8 @@ class _Socket:
         :param via:
         :param flags:
         :param copy:
-            Should a copy be made of the message be made for each send
+            Should a copy be made of the message be made for each send.
+            Frames of at least ZERO_COPY_THRESHOLD bytes are never copied.
         :param track:
         """
 
@@ -549,6 +554,10 @@ class _Socket:
         If socket is a ROUTER, INTERMEDIARY will be inserted before PEER
         in the returned list. ARGS is always a possibly empty list.
 
+        With copy=False the frames are returned as zmq.Frame objects
+        without copying their data; recv_vip_dict() then decodes frames
+        of at least ZERO_COPY_THRESHOLD bytes from their buffers.
+
         :param flags:
         :param copy:
         :param track:
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright 2020, Battelle Memorial Institute.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# This material was prepared as an account of work sponsored by an agency of
+# the United States Government. Neither the United States Government nor the
+# United States Department of Energy, nor Battelle, nor any of their
+# employees, nor any jurisdiction or organization that has cooperated in the
+# development of these materials, makes any warranty, express or
+# implied, or assumes any legal liability or responsibility for the accuracy,
+# completeness, or usefulness or any information, apparatus, product,
+# software, or process disclosed, or represents that its use would not infringe
+# privately owned rights. Reference herein to any specific commercial product,
+# process, or service by trade name, trademark, manufacturer, or otherwise
+# does not necessarily constitute or imply its endorsement, recommendation, or
+# favoring by the United States Government or any agency thereof, or
+# Battelle Memorial Institute. The views and opinions of authors expressed
+# herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY operated by
+# BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+# }}}
+
+
+"""Prefix index of pubsub subscriptions.
+
+Subscriptions are plain string prefixes: a topic matches every prefix it
+starts with, including prefixes that end in the middle of a topic level
+(``devices/build`` matches ``devices/building1/all``). :class:`TopicTrie`
+stores a prefix at the node of its complete levels, keyed by the trailing
+partial level::
+
+    "devices/campus/build"  ->  root -> "devices" -> "campus", partial "build"
+
+Matching walks the levels of the topic. At every node on the way only the
+lengths of the partial levels stored there are tried, each one a dictionary
+lookup, so the cost grows with the length of the topic instead of the
+number of subscriptions.
+"""
+
+
+class _Node(object):
+    __slots__ = ('children', 'partials', 'lengths')
+
+    def __init__(self):
+        # Next topic level -> _Node
+        self.children = {}
+        # Partial level -> {key: subscribers}
+        self.partials = {}
+        # Length of the stored partial levels -> number of partial levels with that length
+        self.lengths = {}
+
+
+class TopicTrie(object):
+    """Subscriber sets indexed by subscription prefix.
+
+    Every prefix holds one subscriber set per key (for example per platform
+    the subscription was made for). The sets are stored by reference, so
+    adding or discarding subscribers of a known prefix needs no update of
+    the index.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        """Number of (prefix, key) entries."""
+        return self._size
+
+    def add(self, prefix, key, subscribers):
+        """Store (or replace) the subscriber set of a prefix and key."""
+        levels = prefix.split('/')
+        partial = levels.pop()
+        node = self._root
+        for level in levels:
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        entries = node.partials.get(partial)
+        if entries is None:
+            entries = node.partials[partial] = {}
+            node.lengths[len(partial)] = node.lengths.get(len(partial), 0) + 1
+        if key not in entries:
+            self._size += 1
+        entries[key] = subscribers
+
+    def get(self, prefix, key, default=None):
+        """Subscriber set of a prefix and key."""
+        node, _ = self._find(prefix)
+        if node is None:
+            return default
+        return node.partials.get(prefix.rpartition('/')[2], {}).get(key, default)
+
+    def remove(self, prefix, key):
+        """Remove the subscriber set of a prefix and key.
+
+        :returns: The removed set or None if there was none.
+        """
+        node, path = self._find(prefix)
+        if node is None:
+            return None
+        partial = prefix.rpartition('/')[2]
+        entries = node.partials.get(partial)
+        if not entries or key not in entries:
+            return None
+        subscribers = entries.pop(key)
+        self._size -= 1
+        if not entries:
+            del node.partials[partial]
+            count = node.lengths.pop(len(partial)) - 1
+            if count:
+                node.lengths[len(partial)] = count
+            # Drop the nodes left without subscriptions
+            for parent, level in reversed(path):
+                child = parent.children[level]
+                if child.partials or child.children:
+                    break
+                del parent.children[level]
+        return subscribers
+
+    def _find(self, prefix):
+        levels = prefix.split('/')[:-1]
+        node = self._root
+        path = []
+        for level in levels:
+            path.append((node, level))
+            node = node.children.get(level)
+            if node is None:
+                return None, None
+        return node, path
+
+    def match(self, topic):
+        """Union of the subscriber sets of every prefix ``topic`` starts with.
+
+        :rtype: set
+        """
+        return set().union(*self.match_sets(topic))
+
+    def match_sets(self, topic):
+        """Subscriber sets of every prefix and key ``topic`` starts with.
+
+        Unlike :meth:`match` a subscriber appears once per matching entry.
+
+        :rtype: list
+        """
+        matched = []
+        node = self._root
+        for level in topic.split('/'):
+            if node.lengths:
+                partials = node.partials
+                size = len(level)
+                for length in node.lengths:
+                    if length <= size:
+                        entries = partials.get(level[:length] if length < size else level)
+                        if entries:
+                            matched.extend(entries.values())
+            node = node.children.get(level)
+            if node is None:
+                break
+        return matched
+
+    def items(self):
+        """Iterate over ``(prefix, key, subscribers)`` of all entries."""
+        stack = [('', self._root)]
+        while stack:
+            path, node = stack.pop()
+            for partial, entries in node.partials.items():
+                for key, subscribers in entries.items():
+                    yield path + partial, key, subscribers
+            for level, child in node.children.items():
+                stack.append((path + level + '/', child))
@@ -47,6 +47,7 @@
 
 import gevent
 
+from volttron.utils import frame_serialization
 from .router import UNROUTABLE, ERROR, INCOMING
 
 __all__ = ['Tracker']
@@ -87,7 +88,10 @@ class Tracker:
             'unroutable': {'error': {}, 'peer': {}},
             'incoming': {'peer': {}, 'user': {}, 'subsystem': {}},
             'outgoing': {'peer': {}, 'user': {}, 'subsystem': {}},
+            # Large frames the platform process sent and decoded without copying
+            'zero_copy': frame_serialization.zero_copy_stats,
         }
+        frame_serialization.reset_zero_copy_stats()
 
     def hit(self, topic, frames, extra):
         '''Increment counters for given topic and frames.'''
@@ -50,6 +50,58 @@ _log = logging.getLogger(__name__)
 # python 3.8 formatting errors with utf-8 encoding.  The ISO-8859-1 is equivilent to latin-1
 ENCODE_FORMAT = 'ISO-8859-1'
 
+# Frames of at least this many bytes are sent by reference and decoded in place instead of being
+# copied. The same size zmq itself stops copying message data at (zmq.COPY_THRESHOLD).
+ZERO_COPY_THRESHOLD = 65536
+
+# First bytes of JSON texts, other large frames are not worth a decode attempt
+_JSON_START = frozenset(b'{["-0123456789tfnNI \t\r\n')
+
+# Frames and bytes handled without copying, in each direction, since reset_zero_copy_stats()
+zero_copy_stats = {'sent': {'frames': 0, 'bytes': 0}, 'received': {'frames': 0, 'bytes': 0}}
+
+
+def reset_zero_copy_stats():
+    for counts in zero_copy_stats.values():
+        counts['frames'] = 0
+        counts['bytes'] = 0
+
+
+def _count(direction, size):
+    counts = zero_copy_stats[direction]
+    counts['frames'] += 1
+    counts['bytes'] += size
+
+
+def zero_copy_frame(data: bytes) -> Frame:
+    """
+    Wrap bytes in a Frame that references them. zmq keeps the bytes alive until the frame is sent,
+    which is safe because bytes are immutable.
+    """
+    _count('sent', len(data))
+    return Frame(data, copy=False)
+
+
+def _frame(data: bytes) -> Frame:
+    if len(data) >= ZERO_COPY_THRESHOLD:
+        return zero_copy_frame(data)
+    return Frame(data)
+
+
+def _decode_buffer(buffer: memoryview):
+    """
+    Decode a large frame from its buffer, skipping the bytes copy of small frames. The text is
+    decoded as ENCODE_FORMAT like small frames, so the result does not depend on the frame size.
+    """
+    _count('received', buffer.nbytes)
+    text = str(buffer, ENCODE_FORMAT)
+    if buffer[0] in _JSON_START:
+        try:
+            return jsonapi.loads(text)
+        except JSONDecodeError:
+            pass
+    return text
+
 
 def deserialize_frames(frames: List[Frame]) -> List:
     decoded = []
@@ -70,6 +122,9 @@ def deserialize_frames(frames: List[Frame]) -> List:
             if x == {}:
                 decoded.append(x)
                 continue
+            if len(x) >= ZERO_COPY_THRESHOLD:
+                decoded.append(_decode_buffer(x.buffer))
+                continue
             try:
                 d = x.bytes.decode(ENCODE_FORMAT)
             except UnicodeDecodeError as e:
@@ -89,11 +144,12 @@ def serialize_frames(data: List[Any]) -> List[Frame]:
     for x in data:
         try:
             if isinstance(x, list) or isinstance(x, dict):
-                frames.append(Frame(jsonapi.dumps(x).encode(ENCODE_FORMAT)))
+                # jsonapi writes ASCII, the same bytes in ENCODE_FORMAT
+                frames.append(_frame(jsonapi.dumpb(x)))
             elif isinstance(x, Frame):
                 frames.append(x)
             elif isinstance(x, bytes):
-                frames.append(Frame(x))
+                frames.append(_frame(x))
             elif isinstance(x, bool):
                 frames.append(struct.pack("?", x))
             elif isinstance(x, int):
@@ -103,7 +159,7 @@ def serialize_frames(data: List[Any]) -> List[Frame]:
             elif x is None:
                 frames.append(Frame(x))
             else:
-                frames.append(Frame(x.encode(ENCODE_FORMAT)))
+                frames.append(_frame(x.encode(ENCODE_FORMAT)))
         except TypeError as e:
             import sys
             sys.exit(0)
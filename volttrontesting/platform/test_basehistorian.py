@@ -129,3 +129,22 @@ def test_cache_enable():
         # give a small amount of time so that the queue can get empty
         assert agent.has_published_items()
         assert len(agent.get_publish_list()) == 2
+
+
+def test_capture_timeseries_payload():
+    from volttron.platform.messaging.timeseries import encode
+
+    agent = BaseHistorianAgent()
+    now = utils.format_timestamp(datetime.utcnow())
+    message = encode([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], ['Demand', 'Grid_Export'], start=1704067200, step=900)
+    agent._capture_analysis_data(peer="foo", sender="test", bus="", topic="analysis/microgrid/data",
+                                 headers={header_mod.DATE: now}, message=message)
+
+    items = {}
+    while not agent._event_queue.empty():
+        item = agent._event_queue.get_nowait()
+        items[item['topic']] = item
+    assert sorted(items) == ['microgrid/data/Demand', 'microgrid/data/Grid_Export']
+    readings = items['microgrid/data/Demand']['readings']
+    assert [value for _, value in readings] == [1.0, 2.0, 3.0]
+    assert readings[1][0] == utils.parse_timestamp_string('2024-01-01T00:15:00+00:00')
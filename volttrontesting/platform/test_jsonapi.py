@@ -0,0 +1,134 @@
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+import pytz
+from mock import Mock
+
+from volttron.platform import jsonapi
+from volttron.platform.vip.router import BaseRouter
+
+SERIALIZERS = jsonapi.available_serializers()
+TEXT_SERIALIZERS = [name for name in SERIALIZERS if jsonapi.get_serializer(name).format == 'json']
+
+
+class PrefixedSerializer(object):
+    """Stand-in binary wire format, JSON behind a byte that is not valid JSON."""
+    name = 'prefixed'
+    format = 'prefixed'
+
+    def dumpb(self, data):
+        return b'\xff' + json.dumps(data).encode('utf-8')
+
+    def loadb(self, s):
+        assert s[:1] == b'\xff'
+        return json.loads(s[1:].decode('utf-8'))
+
+
+@pytest.fixture
+def prefixed(monkeypatch):
+    # Restore the serializer of the test process afterwards
+    monkeypatch.setattr(jsonapi, '_serializer', jsonapi.serializer())
+    monkeypatch.setattr(jsonapi, '_wire_formats', tuple(jsonapi.wire_formats()))
+    monkeypatch.setattr(jsonapi, '_instances', {})
+    monkeypatch.setitem(jsonapi._SERIALIZERS, 'prefixed', PrefixedSerializer)
+    jsonapi.set_serializer('prefixed')
+    yield jsonapi.get_serializer('prefixed')
+
+
+def device_all_message():
+    values = {'point{}'.format(i): float(i) * 1.5 for i in range(50)}
+    meta = {name: {'type': 'float', 'tz': 'US/Pacific', 'units': 'kW'} for name in values}
+    return [values, meta]
+
+
+@pytest.mark.parametrize('name', TEXT_SERIALIZERS)
+def test_text_serializers_decode_to_the_same_values(name):
+    serializer = jsonapi.get_serializer(name)
+    data = {'message': device_all_message(),
+            'headers': {'Date': '2024-01-01T12:30:00.000005+00:00', 'count': 3, 'empty': None},
+            'numbers': [np.float64(0.25), 1e16, -0.0, 2 ** 70],
+            'special': [float('nan'), float('inf'), None, 'Zürich'],
+            1: 'integer key'}
+    reference = jsonapi.get_serializer('json')
+    assert serializer.loads(serializer.dumps(data)) == json.loads(reference.dumps(data)) == \
+        reference.loads(serializer.dumpb(data))
+    text = serializer.dumps(data)
+    assert text.isascii() and 'NaN' in text and 'Infinity' in text
+    decoded = serializer.loads(serializer.dumpb(data))
+    assert decoded['numbers'] == [0.25, 1e16, 0.0, 2 ** 70]
+    assert np.isnan(decoded['special'][0]) and decoded['special'][1:] == [float('inf'), None, 'Zürich']
+    assert decoded['1'] == 'integer key'
+    assert serializer.dumps({'a': 1}, indent=2) == json.dumps({'a': 1}, indent=2)
+
+    stream = io.StringIO()
+    serializer.dump({'a': [1, 2]}, stream)
+    stream.seek(0)
+    assert serializer.load(stream) == {'a': [1, 2]}
+
+    with pytest.raises(json.JSONDecodeError):
+        serializer.loads('{"a": ')
+    # Like the standard library, values that are not JSON types are not converted
+    for value in (object(), datetime(2024, 1, 1, tzinfo=pytz.utc), np.float32(0.5), np.int64(7), np.arange(3)):
+        with pytest.raises(TypeError):
+            serializer.dumps({'value': value})
+
+
+def test_orjson_encodes_payloads_with_null_once(monkeypatch):
+    pytest.importorskip('orjson')
+    serializer = jsonapi.get_serializer('orjson')
+    monkeypatch.setattr(jsonapi.json, 'dumps', Mock(side_effect=AssertionError('standard library used')))
+    assert serializer.dumpb({'value': None, 'values': [1.5, None]}) == b'{"value":null,"values":[1.5,null]}'
+
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError):
+        jsonapi.get_serializer('pickle')
+    with pytest.raises(ValueError):
+        jsonapi.wire_serializer('pickle')
+    assert 'json' in SERIALIZERS
+
+
+def test_binary_serializer_is_only_used_on_the_wire(prefixed):
+    assert jsonapi.serializer().format == 'json'
+    assert jsonapi.dumps({'a': 1}).replace(' ', '') == '{"a":1}'
+    assert jsonapi.wire_formats() == ['prefixed', 'json']
+    assert jsonapi.negotiate(['msgpack', 'prefixed', 'json']) == 'prefixed'
+    assert jsonapi.negotiate(['json']) == 'json'
+    assert jsonapi.negotiate(None) == 'json'
+    assert jsonapi.wire_serializer('prefixed') is prefixed
+    assert jsonapi.wire_serializer('json') is jsonapi.serializer()
+
+
+def test_msgpack_round_trip():
+    pytest.importorskip('msgpack')
+    serializer = jsonapi.get_serializer('msgpack')
+    data = {'message': device_all_message(), 'headers': {'Date': '2024-01-01T00:00:00'}, 'value': 0.5}
+    decoded = serializer.loadb(serializer.dumpb(data))
+    assert decoded == data
+    with pytest.raises(TypeError):
+        serializer.dumpb({'Date': datetime(2024, 1, 1)})
+
+
+@pytest.mark.parametrize('negotiating', [True, False])
+def test_hello_negotiates_the_wire_format(prefixed, monkeypatch, negotiating):
+    router = BaseRouter(context=Mock(), service_notifier=Mock())
+    router.negotiate_wire_formats = negotiating
+    router.socket = Mock(identity='router')
+    sent = []
+    monkeypatch.setattr(router, '_send', lambda frames: sent.append(frames) or [])
+
+    router.route(['agent', '', 'VIP1', '', 'hello.1', 'hello', 'hello', ['prefixed', 'json']])
+    expected = 'prefixed' if negotiating else 'json'
+    assert sent[-1][6:] == ['welcome', '1.0', 'router', 'agent', expected, []]
+    assert router._peer_formats == {'agent': expected}
+
+    # Peers that offer nothing get the original welcome
+    router.route(['old', '', 'VIP1', '', 'hello.1', 'hello', 'hello'])
+    assert sent[-1][6:] == ['welcome', '1.0', 'router', 'old']
+    assert 'old' not in router._peer_formats
+
+    router._drop_peer('agent')
+    assert router._peer_formats == {}
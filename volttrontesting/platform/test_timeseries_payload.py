@@ -0,0 +1,78 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import pytz
+
+from volttron.platform.messaging import timeseries
+
+
+def make_frame(periods=672, tz=None):
+    index = pd.date_range('2024-01-01', periods=periods, freq='15min', tz=tz)
+    values = np.random.default_rng(0).uniform(0, 1000, size=(periods, 3))
+    return pd.DataFrame(values, index=index, columns=['Solar_Generation', 'Demand', 'Grid_Export'])
+
+
+@pytest.mark.parametrize("tz", [None, 'Europe/Berlin'])
+def test_frame_round_trip(tz):
+    df = make_frame(tz=tz)
+    message = timeseries.encode_frame(df)
+
+    assert timeseries.is_timeseries(message)
+    assert message['index']['step'] == 900
+    # The payload has to survive the JSON serializer used on the bus.
+    message = json.loads(json.dumps(message))
+    pd.testing.assert_frame_equal(timeseries.decode_frame(message), df, check_freq=False)
+
+
+def test_irregular_index_and_raw_encoding():
+    df = make_frame(5)
+    df.index = df.index[[0, 1, 2, 4, 4]]
+    message = timeseries.encode_frame(df, encoding=timeseries.RAW)
+
+    assert 'epoch_ns' in message['index']
+    assert isinstance(message['data'], bytes)
+    pd.testing.assert_frame_equal(timeseries.decode_frame(message), df)
+
+
+def test_decode_does_not_copy():
+    message = timeseries.encode(np.arange(6.0).reshape(2, 3), ['a', 'b'], start=0, step=60)
+
+    series = timeseries.decode(message)
+    np.testing.assert_array_equal(series.values, [[0, 1, 2], [3, 4, 5]])
+    np.testing.assert_array_equal(series.index, [0, 60 * 10 ** 9, 120 * 10 ** 9])
+    assert not series.values.flags.writeable
+
+    df = timeseries.decode_frame(message)
+    assert np.shares_memory(df.values, df['a'].values)
+    assert not df['a'].values.flags.writeable
+    assert timeseries.decode_frame(message, copy=True)['a'].values.flags.writeable
+
+
+def test_iter_readings():
+    message = timeseries.encode([[1.0, 2.0], [3.0, 4.0]], ['a', 'b'], start=1704067200, step=900)
+
+    readings = dict(timeseries.iter_readings(message))
+    start = datetime(2024, 1, 1, tzinfo=pytz.utc)
+    assert readings['a'] == [(start, 1.0), (start.replace(minute=15), 2.0)]
+    assert [value for _, value in readings['b']] == [3.0, 4.0]
+
+
+def test_invalid_payloads():
+    with pytest.raises(ValueError):
+        timeseries.encode([[1.0, 2.0]], ['a', 'b'], start=0, step=1)
+    with pytest.raises(ValueError):
+        timeseries.encode([[1.0, 2.0]], ['a'])
+    with pytest.raises(ValueError):
+        timeseries.encode([[1.0, 2.0]], ['a'], start=0, step=1, index=[0, 1])
+    with pytest.raises(ValueError):
+        timeseries.encode_frame(pd.DataFrame({'a': [1.0]}))
+
+    message = timeseries.encode([[1.0, 2.0]], ['a'], start=0, step=1)
+    message['length'] = 3
+    with pytest.raises(ValueError):
+        timeseries.decode(message)
+    with pytest.raises(ValueError):
+        timeseries.decode({'format': 'other'})
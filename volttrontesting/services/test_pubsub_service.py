@@ -1,4 +1,9 @@
+import json
+
+from volttron.platform import jsonapi
+from volttron.platform.jsonrpc import UNAUTHORIZED
 from volttron.platform.vip.pubsubservice import PubSubService, ProtectedPubSubTopics
+from volttron.platform.vip.topictrie import TopicTrie
 from mock import Mock, MagicMock
 import pytest
 
@@ -53,3 +58,140 @@ def test_returns_empty_list_when_subsystem_not_specified(pubsub_service):
     frames[6] = "not_pubsub"
     result = service.handle_subsystem(frames)
     assert [] == result
+
+
+def test_topic_trie_matches_string_prefixes():
+    trie = TopicTrie()
+    prefixes = ['', 'devices', 'devices/build', 'devices/building1/', 'devices/building1/all', 'record/',
+                '/leading', 'devices/building10']
+    for index, prefix in enumerate(prefixes):
+        trie.add(prefix, 'internal', {index})
+    topics = ['devices/building1/all', 'devices/building10/all', 'devices', 'devices/', 'record', 'record/x',
+              '/leading/slash', 'dev', 'analysis/devices']
+    for topic in topics:
+        expected = {index for index, prefix in enumerate(prefixes) if topic.startswith(prefix)}
+        assert trie.match(topic) == expected, topic
+
+    assert len(trie) == len(prefixes)
+    assert trie.remove('devices/build', 'internal') == {2}
+    assert trie.remove('devices/build', 'internal') is None
+    assert trie.remove('no/such/prefix', 'internal') is None
+    assert trie.match('devices/building1/all') == {0, 1, 3, 4}
+    assert sorted(prefix for prefix, _, _ in trie.items()) == sorted(prefixes[:2] + prefixes[3:])
+
+    for prefix in prefixes:
+        trie.remove(prefix, 'internal')
+    assert len(trie) == 0 and trie.match('devices/building1/all') == set()
+    assert not trie._root.children and not trie._root.lengths
+
+
+def test_subscriptions_are_indexed(pubsub_service, monkeypatch):
+    parameters, service = pubsub_service
+    sent = []
+    monkeypatch.setattr(service, '_send', lambda frames, publisher: sent.append(frames[0]) or [])
+    if parameters['has_external_routing']:
+        parameters['routing_service'].my_instance_name.return_value = 'platform1'
+        parameters['routing_service'].get_connected_platforms.return_value = []
+
+    def subscribe(peer, prefix, all_platforms=False):
+        msg = dict(prefix=prefix, bus='', all_platforms=all_platforms)
+        assert service._peer_subscribe([peer, '', 'VIP1', '', '', 'pubsub', 'subscribe', msg])
+
+    def publish(topic):
+        del sent[:]
+        frames = ['publisher', '', 'VIP1', '', '', 'pubsub', 'publish', topic, dict(bus='', headers={}, message=1)]
+        return service._distribute_internal(frames), set(sent)
+
+    subscribe('a', 'devices/building1')
+    subscribe('b', 'devices/building1', all_platforms=True)
+    subscribe('c', ['devices', 'analysis'])
+    assert publish('devices/building1/all') == (3, {'a', 'b', 'c'})
+    assert publish('devices/building2/all') == (1, {'c'})
+
+    msg = dict(prefix='devices', bus='')
+    service._peer_unsubscribe(['c', '', 'VIP1', '', '', 'pubsub', 'unsubscribe', msg])
+    assert publish('devices/building2/all') == (0, set())
+    assert publish('analysis/x') == (1, {'c'})
+
+    service.peer_drop('a')
+    assert publish('devices/building1/all') == (1, {'b'})
+    service.peer_drop('b')
+    service.peer_drop('c')
+    assert len(service._subscription_index['']) == 0
+
+
+class _ReversedSerializer(object):
+    name = format = 'reversed'
+
+    def dumpb(self, data):
+        return json.dumps(data).encode('utf-8')[::-1]
+
+    def loadb(self, s):
+        return json.loads(s[::-1].decode('utf-8'))
+
+
+def test_publish_payloads_use_the_negotiated_wire_format(monkeypatch):
+    monkeypatch.setitem(jsonapi._SERIALIZERS, 'reversed', _ReversedSerializer)
+    service = PubSubService(socket=Mock(), protected_topics=MagicMock(), routing_service=None,
+                            peer_formats={'binary_publisher': 'reversed', 'binary_subscriber': 'reversed'})
+    service._check_if_protected_topic = lambda user_id, topic: None
+    for peer in ('binary_subscriber', 'json_subscriber', 'other_json_subscriber'):
+        msg = dict(prefix='devices', bus='', all_platforms=False)
+        service._peer_subscribe([peer, '', 'VIP1', '', '', 'pubsub', 'subscribe', msg])
+    payloads = {}
+    monkeypatch.setattr(service, '_send', lambda frames, publisher: payloads.update({frames[0]: frames[8]}) or [])
+
+    payload = dict(bus='', headers={'Date': 'now'}, message=[1.5, {'a': 'b'}])
+    # Received frames are latin-1 decoded, as by deserialize_frames
+    frames = ['binary_publisher', '', 'VIP1', '', '', 'pubsub', 'publish', 'devices/all',
+              _ReversedSerializer().dumpb(payload).decode('ISO-8859-1')]
+    assert service._peer_publish(frames, 'binary_publisher') == 3
+
+    expected = dict(payload, sender='binary_publisher')
+    assert _ReversedSerializer().loadb(payloads['binary_subscriber']) == expected
+    assert jsonapi.loadb(payloads['json_subscriber']) == expected
+    # Encoded once per format
+    assert payloads['json_subscriber'] is payloads['other_json_subscriber']
+    assert frames[8] == expected
+
+
+def test_publish_many_coalesces_per_subscriber(monkeypatch):
+    service = PubSubService(socket=Mock(), protected_topics=MagicMock(), routing_service=None,
+                            peer_formats={'new': 'json', 'single': 'json'})
+    service._check_if_protected_topic = lambda user_id, topic: \
+        'protected' if topic.startswith('protected') else None
+    for peer, prefix in (('new', 'devices'), ('old', 'devices/building1'), ('single', 'devices/building2'),
+                         ('new', 'protected')):
+        msg = dict(prefix=prefix, bus='', all_platforms=False)
+        service._peer_subscribe([peer, '', 'VIP1', '', '', 'pubsub', 'subscribe', msg])
+    sent = []
+    monkeypatch.setattr(service, '_send', lambda frames, publisher: sent.append(frames) or [])
+
+    messages = [['devices/building1/a', {'n': 1}, 1.0],
+                ['devices/building1/b', {'n': 2}, 2.0],
+                ['devices/building2/a', {'n': 3}, 3.0],
+                ['protected/topic', {}, 0]]
+    frames = ['publisher', '', 'VIP1', '', 'id', 'pubsub', 'publish_many', dict(bus='', messages=messages)]
+    # An unauthorized topic fails the whole batch before anything is delivered
+    response = service.handle_subsystem(frames, 'publisher')
+    assert response[6:] == ['request_response', 0]
+    assert [[out[0]] + out[5:8] for out in sent] == [['publisher', 'error', str(UNAUTHORIZED), 'protected']]
+
+    del sent[:]
+    frames[7] = dict(bus='', messages=messages[:3])
+    response = service.handle_subsystem(frames, 'publisher')
+    assert response[6:] == ['request_response', 6]
+
+    by_peer = {}
+    for out in sent:
+        by_peer.setdefault(out[0], []).append(out)
+    assert 'publisher' not in by_peer
+    # Subscribers that negotiated get one batch
+    assert [out[6] for out in by_peer['new']] == ['publish_many']
+    batch = jsonapi.loadb(by_peer['new'][0][7])
+    assert batch == dict(sender='publisher', bus='', messages=messages[:3])
+    # Others get single publishes, as do peers with a single message of the batch
+    assert [(out[6], out[7]) for out in by_peer['old']] == [('publish', 'devices/building1/a'),
+                                                           ('publish', 'devices/building1/b')]
+    assert jsonapi.loadb(by_peer['old'][1][8]) == dict(sender='publisher', bus='', headers={'n': 2}, message=2.0)
+    assert [(out[6], out[7]) for out in by_peer['single']] == [('publish', 'devices/building2/a')]
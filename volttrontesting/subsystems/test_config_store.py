@@ -156,6 +156,25 @@ def test_manage_update_config(default_config_test_agent):
     assert second == ("config", "UPDATE", {"value": 2})
 
 
+@pytest.mark.config_store
+def test_manage_store_many(default_config_test_agent):
+    configs = [["registry.csv", "value\n1", "csv"],
+               ["config", """{"value":1}""", "json"],
+               ["config", """{"value":2}""", "json"]]
+    default_config_test_agent.vip.rpc.call(CONFIGURATION_STORE, 'manage_store_many',
+                                           "config_test_agent", configs).get()
+
+    results = default_config_test_agent.callback_results
+    assert results == [("registry.csv", "NEW", [{"value": "1"}]),
+                       ("config", "NEW", {"value": 1}),
+                       ("config", "UPDATE", {"value": 2})]
+
+    with pytest.raises(jsonrpc.RemoteError):
+        default_config_test_agent.vip.rpc.call(CONFIGURATION_STORE, 'manage_store_many', "config_test_agent",
+                                               [["other", "{}", "json"], ["bad", "[", "json"]]).get()
+    assert len(results) == 3
+
+
 @pytest.mark.config_store
 def test_manage_delete_config(default_config_test_agent):
     json_config = """{"value":1}"""
@@ -1,6 +1,10 @@
+import json
+
 import gevent
+from gevent.event import AsyncResult
 import pytest
 from mock import MagicMock
+from volttron.platform import jsonapi
 from volttron.platform.messaging import topics
 from volttron.platform.messaging.headers import DATE
 from volttron.platform.agent.utils import parse_timestamp_string
@@ -119,3 +123,130 @@ def test_multi_unsubscribe(volttron_instance):
     gevent.sleep(1)
 
     assert subscriber_agent.subscription_callback.call_count == 0
+
+
+@pytest.fixture
+def pubsub_subsystem():
+    pubsub = PubSub(core=MagicMock(), rpc_subsys=MagicMock(), peerlist_subsys=MagicMock(), owner=MagicMock())
+    pubsub.vip_socket = MagicMock()
+    return pubsub
+
+
+def test_callbacks_dispatched_per_matching_prefix(pubsub_subsystem):
+    devices = MagicMock()
+    everything = MagicMock()
+    remote = MagicMock()
+    pubsub_subsystem._add_subscription('devices/campus/build', devices)
+    pubsub_subsystem._add_subscription('devices', devices)
+    pubsub_subsystem._add_subscription('', everything)
+    pubsub_subsystem._add_subscription('devices/campus', remote, all_platforms=True)
+    pubsub_subsystem._add_subscription('devices', everything, bus='other')
+
+    pubsub_subsystem._process_callback('sender', '', 'devices/campus/building1/all', {}, 42)
+    assert devices.call_count == 2
+    devices.assert_called_with('pubsub', 'sender', '', 'devices/campus/building1/all', {}, 42)
+    assert everything.call_count == 1
+    assert remote.call_count == 1
+
+    pubsub_subsystem._process_callback('sender', '', 'analysis/campus', {}, 1)
+    assert everything.call_count == 2
+    assert devices.call_count == 2
+    pubsub_subsystem.vip_socket.send_vip.assert_not_called()
+
+    # Nothing subscribed on the bus, the agent resynchronizes
+    pubsub_subsystem._process_callback('sender', 'unknown', 'devices/campus', {}, 1)
+    pubsub_subsystem.vip_socket.send_vip.assert_called()
+
+
+def test_dispatch_cache_follows_subscription_changes(pubsub_subsystem):
+    first = MagicMock()
+    second = MagicMock()
+    topic = 'devices/campus/building1/all'
+    pubsub_subsystem._add_subscription('devices', first)
+    pubsub_subsystem._process_callback('sender', '', topic, {}, 1)
+    assert pubsub_subsystem._matching_callbacks('', topic) == (first,)
+
+    pubsub_subsystem._add_subscription('devices/campus', second)
+    pubsub_subsystem._process_callback('sender', '', topic, {}, 1)
+    assert first.call_count == 2 and second.call_count == 1
+
+    pubsub_subsystem._add_subscription('devices/campus', first)
+    pubsub_subsystem._drop_subscription('devices/campus', second)
+    assert pubsub_subsystem._matching_callbacks('', topic) == (first, first)
+
+    pubsub_subsystem._drop_subscription(None, first)
+    assert pubsub_subsystem._matching_callbacks('', topic) == ()
+    assert not pubsub_subsystem._subscription_index
+    assert not pubsub_subsystem._my_subscriptions
+
+    pubsub_subsystem._add_subscription('dev', second)
+    pubsub_subsystem._process_callback('sender', '', topic, {}, 1)
+    assert second.call_count == 2
+
+
+class _ReversedSerializer(object):
+    name = format = 'reversed'
+
+    def dumpb(self, data):
+        return json.dumps(data).encode('utf-8')[::-1]
+
+    def loadb(self, s):
+        return json.loads(s[::-1].decode('utf-8'))
+
+
+def test_publish_payloads_in_negotiated_wire_format(monkeypatch):
+    monkeypatch.setitem(jsonapi._SERIALIZERS, 'reversed', _ReversedSerializer)
+    core = MagicMock(wire_format='reversed')
+    pubsub = PubSub(core=core, rpc_subsys=MagicMock(), peerlist_subsys=MagicMock(), owner=MagicMock())
+    pubsub.vip_socket = MagicMock()
+
+    pubsub.publish('pubsub', 'devices/all', headers={}, message=[1, 2])
+    args = pubsub.vip_socket.send_vip.call_args[0][2]
+    assert args[:2] == ['publish', 'devices/all']
+    payload = _ReversedSerializer().loadb(args[2])
+    assert payload['message'] == [1, 2] and payload['bus'] == ''
+
+    callback = MagicMock()
+    pubsub._add_subscription('devices', callback)
+    pushed = _ReversedSerializer().dumpb(dict(sender='publisher', bus='', headers={'a': 1}, message=3))
+    message = MagicMock(args=['publish', 'devices/all', pushed.decode('ISO-8859-1')])
+    pubsub._process_incoming_message(message).join()
+    callback.assert_called_once_with('pubsub', 'publisher', '', 'devices/all', {'a': 1}, 3)
+
+
+def test_publish_many_sends_one_message():
+    core = MagicMock(wire_format='json', router_features=frozenset(['publish_many']))
+    pubsub = PubSub(core=core, rpc_subsys=MagicMock(), peerlist_subsys=MagicMock(), owner=MagicMock())
+    pubsub.vip_socket = MagicMock()
+
+    pubsub.publish_many('pubsub', [('devices/a', None, 1), ('devices/b', {'x': 1}, 2)])
+    pubsub.vip_socket.send_vip.assert_called_once()
+    op, payload = pubsub.vip_socket.send_vip.call_args[0][2]
+    assert op == 'publish_many' and payload['bus'] == ''
+    assert [(topic, message) for topic, headers, message in payload['messages']] == [('devices/a', 1),
+                                                                                    ('devices/b', 2)]
+    assert all(headers['min_compatible_version'] for topic, headers, message in payload['messages'])
+
+    callback = MagicMock()
+    pubsub._add_subscription('devices', callback)
+    batch = dict(sender='publisher', bus='', messages=payload['messages'])
+    pubsub._process_incoming_message(MagicMock(args=['publish_many', batch])).join()
+    assert [c[0][3] for c in callback.call_args_list] == ['devices/a', 'devices/b']
+
+
+def test_publish_many_falls_back_to_single_publishes():
+    core = MagicMock(wire_format='json', router_features=frozenset())
+    pubsub = PubSub(core=core, rpc_subsys=MagicMock(), peerlist_subsys=MagicMock(), owner=MagicMock())
+    pubsub.vip_socket = MagicMock()
+
+    def respond(peer, subsystem, args, msg_id, copy):
+        # Router answering every publish with two deliveries
+        gevent.spawn(pubsub._process_incoming_message, MagicMock(id=msg_id, args=['request_response', 2]))
+
+    pubsub.vip_socket.send_vip.side_effect = respond
+    result = pubsub.publish_many('pubsub', [('devices/a', None, 1), ('devices/b', None, 2)])
+    # The same kind of result as with batch support, not the greenlet doing the publishes
+    assert isinstance(result, AsyncResult)
+    assert result.get(timeout=2) == 4
+    assert [c[0][2][:2] for c in pubsub.vip_socket.send_vip.call_args_list] == [['publish', 'devices/a'],
+                                                                              ['publish', 'devices/b']]
@@ -1,5 +1,9 @@
+import zmq
 from zmq.sugar.frame import Frame
-from volttron.utils.frame_serialization import deserialize_frames, serialize_frames
+
+from volttron.platform.vip import Socket
+from volttron.utils.frame_serialization import (ENCODE_FORMAT, ZERO_COPY_THRESHOLD, deserialize_frames,
+                                                reset_zero_copy_stats, serialize_frames, zero_copy_stats)
 
 
 def test_can_deserialize_homogeneous_string():
@@ -32,3 +36,57 @@ def test_mixed_array():
 
     for r in range(len(original)):
         assert original[r] == after_deserialize[r], f"Element {r} is not the same."
+
+
+def test_large_frames_are_not_copied():
+    reset_zero_copy_stats()
+    values = {'point{}'.format(i): i * 0.5 for i in range(ZERO_COPY_THRESHOLD // 10)}
+    text = 'x' * ZERO_COPY_THRESHOLD
+    binary = bytes(range(256)) * (ZERO_COPY_THRESHOLD // 256)
+    original = ["peer", values, text, binary]
+    frames = serialize_frames(original)
+    assert zero_copy_stats['sent']['frames'] == 3
+    assert zero_copy_stats['sent']['bytes'] == sum(len(frame) for frame in frames[1:])
+
+    # Decoded in place: JSON, and the text of anything else, as for small frames
+    assert deserialize_frames(frames) == ["peer", values, text, binary.decode(ENCODE_FORMAT)]
+    assert zero_copy_stats['received'] == zero_copy_stats['sent']
+    reset_zero_copy_stats()
+    assert zero_copy_stats['received'] == {'frames': 0, 'bytes': 0}
+
+
+
+def test_large_frames_decode_like_small_frames():
+    # Non ASCII text in ENCODE_FORMAT is not valid UTF-8, UTF-8 text is read as ENCODE_FORMAT
+    for encoding in (ENCODE_FORMAT, 'utf-8'):
+        for size in (10, ZERO_COPY_THRESHOLD):
+            data = '["Zürich", "{}"]'.format('x' * size).encode(encoding)
+            decoded, = deserialize_frames([Frame(data)])
+            assert decoded == ['Zürich'.encode(encoding).decode(ENCODE_FORMAT), 'x' * size]
+            text = data[1:-1]
+            assert deserialize_frames([Frame(text)]) == [text.decode(ENCODE_FORMAT)]
+
+def test_vip_socket_sends_large_frames_by_reference():
+    context = zmq.Context()
+    router = Socket(context, zmq.ROUTER)
+    dealer = Socket(context, zmq.DEALER)
+    try:
+        router.bind('inproc://zero-copy?domain=vip')
+        dealer.connect('inproc://zero-copy')
+        reset_zero_copy_stats()
+        payload = {'values': list(range(ZERO_COPY_THRESHOLD // 4))}
+        dealer.send_vip('', 'pubsub', args=['publish', payload], msg_id='1')
+        dealer.send_vip('', 'channel', args=b'\x00' * ZERO_COPY_THRESHOLD, msg_id='2')
+        assert zero_copy_stats['sent']['frames'] == 2
+
+        assert router.poll(1000)
+        message = router.recv_vip_object(copy=False)
+        assert (message.subsystem, message.args) == ('pubsub', ['publish', payload])
+        assert router.poll(1000)
+        message = router.recv_vip_object(copy=False)
+        assert message.args == ['\x00' * ZERO_COPY_THRESHOLD]
+        assert zero_copy_stats['received']['frames'] == 2
+    finally:
+        router.close(linger=0)
+        dealer.close(linger=0)
+        context.term()